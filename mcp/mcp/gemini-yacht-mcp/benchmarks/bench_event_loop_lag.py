@@ -0,0 +1,102 @@
+"""
+Event-loop lag benchmark for image decoding.
+
+Decodes a batch of large JPEGs concurrently with each IMAGE_POOL kind
+while a ticker coroutine measures how late the event loop wakes it up.
+``inline`` is the previous behaviour (decoding on the loop thread).
+
+Usage:
+    python benchmarks/bench_event_loop_lag.py [--images 8] [--size 4000x3000]
+"""
+
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.imaging import ImagePool, IMAGE_POOL_KINDS  # noqa: E402
+
+TICK_S = 0.005
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    """Create a noisy JPEG that is realistically expensive to decode."""
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def ticker(lags: list, stop: asyncio.Event) -> None:
+    """Sleep in short ticks and record how late each wake-up is."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_S)
+        lags.append(time.perf_counter() - start - TICK_S)
+
+
+async def run(kind: str, payload: bytes, images: int, workers: int) -> dict:
+    """Decode `images` copies of the payload concurrently with one pool kind."""
+    pool = ImagePool(kind=kind, workers=workers)
+    await pool.warm_up()
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(pool.decode(payload) for _ in range(images)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await tick_task
+    pool.shutdown()
+
+    lags.sort()
+    return {
+        "pool": kind,
+        "wall_s": round(elapsed, 3),
+        "lag_p50_ms": round(lags[len(lags) // 2] * 1000, 2),
+        "lag_p99_ms": round(lags[min(len(lags) - 1, int(0.99 * len(lags)))] * 1000, 2),
+        "lag_max_ms": round(lags[-1] * 1000, 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--size", default="4000x3000")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    payload = make_jpeg(width, height)
+    print(f"{args.images} x {width}x{height} JPEG ({len(payload) / 1e6:.1f} MB)", file=sys.stderr)
+
+    results = []
+    for kind in IMAGE_POOL_KINDS[::-1]:
+        result = await run(kind, payload, args.images, args.workers)
+        results.append(result)
+        print(
+            f"{kind:>8}: wall {result['wall_s']:.2f}s  loop lag p50 {result['lag_p50_ms']}ms"
+            f"  p99 {result['lag_p99_ms']}ms  max {result['lag_max_ms']}ms",
+            file=sys.stderr,
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
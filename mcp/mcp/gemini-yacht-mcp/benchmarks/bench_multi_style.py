@@ -0,0 +1,96 @@
+"""
+Fan-out vs single-call benchmark for generate_all.
+
+Runs ``generate_all_styles`` in both generation modes and reports wall
+time, upstream calls and prompt/output tokens per run. Uses the fake
+backend (GEMINI_BACKEND=fake) unless another backend is configured, so it
+runs offline; set GEMINI_BACKEND=gemini and GEMINI_API_KEY to measure the
+real API.
+
+Usage:
+    python benchmarks/bench_multi_style.py [--runs 3] [--latency-ms 200]
+"""
+
+import os
+import sys
+import time
+import json
+import base64
+import asyncio
+import argparse
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_BACKEND", "fake")
+os.environ.setdefault("IMAGE_POOL", "thread")
+
+from PIL import Image  # noqa: E402
+
+from handlers.tools import GENERATION_MODES, generate_all_styles  # noqa: E402
+from utils.metrics import get_metrics  # noqa: E402
+
+
+def make_image() -> str:
+    """A small JPEG payload; image size does not matter to the fake backend."""
+    buffer = BytesIO()
+    Image.new("RGB", (1024, 768), (180, 170, 160)).save(buffer, format="JPEG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _counters() -> dict:
+    metrics = get_metrics()
+    return {
+        "calls": metrics.snapshot()["summaries"].get("upstream.latency_s", {}).get("count", 0),
+        "prompt_tokens": metrics.counter("upstream.prompt_tokens"),
+        "output_tokens": metrics.counter("upstream.output_tokens"),
+        "fallbacks": metrics.counter("multi_style.fallbacks"),
+    }
+
+
+async def run(mode: str, image: str, runs: int) -> dict:
+    """Run generate_all `runs` times in one mode and average the costs."""
+    before = _counters()
+    start = time.perf_counter()
+    for _ in range(runs):
+        await generate_all_styles(image, generation_mode=mode)
+    elapsed = time.perf_counter() - start
+    after = _counters()
+
+    return {
+        "mode": mode,
+        "wall_s": round(elapsed / runs, 3),
+        **{name: round((after[name] - before[name]) / runs, 1) for name in after},
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, help="Fake backend latency per call")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    if args.latency_ms is not None:
+        os.environ["FAKE_LATENCY_MS"] = str(args.latency_ms)
+
+    image = make_image()
+    print(f"backend={os.environ['GEMINI_BACKEND']}, {args.runs} run(s) per mode", file=sys.stderr)
+
+    results = []
+    for mode in GENERATION_MODES:
+        result = await run(mode, image, args.runs)
+        results.append(result)
+        print(
+            f"{mode:>11}: wall {result['wall_s']:.2f}s  calls {result['calls']}  "
+            f"prompt tokens {result['prompt_tokens']}  output tokens {result['output_tokens']}  "
+            f"fallbacks {result['fallbacks']}",
+            file=sys.stderr,
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
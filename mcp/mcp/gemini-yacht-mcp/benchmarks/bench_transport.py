@@ -0,0 +1,308 @@
+"""
+Benchmark of the Gemini transport settings against a local stand-in.
+
+Starts a stand-in of the GenerativeService (gRPC and REST generateContent
+with a fixed response latency) in a subprocess and drives it through the
+same clients the server builds (utils.transport) from a pool of
+concurrent threads, for several transport settings. Reports throughput,
+latency percentiles and how many connections each setting opened.
+
+The stand-in can limit concurrent HTTP/2 streams per connection
+(``--server-max-streams``, as API frontends do) and charge a cost for
+every new REST connection (``--connect-ms``, standing in for TCP and TLS
+set-up), which is where channel count and connection reuse show.
+
+Usage:
+    python benchmarks/bench_transport.py [--concurrency 32] [--requests 400]
+        [--latency-ms 200] [--connect-ms 100] [--server-max-streams 8]
+        [--settings rest-sdk-default,rest-pool-32,grpc-1,grpc-4]
+        [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+# Connection shutdown notices at the end of a run are expected
+os.environ.setdefault("GRPC_VERBOSITY", "ERROR")
+
+import grpc  # noqa: E402
+from google.ai.generativelanguage_v1beta.types import generative_service  # noqa: E402
+
+from utils.metrics import _percentile  # noqa: E402
+from utils.transport import TransportConfig, build_channel_pool  # noqa: E402
+
+MODEL = "stand-in-model"
+RESPONSE_TEXT = "Teak saloon with cream upholstery."
+
+# name: (transport, TransportConfig overrides)
+SETTINGS: dict[str, tuple[str, dict[str, Any]]] = {
+    "rest-sdk-default": ("rest", {"max_connections": 0}),
+    "rest-pool-8": ("rest", {"max_connections": 8}),
+    "rest-pool-32": ("rest", {"max_connections": 32}),
+    "grpc-1": ("grpc", {"channels": 1}),
+    "grpc-4": ("grpc", {"channels": 4}),
+}
+DEFAULT_SETTINGS = ",".join(SETTINGS)
+
+
+class StandIn:
+    """GenerativeService stand-in counting the connections it serves."""
+
+    def __init__(self, latency_s: float, connect_s: float, max_streams: int, workers: int):
+        self.latency_s = latency_s
+        self.connect_s = connect_s
+        self.max_streams = max_streams
+        self.workers = workers
+        self.rest_connections = 0
+        self.grpc_peers: set[str] = set()
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.rest_connections = 0
+            self.grpc_peers.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"rest": self.rest_connections, "grpc": len(self.grpc_peers)}
+
+    @staticmethod
+    def response() -> generative_service.GenerateContentResponse:
+        return generative_service.GenerateContentResponse(
+            candidates=[
+                {
+                    "content": {"parts": [{"text": RESPONSE_TEXT}], "role": "model"},
+                    "finish_reason": "STOP",
+                }
+            ],
+        )
+
+    def start_grpc(self) -> tuple[grpc.Server, int]:
+        def generate_content(request, context):
+            with self._lock:
+                self.grpc_peers.add(context.peer())
+            time.sleep(self.latency_s)
+            return self.response()
+
+        handler = grpc.method_handlers_generic_handler(
+            "google.ai.generativelanguage.v1beta.GenerativeService",
+            {
+                "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                    generate_content,
+                    request_deserializer=generative_service.GenerateContentRequest.deserialize,
+                    response_serializer=generative_service.GenerateContentResponse.serialize,
+                )
+            },
+        )
+        server = grpc.server(
+            ThreadPoolExecutor(max_workers=self.workers),
+            options=[("grpc.max_concurrent_streams", self.max_streams)],
+        )
+        server.add_generic_rpc_handlers((handler,))
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        return server, port
+
+    def start_rest(self) -> tuple[ThreadingHTTPServer, int]:
+        stand_in = self
+        body = generative_service.GenerateContentResponse.to_json(self.response()).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on,
+            # every reused connection would wait for a delayed ACK
+            disable_nagle_algorithm = True
+            counted = False
+
+            def reply(self, payload: bytes) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                # Control endpoints of the benchmark (not counted)
+                if self.path == "/reset":
+                    stand_in.reset()
+                self.reply(json.dumps(stand_in.stats()).encode())
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.counted:
+                    # First request on a new connection (one handler per
+                    # connection) pays the set-up cost
+                    self.counted = True
+                    with stand_in._lock:
+                        stand_in.rest_connections += 1
+                    time.sleep(stand_in.connect_s)
+                time.sleep(stand_in.latency_s)
+                self.reply(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, server.server_address[1]
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Run the stand-in until stdin closes (``--serve``)."""
+    stand_in = StandIn(
+        args.latency_ms / 1000,
+        args.connect_ms / 1000,
+        args.server_max_streams,
+        workers=max(args.concurrency, 8) * 2,
+    )
+    grpc_server, grpc_port = stand_in.start_grpc()
+    _, rest_port = stand_in.start_rest()
+    print(json.dumps({"grpc": grpc_port, "rest": rest_port}), flush=True)
+    sys.stdin.read()
+    grpc_server.stop(grace=None)
+
+
+def start_stand_in(args: argparse.Namespace) -> tuple[subprocess.Popen, dict[str, int]]:
+    """Start the stand-in subprocess and read its ports."""
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--serve",
+        f"--concurrency={args.concurrency}",
+        f"--latency-ms={args.latency_ms}",
+        f"--connect-ms={args.connect_ms}",
+        f"--server-max-streams={args.server_max_streams}",
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    return process, json.loads(process.stdout.readline())
+
+
+def control(rest_port: int, path: str) -> dict[str, int]:
+    """Reset or read the stand-in's connection counts."""
+    with urllib.request.urlopen(f"http://127.0.0.1:{rest_port}{path}") as response:
+        return json.loads(response.read())
+
+
+def run_setting(name: str, config: TransportConfig, args: argparse.Namespace, rest_port: int) -> dict:
+    """Drive one transport setting and summarize it."""
+    pool = build_channel_pool(config, "stand-in-key", MODEL)
+    # First call opens the connection; keep it out of the measurement
+    with pool.acquire() as model:
+        model.generate_content("warm up")
+    control(rest_port, "/reset")
+
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    def call(_: int) -> None:
+        start = time.perf_counter()
+        try:
+            with pool.acquire() as model:
+                model.generate_content("Describe the saloon.")
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e)[:120]}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(call, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    connections = control(rest_port, "/stats")[config.kind]
+    for model in pool.entries:
+        model._client.transport.close()
+
+    values = sorted(latencies)
+    return {
+        "setting": name,
+        "transport": config.kind,
+        "throughput_rps": round(len(values) / elapsed, 1),
+        "p50_ms": round(1000 * _percentile(values, 0.50), 1) if values else None,
+        "p95_ms": round(1000 * _percentile(values, 0.95), 1) if values else None,
+        "p99_ms": round(1000 * _percentile(values, 0.99), 1) if values else None,
+        "connections_opened": connections,
+        "pool_waits": pool.stats()["waits"],
+        "errors": len(errors),
+        "error_samples": errors[:3],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per setting")
+    parser.add_argument("--latency-ms", type=float, default=200, help="Stand-in response latency")
+    parser.add_argument("--connect-ms", type=float, default=100, help="Cost of a new REST connection")
+    parser.add_argument(
+        "--server-max-streams", type=int, default=8, help="Concurrent streams per gRPC connection"
+    )
+    parser.add_argument("--max-streams-per-channel", type=int, default=8, help="Client-side stream limit")
+    parser.add_argument("--settings", default=DEFAULT_SETTINGS, help=f"Any of: {DEFAULT_SETTINGS}")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    names = [name.strip() for name in args.settings.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SETTINGS]
+    if unknown:
+        parser.error(f"Unknown setting(s): {', '.join(unknown)}")
+
+    process, ports = start_stand_in(args)
+    print(
+        f"Stand-in: {args.latency_ms:g} ms latency, {args.connect_ms:g} ms per new REST connection, "
+        f"{args.server_max_streams} streams per gRPC connection; "
+        f"{args.concurrency} callers x {args.requests} requests",
+        file=sys.stderr,
+    )
+    print(
+        f"{'setting':<18}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'conns':>7}{'waits':>7}{'errors':>8}",
+        file=sys.stderr,
+    )
+    results = []
+    try:
+        for name in names:
+            kind, overrides = SETTINGS[name]
+            config = TransportConfig(
+                kind=kind,
+                endpoint=f"http://127.0.0.1:{ports[kind]}",
+                max_streams_per_channel=args.max_streams_per_channel,
+                **overrides,
+            )
+            result = run_setting(name, config, args, ports["rest"])
+            results.append(result)
+            print(
+                f"{name:<18}{result['throughput_rps']:>8}{result['p50_ms']!s:>9}"
+                f"{result['p95_ms']!s:>9}{result['p99_ms']!s:>9}"
+                f"{result['connections_opened']:>7}{result['pool_waits']:>7}{result['errors']:>8}",
+                file=sys.stderr,
+            )
+            for sample in result["error_samples"]:
+                print(f"    {sample}", file=sys.stderr)
+    finally:
+        process.stdin.close()
+        process.wait(10)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Shared setup for the pytest-benchmark micro-benchmarks.
+
+Each benchmark's fastest round (the least noisy statistic for
+micro-benchmarks) is compared with the time recorded for the current
+machine; a benchmark slower than its baseline by more than the regression
+threshold (``--regression-threshold``, default 0.25 = 25%) fails the
+session. Timings do not carry over between machines, so baselines are
+kept out of the repository, one file per machine (host name, architecture
+and Python version) under ``benchmarks/.benchmarks/`` or
+BENCH_BASELINE_DIR. Without a baseline for the current machine nothing is
+compared; record one with ``--update-baseline``.
+
+Usage:
+    pytest benchmarks/
+    pytest benchmarks/ --regression-threshold 0.1
+    pytest benchmarks/ --update-baseline
+"""
+
+import os
+import sys
+import json
+import re
+import platform
+import subprocess
+from typing import Optional
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+BASELINE_DIR = os.getenv("BENCH_BASELINE_DIR") or os.path.join(BENCH_DIR, ".benchmarks")
+DEFAULT_THRESHOLD = 0.25
+
+# Fastest round of each benchmark in this session, keyed by benchmark name
+_results: dict[str, float] = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("regression", "benchmark regression check")
+    group.addoption(
+        "--regression-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed slowdown over the baseline (default: 0.25 = 25%%)",
+    )
+    group.addoption(
+        "--update-baseline",
+        action="store_true",
+        help="Record this run's times as the baseline of this machine",
+    )
+
+
+@pytest.fixture(autouse=True)
+def _record_time(request):
+    """Collect the fastest round of each benchmark after it has run."""
+    yield
+    fixture = request.node.funcargs.get("benchmark")
+    stats = getattr(fixture, "stats", None)
+    # No stats when benchmarks are disabled (--benchmark-disable)
+    if stats is not None:
+        _results[request.node.name] = stats.stats.min
+
+
+def _machine_key() -> str:
+    """Identify the machine the timings belong to."""
+    major, minor, _ = platform.python_version_tuple()
+    key = f"{platform.node() or 'unknown'}-{platform.machine()}-py{major}.{minor}"
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+
+
+def _baseline_path() -> str:
+    return os.path.join(BASELINE_DIR, f"baseline-{_machine_key()}.json")
+
+
+def _load_baseline() -> Optional[dict]:
+    """Baseline of the current machine, None if none was recorded."""
+    path = _baseline_path()
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(baseline: dict, threshold: float) -> list[tuple[str, Optional[float], float, str]]:
+    """(name, baseline time, current time, verdict) for each measured benchmark."""
+    rows = []
+    for name, current in sorted(_results.items()):
+        recorded = baseline["benchmarks"].get(name)
+        if recorded is None:
+            verdict = "new"
+        elif current > recorded * (1 + threshold):
+            verdict = "REGRESSION"
+        else:
+            verdict = "ok"
+        rows.append((name, recorded, current, verdict))
+    return rows
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Update the baseline, or fail the session on regressions."""
+    if not _results:
+        return
+    config = session.config
+
+    if config.getoption("update_baseline"):
+        baseline = _load_baseline() or {"benchmarks": {}}
+        baseline["benchmarks"].update(_results)
+        baseline["recorded"] = {
+            "commit": _git_commit(),
+            "machine": _machine_key(),
+            "python": platform.python_version(),
+            "statistic": "min_s",
+        }
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(_baseline_path(), "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return
+
+    baseline = _load_baseline()
+    if baseline is None:
+        return
+    rows = _compare(baseline, config.getoption("regression_threshold"))
+    if any(verdict == "REGRESSION" for *_, verdict in rows) and session.exitstatus == 0:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    """Print each benchmark's time against its baseline."""
+    if not _results:
+        return
+    if config.getoption("update_baseline"):
+        terminalreporter.write_line(f"Recorded {len(_results)} baseline(s) in {_baseline_path()}")
+        return
+
+    baseline = _load_baseline()
+    if baseline is None:
+        terminalreporter.write_line(
+            f"No baseline recorded for {_machine_key()}; comparison skipped "
+            "(record one with --update-baseline)"
+        )
+        return
+    threshold = config.getoption("regression_threshold")
+    terminalreporter.section(f"baseline comparison (threshold {threshold:.0%})")
+    for name, recorded, current, verdict in _compare(baseline, threshold):
+        change = f"{current / recorded - 1:+7.1%}" if recorded else "    n/a"
+        terminalreporter.write_line(
+            f"{verdict:>10}  {change}  {current * 1e3:10.3f}ms  {name}",
+            red=verdict == "REGRESSION",
+        )
+
@@ -0,0 +1,350 @@
+"""
+Load test for the MCP server over a real transport.
+
+Launches ``main.py`` as a subprocess (stdio, or streamable HTTP with
+``--transport http``), connects with the MCP client SDK and drives a
+weighted mix of analyze_structure / generate_style / generate_all calls
+from a closed loop of concurrent workers. Each concurrency level in the
+sweep runs for a fixed duration and reports throughput, latency
+percentiles, error rate and the server's resident memory (from
+``server_metrics``).
+
+The server uses the fake backend (GEMINI_BACKEND=fake) unless
+``--backend gemini`` is given, so runs are offline and reproducible;
+FAKE_LATENCY_MS / FAKE_MS_PER_OUTPUT_TOKEN shape the simulated upstream.
+Requests use a pool of distinct images so near-duplicate reuse does not
+short-circuit analyses. Write results with ``--json`` to compare commits.
+
+Usage:
+    python benchmarks/loadtest.py [--transport stdio|http] [--url URL]
+        [--concurrency 1,4,16] [--duration 10]
+        [--mix analyze_structure=6,generate_style=3,generate_all=1]
+        [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from io import BytesIO
+from contextlib import AsyncExitStack
+from typing import Any, Optional
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+from mcp import ClientSession, StdioServerParameters  # noqa: E402
+from mcp.client.stdio import stdio_client  # noqa: E402
+from mcp.client.streamable_http import streamable_http_client  # noqa: E402
+
+from models.schemas import YachtStyle  # noqa: E402
+from utils.metrics import _percentile  # noqa: E402
+
+TOOLS = ("analyze_structure", "generate_style", "generate_all")
+DEFAULT_MIX = "analyze_structure=6,generate_style=3,generate_all=1"
+
+STRUCTURE_DESCRIPTION = (
+    "Main saloon with curved hull walls, a 2.3 m ceiling, an L-shaped sofa "
+    "against the aft bulkhead and large hull windows on both sides."
+)
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """Parse "tool=weight,..." into a weight per tool."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in TOOLS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown tool '{name}' in mix. Expected one of: {', '.join(TOOLS)}"
+            )
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def make_images(count: int, size: tuple[int, int], seed: int) -> list[str]:
+    """
+    Distinct JPEG payloads with different perceptual hashes.
+
+    Each image is a random 8x8 colour grid scaled up, so their pHashes
+    differ and every request is a cache miss.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        grid = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+        image = Image.fromarray(grid, "RGB").resize(size, Image.Resampling.BILINEAR)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=85)
+        images.append(base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+def tool_arguments(tool: str, image: str, rng: random.Random) -> dict[str, Any]:
+    """Arguments for one call of a tool."""
+    if tool == "generate_style":
+        return {
+            "image": image,
+            "structure_description": STRUCTURE_DESCRIPTION,
+            "style": rng.choice([s.value for s in YachtStyle]),
+        }
+    return {"image": image}
+
+
+def result_error(result: Any) -> Optional[str]:
+    """Error message of a tool result, or None if the call succeeded."""
+    text = next((c.text for c in result.content if getattr(c, "text", None)), "")
+    if result.isError:
+        return text or "tool error"
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(payload, dict) and "error" in payload:
+        return str(payload["error"])
+    return None
+
+
+async def call_json(session: ClientSession, tool: str, arguments: dict) -> dict:
+    """Call a tool and decode its JSON text result."""
+    result = await session.call_tool(tool, arguments)
+    return json.loads(result.content[0].text)
+
+
+def server_env(args: argparse.Namespace) -> dict[str, str]:
+    """Environment for the server subprocess."""
+    env = dict(os.environ)
+    env["GEMINI_BACKEND"] = args.backend
+    env.setdefault("LOG_LEVEL", "WARNING")
+    if args.latency_ms is not None:
+        env["FAKE_LATENCY_MS"] = str(args.latency_ms)
+    if args.transport == "http":
+        env["MCP_TRANSPORT"] = "streamable-http"
+        env["MCP_PORT"] = str(args.port)
+    return env
+
+
+async def wait_for_port(host: str, port: int, process: subprocess.Popen, timeout: float) -> None:
+    """Wait until the HTTP server accepts connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            await writer.wait_closed()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Server did not listen on {host}:{port} within {timeout}s")
+
+
+async def connect(args: argparse.Namespace, stack: AsyncExitStack) -> ClientSession:
+    """Start (or attach to) the server and open an initialized session."""
+    if args.transport == "stdio":
+        params = StdioServerParameters(
+            command=sys.executable,
+            args=[os.path.join(PACKAGE_DIR, "main.py")],
+            env=server_env(args),
+            cwd=PACKAGE_DIR,
+        )
+        read, write = await stack.enter_async_context(stdio_client(params, errlog=args.errlog))
+    else:
+        url = args.url
+        if url is None:
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(PACKAGE_DIR, "main.py")],
+                env=server_env(args),
+                cwd=PACKAGE_DIR,
+                stdout=subprocess.DEVNULL,
+                stderr=args.errlog,
+            )
+            stack.callback(process.wait, 10)
+            stack.callback(process.terminate)
+            await wait_for_port("127.0.0.1", args.port, process, timeout=30)
+            url = f"http://127.0.0.1:{args.port}/mcp"
+        read, write, _ = await stack.enter_async_context(streamable_http_client(url))
+
+    session = await stack.enter_async_context(ClientSession(read, write))
+    await session.initialize()
+    return session
+
+
+def summarize(latencies: list[float]) -> dict[str, Any]:
+    """Latency summary in milliseconds."""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 1),
+        "p50_ms": round(1000 * _percentile(values, 0.50), 1),
+        "p95_ms": round(1000 * _percentile(values, 0.95), 1),
+        "p99_ms": round(1000 * _percentile(values, 0.99), 1),
+        "max_ms": round(1000 * values[-1], 1),
+    }
+
+
+async def run_level(
+    session: ClientSession,
+    concurrency: int,
+    duration: float,
+    mix: dict[str, float],
+    images: list[str],
+    seed: int,
+) -> dict[str, Any]:
+    """
+    Drive the server with `concurrency` closed-loop workers for `duration` seconds.
+
+    Returns:
+        Per-level results: throughput, latency percentiles overall and per
+        tool, error counts and sample error messages
+    """
+    tools, weights = list(mix), list(mix.values())
+    latencies: dict[str, list[float]] = {tool: [] for tool in tools}
+    errors: dict[str, int] = {tool: 0 for tool in tools}
+    samples: list[str] = []
+    stop_at = time.monotonic() + duration
+
+    async def worker(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        while time.monotonic() < stop_at:
+            tool = rng.choices(tools, weights)[0]
+            arguments = tool_arguments(tool, rng.choice(images), rng)
+            start = time.perf_counter()
+            try:
+                error = result_error(await session.call_tool(tool, arguments))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            latencies[tool].append(time.perf_counter() - start)
+            if error:
+                errors[tool] += 1
+                if len(samples) < 5:
+                    samples.append(f"{tool}: {error}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    total_errors = sum(errors.values())
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "requests": len(all_latencies),
+        "errors": total_errors,
+        "error_rate": round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+        "throughput_rps": round(len(all_latencies) / elapsed, 2),
+        "latency": summarize(all_latencies),
+        "per_tool": {
+            tool: {**summarize(latencies[tool]), "errors": errors[tool]} for tool in tools
+        },
+        "error_samples": samples,
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Commit of the working tree, for comparing results between commits."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PACKAGE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _mb(value: Optional[int]) -> str:
+    return f"{value / 2**20:.0f}MB" if value else "n/a"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--transport", choices=("stdio", "http"), default="stdio")
+    parser.add_argument("--url", help="Attach to a running streamable HTTP server instead")
+    parser.add_argument("--port", type=int, default=8765, help="Port for a spawned HTTP server")
+    parser.add_argument("--backend", default="fake", help="GEMINI_BACKEND of the spawned server")
+    parser.add_argument("--latency-ms", type=float, help="Fake backend latency per call")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1, 4, 16],
+        help="Comma-separated concurrency levels",
+    )
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--images", type=int, default=32, help="Distinct images in the pool")
+    parser.add_argument(
+        "--image-size",
+        type=lambda s: tuple(int(x) for x in s.lower().split("x")),
+        default=(1024, 768),
+        help="WIDTHxHEIGHT of request images",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server-log", help="Write server stderr to this file")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    images = make_images(args.images, args.image_size, args.seed)
+    target = args.url or f"spawned server ({args.transport}, backend={args.backend})"
+    print(f"Load test against {target}, mix {args.mix}", file=sys.stderr)
+
+    levels = []
+    with open(args.server_log or os.devnull, "w") as errlog:
+        args.errlog = errlog
+        async with AsyncExitStack() as stack:
+            session = await connect(args, stack)
+            for concurrency in args.concurrency:
+                level = await run_level(
+                    session, concurrency, args.duration, args.mix, images, args.seed
+                )
+                level["process"] = (await call_json(session, "server_metrics", {})).get("process")
+                levels.append(level)
+
+                rss = level["process"] or {}
+                print(
+                    f"c={concurrency:>3}: {level['throughput_rps']:7.2f} req/s  "
+                    f"p50 {level['latency'].get('p50_ms', 0):7.1f}ms  "
+                    f"p95 {level['latency'].get('p95_ms', 0):7.1f}ms  "
+                    f"p99 {level['latency'].get('p99_ms', 0):7.1f}ms  "
+                    f"errors {level['error_rate']:.1%}  rss {_mb(rss.get('rss_bytes'))}",
+                    file=sys.stderr,
+                )
+                for sample in level["error_samples"]:
+                    print(f"       {sample}", file=sys.stderr)
+
+    if args.json:
+        results = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "config": {
+                "transport": args.transport,
+                "backend": args.backend,
+                "latency_ms": args.latency_ms,
+                "duration_s": args.duration,
+                "mix": args.mix,
+                "images": args.images,
+                "image_size": list(args.image_size),
+            },
+            "levels": levels,
+        }
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
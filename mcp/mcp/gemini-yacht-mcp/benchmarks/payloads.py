@@ -0,0 +1,89 @@
+"""
+Realistic inputs for the micro-benchmarks.
+
+Generated deterministically so runs are comparable with the recorded
+baselines.
+"""
+
+import base64
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+
+def make_analysis_text(tokens: int) -> str:
+    """
+    A realistic structured analysis of roughly `tokens` tokens.
+
+    Mirrors what the analysis prompt asks for: a long structure section,
+    a bulleted and numbered feature list, geometry and lighting sections.
+    Sections grow proportionally (about four characters per token).
+    """
+    rng = np.random.default_rng(tokens)
+    rooms = ["saloon", "galley", "master cabin", "bridge deck", "guest cabin", "sky lounge"]
+    materials = ["teak", "walnut", "brushed steel", "travertine", "leather", "oak", "glass"]
+    elements = ["sofa", "ceiling panel", "window", "bulkhead", "staircase", "bar", "bed", "desk"]
+
+    def sentence() -> str:
+        return (
+            f"The {rng.choice(rooms)} has a {rng.choice(materials)} {rng.choice(elements)} "
+            f"set {rng.integers(1, 9)}.{rng.integers(0, 9)} m from the "
+            f"{rng.choice(['aft', 'forward', 'port', 'starboard'])} "
+            f"{rng.choice(elements)}, following the curve of the hull."
+        )
+
+    def paragraphs(chars: int, sentences: int) -> str:
+        """Paragraphs of `sentences` sentences until `chars` characters."""
+        parts, length = [], 0
+        while length < chars:
+            parts.append(" ".join(sentence() for _ in range(sentences)))
+            length += len(parts[-1]) + 2
+        return "\n\n".join(parts)
+
+    def features(chars: int) -> list[str]:
+        """Bulleted and numbered feature lines until `chars` characters."""
+        lines, length = [], 0
+        while length < chars or len(lines) < 5:
+            numbered = len(lines) % 3 == 0
+            bullet = f"{len(lines) % 9 + 1}." if numbered else rng.choice(["-", "*", "•"])
+            lines.append(
+                f"{bullet} {rng.choice(materials).title()} {rng.choice(elements)} "
+                f"in the {rng.choice(rooms)}"
+            )
+            length += len(lines[-1]) + 1
+        return lines
+
+    budget = tokens * 4
+    return "\n".join(
+        [
+            "## Architectural Structure",
+            paragraphs(budget * 55 // 100, 6),
+            "",
+            "## Key Features",
+            *features(budget * 20 // 100),
+            "",
+            "## Geometry & Layout",
+            paragraphs(budget * 12 // 100, 5),
+            "",
+            "## Lighting Analysis",
+            paragraphs(budget * 12 // 100, 5),
+        ]
+    )
+
+def make_image(size: tuple[int, int], seed: int = 0) -> Image.Image:
+    """A photo-like RGB image: smooth gradients plus sensor noise."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    base = np.stack([160 + 60 * x + 0 * y, 140 + 50 * y + 0 * x, 120 + 40 * x * y], axis=-1)
+    noise = rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), "RGB")
+
+
+def encode_image(image: Image.Image, format: str) -> str:
+    """Base64 payload of an image in the given format."""
+    buffer = BytesIO()
+    image.save(buffer, format=format)
+    return base64.b64encode(buffer.getvalue()).decode()
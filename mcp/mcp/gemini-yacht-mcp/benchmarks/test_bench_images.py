@@ -0,0 +1,34 @@
+"""Micro-benchmarks for base64 payload validation and image decoding."""
+
+import os
+import base64
+
+import pytest
+
+from models.schemas import AnalyzeYachtInput
+from utils.gemini_client import GeminiClient
+from payloads import encode_image, make_image
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize("size_mb", [1, 5, 20])
+def test_validate_base64(benchmark, size_mb):
+    # Validation only decodes base64; the bytes need not be an image
+    payload = base64.b64encode(os.urandom(size_mb * MB * 3 // 4)).decode()
+    model = benchmark(AnalyzeYachtInput, image=payload)
+    assert len(model.pop_image_bytes()) == size_mb * MB * 3 // 4
+
+
+def test_validate_base64_data_url(benchmark):
+    payload = "data:image/jpeg;base64," + base64.b64encode(os.urandom(5 * MB * 3 // 4)).decode()
+    model = benchmark(AnalyzeYachtInput, image=payload)
+    assert model.pop_image_bytes()
+
+
+@pytest.mark.parametrize("format", ["JPEG", "PNG", "WEBP"])
+@pytest.mark.parametrize("side", [512, 2048])
+def test_decode_base64_image(benchmark, format, side):
+    payload = encode_image(make_image((side, side * 3 // 4)), format)
+    image = benchmark(GeminiClient.decode_base64_image, payload)
+    assert image.size == (side, side * 3 // 4)
@@ -0,0 +1,24 @@
+"""Micro-benchmarks for parsing Gemini analysis responses."""
+
+import pytest
+
+from handlers.tools import _extract_list_items, _parse_analysis_response
+from payloads import make_analysis_text
+
+# Realistic analysis lengths in tokens
+ANALYSIS_TOKENS = [2000, 4000, 8000]
+
+
+@pytest.mark.parametrize("tokens", ANALYSIS_TOKENS)
+def test_parse_analysis_response(benchmark, tokens):
+    text = make_analysis_text(tokens)
+    result = benchmark(_parse_analysis_response, text)
+    assert len(result.key_features) > 5
+    assert result.lighting_analysis and result.geometry_notes
+
+
+@pytest.mark.parametrize("tokens", ANALYSIS_TOKENS)
+def test_extract_list_items(benchmark, tokens):
+    lines = make_analysis_text(tokens).split("\n")
+    items = benchmark(_extract_list_items, lines)
+    assert len(items) > 5
@@ -0,0 +1,40 @@
+"""Micro-benchmarks for prompt formatting and output serialization."""
+
+import pytest
+
+from models.schemas import GenerateAllStylesOutput, GenerateStyleOutput, YachtStyle
+from utils.prompts import get_style_prompt
+from payloads import encode_image, make_analysis_text, make_image
+
+
+@pytest.mark.parametrize("style", [YachtStyle.FUTURISTIC, YachtStyle.MEDITERRANEAN])
+def test_get_style_prompt(benchmark, style):
+    description = make_analysis_text(2000)
+    prompt = benchmark(get_style_prompt, style, description)
+    assert description in prompt
+
+
+@pytest.fixture(scope="module")
+def all_styles_output() -> GenerateAllStylesOutput:
+    image = encode_image(make_image((1024, 768)), "JPEG")
+    description = make_analysis_text(1000)
+    return GenerateAllStylesOutput(
+        structure_analysis=make_analysis_text(2000),
+        styles={
+            style.value: GenerateStyleOutput(
+                generated_image=image, style=style, description=description
+            )
+            for style in YachtStyle
+        },
+    )
+
+
+@pytest.mark.parametrize("mode", ["python", "json"])
+def test_generate_all_model_dump(benchmark, all_styles_output, mode):
+    dumped = benchmark(all_styles_output.model_dump, mode=mode)
+    assert len(dumped["styles"]) == len(YachtStyle)
+
+
+def test_generate_all_model_dump_json(benchmark, all_styles_output):
+    serialized = benchmark(all_styles_output.model_dump_json)
+    assert serialized.startswith("{")
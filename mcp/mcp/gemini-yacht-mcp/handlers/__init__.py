@@ -6,6 +6,7 @@ This module contains tool handlers for yacht interior design operations.
 
 from .tools import (
     analyze_yacht_structure,
+    analyze_yacht_room,
     generate_yacht_style,
     generate_all_styles,
     list_available_styles,
@@ -13,6 +14,7 @@ from .tools import (
 
 __all__ = [
     "analyze_yacht_structure",
+    "analyze_yacht_room",
     "generate_yacht_style",
     "generate_all_styles",
     "list_available_styles",
@@ -1,39 +1,115 @@
 """
 Tool handlers for Gemini Yacht MCP server.
 
-Implements the four main tools:
+Implements the main tools:
 1. analyze_yacht_structure - Analyze yacht interior architecture
-2. generate_yacht_style - Generate single style transformation
-3. generate_all_styles - Generate all 5 style variations
-4. list_available_styles - List available design styles
+2. analyze_yacht_room - Analyze several photos of one space together
+3. generate_yacht_style - Generate single style transformation
+4. generate_all_styles - Generate all 5 style variations
+5. list_available_styles - List available design styles
+6. find_similar_interiors - Search previously analyzed interiors
 """
 
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import functools
 import logging
-from typing import Dict, Any
+from dataclasses import asdict
+from typing import Dict, Any, Callable
 
 from models.schemas import (
     YachtStyle,
     AnalyzeYachtInput,
     AnalyzeYachtOutput,
+    AnalyzeRoomInput,
     GenerateStyleInput,
     GenerateStyleOutput,
     GenerateAllStylesInput,
     GenerateAllStylesOutput,
     StyleInfo,
+    ArtifactRef,
+)
+from utils.gemini_client import (
+    get_gemini_client,
+    estimate_image_tokens,
+    pixel_tier,
+    GeminiClientError,
+    RejectedError,
 )
-from utils.gemini_client import get_gemini_client, GeminiClientError
 from utils.prompts import (
     ANALYSIS_PROMPT,
+    ANALYSIS_SEED_PROMPT,
+    ROOM_ANALYSIS_PROMPT,
+    TILE_ANALYSIS_PROMPT,
+    get_batch_style_prompt,
+    get_multi_style_prompt,
     get_style_prompt,
+    PROMPT_VERSION,
     STYLE_DESCRIPTIONS,
 )
+from utils.artifacts import (
+    OUTPUT_MODE_INLINE,
+    get_artifact_store,
+    preview_text,
+    resolve_output_mode,
+    should_externalize,
+    sniff_generated_image,
+)
+from utils.batcher import get_batcher
+from utils.metrics import get_metrics
+from utils.phash import (
+    PHASH_MODE_OFF,
+    PHASH_MODE_RETURN,
+    dhash,
+    get_perceptual_index,
+    get_phash_max_distance,
+    get_phash_mode,
+    phash,
+)
+from utils.result_store import (
+    KIND_ANALYSIS,
+    KIND_STYLE,
+    get_result_store,
+    image_digest,
+    normalize_text,
+    result_key,
+    text_digest,
+)
+from utils.vector_index import analysis_text, get_vector_index_async
+from utils.speculation import get_prefetcher
+from utils.context import current_caller, shared_by
+from utils.imaging import read_image_size
+from utils.tiling import (
+    TILING_OFF,
+    merge_analyses,
+    resolve_tiling,
+    should_tile,
+    tile_boxes,
+)
 
 logger = logging.getLogger(__name__)
 
+# Output token limit and sampling temperature of style descriptions
+_STYLE_MAX_TOKENS = 2048
+_STYLE_TEMPERATURE = 0.7
+
+# How generate_all produces its styles
+GENERATION_FANOUT = "fanout"
+GENERATION_SINGLE_CALL = "single_call"
+GENERATION_MODES = (GENERATION_FANOUT, GENERATION_SINGLE_CALL)
+
+# A complete "key": "string value" member of a (possibly truncated) JSON object
+_JSON_STRING_MEMBER = re.compile(r'"(\w+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
 
 async def analyze_yacht_structure(
     image: str,
     options: Dict[str, str] | None = None,
+    tiling: str | None = None,
 ) -> Dict[str, Any]:
     """
     Analyze yacht interior structure and architecture.
@@ -44,6 +120,8 @@ async def analyze_yacht_structure(
     Args:
         image: Base64-encoded yacht interior image
         options: Optional analysis parameters (e.g., {"detail_level": "high"})
+        tiling: "off", "on" or "auto" (default: ANALYSIS_TILING); large images
+            are analyzed as overlapping tiles whose results are merged
 
     Returns:
         Dictionary with structure analysis:
@@ -58,52 +136,145 @@ async def analyze_yacht_structure(
     """
     try:
         # Validate input
-        input_data = AnalyzeYachtInput(image=image, options=options)
+        tiling_mode = resolve_tiling(tiling)
+        # Base64 decoding of large payloads runs in a worker thread
+        input_data = await asyncio.to_thread(AnalyzeYachtInput, image=image, options=options)
 
         # Get Gemini client
         client = get_gemini_client()
 
-        # Decode image
-        pil_image = client.decode_base64_image(input_data.image)
+        data = input_data.pop_image_bytes()
+        digest = await _image_digest(data)
 
-        # Customize prompt if options provided
-        analysis_prompt = ANALYSIS_PROMPT
-        if options:
-            if "focus_areas" in options:
-                analysis_prompt += f"\n\nPay special attention to: {options['focus_areas']}"
-            if "detail_level" in options:
-                analysis_prompt += f"\n\nDetail level: {options['detail_level']}"
+        # Decode off the event loop, and only when the pixels are needed;
+        # the encoded buffer is released afterwards
+        pil_image = None
+        output = await _stored_analysis(client, data, digest, options, tiling_mode)
+        if output is None:
+            pil_image = await client.decode_image_async(data)
+            output = await _analyze_pil_image(client, pil_image, options, tiling_mode, digest)
+        targets = await _speculation_targets(client, digest, output.description)
+        if targets and pil_image is None:
+            pil_image = await client.decode_image_async(data)
+        del data
 
-        # Call Gemini API
-        logger.info("Starting yacht structure analysis")
-        raw_analysis = await client.analyze_image(
-            pil_image,
-            analysis_prompt,
-            options={"temperature": 0.3, "max_tokens": 4096},
-        )
-
-        # Parse the response into structured output
-        # For simplicity, we'll extract sections from the text response
-        output = _parse_analysis_response(raw_analysis)
+        if targets:
+            _speculate_styles(client, pil_image, digest, output.description, targets)
 
         logger.info("Yacht structure analysis completed successfully")
         return output.model_dump()
 
     except ValueError as e:
-        logger.error(f"Input validation error: {str(e)}")
+        logger.error("Input validation error: %s", e)
         raise
     except GeminiClientError as e:
-        logger.error(f"Gemini API error during analysis: {str(e)}")
+        logger.error("Gemini API error during analysis: %s", e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error during analysis: {str(e)}")
+        logger.error("Unexpected error during analysis: %s", e)
         raise GeminiClientError(f"Analysis failed: {str(e)}")
 
 
+async def analyze_yacht_room(
+    images: list[str],
+    options: Dict[str, str] | None = None,
+) -> Dict[str, Any]:
+    """
+    Analyze several photos of the same yacht interior space together.
+
+    The photos are sent in one multimodal request, or in a few balanced
+    groups of at most ROOM_MAX_IMAGES_PER_CALL photos analyzed concurrently
+    and merged. The result is a single analysis that can be passed to
+    ``generate_yacht_style`` as the structure description.
+
+    Args:
+        images: Base64-encoded photos of one room (at most ROOM_MAX_IMAGES)
+        options: Optional analysis parameters (e.g., {"detail_level": "high"})
+
+    Returns:
+        Dictionary with the merged structure analysis (same fields as
+        ``analyze_yacht_structure``)
+
+    Raises:
+        ValueError: If input validation fails
+        GeminiClientError: If API call fails
+    """
+    try:
+        # Base64 decoding of large payloads runs in a worker thread
+        input_data = await asyncio.to_thread(AnalyzeRoomInput, images=images, options=options)
+
+        client = get_gemini_client()
+
+        # Decode all photos off the event loop
+        pil_images = await asyncio.gather(
+            *(client.decode_image_async(data) for data in input_data.pop_images_bytes())
+        )
+
+        groups = _photo_groups(list(pil_images), _room_images_per_call())
+        analysis_prompt = _build_analysis_prompt(options)
+        logger.info(
+            "Starting room analysis of %s photos in %s call(s)", len(pil_images), len(groups)
+        )
+
+        async def analyze_group(group: list) -> AnalyzeYachtOutput:
+            prompt = analysis_prompt
+            if len(group) > 1:
+                prompt = ROOM_ANALYSIS_PROMPT.format(count=len(group)) + analysis_prompt
+            raw_analysis = await client.analyze_images(
+                group,
+                prompt,
+                options={"temperature": 0.3, "max_tokens": 4096},
+                operation="room_analysis",
+            )
+            return _parse_analysis_response(raw_analysis)
+
+        analyses = await asyncio.gather(*(analyze_group(group) for group in groups))
+
+        metrics = get_metrics()
+        metrics.increment("room.analyses")
+        metrics.increment("room.photos", len(pil_images))
+        metrics.increment("room.calls", len(groups))
+
+        output = merge_analyses(list(analyses))
+        await _index_analysis(None, output)
+
+        logger.info("Room analysis completed successfully")
+        return output.model_dump()
+
+    except ValueError as e:
+        logger.error("Input validation error: %s", e)
+        raise
+    except GeminiClientError as e:
+        logger.error("Gemini API error during room analysis: %s", e)
+        raise
+    except Exception as e:
+        logger.error("Unexpected error during room analysis: %s", e)
+        raise GeminiClientError(f"Room analysis failed: {str(e)}")
+
+
+def _room_images_per_call() -> int:
+    """Maximum photos per upstream call (ROOM_MAX_IMAGES_PER_CALL, default: 4)."""
+    return int(os.getenv("ROOM_MAX_IMAGES_PER_CALL", "4"))
+
+
+def _photo_groups(photos: list, per_call: int) -> list[list]:
+    """Split photos into the fewest groups of at most per_call, balanced in size."""
+    count = math.ceil(len(photos) / max(1, per_call))
+    size, extra = divmod(len(photos), count)
+    groups, start = [], 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(photos[start:end])
+        start = end
+    return groups
+
+
 async def generate_yacht_style(
     image: str,
     structure_description: str,
     style: str,
+    output_mode: str | None = None,
+    regenerate: bool = False,
 ) -> Dict[str, Any]:
     """
     Generate yacht interior in specified style.
@@ -115,12 +286,16 @@ async def generate_yacht_style(
         image: Base64-encoded yacht interior image
         structure_description: Architectural description from analysis
         style: Target style (futuristic, artdeco, biophilic, mediterranean, cyberpunk)
+        output_mode: "inline", "reference" or "auto" (default: ARTIFACT_OUTPUT_MODE)
+        regenerate: Skip stored outputs and generate a new one (stored as
+            another variant)
 
     Returns:
         Dictionary with generation result:
-        - generated_image: Base64-encoded transformed image
+        - generated_image: Base64-encoded transformed image (or artifact URI)
         - style: Applied style name
-        - description: Description of the transformation
+        - description: Description of the transformation (or preview)
+        - artifacts: Artifact references for externalized fields
 
     Raises:
         ValueError: If input validation fails
@@ -128,7 +303,9 @@ async def generate_yacht_style(
     """
     try:
         # Validate input
-        input_data = GenerateStyleInput(
+        mode = resolve_output_mode(output_mode)
+        input_data = await asyncio.to_thread(
+            GenerateStyleInput,
             image=image,
             structure_description=structure_description,
             style=YachtStyle(style),
@@ -137,63 +314,70 @@ async def generate_yacht_style(
         # Get Gemini client
         client = get_gemini_client()
 
-        # Decode image
-        pil_image = client.decode_base64_image(input_data.image)
-
-        # Get style-specific prompt
-        generation_prompt = get_style_prompt(
-            input_data.style,
-            input_data.structure_description,
-        )
-
-        # Call Gemini API for generation
-        logger.info(f"Generating yacht design in {input_data.style.value} style")
+        data = input_data.pop_image_bytes()
+        digest = await _image_digest(data)
 
-        # NOTE: Current implementation uses Gemini for description
-        # In production, replace with actual image generation API (Imagen 3, etc.)
-        generated_description = await client.analyze_image(
-            pil_image,
-            generation_prompt,
-            options={"temperature": 0.7, "max_tokens": 2048},
-        )
-
-        # For now, return description instead of actual image
-        # In production: Call image generation API here
-        output = GenerateStyleOutput(
-            generated_image=f"[DESCRIPTION]\n{generated_description}",
-            style=input_data.style,
-            description=generated_description,
-        )
+        description = input_data.structure_description
+        get_prefetcher().record(input_data.style)
+        output = None
+        if regenerate:
+            get_metrics().increment("style_cache.regenerated")
+        else:
+            output = await _stored_style(client, digest, description, input_data.style, data)
+        if output is None:
+            # Decode only when generating, off the event loop; the encoded
+            # buffer is released afterwards
+            pil_image = await client.decode_image_async(data)
+            del data
+            output = await _generate_style_maybe_batched(
+                client, pil_image, description, input_data.style
+            )
+            await _store_style(client, digest, description, output)
+        output = await _apply_output_mode(output, mode)
 
-        logger.info(f"Style generation for {input_data.style.value} completed")
-        return output.model_dump()
+        logger.info("Style generation for %s completed", input_data.style.value)
+        return output.model_dump(exclude_none=True)
 
     except ValueError as e:
-        logger.error(f"Input validation error: {str(e)}")
+        logger.error("Input validation error: %s", e)
         raise
     except GeminiClientError as e:
-        logger.error(f"Gemini API error during generation: {str(e)}")
+        logger.error("Gemini API error during generation: %s", e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error during generation: {str(e)}")
+        logger.error("Unexpected error during generation: %s", e)
         raise GeminiClientError(f"Generation failed: {str(e)}")
 
 
-async def generate_all_styles(image: str) -> Dict[str, Any]:
+async def generate_all_styles(
+    image: str,
+    output_mode: str | None = None,
+    progress: Callable[[str, str], None] | None = None,
+    generation_mode: str | None = None,
+) -> Dict[str, Any]:
     """
     Generate yacht interior in ALL available styles.
 
     Performs complete workflow:
     1. Analyzes yacht structure
-    2. Generates transformations for all 5 styles
+    2. Generates transformations for all 5 styles, either concurrently with
+       one call per style ("fanout") or in one call returning a JSON object
+       keyed by style ("single_call"); styles missing from the single-call
+       response fall back to their own call
 
     Args:
         image: Base64-encoded yacht interior image
+        output_mode: "inline", "reference" or "auto" (default: ARTIFACT_OUTPUT_MODE)
+        progress: Optional callback receiving (step, state) updates, where step
+            is "analysis" or a style name and state is "running", "completed"
+            or "failed"
+        generation_mode: "fanout" or "single_call" (default: GENERATE_ALL_MODE)
 
     Returns:
         Dictionary with:
-        - structure_analysis: Initial architectural analysis
+        - structure_analysis: Initial architectural analysis (or preview)
         - styles: Dict mapping style names to generated outputs
+        - artifacts: Artifact references for externalized fields
 
     Raises:
         ValueError: If input validation fails
@@ -201,43 +385,96 @@ async def generate_all_styles(image: str) -> Dict[str, Any]:
     """
     try:
         # Validate input
-        input_data = GenerateAllStylesInput(image=image)
+        mode = resolve_output_mode(output_mode)
+        generation = _resolve_generation_mode(generation_mode)
+        input_data = await asyncio.to_thread(GenerateAllStylesInput, image=image)
 
         logger.info("Starting complete workflow: analyze + generate all styles")
 
+        # Decode at most once, and only if something is not in the result
+        # store, and share the image across the analysis and all styles
+        client = get_gemini_client()
+        data = input_data.pop_image_bytes()
+        digest = await _image_digest(data)
+        pil_image = None
+
         # Step 1: Analyze structure
-        analysis_result = await analyze_yacht_structure(input_data.image)
-        structure_description = analysis_result["description"]
+        _report_progress(progress, "analysis", "running")
+        analysis = await _stored_analysis(client, data, digest)
+        if analysis is None:
+            pil_image = await client.decode_image_async(data)
+            analysis = await _analyze_pil_image(client, pil_image, digest=digest)
+        structure_description = analysis.description
+        _report_progress(progress, "analysis", "completed")
 
         logger.info("Structure analysis complete, generating all styles")
 
-        # Step 2: Generate all styles in parallel
-        import asyncio
-
-        generation_tasks = []
-        for yacht_style in YachtStyle:
-            task = generate_yacht_style(
-                image=input_data.image,
-                structure_description=structure_description,
-                style=yacht_style.value,
+        # Styles already in the result store need no call
+        generated = await _lookup_styles(
+            client, digest, structure_description, list(YachtStyle)
+        )
+        missing = [s for s in YachtStyle if s not in generated]
+        if missing and pil_image is None:
+            pil_image = await client.decode_image_async(data)
+        del data
+
+        # Styles reported as running / completed before generate_one
+        started: set[YachtStyle] = set()
+        finished: set[YachtStyle] = set()
+
+        # Step 2 (single_call): all (remaining) styles in one structured response
+        if generation == GENERATION_SINGLE_CALL and missing:
+            for yacht_style in missing:
+                _report_progress(progress, yacht_style.value, "running")
+            started.update(missing)
+            fresh = await _generate_styles_single_call(
+                client, pil_image, structure_description, missing
             )
-            generation_tasks.append((yacht_style.value, task))
-
-        # Wait for all generations to complete
-        styles_dict = {}
-        for style_name, task in generation_tasks:
+            for output in fresh.values():
+                await _store_style(client, digest, structure_description, output)
+            for yacht_style in fresh:
+                _report_progress(progress, yacht_style.value, "completed")
+            finished.update(fresh)
+            generated.update(fresh)
+
+        # Step 2: Generate all (remaining) styles in parallel
+        async def generate_one(yacht_style: YachtStyle) -> Dict[str, Any]:
+            if yacht_style not in generated and yacht_style not in started:
+                _report_progress(progress, yacht_style.value, "running")
             try:
-                result = await task
-                styles_dict[style_name] = result
-                logger.info(f"✓ Generated {style_name} style")
+                if yacht_style in generated:
+                    result = (
+                        await _apply_output_mode(generated[yacht_style], mode)
+                    ).model_dump(exclude_none=True)
+                else:
+                    result = await _generate_styled_output(
+                        client,
+                        pil_image,
+                        structure_description,
+                        yacht_style,
+                        mode,
+                        digest,
+                    )
+                if yacht_style not in finished:
+                    _report_progress(progress, yacht_style.value, "completed")
+                logger.info("✓ Generated %s style", yacht_style.value)
+                return result
             except Exception as e:
-                logger.error(f"✗ Failed to generate {style_name}: {str(e)}")
+                _report_progress(progress, yacht_style.value, "failed")
+                logger.error("✗ Failed to generate %s: %s", yacht_style.value, e)
                 # Continue with other styles even if one fails
-                styles_dict[style_name] = {
-                    "error": str(e),
-                    "style": style_name,
-                    "description": f"Generation failed: {str(e)}",
-                }
+                return GenerateStyleOutput(
+                    generated_image="",
+                    style=yacht_style,
+                    description=f"Generation failed: {str(e)}",
+                    error=str(e),
+                ).model_dump(exclude_none=True)
+
+        results = await asyncio.gather(*(generate_one(s) for s in YachtStyle))
+        styles_dict = {
+            yacht_style.value: result
+            for yacht_style, result in zip(YachtStyle, results)
+        }
 
         # Build output
         output = GenerateAllStylesOutput(
@@ -245,17 +482,24 @@ async def generate_all_styles(image: str) -> Dict[str, Any]:
             styles=styles_dict,
         )
 
-        logger.info(f"All styles generated ({len(styles_dict)}/{len(YachtStyle)})")
-        return output.model_dump()
+        analysis_bytes = structure_description.encode("utf-8")
+        if should_externalize(mode, len(analysis_bytes)):
+            ref = await asyncio.to_thread(get_artifact_store().put, analysis_bytes, "text/plain")
+            output.structure_analysis = preview_text(structure_description)
+            output.artifacts = {"structure_analysis": ref}
+
+        succeeded = sum(1 for result in styles_dict.values() if "error" not in result)
+        logger.info("All styles generated (%s/%s)", succeeded, len(YachtStyle))
+        return output.model_dump(exclude_none=True)
 
     except ValueError as e:
-        logger.error(f"Input validation error: {str(e)}")
+        logger.error("Input validation error: %s", e)
         raise
     except GeminiClientError as e:
-        logger.error(f"Gemini API error during batch generation: {str(e)}")
+        logger.error("Gemini API error during batch generation: %s", e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error during batch generation: {str(e)}")
+        logger.error("Unexpected error during batch generation: %s", e)
         raise GeminiClientError(f"Batch generation failed: {str(e)}")
 
 
@@ -287,13 +531,857 @@ async def list_available_styles() -> list[Dict[str, Any]]:
             ).model_dump()
         )
 
-    logger.info(f"Returning {len(styles)} available styles")
+    logger.info("Returning %s available styles", len(styles))
     return styles
 
 
+async def find_similar_interiors(
+    image: str | None = None,
+    description: str | None = None,
+    features: list[str] | None = None,
+    top_k: int = 5,
+) -> Dict[str, Any]:
+    """
+    Find previously analyzed interiors similar to an image or a description.
+
+    Searches the similarity index, which every analysis is added to as it
+    is produced. A query image is analyzed first (served from the result
+    store when it holds the analysis) and left out of its own results.
+
+    Args:
+        image: Base64-encoded interior image to match
+        description: Text to match when no image is given
+        features: Only return interiors whose key features contain these
+            (e.g. ["teak", "skylight"]); alone, they also form the query
+        top_k: Number of results (1-50)
+
+    Returns:
+        Dictionary with:
+        - matches: Best first, each with id, score (cosine similarity),
+          description, key_features, lighting_analysis and matched_features
+        - index_size: Interiors in the index
+        - search_ms: Time spent embedding the query and searching
+
+    Raises:
+        ValueError: If no query is given or top_k is out of range
+        GeminiClientError: If the query image cannot be analyzed
+    """
+    try:
+        if image is None and not description and not features:
+            raise ValueError("Provide an image, a description or features to search for")
+        if not 1 <= top_k <= 50:
+            raise ValueError("top_k must be between 1 and 50")
+
+        index = await get_vector_index_async()
+        exclude = None
+        if image is not None:
+            input_data = await asyncio.to_thread(AnalyzeYachtInput, image=image)
+            client = get_gemini_client()
+            data = input_data.pop_image_bytes()
+            digest = await _image_digest(data)
+            analysis = await _stored_analysis(client, data, digest)
+            if analysis is None:
+                pil_image = await client.decode_image_async(data)
+                analysis = await _analyze_pil_image(client, pil_image, digest=digest)
+            del data
+            query_text = analysis_text(analysis.model_dump())
+            exclude = _analysis_id(digest, analysis)
+        else:
+            query_text = description or " ".join(features)
+
+        started = time.perf_counter()
+        query = await index.embed(query_text)
+        matches = await asyncio.to_thread(index.search, query, top_k, features, exclude)
+        search_ms = (time.perf_counter() - started) * 1000
+        get_metrics().observe("similarity.search_s", search_ms / 1000)
+
+        logger.info("Found %s similar interiors in %.1f ms", len(matches), search_ms)
+        return {
+            "matches": [asdict(match) for match in matches],
+            "index_size": len(index),
+            "search_ms": round(search_ms, 2),
+        }
+
+    except ValueError as e:
+        logger.error("Input validation error: %s", e)
+        raise
+    except GeminiClientError as e:
+        logger.error("Gemini API error during similarity search: %s", e)
+        raise
+    except Exception as e:
+        logger.error("Unexpected error during similarity search: %s", e)
+        raise GeminiClientError(f"Similarity search failed: {str(e)}")
+
+
 # Helper functions
 
 
+def _resolve_generation_mode(requested: str | None = None) -> str:
+    """
+    Resolve how generate_all produces its styles.
+
+    Args:
+        requested: "fanout", "single_call" or None for GENERATE_ALL_MODE
+            (default: fanout)
+
+    Returns:
+        Generation mode
+
+    Raises:
+        ValueError: If the mode is not recognized
+    """
+    mode = (requested or os.getenv("GENERATE_ALL_MODE", GENERATION_FANOUT)).lower()
+    if mode not in GENERATION_MODES:
+        raise ValueError(
+            f"Invalid generation mode '{mode}'. Expected one of: {', '.join(GENERATION_MODES)}"
+        )
+    return mode
+
+
+def _report_progress(
+    progress: Callable[[str, str], None] | None,
+    step: str,
+    state: str,
+) -> None:
+    """Forward a progress update to the caller's callback, if any."""
+    if progress is not None:
+        progress(step, state)
+
+
+def _build_analysis_prompt(options: Dict[str, str] | None = None) -> str:
+    """Analysis prompt customized with the focus_areas/detail_level options."""
+    analysis_prompt = ANALYSIS_PROMPT
+    if options:
+        if "focus_areas" in options:
+            analysis_prompt += f"\n\nPay special attention to: {options['focus_areas']}"
+        if "detail_level" in options:
+            analysis_prompt += f"\n\nDetail level: {options['detail_level']}"
+    return analysis_prompt
+
+
+def _analysis_variant(options: Dict[str, str] | None, tiled: bool) -> str:
+    """Analysis parameters that shape the output (store key and near-duplicate scope)."""
+    return json.dumps({**(options or {}), **({"tiling": True} if tiled else {})}, sort_keys=True)
+
+
+def _analysis_key(client, digest: str, variant: str) -> str:
+    """Result store key of an analysis."""
+    return result_key(KIND_ANALYSIS, digest, model=client.model_name, variant=variant)
+
+
+async def _stored_analysis(
+    client,
+    data: bytes,
+    digest: str | None,
+    options: Dict[str, str] | None = None,
+    tiling: str = TILING_OFF,
+) -> AnalyzeYachtOutput | None:
+    """
+    Look up the stored analysis of an image without decoding it.
+
+    Whether the image would be tiled is decided from the dimensions in
+    its header.
+
+    Args:
+        client: Gemini client
+        data: Encoded image bytes
+        digest: Image content digest (None: the store is off)
+        options: Optional analysis parameters
+        tiling: Resolved tiling mode
+
+    Returns:
+        The stored analysis, or None
+    """
+    if digest is None:
+        return None
+    tiled = False
+    if tiling != TILING_OFF:
+        size = await asyncio.to_thread(read_image_size, data)
+        if size is None:
+            return None
+        tiled = should_tile(tiling, size)
+    key = _analysis_key(client, digest, _analysis_variant(options, tiled))
+    stored = await get_result_store().get_async(key)
+    if stored is None:
+        return None
+    logger.info("Serving stored analysis of image %s", digest[:12])
+    output = AnalyzeYachtOutput(**stored)
+    await _index_analysis(digest, output)
+    return output
+
+
+async def _analyze_pil_image(
+    client,
+    pil_image,
+    options: Dict[str, str] | None = None,
+    tiling: str = TILING_OFF,
+    digest: str | None = None,
+) -> AnalyzeYachtOutput:
+    """
+    Run the structural analysis on an already decoded image.
+
+    Callers look up the result store first (see _stored_analysis), before
+    decoding the image.
+
+    Args:
+        client: Gemini client
+        pil_image: Decoded PIL image
+        options: Optional analysis parameters (focus_areas, detail_level)
+        tiling: Resolved tiling mode
+        digest: Image content digest, to store the result in the result
+            store (None skips it)
+
+    Returns:
+        Structured AnalyzeYachtOutput
+    """
+    analysis_prompt = _build_analysis_prompt(options)
+
+    tiled = should_tile(tiling, pil_image.size)
+
+    # Reuse the analysis of a near-duplicate photo if one was seen before
+    phash_mode = get_phash_mode()
+    variant = _analysis_variant(options, tiled)
+
+    hashes = None
+    output = None
+    if phash_mode != PHASH_MODE_OFF:
+        metrics = get_metrics()
+        hashes = await asyncio.to_thread(lambda: (phash(pil_image), dhash(pil_image)))
+        metrics.increment("phash.lookups")
+        match = get_perceptual_index().find_hashes(
+            *hashes, get_phash_max_distance(), variant
+        )
+        if match:
+            metrics.increment("phash.near_duplicate_hits")
+            if match.distance == 0:
+                metrics.increment("phash.exact_hits")
+            if phash_mode == PHASH_MODE_RETURN:
+                logger.info(
+                    "Reusing analysis of near-duplicate image (distance %s)", match.distance
+                )
+                # Still stored and indexed under this image below
+                output = AnalyzeYachtOutput(**match.analysis)
+            else:
+                logger.info(
+                    "Seeding analysis from near-duplicate image (distance %s)", match.distance
+                )
+                metrics.increment("phash.seeded")
+                analysis_prompt += ANALYSIS_SEED_PROMPT.format(
+                    prior_analysis=_format_prior_analysis(match.analysis)
+                )
+
+    if output is None:
+        if tiled:
+            output = await _analyze_tiles(client, pil_image, analysis_prompt)
+        else:
+            # Call Gemini API
+            logger.info("Starting yacht structure analysis")
+            raw_analysis = await client.analyze_image(
+                pil_image,
+                analysis_prompt,
+                options={"temperature": 0.3, "max_tokens": 4096},
+            )
+
+            # Parse the response into structured output
+            # For simplicity, we'll extract sections from the text response
+            output = _parse_analysis_response(raw_analysis)
+
+        if hashes is not None:
+            await asyncio.to_thread(
+                get_perceptual_index().add_hashes, *hashes, output.model_dump(), variant
+            )
+    if digest is not None:
+        await get_result_store().put_async(
+            _analysis_key(client, digest, variant), output.model_dump()
+        )
+    await _index_analysis(digest, output)
+
+    return output
+
+
+async def _analyze_tiles(client, pil_image, analysis_prompt: str) -> AnalyzeYachtOutput:
+    """
+    Analyze a large image as overlapping tiles and merge the results.
+
+    All tiles are submitted at once; the scheduler bounds how many run
+    concurrently. Failed tiles are skipped as long as one tile succeeds.
+
+    Args:
+        client: Gemini client
+        pil_image: Decoded PIL image
+        analysis_prompt: Prompt used for every tile (after the tile header)
+
+    Returns:
+        Merged AnalyzeYachtOutput
+
+    Raises:
+        GeminiClientError: If every tile fails
+    """
+    boxes = tile_boxes(pil_image.size)
+    columns = len({box[0] for box in boxes})
+    logger.info(
+        "Starting tiled analysis of %sx%s image (%s tiles)",
+        pil_image.size[0],
+        pil_image.size[1],
+        len(boxes),
+    )
+
+    async def analyze_tile(index: int, box: tuple[int, int, int, int]) -> AnalyzeYachtOutput:
+        prompt = TILE_ANALYSIS_PROMPT.format(
+            index=index + 1,
+            count=len(boxes),
+            row=index // columns + 1,
+            column=index % columns + 1,
+        ) + analysis_prompt
+        # Cropping copies the tile's pixels; keep it off the event loop
+        tile = await asyncio.to_thread(pil_image.crop, box)
+        raw_analysis = await client.analyze_image(
+            tile,
+            prompt,
+            options={"temperature": 0.3, "max_tokens": 4096},
+        )
+        return _parse_analysis_response(raw_analysis)
+
+    results = await asyncio.gather(
+        *(analyze_tile(i, box) for i, box in enumerate(boxes)),
+        return_exceptions=True,
+    )
+
+    metrics = get_metrics()
+    metrics.increment("analysis.tiled")
+    metrics.increment("analysis.tiles", len(boxes))
+    analyses = [r for r in results if isinstance(r, AnalyzeYachtOutput)]
+    failures = [r for r in results if not isinstance(r, AnalyzeYachtOutput)]
+    for failure in failures:
+        if isinstance(failure, asyncio.CancelledError):
+            raise failure
+    if not analyses:
+        raise failures[0]
+    if failures:
+        metrics.increment("analysis.tile_failures", len(failures))
+        logger.warning("%s of %s tiles failed: %s", len(failures), len(boxes), failures[0])
+
+    return merge_analyses(analyses)
+
+
+def _format_prior_analysis(analysis: Dict[str, Any]) -> str:
+    """Render a stored analysis as prompt text for seeding."""
+    features = "\n".join(f"- {item}" for item in analysis["key_features"])
+    return (
+        f"{analysis['description']}\n\n"
+        f"Key Features:\n{features}\n\n"
+        f"Geometry & Layout:\n{analysis['geometry_notes']}\n\n"
+        f"Lighting Analysis:\n{analysis['lighting_analysis']}"
+    )
+
+
+async def _generate_style_for_image(
+    client,
+    pil_image,
+    structure_description: str,
+    style: YachtStyle,
+) -> GenerateStyleOutput:
+    """
+    Generate one style transformation for an already decoded image.
+
+    Args:
+        client: Gemini client
+        pil_image: Decoded PIL image
+        structure_description: Architectural description from analysis
+        style: Target style
+
+    Returns:
+        Inline GenerateStyleOutput
+    """
+    # Get style-specific prompt
+    generation_prompt = get_style_prompt(style, structure_description)
+
+    # Call Gemini API for generation
+    logger.info("Generating yacht design in %s style", style.value)
+
+    # NOTE: Current implementation uses Gemini for description
+    # In production, replace with actual image generation API (Imagen 3, etc.)
+    generated_description = await client.analyze_image(
+        pil_image,
+        generation_prompt,
+        options={"temperature": _STYLE_TEMPERATURE, "max_tokens": _STYLE_MAX_TOKENS},
+        operation="style",
+    )
+
+    # For now, return description instead of actual image
+    # In production: Call image generation API here
+    return GenerateStyleOutput(
+        generated_image=f"[DESCRIPTION]\n{generated_description}",
+        style=style,
+        description=generated_description,
+    )
+
+
+async def _generate_styles_single_call(
+    client,
+    pil_image,
+    structure_description: str,
+    styles: list[YachtStyle],
+) -> Dict[YachtStyle, GenerateStyleOutput]:
+    """
+    Generate several styles in one call with a JSON response keyed by style.
+
+    The image, structure description and shared constraints are sent once.
+    Styles that are missing from the response (truncation, invalid JSON,
+    empty values) or a failed call are not returned, so the caller can fall
+    back to one call per missing style.
+
+    Args:
+        client: Gemini client
+        pil_image: Decoded PIL image
+        structure_description: Architectural description from analysis
+        styles: Target styles
+
+    Returns:
+        Inline outputs for the styles parsed from the response
+    """
+    metrics = get_metrics()
+    metrics.increment("multi_style.calls")
+    schema = {
+        "type": "object",
+        "properties": {style.value: {"type": "string"} for style in styles},
+        "required": [style.value for style in styles],
+    }
+
+    logger.info("Generating %s styles in one call", len(styles))
+    try:
+        raw = await client.analyze_image(
+            pil_image,
+            get_multi_style_prompt(styles, structure_description),
+            options={
+                "temperature": _STYLE_TEMPERATURE,
+                "max_tokens": _STYLE_MAX_TOKENS * len(styles),
+                "response_mime_type": "application/json",
+                "response_schema": schema,
+            },
+            operation="multi_style",
+        )
+    except RejectedError:
+        # Over quota: falling back would only multiply rejected calls
+        raise
+    except GeminiClientError as e:
+        logger.warning("Multi-style call failed, falling back to per-style calls: %s", e)
+        metrics.increment("multi_style.fallbacks", len(styles))
+        return {}
+
+    descriptions = _parse_multi_style_response(raw, styles)
+    missing = len(styles) - len(descriptions)
+    if missing:
+        logger.warning("%s style(s) missing from multi-style response, falling back", missing)
+        metrics.increment("multi_style.fallbacks", missing)
+
+    return {
+        style: GenerateStyleOutput(
+            generated_image=f"[DESCRIPTION]\n{description}",
+            style=style,
+            description=description,
+        )
+        for style, description in descriptions.items()
+    }
+
+
+def _parse_multi_style_response(raw: str, styles: list[YachtStyle]) -> Dict[YachtStyle, str]:
+    """
+    Extract per-style descriptions from a JSON multi-style response.
+
+    Args:
+        raw: Response text
+        styles: Requested styles
+
+    Returns:
+        Non-empty descriptions keyed by style
+    """
+    descriptions = _parse_json_strings(raw, [style.value for style in styles])
+    return {style: descriptions[style.value] for style in styles if style.value in descriptions}
+
+
+def _parse_json_strings(raw: str, keys: list[str]) -> Dict[str, str]:
+    """
+    Extract string members from a JSON object response.
+
+    A truncated response is not valid JSON; in that case every string value
+    that was completed before the cut is still recovered.
+
+    Args:
+        raw: Response text
+        keys: Expected keys
+
+    Returns:
+        Non-empty, stripped values of the expected keys that were found
+    """
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            data = {}
+    except json.JSONDecodeError:
+        data = {}
+        for match in _JSON_STRING_MEMBER.finditer(raw):
+            try:
+                data[match.group(1)] = json.loads(f'"{match.group(2)}"')
+            except json.JSONDecodeError:
+                continue
+
+    return {
+        key: data[key].strip()
+        for key in keys
+        if isinstance(data.get(key), str) and data[key].strip()
+    }
+
+
+async def _generate_style_maybe_batched(
+    client,
+    pil_image,
+    structure_description: str,
+    style: YachtStyle,
+) -> GenerateStyleOutput:
+    """
+    Generate one style, through the micro-batcher when it is enabled.
+
+    Concurrent requests for the same model and style are collected for
+    MICROBATCH_WINDOW_MS and served by one multimodal call.
+    """
+    batcher = get_batcher()
+    if not batcher.enabled:
+        return await _generate_style_for_image(client, pil_image, structure_description, style)
+
+    tokens = (
+        estimate_image_tokens(pil_image)
+        + len(structure_description) // 4
+        + _STYLE_MAX_TOKENS
+    )
+    return await batcher.submit(
+        (client.model_name, style),
+        (pil_image, structure_description, current_caller()),
+        tokens,
+        functools.partial(_run_style_batch, client, style),
+    )
+
+
+async def _run_style_batch(client, style: YachtStyle, items: list[tuple]) -> list:
+    """
+    Generate one style for several unrelated images in one call.
+
+    Items missing from the JSON response (or all items, if the call fails)
+    fall back to individual calls.
+
+    Args:
+        client: Gemini client
+        style: Target style shared by the batch
+        items: (pil_image, structure_description, caller) triples
+
+    Returns:
+        GenerateStyleOutput or exception per item, in order
+    """
+    async def generate_single(index: int) -> Any:
+        # A fallback call serves one item and is charged to its caller alone
+        image, description, caller = items[index]
+        try:
+            with shared_by(((caller, 1.0),)):
+                return await _generate_style_for_image(client, image, description, style)
+        except Exception as e:
+            return e
+
+    if len(items) == 1:
+        return [await generate_single(0)]
+
+    metrics = get_metrics()
+    keys = [f"photo_{index}" for index in range(1, len(items) + 1)]
+    schema = {
+        "type": "object",
+        "properties": {key: {"type": "string"} for key in keys},
+        "required": keys,
+    }
+
+    logger.info("Generating %s style for %s batched images", style.value, len(items))
+    try:
+        raw = await client.analyze_images(
+            [image for image, _, _ in items],
+            get_batch_style_prompt(style, [description for _, description, _ in items]),
+            options={
+                "temperature": _STYLE_TEMPERATURE,
+                "max_tokens": _STYLE_MAX_TOKENS * len(items),
+                "response_mime_type": "application/json",
+                "response_schema": schema,
+            },
+            operation="style_batch",
+        )
+        descriptions = _parse_json_strings(raw, keys)
+    except RejectedError:
+        # Over quota: falling back would only multiply rejected calls
+        raise
+    except GeminiClientError as e:
+        logger.warning("Batched style call failed, falling back to single calls: %s", e)
+        descriptions = {}
+
+    missing = [index for index, key in enumerate(keys) if key not in descriptions]
+    if missing:
+        metrics.increment("batch.fallbacks", len(missing))
+    fallbacks = dict(zip(missing, await asyncio.gather(*(generate_single(i) for i in missing))))
+
+    return [
+        fallbacks[index]
+        if index in fallbacks
+        else GenerateStyleOutput(
+            generated_image=f"[DESCRIPTION]\n{descriptions[key]}",
+            style=style,
+            description=descriptions[key],
+        )
+        for index, key in enumerate(keys)
+    ]
+
+
+async def _generate_styled_output(
+    client,
+    pil_image,
+    structure_description: str,
+    style: YachtStyle,
+    mode: str,
+    digest: str | None = None,
+) -> Dict[str, Any]:
+    """Generate one style and apply the output mode (used by generate_all)."""
+    output = await _generate_style_for_image(
+        client, pil_image, structure_description, style
+    )
+    await _store_style(client, digest, structure_description, output)
+    return (await _apply_output_mode(output, mode)).model_dump(exclude_none=True)
+
+
+async def _image_digest(data: bytes) -> str | None:
+    """Content digest of an image for the result store (None when it is off)."""
+    if not get_result_store().enabled:
+        return None
+    return await asyncio.to_thread(image_digest, data)
+
+
+def _analysis_id(digest: str | None, analysis: AnalyzeYachtOutput) -> str:
+    """Similarity index id of an analysis: its image digest, else its description's."""
+    return digest or text_digest(analysis.description)
+
+
+async def _index_analysis(digest: str | None, analysis: AnalyzeYachtOutput) -> None:
+    """Add an analysis to the similarity index in the background."""
+    index = await get_vector_index_async()
+    index.add_in_background(_analysis_id(digest, analysis), analysis.model_dump())
+
+
+def _style_key(client, digest: str, structure_description: str, style: YachtStyle) -> str:
+    """
+    Result store key of one style output.
+
+    Covers everything that shapes the output: image, style, structure
+    description (whitespace-normalized), model, temperature and prompt
+    version.
+    """
+    return result_key(
+        KIND_STYLE,
+        digest,
+        model=client.model_name,
+        style=style.value,
+        description=text_digest(normalize_text(structure_description)),
+        temperature=_STYLE_TEMPERATURE,
+        prompt_version=PROMPT_VERSION,
+    )
+
+
+def style_variants() -> int:
+    """Outputs kept per style key and served round-robin (STYLE_CACHE_VARIANTS)."""
+    return max(1, int(os.getenv("STYLE_CACHE_VARIANTS", "1")))
+
+
+async def _lookup_styles(
+    client,
+    digest: str | None,
+    structure_description: str,
+    styles: list[YachtStyle],
+) -> Dict[YachtStyle, GenerateStyleOutput]:
+    """
+    Look up stored style outputs for an image and structure description.
+
+    A style counts as stored once STYLE_CACHE_VARIANTS outputs were
+    generated for it; they are then served in turn.
+
+    Returns:
+        Inline outputs of the styles found (empty without a digest)
+    """
+    if digest is None:
+        return {}
+    store = get_result_store()
+    wanted = style_variants()
+    found = {}
+    for style in styles:
+        key = _style_key(client, digest, structure_description, style)
+        variants = ((await store.get_async(key)) or {}).get("variants", [])
+        if variants and len(variants) >= wanted:
+            found[style] = GenerateStyleOutput(**variants[store.next_variant(key, len(variants))])
+    if found:
+        logger.info("Serving %s stored style(s) for image %s", len(found), digest[:12])
+    return found
+
+
+async def _stored_style(
+    client,
+    digest: str | None,
+    structure_description: str,
+    style: YachtStyle,
+    data: bytes | None = None,
+) -> GenerateStyleOutput | None:
+    """
+    Look up one stored style output, waiting for a speculative generation
+    of it that is still running.
+
+    Args:
+        client: Gemini client
+        digest: Image digest, None if the store is off
+        structure_description: Structure description of the request
+        style: Requested style
+        data: Encoded image (its size selects the latency to leave time for)
+
+    Returns:
+        Inline output, or None if it is not stored
+    """
+    if digest is None:
+        return None
+    key = _style_key(client, digest, structure_description, style)
+    prefetcher = get_prefetcher()
+    if prefetcher.running(key):
+        # Wait only as long as a direct generation could still follow
+        size = await asyncio.to_thread(read_image_size, data) if data is not None else None
+        tier = pixel_tier(size[0] * size[1]) if size else "small"
+        await prefetcher.join(key, (client.model_name, "style", tier))
+    output = (await _lookup_styles(client, digest, structure_description, [style])).get(style)
+    if output is not None:
+        prefetcher.served(key)
+    return output
+
+
+async def _speculation_targets(
+    client,
+    digest: str | None,
+    structure_description: str,
+) -> list[tuple[str, YachtStyle, int]]:
+    """
+    Popular styles of an image whose stored variants are incomplete.
+
+    Returns:
+        (result key, style, variants missing) per style to speculate on
+        (empty when speculation or the result store is off)
+    """
+    prefetcher = get_prefetcher()
+    if not prefetcher.enabled or digest is None:
+        return []
+    store = get_result_store()
+    wanted = style_variants()
+    targets = []
+    for style in prefetcher.popular():
+        key = _style_key(client, digest, structure_description, style)
+        # Fill every variant, or the key is never served (see _lookup_styles)
+        missing = wanted - await store.variant_count_async(key)
+        if missing > 0:
+            targets.append((key, style, missing))
+    return targets
+
+
+def _speculate_styles(
+    client,
+    pil_image,
+    digest: str,
+    structure_description: str,
+    targets: list[tuple[str, YachtStyle, int]],
+) -> None:
+    """
+    Generate the most requested styles of a freshly analyzed image in the
+    background, so the generate_style calls that usually follow are served
+    from the result store (see utils.speculation).
+
+    Args:
+        client: Gemini client
+        pil_image: Decoded image
+        digest: Image content digest
+        structure_description: Description the styles are generated from
+        targets: Styles to generate, from _speculation_targets()
+    """
+    jobs = {}
+    for key, style, missing in targets:
+
+        async def generate(style: YachtStyle = style, missing: int = missing) -> None:
+            for _ in range(missing):
+                output = await _generate_style_for_image(
+                    client, pil_image, structure_description, style
+                )
+                await _store_style(client, digest, structure_description, output)
+
+        jobs[key] = generate
+    if jobs:
+        tokens = estimate_image_tokens(pil_image) + len(structure_description) // 4 + _STYLE_MAX_TOKENS
+        get_prefetcher().schedule(jobs, current_caller(), tokens)
+
+
+async def _store_style(
+    client,
+    digest: str | None,
+    structure_description: str,
+    output: GenerateStyleOutput,
+) -> None:
+    """Store an inline style output as one more variant (before the output mode is applied)."""
+    if digest is None:
+        return
+    await get_result_store().add_variant_async(
+        _style_key(client, digest, structure_description, output.style),
+        output.model_dump(mode="json", exclude_none=True),
+        style_variants(),
+    )
+
+
+def _put_generated_image(store, generated_image: str) -> ArtifactRef:
+    """Decode a generated_image field and store it (blocking)."""
+    return store.put(*sniff_generated_image(generated_image))
+
+
+async def _apply_output_mode(output: GenerateStyleOutput, mode: str) -> GenerateStyleOutput:
+    """
+    Move large fields of a style output into the artifact store.
+
+    In reference mode, ``generated_image`` is replaced by the artifact URI
+    and ``description`` by a short preview; the full content stays
+    reachable through ``artifacts``. Decoding, hashing and writing run in
+    a worker thread.
+
+    Args:
+        output: Inline style generation output
+        mode: Resolved output mode
+
+    Returns:
+        The same output, externalized where the mode requires it
+    """
+    if mode == OUTPUT_MODE_INLINE:
+        return output
+    store = get_artifact_store()
+    artifacts = {}
+
+    # The inline field's length is what a client would receive; the image
+    # is only decoded once it is known to be externalized
+    if should_externalize(mode, len(output.generated_image)):
+        ref = await asyncio.to_thread(_put_generated_image, store, output.generated_image)
+        artifacts["generated_image"] = ref
+        output.generated_image = ref.uri
+
+    description_bytes = output.description.encode("utf-8")
+    if should_externalize(mode, len(description_bytes)):
+        artifacts["description"] = await asyncio.to_thread(
+            store.put, description_bytes, "text/plain"
+        )
+        output.description = preview_text(output.description)
+
+    if artifacts:
+        output.artifacts = artifacts
+    return output
+
+
 def _parse_analysis_response(raw_text: str) -> AnalyzeYachtOutput:
     """
     Parse Gemini's analysis response into structured output.
@@ -325,7 +1413,10 @@ def _parse_analysis_response(raw_text: str) -> AnalyzeYachtOutput:
 
         # Detect section headers
         if "key features" in line_lower or "notable" in line_lower:
-            sections[current_section] = "\n".join(current_text).strip()
+            if current_section == "key_features":
+                sections["key_features"] = _extract_list_items(current_text)
+            else:
+                sections[current_section] = "\n".join(current_text).strip()
             current_section = "key_features"
             current_text = []
         elif "geometry" in line_lower or "layout" in line_lower:
@@ -337,7 +1428,10 @@ def _parse_analysis_response(raw_text: str) -> AnalyzeYachtOutput:
             current_section = "geometry_notes"
             current_text = []
         elif "lighting" in line_lower:
-            sections[current_section] = "\n".join(current_text).strip()
+            if current_section == "key_features":
+                sections["key_features"] = _extract_list_items(current_text)
+            else:
+                sections[current_section] = "\n".join(current_text).strip()
             current_section = "lighting_analysis"
             current_text = []
         else:
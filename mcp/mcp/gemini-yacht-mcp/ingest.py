@@ -0,0 +1,340 @@
+"""
+Gemini Yacht MCP Server - Bulk Ingest
+
+Precomputes the structure analysis and all five style outputs for a
+directory of yacht interior photos, so the server answers them from its
+result store instead of calling Gemini on first use.
+
+Photos are deduplicated by content hash and run through the same handler
+code as the ``generate_all`` tool (at bulk priority, through the priority
+scheduler), with at most --concurrency photos in progress and at most
+--rate photos started per minute. Results are written to the disk result
+store; a server started with RESULT_STORE=disk and the same
+RESULT_STORE_DIR then serves analyze_structure, generate_style and
+generate_all for these photos without upstream calls (with
+STYLE_CACHE_VARIANTS above 1, every variant of each style is generated). With
+VECTOR_INDEX_PATH set, the analyses are also appended to the similarity
+index the server loads at startup (find_similar_interiors).
+
+Progress is appended to a checkpoint file, one JSON line per photo, as
+each photo finishes. Re-running the same command skips photos that are
+already done and retries the ones that failed; results stored before an
+interruption are reused, so a failed photo only repeats its failed styles.
+
+Usage:
+    python ingest.py DIRECTORY [--store-dir ./results]
+        [--checkpoint ingest_checkpoint.jsonl] [--concurrency 4] [--rate 0]
+        [--generation-mode fanout|single_call] [--deadline-s 600]
+        [--no-recursive]
+
+Environment Variables:
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_BACKEND: As for the server
+    RESULT_STORE_DIR: Default of --store-dir (default: ./results)
+    JOB_DEADLINE_S: Default of --deadline-s (default: 600)
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from handlers.tools import generate_all_styles, style_variants  # noqa: E402
+from utils.context import request_scope  # noqa: E402
+from utils.logging_setup import configure_logging  # noqa: E402
+from utils.quotas import Caller  # noqa: E402
+from utils.result_store import (  # noqa: E402
+    RESULT_STORE_DISK,
+    ResultStore,
+    image_digest,
+    set_result_store,
+)
+from utils.vector_index import get_vector_index  # noqa: E402
+
+logger = logging.getLogger("ingest")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Checkpoint states
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+INGEST_CALLER = Caller(session="ingest")
+
+
+def find_images(directory: str, recursive: bool = True) -> Iterator[str]:
+    """
+    List the photos in a directory, in a stable order.
+
+    Args:
+        directory: Directory to walk
+        recursive: Include subdirectories
+
+    Yields:
+        Paths of files with an image extension
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        if not recursive:
+            dirs.clear()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read a checkpoint file.
+
+    Args:
+        path: Checkpoint file (JSON lines; missing means a fresh run)
+
+    Returns:
+        Latest record per image digest
+    """
+    records: Dict[str, Dict[str, Any]] = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                records[record["sha256"]] = record
+            except (ValueError, KeyError):
+                # A line cut off by an interruption
+                continue
+    return records
+
+
+class Checkpoint:
+    """Append-only record of finished photos."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = load_checkpoint(path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def done(self, digest: str) -> bool:
+        """Whether a photo was ingested successfully by an earlier run."""
+        return self.records.get(digest, {}).get("status") == STATUS_DONE
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Append a record and flush it to disk."""
+        self.records[record["sha256"]] = record
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class RateLimiter:
+    """Spaces out starts to at most ``per_minute`` per minute (0 = unlimited)."""
+
+    def __init__(self, per_minute: float):
+        self.interval_s = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if self.interval_s <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval_s
+
+
+async def ingest_image(
+    data: bytes,
+    generation_mode: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+) -> list[str]:
+    """
+    Analyze one photo and generate all styles into the result store.
+
+    Args:
+        data: Image file contents
+        generation_mode: "fanout" or "single_call" (default: GENERATE_ALL_MODE)
+        deadline_s: Time budget for the photo, 0 for unbounded
+            (default: REQUEST_DEADLINE_S)
+
+    Returns:
+        Styles that failed (empty if everything was stored)
+
+    Raises:
+        ValueError: If the file is not a valid image
+        GeminiClientError: If the analysis fails
+    """
+    image = base64.b64encode(data).decode("ascii")
+    with request_scope("ingest", deadline_s=deadline_s, caller=INGEST_CALLER):
+        # Each pass adds one variant to the styles that have fewer than
+        # STYLE_CACHE_VARIANTS; complete styles are served from the store
+        for _ in range(style_variants()):
+            result = await generate_all_styles(image, "inline", generation_mode=generation_mode)
+            failed = [style for style, output in result["styles"].items() if output.get("error")]
+            if failed:
+                break
+    return failed
+
+
+async def ingest_directory(
+    directory: str,
+    checkpoint_path: str,
+    concurrency: int = 4,
+    rate: float = 0,
+    generation_mode: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    recursive: bool = True,
+) -> Dict[str, int]:
+    """
+    Ingest every new photo of a directory.
+
+    Args:
+        directory: Directory of photos
+        checkpoint_path: Checkpoint file (created or resumed)
+        concurrency: Photos in progress at once
+        rate: Photos started per minute (0 = unlimited)
+        generation_mode: "fanout" or "single_call" (default: GENERATE_ALL_MODE)
+        deadline_s: Time budget per photo, 0 for unbounded
+            (default: REQUEST_DEADLINE_S)
+        recursive: Include subdirectories
+
+    Returns:
+        Counts of photos found, ingested, failed, skipped (done in an earlier
+        run) and duplicates (same content as another photo)
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    limiter = RateLimiter(rate)
+    paths = find_images(directory, recursive)
+    claimed: set[str] = set()
+    summary = {"found": 0, "ingested": 0, "failed": 0, "skipped": 0, "duplicates": 0}
+
+    async def worker() -> None:
+        # Paths are shared by the workers; each takes the next one
+        for path in paths:
+            summary["found"] += 1
+            try:
+                data, digest = await asyncio.to_thread(_read_image, path)
+            except OSError as e:
+                logger.error("Cannot read %s: %s", path, e)
+                summary["failed"] += 1
+                continue
+            if digest in claimed:
+                summary["duplicates"] += 1
+                continue
+            claimed.add(digest)
+            if checkpoint.done(digest):
+                summary["skipped"] += 1
+                continue
+
+            await limiter.wait()
+            started = time.monotonic()
+            record = {"sha256": digest, "path": path}
+            try:
+                failed_styles = await ingest_image(data, generation_mode, deadline_s)
+                if failed_styles:
+                    record.update(status=STATUS_FAILED, error=f"Styles failed: {', '.join(failed_styles)}")
+                else:
+                    record["status"] = STATUS_DONE
+            except Exception as e:
+                record.update(status=STATUS_FAILED, error=str(e))
+            del data
+            record["seconds"] = round(time.monotonic() - started, 2)
+            checkpoint.write(record)
+
+            if record["status"] == STATUS_DONE:
+                summary["ingested"] += 1
+                logger.info("Ingested %s in %.1fs", path, record["seconds"])
+            else:
+                summary["failed"] += 1
+                logger.error("Failed to ingest %s: %s", path, record["error"])
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        # Analyses are added to the similarity index in the background
+        await get_vector_index().drain()
+    finally:
+        checkpoint.close()
+    return summary
+
+
+def _read_image(path: str) -> tuple[bytes, str]:
+    """Read a photo and compute its content digest."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, image_digest(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Precompute analyses and style outputs into the result store"
+    )
+    parser.add_argument("directory", help="Directory of photos to ingest")
+    parser.add_argument(
+        "--store-dir",
+        default=os.getenv("RESULT_STORE_DIR", os.path.join(os.getcwd(), "results")),
+        help="Result store directory shared with the server (default: RESULT_STORE_DIR or ./results)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default="ingest_checkpoint.jsonl",
+        help="Progress file; re-run with the same file to resume",
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Photos in progress at once")
+    parser.add_argument("--rate", type=float, default=0, help="Photos started per minute (0 = unlimited)")
+    parser.add_argument(
+        "--generation-mode",
+        choices=("fanout", "single_call"),
+        help="How styles are generated (default: GENERATE_ALL_MODE)",
+    )
+    parser.add_argument(
+        "--deadline-s",
+        type=float,
+        default=float(os.getenv("JOB_DEADLINE_S", "600")),
+        help="Time budget per photo (0 = unbounded)",
+    )
+    parser.add_argument("--no-recursive", action="store_true", help="Skip subdirectories")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"Not a directory: {args.directory}")
+
+    # Logs go to stderr, as for the server
+    configure_logging()
+
+    set_result_store(ResultStore(mode=RESULT_STORE_DISK, root=args.store_dir))
+    logger.info(f"Ingesting {args.directory} into {os.path.abspath(args.store_dir)}")
+
+    started = time.monotonic()
+    summary = asyncio.run(
+        ingest_directory(
+            args.directory,
+            args.checkpoint,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            generation_mode=args.generation_mode,
+            deadline_s=args.deadline_s,
+            recursive=not args.no_recursive,
+        )
+    )
+    logger.info(
+        f"Done in {time.monotonic() - started:.1f}s: {summary['ingested']} ingested, "
+        f"{summary['failed']} failed, {summary['skipped']} already done, "
+        f"{summary['duplicates']} duplicates ({summary['found']} photos)"
+    )
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
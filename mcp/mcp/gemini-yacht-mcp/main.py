@@ -4,11 +4,21 @@ Gemini Yacht MCP Server - Main Entry Point
 A Model Context Protocol server providing Gemini-powered yacht interior
 design tools for the YachtGenius application.
 
-Exposes 4 tools:
+Exposes 13 tools:
 - analyze_yacht_structure: Architectural analysis
+- analyze_room: One merged analysis from several photos of a space
 - generate_yacht_style: Single style transformation
 - generate_all_styles: All 5 style variations
 - list_available_styles: Available styles information
+- server_metrics: Metrics counters and latency summaries
+- submit_generate_all / get_job_status / get_job_result / cancel_job:
+  Background generate_all jobs
+- configure_profiling: Runtime profiling of selected tools (see PROFILE_*)
+- readiness: Startup warm-up state, for routing traffic to warm servers
+- find_similar_interiors: Similarity search over analyzed interiors
+
+Large outputs can be returned by reference (see ARTIFACT_OUTPUT_MODE) and
+fetched through the ``artifact://{digest}`` resource template.
 
 Usage:
     python main.py
@@ -18,56 +28,126 @@ Environment Variables:
     GEMINI_MODEL: Model name (default: gemini-2.5-flash)
     GEMINI_TIMEOUT: API timeout in seconds (default: 60)
     LOG_LEVEL: Logging level (default: INFO)
+    LOG_FORMAT: text or json (default: text)
+    ARTIFACT_DIR: Output directory for artifacts (default: ./output)
+    ARTIFACT_OUTPUT_MODE: inline, reference or auto (default: inline)
+    MCP_TRANSPORT: stdio, streamable-http or sse (default: stdio)
+    MCP_HOST / MCP_PORT: Bind address for HTTP transports (default: 127.0.0.1:8000)
+    QUOTA_*: Per-session and per-tenant limits (see utils.quotas)
+    RESULT_STORE: off, memory or disk; results precomputed by ingest.py are
+        served from RESULT_STORE_DIR (default: off)
+    STYLE_CACHE_VARIANTS: Stored outputs per style key, served round-robin
+        (default: 1)
+    EMBEDDER / VECTOR_INDEX_PATH: Similarity index (see utils.vector_index)
+    SPECULATIVE_PREFETCH: Generate popular styles after analyze_structure
+        in spare capacity (see utils.speculation) (default: false)
+    ADMISSION_*: Bounds on calls and image bytes in progress, and CoDel
+        queue-delay shedding (see utils.admission)
 """
 
 import os
 import sys
+import asyncio
 import logging
-from typing import Any
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
 # Load environment variables FIRST
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Configure logging to stderr (CRITICAL for stdio MCP servers)
-log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, log_level, logging.INFO),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    stream=sys.stderr,  # NEVER use stdout in MCP servers
-)
+# Configure logging to stderr (CRITICAL for stdio MCP servers), written by
+# a background thread so a slow stderr pipe cannot stall the event loop
+from utils.logging_setup import configure_logging
+
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Import FastMCP
 try:
-    from mcp.server.fastmcp import FastMCP
+    from mcp.server.fastmcp import Context, FastMCP
 except ImportError as e:
     logger.error(
-        "Failed to import MCP SDK. Install with: pip install mcp>=1.2.0"
+        "Failed to import MCP SDK. Install with: pip install 'mcp>=1.2.0,<2'"
     )
     sys.exit(1)
 
 # Import tool handlers
 from handlers.tools import (
     analyze_yacht_structure,
+    analyze_yacht_room,
     generate_yacht_style,
     generate_all_styles,
     list_available_styles,
+    find_similar_interiors as find_similar_interiors_handler,
 )
-from utils.gemini_client import GeminiClientError
+from models.schemas import decode_image_payload
+from utils.gemini_client import (
+    GeminiClientError,
+    OverloadedError,
+    RejectedError,
+    get_gemini_client,
+)
+from utils.latency import get_latency_tracker
+from utils.batcher import get_batcher
+from utils.artifacts import get_artifact_store, ArtifactStoreError
+from utils.metrics import get_metrics, process_stats
+from utils.profiling import get_profiler
+from utils.warmup import get_warmup
+from utils.jobs import get_job_manager, JobError, JobStatus
+from utils.context import request_scope
+from utils.quotas import caller_identity, get_quotas
+from utils.result_store import get_result_store
+from utils.vector_index import get_vector_index_async
+from utils.speculation import get_prefetcher
+from utils.admission import get_admission, payload_bytes
+from utils.scheduler import PriorityName, get_scheduler, tool_priority
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """
+    Start the warm-up in the background as the server starts.
+
+    The handshake is not delayed; ``readiness`` reports when the warm-up
+    has finished. HTTP transports enter the lifespan once per session, so
+    the warm-up only starts on the first.
+    """
+    get_warmup().start()
+    yield
+
 
 # Initialize FastMCP server
-mcp = FastMCP("gemini-yacht-mcp")
+mcp = FastMCP("gemini-yacht-mcp", lifespan=lifespan)
+
+MCP_TRANSPORTS = ("stdio", "streamable-http", "sse")
 
 logger.info("Initializing Gemini Yacht MCP Server")
 
 
+def rejected(tool: str, error: RejectedError) -> dict[str, Any]:
+    """
+    Response for a call refused by a quota ("rejected") or shed by admission
+    control ("overloaded"); the client may retry after ``retry_after`` seconds.
+    """
+    logger.warning("Rejected - %s: %s", tool, error)
+    return {
+        "error": str(error),
+        "status": "overloaded" if isinstance(error, OverloadedError) else "rejected",
+        "retry_after": round(error.retry_after, 1),
+    }
+
+
 # Tool 1: Analyze Yacht Structure
 @mcp.tool()
 async def analyze_structure(
     image: str,
     options: dict[str, str] | None = None,
+    tiling: str | None = None,
+    priority: PriorityName | None = None,
+    deadline_s: float | None = None,
+    ctx: Context | None = None,
 ) -> dict[str, Any]:
     """
     Analyze yacht interior structure and architecture using Gemini 2.5 Flash.
@@ -81,6 +161,13 @@ async def analyze_structure(
         options: Optional analysis parameters:
             - focus_areas: Specific areas to emphasize (e.g., "lighting, materials")
             - detail_level: Analysis depth ("high", "medium", "low")
+        tiling: "off", "on" or "auto" (default: ANALYSIS_TILING). Panoramas and
+            very large images are split into overlapping tiles that are
+            analyzed concurrently and merged into one analysis
+        priority: Scheduling class for upstream calls: "interactive" (default
+            for this tool), "normal" or "bulk"
+        deadline_s: Time budget for the whole call in seconds (default:
+            REQUEST_DEADLINE_S); every stage only gets the remaining budget
 
     Returns:
         Dictionary containing:
@@ -96,21 +183,80 @@ async def analyze_structure(
         )
     """
     try:
-        return await analyze_yacht_structure(image, options)
+        with get_admission().admit("analyze_structure", priority, payload_bytes(image)):
+            with request_scope("analyze_structure", priority, deadline_s, caller_identity(ctx)):
+                return await analyze_yacht_structure(image, options, tiling)
+    except RejectedError as e:
+        return rejected("analyze_structure", e)
+    except GeminiClientError as e:
+        logger.error("Tool error - analyze_structure: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - analyze_structure: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 2: Analyze Room (several photos)
+@mcp.tool()
+async def analyze_room(
+    images: list[str],
+    options: dict[str, str] | None = None,
+    priority: PriorityName | None = None,
+    deadline_s: float | None = None,
+    ctx: Context | None = None,
+) -> dict[str, Any]:
+    """
+    Analyze several photos of the same yacht cabin or room in one request.
+
+    Instead of one analyze_structure call per photo (each paying the full
+    prompt and returning its own, possibly contradictory description), the
+    photos are analyzed together and reconciled into a single structural
+    analysis. Large sets are split into a few groups of at most
+    ROOM_MAX_IMAGES_PER_CALL photos that run concurrently and are merged.
+
+    Args:
+        images: Base64-encoded photos of one space (at most ROOM_MAX_IMAGES)
+        options: Optional analysis parameters (focus_areas, detail_level)
+        priority: Scheduling class for upstream calls: "interactive" (default
+            for this tool), "normal" or "bulk"
+        deadline_s: Time budget for the whole call in seconds (default:
+            REQUEST_DEADLINE_S); every stage only gets the remaining budget
+
+    Returns:
+        Dictionary containing description, key_features, geometry_notes and
+        lighting_analysis; pass the description to generate_style as
+        structure_description
+
+    Example:
+        result = await analyze_room(
+            images=["data:image/jpeg;base64,...", "data:image/jpeg;base64,..."]
+        )
+    """
+    try:
+        with get_admission().admit("analyze_room", priority, payload_bytes(*images)):
+            with request_scope("analyze_room", priority, deadline_s, caller_identity(ctx)):
+                return await analyze_yacht_room(images, options)
+    except RejectedError as e:
+        return rejected("analyze_room", e)
     except GeminiClientError as e:
-        logger.error(f"Tool error - analyze_structure: {str(e)}")
+        logger.error("Tool error - analyze_room: %s", e)
         return {"error": str(e), "status": "failed"}
     except Exception as e:
-        logger.error(f"Unexpected error - analyze_structure: {str(e)}")
+        logger.error("Unexpected error - analyze_room: %s", e)
         return {"error": f"Internal error: {str(e)}", "status": "failed"}
 
 
-# Tool 2: Generate Yacht Style
+# Tool 3: Generate Yacht Style
 @mcp.tool()
 async def generate_style(
     image: str,
     structure_description: str,
     style: str,
+    output_mode: str | None = None,
+    regenerate: bool = False,
+    priority: PriorityName | None = None,
+    deadline_s: float | None = None,
+    ctx: Context | None = None,
 ) -> dict[str, Any]:
     """
     Generate yacht interior transformation in a specific design style.
@@ -127,12 +273,26 @@ async def generate_style(
             - "biophilic": Nature-inspired with plants and organic materials
             - "mediterranean": Coastal elegance with white/blue palette
             - "cyberpunk": High-tech dystopian with neon accents
+        output_mode: How large fields are returned:
+            - "inline": Full content in the response (default)
+            - "reference": artifact:// URIs with size and hash metadata
+            - "auto": Reference only for fields above ARTIFACT_INLINE_MAX_BYTES
+        regenerate: Generate a new output even if one is stored for this
+            image, style and description (the new one is stored as another
+            variant)
+        priority: Scheduling class for upstream calls: "interactive" (default
+            for this tool), "normal" or "bulk"
+        deadline_s: Time budget for the whole call in seconds (default:
+            REQUEST_DEADLINE_S); every stage only gets the remaining budget
 
     Returns:
         Dictionary containing:
-        - generated_image: Base64-encoded transformed image (or description)
+        - generated_image: Base64-encoded transformed image (or description),
+          or an artifact URI in reference mode
         - style: Applied style name
         - description: Detailed description of the transformation
+          (a short preview in reference mode)
+        - artifacts: Artifact references (uri, sha256, size_bytes, mime_type)
 
     Example:
         result = await generate_style(
@@ -142,18 +302,31 @@ async def generate_style(
         )
     """
     try:
-        return await generate_yacht_style(image, structure_description, style)
+        with get_admission().admit("generate_style", priority, payload_bytes(image)):
+            with request_scope("generate_style", priority, deadline_s, caller_identity(ctx)):
+                return await generate_yacht_style(
+                    image, structure_description, style, output_mode, regenerate
+                )
+    except RejectedError as e:
+        return rejected("generate_style", e)
     except GeminiClientError as e:
-        logger.error(f"Tool error - generate_style: {str(e)}")
+        logger.error("Tool error - generate_style: %s", e)
         return {"error": str(e), "status": "failed"}
     except Exception as e:
-        logger.error(f"Unexpected error - generate_style: {str(e)}")
+        logger.error("Unexpected error - generate_style: %s", e)
         return {"error": f"Internal error: {str(e)}", "status": "failed"}
 
 
-# Tool 3: Generate All Styles
+# Tool 4: Generate All Styles
 @mcp.tool()
-async def generate_all(image: str) -> dict[str, Any]:
+async def generate_all(
+    image: str,
+    output_mode: str | None = None,
+    generation_mode: str | None = None,
+    priority: PriorityName | None = None,
+    deadline_s: float | None = None,
+    ctx: Context | None = None,
+) -> dict[str, Any]:
     """
     Generate yacht interior transformations in ALL available styles.
 
@@ -167,6 +340,14 @@ async def generate_all(image: str) -> dict[str, Any]:
 
     Args:
         image: Base64-encoded yacht interior image
+        output_mode: "inline" (default), "reference" or "auto" - see generate_style
+        generation_mode: "fanout" (one call per style) or "single_call" (all
+            styles in one structured response, falling back per style)
+            (default: GENERATE_ALL_MODE)
+        priority: Scheduling class for upstream calls: "normal" (default for
+            this tool), "interactive" or "bulk"
+        deadline_s: Time budget for the whole call in seconds (default:
+            REQUEST_DEADLINE_S); every stage only gets the remaining budget
 
     Returns:
         Dictionary containing:
@@ -177,6 +358,7 @@ async def generate_all(image: str) -> dict[str, Any]:
             - biophilic: {...}
             - mediterranean: {...}
             - cyberpunk: {...}
+        - artifacts: Artifact reference for the analysis in reference mode
 
     Example:
         result = await generate_all(
@@ -185,16 +367,22 @@ async def generate_all(image: str) -> dict[str, Any]:
         print(result["styles"]["futuristic"]["description"])
     """
     try:
-        return await generate_all_styles(image)
+        with get_admission().admit("generate_all", priority, payload_bytes(image)):
+            with request_scope("generate_all", priority, deadline_s, caller_identity(ctx)):
+                return await generate_all_styles(
+                    image, output_mode, generation_mode=generation_mode
+                )
+    except RejectedError as e:
+        return rejected("generate_all", e)
     except GeminiClientError as e:
-        logger.error(f"Tool error - generate_all: {str(e)}")
+        logger.error("Tool error - generate_all: %s", e)
         return {"error": str(e), "status": "failed"}
     except Exception as e:
-        logger.error(f"Unexpected error - generate_all: {str(e)}")
+        logger.error("Unexpected error - generate_all: %s", e)
         return {"error": f"Internal error: {str(e)}", "status": "failed"}
 
 
-# Tool 4: List Available Styles
+# Tool 5: List Available Styles
 @mcp.tool()
 async def list_styles() -> list[dict[str, Any]]:
     """
@@ -221,10 +409,370 @@ async def list_styles() -> list[dict[str, Any]]:
     try:
         return await list_available_styles()
     except Exception as e:
-        logger.error(f"Unexpected error - list_styles: {str(e)}")
+        logger.error("Unexpected error - list_styles: %s", e)
         return [{"error": f"Failed to list styles: {str(e)}"}]
 
 
+# Tool 6: Server Metrics
+@mcp.tool()
+async def server_metrics() -> dict[str, Any]:
+    """
+    Report server metrics counters and latency summaries.
+
+    Returns:
+        Dictionary containing:
+        - counters: Named counters (e.g. "phash.near_duplicate_hits")
+        - summaries: Named value summaries with count, mean, max, p50, p95, p99
+        - scheduler: Upstream slots in flight and queued per priority class
+        - hedging: Hedge rate (extra calls per primary call) and win rate
+        - latency: Recent upstream latency per model and operation
+        - batching: Micro-batcher settings and open batches (batch sizes
+          and wait times are in summaries as "batch.size" / "batch.wait_s")
+        - process: Resident memory (current and peak), CPU time, threads
+          and uptime of the server process
+        - transport: Gemini transport settings and calls in flight / served
+          per channel
+        - quotas: Quota limits, and calls in flight, calls, tokens (total and
+          last minute) and rejections per session and tenant
+        - result_store: Result store mode and entries held in memory (hits
+          and misses are in counters)
+        - vector_index: Similarity index size, embedder and analyses waiting
+          to be indexed
+        - speculation: Speculative prefetch settings, generations in flight
+          and style popularity
+        - admission: Admission limits, calls and image bytes in progress,
+          and whether each priority class is being shed
+    """
+    try:
+        snapshot = get_metrics().snapshot()
+        snapshot["scheduler"] = get_scheduler().stats()
+        snapshot["hedging"] = get_gemini_client().hedging.stats()
+        snapshot["latency"] = get_latency_tracker().snapshot()
+        snapshot["batching"] = get_batcher().stats()
+        snapshot["process"] = process_stats()
+        snapshot["transport"] = get_gemini_client().transport_stats()
+        snapshot["quotas"] = get_quotas().stats()
+        snapshot["result_store"] = get_result_store().stats()
+        snapshot["vector_index"] = (await get_vector_index_async()).stats()
+        snapshot["speculation"] = get_prefetcher().stats()
+        snapshot["admission"] = get_admission().stats()
+        return snapshot
+    except Exception as e:
+        logger.error("Unexpected error - server_metrics: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 7: Submit Generate All Job
+@mcp.tool()
+async def submit_generate_all(
+    image: str,
+    output_mode: str | None = None,
+    generation_mode: str | None = None,
+    priority: PriorityName | None = None,
+    deadline_s: float | None = None,
+    ctx: Context | None = None,
+) -> dict[str, Any]:
+    """
+    Submit a background generate_all job and return its id immediately.
+
+    Use this instead of generate_all when the full workflow may outlast the
+    client's request timeout. Poll get_job_status for per-style progress and
+    fetch the output with get_job_result.
+
+    Args:
+        image: Base64-encoded yacht interior image
+        output_mode: "inline" (default), "reference" or "auto" - see generate_style
+        generation_mode: "fanout" (one call per style) or "single_call" (all
+            styles in one structured response, falling back per style)
+            (default: GENERATE_ALL_MODE)
+        priority: Scheduling class for upstream calls: "bulk" (default for
+            jobs), "normal" or "interactive"
+        deadline_s: Time budget for the job once it starts running
+            (default: JOB_DEADLINE_S)
+
+    Returns:
+        Dictionary containing:
+        - job_id: Identifier for status, result and cancellation calls
+        - status: "queued"
+        (or error and status "failed" if the image is invalid or too large)
+
+    Example:
+        job = await submit_generate_all(image="data:image/jpeg;base64,/9j/4AAQ...")
+        status = await get_job_status(job_id=job["job_id"])
+    """
+    try:
+        job_priority = tool_priority("submit_generate_all", priority).value
+        # The job runs after this request; its upstream calls still count
+        # against the submitting caller's quotas
+        caller = caller_identity(ctx)
+        rejection = get_quotas().check(caller)
+        if rejection is not None:
+            return rejected(
+                "submit_generate_all", RejectedError(rejection.reason, rejection.retry_after)
+            )
+
+        # Reject an oversized or malformed image now, as the synchronous
+        # tools do, rather than from inside the queued job
+        try:
+            await asyncio.to_thread(decode_image_payload, image)
+        except ValueError as e:
+            logger.error("Input validation error - submit_generate_all: %s", e)
+            return {"error": str(e), "status": "failed"}
+
+        async def run(job):
+            with request_scope("submit_generate_all", job_priority, deadline_s, caller):
+                return await generate_all_styles(
+                    image, output_mode, progress=job.report, generation_mode=generation_mode
+                )
+
+        # The image stays in memory until the job finishes
+        release = get_admission().reserve("submit_generate_all", priority, payload_bytes(image))
+        try:
+            job = get_job_manager().submit("generate_all", run, on_done=release)
+        except Exception:
+            release()
+            raise
+        return {"job_id": job.id, "status": job.status.value}
+    except RejectedError as e:
+        return rejected("submit_generate_all", e)
+    except JobError as e:
+        logger.error("Tool error - submit_generate_all: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - submit_generate_all: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 8: Get Job Status
+@mcp.tool()
+async def get_job_status(job_id: str) -> dict[str, Any]:
+    """
+    Report the state and per-step progress of a background job.
+
+    Args:
+        job_id: Id returned by submit_generate_all
+
+    Returns:
+        Dictionary containing:
+        - job_id, kind: Job identity
+        - status: "queued", "running", "succeeded", "failed" or "cancelled"
+        - progress: Step name ("analysis" or a style) -> "running", "completed" or "failed"
+        - error: Failure message, if any
+        - created_at, started_at, finished_at: Unix timestamps
+    """
+    try:
+        return get_job_manager().get(job_id).to_status()
+    except JobError as e:
+        logger.error("Tool error - get_job_status: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - get_job_status: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 9: Get Job Result
+@mcp.tool()
+async def get_job_result(job_id: str) -> dict[str, Any]:
+    """
+    Fetch the result of a finished background job.
+
+    Results are kept for JOB_RESULT_TTL seconds after the job finishes.
+
+    Args:
+        job_id: Id returned by submit_generate_all
+
+    Returns:
+        The generate_all output once the job has succeeded; otherwise the job
+        status (see get_job_status)
+    """
+    try:
+        job = get_job_manager().get(job_id)
+        if job.status == JobStatus.SUCCEEDED:
+            return job.result
+        return job.to_status()
+    except JobError as e:
+        logger.error("Tool error - get_job_result: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - get_job_result: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 10: Cancel Job
+@mcp.tool()
+async def cancel_job(job_id: str) -> dict[str, Any]:
+    """
+    Cancel a queued or running background job.
+
+    Args:
+        job_id: Id returned by submit_generate_all
+
+    Returns:
+        The job status after the cancellation request (see get_job_status)
+    """
+    try:
+        job = get_job_manager().cancel(job_id)
+        return job.to_status()
+    except JobError as e:
+        logger.error("Tool error - cancel_job: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - cancel_job: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 11: Configure Profiling
+@mcp.tool()
+async def configure_profiling(
+    tools: list[str] | None = None,
+    every_n: int | None = None,
+    slow_ms: float | None = None,
+    mode: str | None = None,
+    trace_memory: bool | None = None,
+) -> dict[str, Any]:
+    """
+    Inspect or change on-demand profiling of tool calls (admin tool).
+
+    Call without arguments to read the current settings. Profiles are
+    written to PROFILE_DIR, named after the tool and request id. They cover
+    the event-loop thread, so they also contain the coroutines of other
+    calls that ran meanwhile (counted in the summary header).
+
+    Args:
+        tools: Tool names to profile ("*" for all, [] to turn profiling off)
+        every_n: Profile every Nth call of each selected tool (0: never)
+        slow_ms: Keep profiles of calls slower than this many ms (0: never);
+            all calls of the selected tools are profiled while this is set
+        mode: "cprofile" (deterministic) or "sample" (stack sampling, cheaper)
+        trace_memory: Also write the top allocations of each profiled call
+            (tracemalloc slows every allocation while on)
+
+    Returns:
+        Dictionary containing:
+        - enabled: Whether any call can currently be profiled
+        - config: Effective settings
+        - recent_files: Newest profile files in the profile directory
+    """
+    try:
+        profiler = get_profiler()
+        profiler.configure(
+            tools=",".join(tools) if tools is not None else None,
+            every_n=every_n,
+            slow_ms=slow_ms,
+            mode=mode,
+            trace_memory=trace_memory,
+        )
+        return profiler.status()
+    except ValueError as e:
+        logger.error("Tool error - configure_profiling: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - configure_profiling: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 12: Readiness
+@mcp.tool()
+async def readiness() -> dict[str, Any]:
+    """
+    Report whether the server has finished its startup warm-up.
+
+    The warm-up (image workers, codecs, thread pool, Gemini SDK client and
+    optional API ping, perceptual-hash cache) starts in the background when
+    the server starts, so the first real request does not pay for it.
+    Hosts can poll this tool and route traffic only to ready servers.
+
+    Returns:
+        Dictionary containing:
+        - ready: True once the warm-up has finished (or is disabled),
+          unless the Gemini client could not be created
+        - state: "pending", "warming", "ready", "degraded" (a step failed)
+          or "disabled"
+        - warmup_duration_s: Time the warm-up took
+        - steps: Per-step name, duration_s and error
+        - uptime_s: Seconds since the server started
+    """
+    try:
+        return get_warmup().status()
+    except Exception as e:
+        logger.error("Unexpected error - readiness: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Tool 13: Find Similar Interiors
+@mcp.tool()
+async def find_similar_interiors(
+    image: str | None = None,
+    description: str | None = None,
+    features: list[str] | None = None,
+    top_k: int = 5,
+    priority: PriorityName | None = None,
+    deadline_s: float | None = None,
+    ctx: Context | None = None,
+) -> dict[str, Any]:
+    """
+    Find previously analyzed yacht interiors similar to a photo or description.
+
+    Every structure analysis the server produces (or loads from
+    VECTOR_INDEX_PATH) is indexed, so the search ranks all of them in
+    milliseconds without re-analyzing anything. A query photo is analyzed
+    once (or served from the result store) and excluded from its results.
+
+    Args:
+        image: Base64-encoded interior photo to match
+        description: Text to match instead of a photo (e.g. "teak saloon
+            with skylights and warm indirect lighting")
+        features: Only return interiors whose key features mention all of
+            these (e.g. ["teak", "skylight"]); alone, they are the query
+        top_k: Number of matches (1-50, default: 5)
+        priority: Scheduling class for the analysis of a query photo
+        deadline_s: Time budget for the whole call in seconds
+
+    Returns:
+        Dictionary containing:
+        - matches: Best first, each with id (image digest), score (cosine
+          similarity), description, key_features, lighting_analysis and the
+          matched_features
+        - index_size: Interiors in the index
+        - search_ms: Time spent embedding the query and searching
+    """
+    try:
+        with get_admission().admit("find_similar_interiors", priority, payload_bytes(image)):
+            with request_scope(
+                "find_similar_interiors", priority, deadline_s, caller_identity(ctx)
+            ):
+                return await find_similar_interiors_handler(image, description, features, top_k)
+    except RejectedError as e:
+        return rejected("find_similar_interiors", e)
+    except GeminiClientError as e:
+        logger.error("Tool error - find_similar_interiors: %s", e)
+        return {"error": str(e), "status": "failed"}
+    except Exception as e:
+        logger.error("Unexpected error - find_similar_interiors: %s", e)
+        return {"error": f"Internal error: {str(e)}", "status": "failed"}
+
+
+# Resource: Stored artifacts
+@mcp.resource("artifact://{digest}")
+async def read_artifact(digest: str) -> str | bytes:
+    """
+    Read a generated artifact by its SHA-256 digest.
+
+    Text artifacts (descriptions, analyses) are returned as text; images
+    and other binary artifacts are returned as binary content.
+    """
+    try:
+        # Artifacts can be several MB: read them off the event loop
+        data, mime_type = await asyncio.to_thread(get_artifact_store().get, digest)
+    except ArtifactStoreError as e:
+        logger.error("Resource error - artifact: %s", e)
+        raise
+
+    if mime_type.startswith("text/"):
+        return data.decode("utf-8")
+    return data
+
+
 # Server initialization and error handling
 def validate_environment():
     """
@@ -233,7 +781,8 @@ def validate_environment():
     Raises:
         SystemExit: If required variables are missing
     """
-    required = ["GEMINI_API_KEY"]
+    # The offline fake backend (GEMINI_BACKEND=fake) needs no API key
+    required = [] if os.getenv("GEMINI_BACKEND", "gemini").lower() == "fake" else ["GEMINI_API_KEY"]
     missing = [var for var in required if not os.getenv(var)]
 
     if missing:
@@ -245,6 +794,13 @@ def validate_environment():
     logger.info(f"Using model: {os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')}")
     logger.info(f"API timeout: {os.getenv('GEMINI_TIMEOUT', '60')}s")
 
+    transport = os.getenv("MCP_TRANSPORT", "stdio").lower()
+    if transport not in MCP_TRANSPORTS:
+        logger.error(
+            f"Invalid MCP_TRANSPORT '{transport}'. Expected one of: {', '.join(MCP_TRANSPORTS)}"
+        )
+        sys.exit(1)
+
 
 def main():
     """
@@ -261,23 +817,39 @@ def main():
         validate_environment()
 
         # Initialize Gemini client (will raise if API key invalid)
-        from utils.gemini_client import get_gemini_client
-
         client = get_gemini_client()
         logger.info("Gemini client initialized successfully")
 
         # Log registered tools
         logger.info("Registered tools:")
         logger.info("  - analyze_structure: Analyze yacht interior architecture")
+        logger.info("  - analyze_room: Analyze several photos of one space together")
         logger.info("  - generate_style: Generate single style transformation")
         logger.info("  - generate_all: Generate all 5 style variations")
         logger.info("  - list_styles: List available design styles")
-
-        # Start MCP server (stdio transport)
-        logger.info("Starting MCP server on stdio transport")
+        logger.info("  - server_metrics: Report server metrics")
+        logger.info("  - submit_generate_all: Queue a background generate_all job")
+        logger.info("  - get_job_status / get_job_result / cancel_job: Manage jobs")
+        logger.info("  - configure_profiling: Profile selected tool calls")
+        logger.info("  - readiness: Report startup warm-up state")
+        logger.info("  - find_similar_interiors: Search analyzed interiors by similarity")
+        logger.info(f"Artifact directory: {get_artifact_store().root}")
+
+        # Start MCP server (stdio by default; HTTP transports for load testing
+        # and remote clients)
+        transport = os.getenv("MCP_TRANSPORT", "stdio").lower()
+        if transport == "stdio":
+            logger.info("Starting MCP server on stdio transport")
+        else:
+            mcp.settings.host = os.getenv("MCP_HOST", mcp.settings.host)
+            mcp.settings.port = int(os.getenv("MCP_PORT", str(mcp.settings.port)))
+            logger.info(
+                f"Starting MCP server on {transport} transport at "
+                f"http://{mcp.settings.host}:{mcp.settings.port}"
+            )
         logger.info("=" * 60)
 
-        mcp.run(transport="stdio")
+        mcp.run(transport=transport)
 
     except KeyboardInterrupt:
         logger.info("Server shutdown requested")
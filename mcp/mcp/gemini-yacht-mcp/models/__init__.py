@@ -8,8 +8,10 @@ from .schemas import (
     YachtStyle,
     AnalyzeYachtInput,
     AnalyzeYachtOutput,
+    AnalyzeRoomInput,
     GenerateStyleInput,
     GenerateStyleOutput,
+    ArtifactRef,
     GenerateAllStylesInput,
     GenerateAllStylesOutput,
     StyleInfo,
@@ -19,8 +21,10 @@ __all__ = [
     "YachtStyle",
     "AnalyzeYachtInput",
     "AnalyzeYachtOutput",
+    "AnalyzeRoomInput",
     "GenerateStyleInput",
     "GenerateStyleOutput",
+    "ArtifactRef",
     "GenerateAllStylesInput",
     "GenerateAllStylesOutput",
     "StyleInfo",
@@ -4,10 +4,68 @@ Pydantic schemas for Gemini Yacht MCP server.
 Defines input/output models for all tools with strict validation.
 """
 
+import os
+import binascii
 from enum import Enum
 from typing import Optional, Dict
-from pydantic import BaseModel, Field, field_validator
-import base64
+from pydantic import BaseModel, Field, PrivateAttr, model_validator
+
+# Data URL prefixes ("data:image/jpeg;base64,") are short; only this many
+# leading characters are searched for the separator.
+_DATA_URL_PREFIX_MAX = 256
+
+
+def max_image_bytes() -> int:
+    """Maximum decoded image size in bytes (MAX_IMAGE_BYTES, default: 20 MiB)."""
+    return int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+
+
+def decode_image_payload(value: str) -> bytes:
+    """
+    Decode a base64 image payload into a single bytes buffer.
+
+    The data URL prefix is skipped with a memoryview slice instead of
+    splitting the string, and the payload size is checked against
+    MAX_IMAGE_BYTES before anything is decoded. Peak memory is one ASCII
+    copy of the payload plus the decoded bytes; the ASCII copy is released
+    before returning.
+
+    Args:
+        value: Base64-encoded image (with or without data URL prefix)
+
+    Returns:
+        Decoded image bytes
+
+    Raises:
+        ValueError: If the payload is too large or not valid base64
+    """
+    start = value.find(",", 0, _DATA_URL_PREFIX_MAX) + 1
+
+    # Every 4 base64 characters decode to at most 3 bytes
+    encoded_length = len(value) - start
+    limit = max_image_bytes()
+    if encoded_length // 4 * 3 > limit:
+        raise ValueError(
+            f"Image payload too large: ~{encoded_length // 4 * 3} bytes "
+            f"(limit: {limit} bytes)"
+        )
+
+    try:
+        raw = value.encode("ascii")
+    except UnicodeEncodeError:
+        raise ValueError("Invalid base64 image data: non-ASCII characters")
+
+    try:
+        with memoryview(raw) as view:
+            data = binascii.a2b_base64(view[start:])
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"Invalid base64 image data: {str(e)}")
+    finally:
+        del raw
+
+    if not data:
+        raise ValueError("Invalid base64 image data: empty payload")
+    return data
 
 
 class YachtStyle(str, Enum):
@@ -20,30 +78,106 @@ class YachtStyle(str, Enum):
     CYBERPUNK = "cyberpunk"
 
 
-class AnalyzeYachtInput(BaseModel):
-    """Input schema for yacht structure analysis."""
+class ImagePayloadInput(BaseModel):
+    """
+    Base schema for inputs carrying a base64 image.
+
+    The payload is decoded exactly once during validation. ``image`` keeps
+    the caller's original string (no stripped copy); handlers consume the
+    decoded bytes through ``pop_image_bytes()`` so the buffer can be freed
+    as soon as the image has been loaded.
+    """
 
     image: str = Field(
         ...,
         description="Base64-encoded image of yacht interior"
     )
+
+    _image_bytes: Optional[bytes] = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def validate_base64(self):
+        """Validate that image is valid base64 within the size limit."""
+        self._image_bytes = decode_image_payload(self.image)
+        return self
+
+    def pop_image_bytes(self) -> bytes:
+        """
+        Return the decoded image bytes and drop the model's reference.
+
+        Raises:
+            ValueError: If the bytes were already consumed
+        """
+        data = self._image_bytes
+        if data is None:
+            raise ValueError("Image bytes already consumed")
+        self._image_bytes = None
+        return data
+
+
+class AnalyzeYachtInput(ImagePayloadInput):
+    """Input schema for yacht structure analysis."""
+
     options: Optional[Dict[str, str]] = Field(
         default=None,
         description="Optional analysis parameters (e.g., focus_areas, detail_level)"
     )
 
-    @field_validator("image")
-    @classmethod
-    def validate_base64(cls, v: str) -> str:
-        """Validate that image is valid base64."""
-        try:
-            # Remove data URL prefix if present
-            if "," in v:
-                v = v.split(",", 1)[1]
-            base64.b64decode(v)
-            return v
-        except Exception as e:
-            raise ValueError(f"Invalid base64 image data: {str(e)}")
+
+def max_room_images() -> int:
+    """Maximum photos per room analysis (ROOM_MAX_IMAGES, default: 8)."""
+    return int(os.getenv("ROOM_MAX_IMAGES", "8"))
+
+
+class AnalyzeRoomInput(BaseModel):
+    """
+    Input schema for multi-photo analysis of one room.
+
+    Like ImagePayloadInput, every payload is decoded once during
+    validation and handed over through ``pop_images_bytes()``.
+    """
+
+    images: list[str] = Field(
+        ...,
+        min_length=1,
+        description="Base64-encoded photos of the same yacht interior space"
+    )
+    options: Optional[Dict[str, str]] = Field(
+        default=None,
+        description="Optional analysis parameters (e.g., focus_areas, detail_level)"
+    )
+
+    _images_bytes: Optional[list[bytes]] = PrivateAttr(default=None)
+
+    @model_validator(mode="after")
+    def validate_images(self):
+        """Validate the photo count and decode every payload."""
+        limit = max_room_images()
+        if len(self.images) > limit:
+            raise ValueError(
+                f"Too many photos: {len(self.images)} (limit {limit}, see ROOM_MAX_IMAGES)"
+            )
+        decoded = []
+        for index, image in enumerate(self.images, start=1):
+            try:
+                decoded.append(decode_image_payload(image))
+            except ValueError as e:
+                raise ValueError(f"Photo {index}: {str(e)}")
+        self._images_bytes = decoded
+        return self
+
+    def pop_images_bytes(self) -> list[bytes]:
+        """
+        Return the decoded image bytes and drop the model's references.
+
+        Raises:
+            ValueError: If the bytes were already consumed
+        """
+        data = self._images_bytes
+        if data is None:
+            raise ValueError("Image bytes already consumed")
+        self._images_bytes = None
+        return data
 
 
 class AnalyzeYachtOutput(BaseModel):
@@ -67,13 +201,9 @@ class AnalyzeYachtOutput(BaseModel):
     )
 
 
-class GenerateStyleInput(BaseModel):
+class GenerateStyleInput(ImagePayloadInput):
     """Input schema for style generation."""
 
-    image: str = Field(
-        ...,
-        description="Base64-encoded image of yacht interior"
-    )
     structure_description: str = Field(
         ...,
         description="Structural description from analysis phase"
@@ -83,17 +213,26 @@ class GenerateStyleInput(BaseModel):
         description="Target design style"
     )
 
-    @field_validator("image")
-    @classmethod
-    def validate_base64(cls, v: str) -> str:
-        """Validate that image is valid base64."""
-        try:
-            if "," in v:
-                v = v.split(",", 1)[1]
-            base64.b64decode(v)
-            return v
-        except Exception as e:
-            raise ValueError(f"Invalid base64 image data: {str(e)}")
+
+class ArtifactRef(BaseModel):
+    """Reference to a large output stored in the artifact directory."""
+
+    uri: str = Field(
+        ...,
+        description="MCP resource URI (artifact://<sha256>)"
+    )
+    sha256: str = Field(
+        ...,
+        description="SHA-256 hex digest of the artifact content"
+    )
+    size_bytes: int = Field(
+        ...,
+        description="Artifact size in bytes"
+    )
+    mime_type: str = Field(
+        ...,
+        description="MIME type of the artifact content"
+    )
 
 
 class GenerateStyleOutput(BaseModel):
@@ -111,27 +250,20 @@ class GenerateStyleOutput(BaseModel):
         ...,
         description="Description of the generated design"
     )
+    artifacts: Optional[Dict[str, ArtifactRef]] = Field(
+        default=None,
+        description="Externalized fields (reference output mode), keyed by field name"
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="Error message if generation failed for this style"
+    )
 
 
-class GenerateAllStylesInput(BaseModel):
+class GenerateAllStylesInput(ImagePayloadInput):
     """Input schema for generating all styles at once."""
 
-    image: str = Field(
-        ...,
-        description="Base64-encoded image of yacht interior"
-    )
-
-    @field_validator("image")
-    @classmethod
-    def validate_base64(cls, v: str) -> str:
-        """Validate that image is valid base64."""
-        try:
-            if "," in v:
-                v = v.split(",", 1)[1]
-            base64.b64decode(v)
-            return v
-        except Exception as e:
-            raise ValueError(f"Invalid base64 image data: {str(e)}")
+    pass
 
 
 class GenerateAllStylesOutput(BaseModel):
@@ -145,6 +277,10 @@ class GenerateAllStylesOutput(BaseModel):
         ...,
         description="Generated images for each style (keyed by style name)"
     )
+    artifacts: Optional[Dict[str, ArtifactRef]] = Field(
+        default=None,
+        description="Externalized fields (reference output mode), keyed by field name"
+    )
 
 
 class StyleInfo(BaseModel):
@@ -45,6 +45,20 @@ def create_test_image() -> str:
         raise
 
 
+def create_offline_client(model, model_name: str):
+    """Create a GeminiClient around a stand-in model (no API key needed)."""
+    from utils.gemini_client import GeminiClient, HedgePolicy, TimeoutPolicy
+
+    # Bypass the singleton and SDK configuration
+    client = object.__new__(GeminiClient)
+    client.model = model
+    client.model_name = model_name
+    client.timeout = 60
+    client.timeouts = TimeoutPolicy(default=60, enabled=False)
+    client.hedging = HedgePolicy(enabled=False)
+    return client
+
+
 async def test_environment():
     """Test 1: Environment configuration"""
     logger.info("=" * 60)
@@ -248,6 +262,2228 @@ async def test_error_handling():
         return False
 
 
+async def test_artifact_output_mode():
+    """Test 7: Reference output mode"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 7: Artifact Output Mode")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import time
+        import shutil
+        import tempfile
+        from unittest.mock import patch
+        import main
+        from handlers.tools import _apply_output_mode
+        from models.schemas import GenerateStyleOutput, YachtStyle
+        from utils.artifacts import ArtifactStore
+        import utils.artifacts as artifacts
+
+        previous_store = artifacts._store
+        workdir = tempfile.mkdtemp()
+        try:
+            artifacts._store = ArtifactStore(os.path.join(workdir, "outputs"))
+            description = "Futuristic salon " * 100
+            output = await _apply_output_mode(
+                GenerateStyleOutput(
+                    generated_image=f"[DESCRIPTION]\n{description}",
+                    style=YachtStyle.FUTURISTIC,
+                    description=description,
+                ),
+                "reference",
+            )
+
+            ref = output.artifacts["description"]
+            data, mime_type = artifacts._store.get(ref.uri)
+            resource_text = await main.read_artifact(ref.sha256)
+
+            # Inline outputs are never decoded; auto decodes only what it moves
+            sniffed = []
+
+            def counting_sniff(generated_image):
+                sniffed.append(len(generated_image))
+                return artifacts.sniff_generated_image(generated_image)
+
+            small_image = base64.b64encode(b"\x89PNG" + b"\0" * 1000).decode("ascii")
+            large_image = base64.b64encode(b"\x89PNG" + b"\0" * 100_000).decode("ascii")
+            with patch("handlers.tools.sniff_generated_image", side_effect=counting_sniff):
+                inline = await _apply_output_mode(
+                    GenerateStyleOutput(
+                        generated_image=large_image, style=YachtStyle.FUTURISTIC, description="Salon"
+                    ),
+                    "inline",
+                )
+                kept = await _apply_output_mode(
+                    GenerateStyleOutput(
+                        generated_image=small_image, style=YachtStyle.FUTURISTIC, description="Salon"
+                    ),
+                    "auto",
+                )
+                moved = await _apply_output_mode(
+                    GenerateStyleOutput(
+                        generated_image=large_image, style=YachtStyle.FUTURISTIC, description="Salon"
+                    ),
+                    "auto",
+                )
+
+            # Expired artifacts are pruned, then the least recently stored over the limit
+            store = ArtifactStore(os.path.join(workdir, "pruned"), ttl_s=3600, max_bytes=2500)
+            mime = "application/octet-stream"
+            refs = [store.put(bytes([n]) * 1000, mime) for n in range(3)]
+            now = time.time()
+            for stored, age in zip(refs, (7200, 20, 10)):
+                os.utime(store._path_for(stored.sha256, mime), (now - age, now - age))
+            expired = store.prune()
+            refs.append(store.put(bytes([3]) * 1000, mime))
+            over_limit = store.prune()
+            kept_refs = []
+            for stored in refs:
+                try:
+                    store.get(stored.sha256)
+                    kept_refs.append(stored)
+                except artifacts.ArtifactStoreError:
+                    pass
+
+            # put never prunes the artifact it returns, nor files it did not name
+            capped = ArtifactStore(os.path.join(workdir, "capped"), max_bytes=1000)
+            partial = os.path.join(capped.root, "ab", "tmpwriting")
+            os.makedirs(os.path.dirname(partial))
+            with open(partial, "wb") as f:
+                f.write(b"x" * 5000)
+            big = capped.put(b"a" * 5000, "text/plain")
+            big_readable = capped.get(big.uri)[0] == b"a" * 5000
+            partial_kept = os.path.exists(partial)
+        finally:
+            artifacts._store = previous_store
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if (
+            output.generated_image.startswith("artifact://")
+            and len(output.description) < len(description)
+            and data.decode("utf-8") == description
+            and resource_text == description
+            and mime_type == "text/plain"
+            and ref.size_bytes == len(data)
+            and inline.generated_image == large_image
+            and kept.generated_image == small_image
+            and moved.artifacts["generated_image"].mime_type == "image/png"
+            and sniffed == [len(large_image)]
+            and "path" not in ref.model_dump()
+            and (expired, over_limit) == (1, 1)
+            and kept_refs == refs[2:]
+            and big_readable
+            and partial_kept
+        ):
+            logger.info(f"✓ Outputs externalized ({ref.size_bytes} bytes, {ref.sha256[:12]})")
+            return True
+
+        logger.error("✗ Reference output did not round-trip")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Artifact output mode failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def _measure_ingestion() -> dict:
+    """
+    Measure the memory of one image ingestion (run by Test 8 in a fresh process).
+
+    Covers the handler path: validation in a thread, then decoding on a
+    process pool. Python allocations are traced with tracemalloc, PIL pixel
+    storage through its block allocator stats and the shared memory
+    segments mapped by this process through a wrapper; all are reported
+    relative to the payload size.
+    """
+    import gc
+    import os
+    import tracemalloc
+    from multiprocessing.shared_memory import SharedMemory
+    from unittest.mock import patch
+    from PIL import Image
+    from models.schemas import AnalyzeYachtInput
+    from utils.gemini_client import GeminiClient
+    from utils.imaging import ImagePool
+
+    # Random pixels so the PNG does not compress below the image size
+    img = Image.frombytes("RGB", (1024, 1024), os.urandom(1024 * 1024 * 3))
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    payload = "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+    del img, buffer
+
+    # tracemalloc does not see pixel storage, which PIL allocates in
+    # blocks; with small blocks the live block count measures it
+    core = Image.core
+    core.set_block_size(64 * 1024)
+
+    def pixel_bytes() -> int:
+        stats = core.get_stats()
+        live = stats["allocated_blocks"] + stats["reused_blocks"] - stats["freed_blocks"]
+        return live * 64 * 1024
+
+    shared = {"live": 0, "peak": 0}
+
+    class TrackedSegment(SharedMemory):
+        def __init__(self, name=None, create=False, size=0):
+            super().__init__(name, create, size)
+            shared["live"] += self.size
+            shared["peak"] = max(shared["peak"], shared["live"])
+
+        def unlink(self):
+            super().unlink()
+            shared["live"] -= self.size
+
+    def settle() -> int:
+        gc.collect()
+        shared["peak"] = shared["live"]
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    async def release_pixel_copy() -> None:
+        # The pixels are copied into the image on a thread; the loop and that
+        # thread drop their references to the returned image shortly after
+        await asyncio.sleep(0.05)
+
+    pool = ImagePool(kind="process", workers=1)
+    tracemalloc.start()
+    try:
+        with patch("utils.gemini_client.get_image_pool", return_value=pool), \
+                patch("utils.imaging.SharedMemory", TrackedSegment):
+            # Start the worker and load the codecs outside the measurement
+            await pool.decode(base64.b64decode(create_test_image()))
+            await release_pixel_copy()
+            base_pixels = pixel_bytes()
+
+            # Validation: the ASCII copy of the payload and the decoded bytes
+            baseline = settle()
+            input_data = await asyncio.to_thread(AnalyzeYachtInput, image=payload)
+            data = input_data.pop_image_bytes()
+            del input_data
+            validate_peak = tracemalloc.get_traced_memory()[1] - baseline
+
+            # Decoding: the decoded bytes held by the handler, the transfer
+            # segments and the image
+            held = settle()
+            pil_image = await GeminiClient.decode_image_async(data)
+            decode_peak = (
+                len(data)
+                + tracemalloc.get_traced_memory()[1] - held
+                + shared["peak"]
+                + pixel_bytes() - base_pixels
+            )
+            size = pil_image.size
+            del pil_image, data
+
+            # Further calls leave nothing behind
+            after_one = settle()
+            for _ in range(3):
+                input_data = await asyncio.to_thread(AnalyzeYachtInput, image=payload)
+                pil_image = await GeminiClient.decode_image_async(input_data.pop_image_bytes())
+                del input_data, pil_image
+            await release_pixel_copy()
+            growth = settle() - after_one
+            retained_pixels = pixel_bytes() - base_pixels
+    finally:
+        tracemalloc.stop()
+        pool.shutdown()
+
+    return {
+        "payload": len(payload),
+        "size": list(size),
+        "validate_ratio": validate_peak / len(payload),
+        "decode_ratio": decode_peak / len(payload),
+        "growth_ratio": growth / len(payload),
+        "retained_pixels": retained_pixels,
+        "shared_left": shared["live"],
+    }
+
+
+async def test_ingestion_peak_memory():
+    """Test 8: Low-copy base64 ingestion"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 8: Ingestion Peak Memory")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import json
+        import subprocess
+        from models.schemas import AnalyzeYachtInput
+
+        # Measured in a fresh interpreter: threads and images of calls left
+        # over by other tests would otherwise count against this one
+        result = await asyncio.to_thread(
+            subprocess.run,
+            [
+                sys.executable,
+                "-W", "ignore",
+                "-c",
+                "import asyncio, json, test_server; "
+                "print(json.dumps(asyncio.run(test_server._measure_ingestion())))",
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        if result.returncode != 0:
+            logger.error(f"✗ Measurement failed:\n{result.stderr[-2000:]}")
+            return False
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+        # Validation holds the ASCII copy (1x) and the decoded bytes (0.75x);
+        # decoding the decoded bytes (0.75x), one transfer segment at a time
+        # (0.75x) and the image (1x, RGB stored as 4 bytes per pixel)
+        logger.info(
+            f"  Payload {measured['payload']} bytes, validation {measured['validate_ratio']:.2f}x, "
+            f"decoding {measured['decode_ratio']:.2f}x, growth {measured['growth_ratio']:.3f}x, "
+            f"pixel bytes retained {measured['retained_pixels']}, "
+            f"shared bytes left {measured['shared_left']}"
+        )
+        if (
+            measured["size"] != [1024, 1024]
+            or measured["validate_ratio"] > 1.8
+            or measured["decode_ratio"] > 2.55
+            or measured["growth_ratio"] > 0.01
+            or measured["retained_pixels"] != 0
+            or measured["shared_left"] != 0
+        ):
+            logger.error("✗ Ingestion used more memory than expected")
+            return False
+
+        # Oversized payloads are rejected before decoding
+        payload = create_test_image()
+        os.environ["MAX_IMAGE_BYTES"] = "16"
+        try:
+            AnalyzeYachtInput(image=payload)
+            logger.error("✗ Should have rejected payload above MAX_IMAGE_BYTES")
+            return False
+        except ValueError as e:
+            logger.info(f"✓ Correctly rejected oversized payload: {str(e)[:50]}...")
+        finally:
+            del os.environ["MAX_IMAGE_BYTES"]
+
+        logger.info("✓ Ingestion stays within memory bounds")
+        return True
+
+    except Exception as e:
+        logger.error(f"✗ Ingestion peak memory test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_near_duplicate_reuse():
+    """Test 9: Perceptual-hash reuse of prior analyses"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 9: Near-Duplicate Analysis Reuse")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import tempfile
+        from unittest.mock import AsyncMock, MagicMock, patch
+        from PIL import Image, ImageDraw
+        from handlers.tools import _analyze_pil_image
+        from utils.metrics import get_metrics
+        import utils.phash as phash_module
+
+        class CountingClient:
+            calls = 0
+            model_name = "counting-model"
+
+            async def analyze_image(self, image, prompt, options=None):
+                self.calls += 1
+                return "Salon overview\nKey Features\n- Curved sofa\nGeometry\nOpen plan\nLighting\nSkylight"
+
+        img = Image.new("RGB", (640, 480), (200, 190, 170))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([40, 60, 300, 200], fill=(90, 60, 40))
+        draw.rectangle([380, 120, 600, 420], fill=(30, 80, 140))
+        draw.ellipse([200, 250, 360, 400], fill=(240, 240, 230))
+
+        # Recompressed, resized and slightly cropped copy of the same shot
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=50)
+        variant = Image.open(buffer).resize((448, 336)).crop((8, 6, 440, 330))
+
+        os.environ["PHASH_MODE"] = "return"
+        phash_module._index = phash_module.PerceptualIndex(path="")
+        client = CountingClient()
+        store = MagicMock()
+        store.put_async = AsyncMock()
+        index_analysis = AsyncMock()
+        try:
+            first = await _analyze_pil_image(client, img)
+            # A reused analysis is still stored and indexed under the new image
+            with patch("handlers.tools.get_result_store", return_value=store), patch(
+                "handlers.tools._index_analysis", index_analysis
+            ):
+                second = await _analyze_pil_image(client, variant, digest="variant-digest")
+        finally:
+            del os.environ["PHASH_MODE"]
+            phash_module._index = None
+
+        # Entries are appended to the file, which is compacted at twice the
+        # capacity and reloads to the newest entries
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "phash.jsonl")
+            index = phash_module.PerceptualIndex(path=path, max_entries=4)
+            for n in range(10):
+                index.add_hashes(n, n, {"description": f"Entry {n}"}, "wide" if n % 2 else "")
+            with open(path, encoding="utf-8") as f:
+                lines = len(f.readlines())
+            reloaded = phash_module.PerceptualIndex(path=path, max_entries=4)
+            newest = reloaded.find_hashes(9, 9, 0, "wide")
+            other_variant = reloaded.find_hashes(9, 9, 0, "")
+            evicted = reloaded.find_hashes(1, 1, 0, "wide")
+
+        hits = get_metrics().counter("phash.near_duplicate_hits")
+        logger.info(f"  file lines after 10 adds: {lines}, reloaded entries: {len(reloaded)}")
+        persisted = (
+            lines <= 8
+            and len(reloaded) == 4
+            and newest.analysis["description"] == "Entry 9"
+            and other_variant is None
+            and evicted is None
+        )
+        reused_recorded = (
+            store.put_async.await_count == 1
+            and index_analysis.await_args.args == ("variant-digest", second)
+        )
+        if client.calls == 1 and second == first and hits >= 1 and persisted and reused_recorded:
+            logger.info(f"✓ Near-duplicate served from index ({int(hits)} hit(s))")
+            return True
+
+        logger.error(f"✗ Expected one Gemini call and a persisted index, got {client.calls} call(s)")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Near-duplicate reuse failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_priority_scheduler():
+    """Test 10: Priority scheduling"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 10: Priority Scheduler")
+    logger.info("=" * 60)
+
+    try:
+        from utils.scheduler import PriorityScheduler, Priority
+
+        scheduler = PriorityScheduler(
+            max_concurrency=2,
+            shares={Priority.INTERACTIVE: 1.0, Priority.NORMAL: 1.0, Priority.BULK: 0.5},
+            aging_s=60,
+        )
+        order = []
+
+        async def call(name, priority, hold):
+            async with scheduler.slot(priority):
+                order.append(name)
+                await hold.wait()
+
+        hold = asyncio.Event()
+        tasks = [
+            asyncio.create_task(call("bulk-1", Priority.BULK, hold)),
+            asyncio.create_task(call("bulk-2", Priority.BULK, hold)),
+            asyncio.create_task(call("normal", Priority.NORMAL, hold)),
+            asyncio.create_task(call("interactive", Priority.INTERACTIVE, hold)),
+        ]
+        await asyncio.sleep(0.01)
+
+        # Bulk may only hold half the slots, so bulk-2 queues behind the rest
+        hold.set()
+        await asyncio.gather(*tasks)
+
+        # TOOL_PRIORITIES is parsed on first use, not on every call
+        import os
+        import utils.scheduler as scheduler_module
+
+        os.environ["TOOL_PRIORITIES"] = "generate_all=bulk"
+        scheduler_module._configured_priorities = None
+        try:
+            configured = scheduler_module.tool_priority("generate_all")
+            os.environ["TOOL_PRIORITIES"] = "generate_all=interactive"
+            cached = scheduler_module.tool_priority("generate_all")
+        finally:
+            del os.environ["TOOL_PRIORITIES"]
+            scheduler_module._configured_priorities = None
+
+        if (
+            order == ["bulk-1", "normal", "interactive", "bulk-2"]
+            and configured == cached == Priority.BULK
+        ):
+            logger.info(f"✓ Slots granted in priority order: {order}")
+            return True
+
+        logger.error(f"✗ Unexpected grant order: {order}")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Priority scheduler test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_deadline_and_cancellation():
+    """Test 11: Deadline propagation and cancellation"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 11: Deadlines and Cancellation")
+    logger.info("=" * 60)
+
+    try:
+        import time
+        from utils.context import request_scope
+        from utils.gemini_client import DeadlineExceededError
+        from utils.metrics import get_metrics
+        from utils.scheduler import get_scheduler
+
+        class SlowModel:
+            calls = 0
+
+            def generate_content(self, content, generation_config=None):
+                self.calls += 1
+                time.sleep(0.3)
+                return type("Response", (), {"text": "done"})()
+
+        model = SlowModel()
+        client = create_offline_client(model, "slow-model")
+        # Calls abandoned by earlier tests may still hold slots
+        in_flight_before = get_scheduler().in_flight
+
+        # A call is not started with less than the minimum useful time left
+        try:
+            with request_scope("generate_style", deadline_s=0.3):
+                await client.analyze_image(None, "prompt")
+            logger.error("✗ Should have raised DeadlineExceededError")
+            return False
+        except DeadlineExceededError as e:
+            logger.info(f"✓ Refused before calling upstream: {e}")
+            if model.calls != 0 or get_scheduler().in_flight != in_flight_before:
+                logger.error("✗ Call started (or slot kept) with too little time left")
+                return False
+
+        # The call only gets what is left of the request deadline
+        client.timeouts.min_call = 0.05
+        started = time.monotonic()
+        try:
+            with request_scope("generate_style", deadline_s=0.1):
+                await client.analyze_image(None, "prompt")
+            logger.error("✗ Should have raised DeadlineExceededError")
+            return False
+        except DeadlineExceededError as e:
+            elapsed = time.monotonic() - started
+            logger.info(f"✓ Deadline enforced after {elapsed:.2f}s: {e}")
+            if elapsed > 0.25:
+                logger.error("✗ Call ran past the request deadline")
+                return False
+
+        # Cancelling the caller abandons the call right away
+        metrics = get_metrics()
+        abandoned_before = metrics.counter("upstream.abandoned.cancelled")
+        task = asyncio.create_task(client.analyze_image(None, "prompt"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+        await asyncio.sleep(0.6)
+        if (
+            metrics.counter("upstream.abandoned.cancelled") == abandoned_before + 1
+            and metrics.counter("upstream.wasted_seconds") > 0
+            and get_scheduler().in_flight == in_flight_before
+        ):
+            logger.info(
+                f"✓ Cancelled call abandoned, "
+                f"{metrics.counter('upstream.wasted_seconds'):.2f}s wasted upstream"
+            )
+            return True
+
+        logger.error("✗ Cancellation was not accounted for")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Deadline test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_hedged_requests():
+    """Test 12: Hedged requests"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 12: Hedged Requests")
+    logger.info("=" * 60)
+
+    try:
+        import time
+        from utils.gemini_client import HedgePolicy
+        from utils.latency import get_latency_tracker
+
+        class TailModel:
+            calls = 0
+
+            def generate_content(self, content, generation_config=None):
+                self.calls += 1
+                # The first call hits the slow tail, the duplicate does not
+                time.sleep(1.0 if self.calls == 1 else 0.02)
+                return type("Response", (), {"text": f"call {self.calls}"})()
+
+        client = create_offline_client(TailModel(), "tail-model")
+        client.hedging = HedgePolicy(enabled=True, quantile=0.9, budget=1.0, min_samples=5)
+
+        for _ in range(10):
+            get_latency_tracker().record(("tail-model", "style", "small"), 0.05)
+
+        started = time.monotonic()
+        text = await client.analyze_image(None, "prompt", operation="style")
+        elapsed = time.monotonic() - started
+        stats = client.hedging.stats()
+
+        if text == "call 2" and elapsed < 0.5 and stats["win_rate"] == 1.0:
+            logger.info(f"✓ Hedge won in {elapsed:.2f}s (hedge rate {stats['hedge_rate']:.2f})")
+            await asyncio.sleep(1.0)
+            return True
+
+        logger.error(f"✗ Hedge did not win: {text!r} after {elapsed:.2f}s, {stats}")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Hedged request test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_adaptive_timeouts():
+    """Test 13: Adaptive per-call timeouts"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 13: Adaptive Timeouts")
+    logger.info("=" * 60)
+
+    try:
+        from utils.gemini_client import TimeoutPolicy
+        from utils.latency import get_latency_tracker
+
+        policy = TimeoutPolicy(
+            default=60, enabled=True, quantile=0.99, multiplier=3,
+            floor=5, ceiling=90, min_samples=10,
+        )
+        fast = ("adaptive-model", "style", "small")
+        slow = ("adaptive-model", "analysis", "large")
+
+        cold = policy.timeout_for(fast)
+        for _ in range(20):
+            get_latency_tracker().record(fast, 0.5)
+            get_latency_tracker().record(slow, 40.0)
+
+        learned_fast = policy.timeout_for(fast)
+        learned_slow = policy.timeout_for(slow)
+        logger.info(
+            f"  cold {cold:.0f}s, style/small {learned_fast:.0f}s, "
+            f"analysis/large {learned_slow:.0f}s"
+        )
+
+        if cold == 60 and learned_fast == 5 and learned_slow == 90:
+            logger.info("✓ Timeouts follow observed latency within bounds")
+            return True
+
+        logger.error("✗ Unexpected adaptive timeouts")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Adaptive timeout test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_image_pool():
+    """Test 14: Off-loop image decode and encode"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 14: Image Process Pool")
+    logger.info("=" * 60)
+
+    try:
+        from PIL import Image
+        from utils.imaging import ImagePool, ImageProcessingError
+
+        source = Image.new("RGBA", (64, 48), color=(10, 20, 30, 255))
+        buffer = BytesIO()
+        source.save(buffer, format="PNG")
+        encoded = buffer.getvalue()
+
+        process_pool = ImagePool(kind="process", workers=1)
+        inline_pool = ImagePool(kind="inline")
+        try:
+            decoded = await process_pool.decode(encoded)
+            reference = await inline_pool.decode(encoded)
+            round_trip = await process_pool.encode(decoded, "PNG")
+            # Modes PNG/JPEG cannot all store are converted before the pixels are shared
+            paletted = source.convert("P")
+            paletted_png = await process_pool.encode(paletted, "PNG")
+            paletted_reference = await inline_pool.encode(paletted, "PNG")
+
+            rejected = False
+            try:
+                await process_pool.decode(b"not an image")
+            except ImageProcessingError:
+                rejected = True
+
+            # A pool whose worker was killed is replaced and the call retried
+            broken = process_pool._executor
+            for process in list(broken._processes.values()):
+                process.kill()
+                process.join()
+            recovered = await process_pool.decode(encoded)
+            replaced = process_pool._executor is not broken
+        finally:
+            process_pool.shutdown()
+
+        logger.info(f"  decoded {decoded.size} {decoded.mode}, re-encoded {len(round_trip)} bytes")
+
+        if (
+            decoded.mode == "RGB"
+            and decoded.tobytes() == reference.tobytes()
+            and Image.open(BytesIO(round_trip)).size == (64, 48)
+            and paletted_png == paletted_reference
+            and rejected
+            and recovered.tobytes() == reference.tobytes()
+            and replaced
+        ):
+            logger.info("✓ Process pool matches inline decoding")
+            return True
+
+        logger.error("✗ Unexpected image pool results")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Image pool test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_tiled_analysis():
+    """Test 15: Tiled analysis of panoramas"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 15: Tiled Analysis")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        from unittest.mock import patch
+        from PIL import Image
+        from handlers.tools import _analyze_pil_image
+        from utils.tiling import tile_boxes
+
+        class TileClient:
+            sizes = []
+            active = 0
+            peak = 0
+
+            async def analyze_image(self, image, prompt, options=None):
+                self.sizes.append(image.size)
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                await asyncio.sleep(0.05)
+                self.active -= 1
+                tile = prompt.split("tile ")[1].split(" ")[0]
+                return (
+                    f"Panoramic saloon, section {tile}\n"
+                    "Key Features\n- Curved leather sofa\n- curved leather sofa.\n"
+                    f"- Porthole {tile}\n"
+                    "Geometry\nLong open plan\nLighting\nRecessed LED strips"
+                )
+
+        panorama = Image.new("RGB", (6000, 1500), (180, 170, 160))
+        boxes = tile_boxes(panorama.size, tile_size=1536, overlap=192, max_tiles=8)
+        client = TileClient()
+        output = await _analyze_pil_image(client, panorama, tiling="on")
+
+        covered = boxes[0][0] == 0 and boxes[-1][2] == 6000
+        overlapping = all(a[2] - b[0] >= 192 for a, b in zip(boxes, boxes[1:]))
+        sofas = [f for f in output.key_features if "sofa" in f.lower()]
+
+        # Zero tile sizes or counts are refused instead of looping forever
+        refused = 0
+        for name in ("TILE_SIZE", "TILE_MAX_COUNT"):
+            with patch.dict(os.environ, {name: "0"}):
+                try:
+                    tile_boxes(panorama.size)
+                except ValueError:
+                    refused += 1
+        tiny = tile_boxes((40, 10), tile_size=1, overlap=0, max_tiles=8)
+
+        logger.info(
+            f"  {len(boxes)} tiles, peak concurrency {client.peak}, "
+            f"{len(output.key_features)} merged features"
+        )
+
+        if (
+            len(client.sizes) == len(boxes) == 5
+            and covered
+            and overlapping
+            and client.peak == len(boxes)
+            and len(sofas) == 1
+            and len(output.key_features) == 1 + len(boxes)
+            and output.lighting_analysis == "Recessed LED strips"
+            and refused == 2
+            and 1 <= len(tiny) <= 8
+        ):
+            logger.info("✓ Tiles analyzed concurrently and merged without duplicates")
+            return True
+
+        logger.error("✗ Unexpected tiled analysis result")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Tiled analysis test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_room_analysis():
+    """Test 16: Multi-photo room analysis"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 16: Room Analysis")
+    logger.info("=" * 60)
+
+    try:
+        from unittest.mock import patch
+        from PIL import Image
+        from handlers.tools import analyze_yacht_room
+
+        class RecordingModel:
+            calls = []
+
+            def generate_content(self, content, generation_config=None):
+                photos = [part for part in content if isinstance(part, Image.Image)]
+                labels = [part for part in content[1:] if isinstance(part, str)]
+                self.calls.append((len(photos), labels))
+                text = (
+                    "Owner's stateroom\nKey Features\n- King-size bed\n- Hull windows\n"
+                    "Geometry\nSymmetric around the bed\nLighting\nTwo hull windows"
+                )
+                return type("Response", (), {"text": text})()
+
+        model = RecordingModel()
+        client = create_offline_client(model, "room-model")
+        photos = [create_test_image() for _ in range(6)]
+
+        with patch("handlers.tools.get_gemini_client", return_value=client):
+            result = await analyze_yacht_room(photos)
+
+            rejected = False
+            try:
+                await analyze_yacht_room(photos + ["not-base64!"])
+            except ValueError:
+                rejected = True
+
+        logger.info(f"  calls: {[count for count, _ in model.calls]}, features: {result['key_features']}")
+
+        if (
+            [count for count, _ in model.calls] == [3, 3]
+            and model.calls[0][1] == ["Photo 1:", "Photo 2:", "Photo 3:"]
+            and result["key_features"] == ["King-size bed", "Hull windows"]
+            and rejected
+        ):
+            logger.info("✓ Six photos analyzed in two grouped calls and merged")
+            return True
+
+        logger.error("✗ Unexpected room analysis result")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Room analysis test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_single_call_styles():
+    """Test 17: Single-call multi-style generation with per-style fallback"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 17: Single-Call Multi-Style Generation")
+    logger.info("=" * 60)
+
+    try:
+        import json
+        from unittest.mock import patch
+        from handlers.tools import generate_all_styles
+        from utils.fake_backend import FakeGenerativeModel
+
+        class TruncatingModel(FakeGenerativeModel):
+            """Cuts the JSON response off in the middle of the third style."""
+
+            json_calls = 0
+            style_calls = 0
+
+            def _respond(self, prompt, generation_config):
+                text = super()._respond(prompt, generation_config)
+                if getattr(generation_config, "response_schema", None):
+                    self.json_calls += 1
+                    data = json.loads(text)
+                    keys = list(data)
+                    partial = json.dumps({k: data[k] for k in keys[:3]})
+                    return partial[: partial.rindex(data[keys[2]]) + 40]
+                if "STYLE GUIDELINES" in prompt:
+                    self.style_calls += 1
+                return text
+
+        model = TruncatingModel("multi-style-model", latency_ms=0, ms_per_output_token=0)
+        client = create_offline_client(model, "multi-style-model")
+
+        events = {}
+        with patch("handlers.tools.get_gemini_client", return_value=client):
+            result = await generate_all_styles(
+                create_test_image(),
+                generation_mode="single_call",
+                progress=lambda step, state: events.setdefault(step, []).append(state),
+            )
+
+        styles = result["styles"]
+        # Each step reports running once, then completed once
+        reported = set(events) == {"analysis", *styles} and all(
+            states == ["running", "completed"] for states in events.values()
+        )
+        logger.info(
+            f"  JSON calls: {model.json_calls}, per-style fallbacks: {model.style_calls}, "
+            f"styles returned: {len(styles)}"
+        )
+
+        if (
+            model.json_calls == 1
+            and model.style_calls == 3
+            and len(styles) == 5
+            and all(not style.get("error") and style["description"] for style in styles.values())
+            and reported
+        ):
+            logger.info("✓ Two styles from one call, truncated ones regenerated individually")
+            return True
+
+        logger.error("✗ Unexpected single-call result")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Single-call generation test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_micro_batching():
+    """Test 18: Micro-batching of concurrent generate_style calls"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 18: Micro-Batching")
+    logger.info("=" * 60)
+
+    try:
+        from unittest.mock import patch
+        from PIL import Image
+        from handlers.tools import generate_yacht_style
+        from utils.batcher import MicroBatcher
+        from utils.context import request_scope
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.gemini_client import DeadlineExceededError
+        from utils.metrics import get_metrics
+
+        class CountingModel(FakeGenerativeModel):
+            def generate_content(self, content, generation_config=None, **kwargs):
+                self.images_per_call = getattr(self, "images_per_call", [])
+                self.images_per_call.append(
+                    sum(1 for part in content if isinstance(part, Image.Image))
+                )
+                return super().generate_content(content, generation_config)
+
+        model = CountingModel("batch-model", latency_ms=20, ms_per_output_token=0)
+        client = create_offline_client(model, "batch-model")
+        # Token budget fits three items (small image + description + output limit)
+        batcher = MicroBatcher(enabled=True, window_ms=50, max_tokens=7000, max_items=8)
+
+        with patch("handlers.tools.get_gemini_client", return_value=client), \
+                patch("handlers.tools.get_batcher", return_value=batcher):
+            requests = [
+                generate_yacht_style(create_test_image(), f"Cabin {i}", "futuristic")
+                for i in range(4)
+            ] + [generate_yacht_style(create_test_image(), "Cabin 9", "cyberpunk")]
+            results = await asyncio.gather(*requests)
+
+        # Priority classes are batched separately; a short deadline only
+        # fails its own item, not the batch it opened
+        slow = CountingModel("batch-model", latency_ms=200, ms_per_output_token=0)
+        slow_client = create_offline_client(slow, "batch-model")
+
+        async def styled(description, priority=None, deadline_s=None):
+            with request_scope("generate_style", priority, deadline_s):
+                return await generate_yacht_style(create_test_image(), description, "artdeco")
+
+        with patch("handlers.tools.get_gemini_client", return_value=slow_client), \
+                patch("handlers.tools.get_batcher", return_value=batcher):
+            await asyncio.gather(styled("Cabin A"), styled("Cabin B", priority="bulk"))
+            by_priority = sorted(slow.images_per_call)
+            short, long = await asyncio.gather(
+                styled("Cabin C", deadline_s=0.1),
+                styled("Cabin D", deadline_s=10),
+                return_exceptions=True,
+            )
+
+        wait = get_metrics().snapshot()["summaries"].get("batch.wait_s", {})
+        logger.info(
+            f"  images per upstream call: {sorted(model.images_per_call)}, "
+            f"batch wait p95: {wait.get('p95', 0) * 1000:.0f}ms"
+        )
+        logger.info(f"  by priority: {by_priority}, short deadline: {type(short).__name__}")
+
+        if (
+            sorted(model.images_per_call) == [1, 1, 3]
+            and all(r["description"] for r in results)
+            and [r["style"] for r in results] == ["futuristic"] * 4 + ["cyberpunk"]
+            and wait.get("count", 0) >= 5
+            and by_priority == [1, 1]
+            and isinstance(short, DeadlineExceededError)
+            and isinstance(long, dict) and long["description"]
+            and sorted(slow.images_per_call) == [1, 1, 2]
+        ):
+            logger.info("✓ Same-style requests batched within the token budget")
+            return True
+
+        logger.error("✗ Unexpected batching")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Micro-batching test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_stdio_transport():
+    """Test 19: Real MCP server over stdio with the fake backend"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 19: Stdio Transport (fake backend)")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import json
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, GEMINI_BACKEND="fake", FAKE_LATENCY_MS="10",
+                   IMAGE_POOL="process", IMAGE_WORKERS="1", LOG_LEVEL="WARNING")
+        params = StdioServerParameters(
+            command=sys.executable,
+            args=[os.path.join(package_dir, "main.py")],
+            env=env,
+            cwd=package_dir,
+        )
+
+        with open(os.devnull, "w") as errlog:
+            async with stdio_client(params, errlog=errlog) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    # Decoding goes through the process pool inside the server
+                    result = await asyncio.wait_for(
+                        session.call_tool("analyze_structure", {"image": create_test_image()}),
+                        timeout=60,
+                    )
+                    analysis = json.loads(result.content[0].text)
+                    metrics = await session.call_tool("server_metrics", {})
+                    process = json.loads(metrics.content[0].text).get("process", {})
+
+        logger.info(
+            f"  analysis status: {analysis.get('status', 'ok')}, "
+            f"server rss: {(process.get('rss_bytes') or 0) / 2**20:.0f}MB"
+        )
+        if analysis.get("key_features") and process.get("max_rss_bytes"):
+            logger.info("✓ Server answered over stdio and reported its memory use")
+            return True
+
+        logger.error(f"✗ Unexpected response: {analysis} / {process}")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Stdio transport test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_profiling():
+    """Test 20: On-demand profiling of selected tool calls"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 20: On-Demand Profiling")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import tempfile
+        from unittest.mock import patch
+        from utils.context import request_scope
+        from utils.profiling import Profiler
+
+        async def call(tool, delay_s):
+            with request_scope(tool):
+                await asyncio.sleep(delay_s)
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Every 2nd call of analyze_structure, and any call slower than 80 ms
+            profiler = Profiler(
+                tools="analyze_structure", every_n=2, slow_ms=80, directory=directory
+            )
+            with patch("utils.context.get_profiler", return_value=profiler):
+                for delay_s in (0.01, 0.01, 0.01, 0.1):
+                    await call("analyze_structure", delay_s)
+                await call("generate_style", 0.1)  # not selected
+
+                # Profiles are written off the loop
+                profiler.flush()
+                profiles = sorted(f for f in os.listdir(directory) if f.endswith(".prof"))
+
+                # A call overlapping a profiled one is reported in its summary
+                before = set(os.listdir(directory))
+                await asyncio.gather(
+                    call("analyze_structure", 0.1), call("generate_style", 0.01)
+                )
+                profiler.flush()
+                (summary,) = [
+                    f for f in set(os.listdir(directory)) - before if f.endswith(".txt")
+                ]
+                with open(os.path.join(directory, summary)) as f:
+                    overlap_noted = "1 other call(s) overlapped" in f.read()
+
+                profiler.configure(tools="")
+                await call("analyze_structure", 0.1)
+                after_off = len([f for f in os.listdir(directory) if f.endswith(".prof")])
+
+        # Rotation only deletes profile files, never other files in the directory
+        with tempfile.TemporaryDirectory() as directory:
+            foreign = ["main.py", "notes.txt", "20240101-000000_report.pdf"]
+            for name in foreign:
+                with open(os.path.join(directory, name), "w") as f:
+                    f.write("keep me")
+            rotating = Profiler(tools="analyze_structure", every_n=1, directory=directory, max_files=2)
+            with patch("utils.context.get_profiler", return_value=rotating):
+                for _ in range(3):
+                    await call("analyze_structure", 0.01)
+                    rotating.flush()
+            remaining = set(os.listdir(directory))
+            survived = all(name in remaining for name in foreign)
+            kept = len(remaining) - len(foreign)
+
+        logger.info(f"  profiles written: {len(profiles)}, after turning off: {after_off}")
+        logger.info(f"  after rotation: {kept} profile files, foreign files kept: {survived}")
+        if (
+            len(profiles) == 2
+            and all("_analyze_structure_" in name for name in profiles)
+            and overlap_noted
+            and after_off == 3
+            and not profiler.enabled
+            and survived
+            and kept == 2
+        ):
+            logger.info("✓ Sampled and slow calls profiled; nothing when off")
+            return True
+
+        logger.error(f"✗ Unexpected profiles: {profiles}")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Profiling test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_warmup():
+    """Test 21: Startup warm-up and readiness"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 21: Startup Warm-Up")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        from unittest.mock import patch
+        from utils.gemini_client import GeminiClient
+        from utils.warmup import Warmup
+
+        # Independent of GEMINI_API_KEY: the fake backend, on a client of its own
+        with patch.dict(os.environ, {"GEMINI_BACKEND": "fake"}), patch.object(
+            GeminiClient, "_instance", None
+        ):
+            warmup = Warmup(enabled=True, ping=False, preload_cache=True)
+            before = warmup.status()
+            await warmup.run()
+            after = warmup.status()
+
+            # A warm-up that cannot finish in time is reported, not raised
+            slow = Warmup(enabled=True, ping=False, timeout_s=0.0001)
+            await slow.run()
+
+        # Without a client the server is degraded and not ready
+        keyless_env = {"GEMINI_BACKEND": "gemini", "GEMINI_API_KEY": ""}
+        with patch.dict(os.environ, keyless_env), patch.object(GeminiClient, "_instance", None):
+            keyless = Warmup(enabled=True, ping=False, preload_cache=False)
+            await keyless.run()
+
+        disabled = Warmup(enabled=False)
+
+        logger.info(
+            f"  warm-up: {after['state']} in {after['warmup_duration_s']}s, "
+            f"steps: {[step['name'] for step in after['steps']]}"
+        )
+        if (
+            not before["ready"]
+            and after["ready"]
+            and after["state"] == "ready"
+            and {step["name"] for step in after["steps"]}
+            == {"image_pool", "hashing", "client", "cache"}
+            and slow.state == "degraded"
+            and any("Timed out" in (step["error"] or "") for step in slow.status()["steps"])
+            and keyless.state == "degraded"
+            and not keyless.ready
+            and disabled.ready
+        ):
+            logger.info("✓ Warm-up primes all paths and reports readiness")
+            return True
+
+        logger.error(f"✗ Unexpected warm-up state: {after} / {slow.status()}")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Warm-up test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_transport():
+    """Test 22: Gemini transport configuration and channel pool"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 22: Gemini Transport")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import threading
+        import time
+        from unittest import mock
+        from utils.gemini_client import DeadlineExceededError
+        from utils.transport import (
+            ChannelPool,
+            ChannelWaitTimeout,
+            TransportConfig,
+            build_channel_pool,
+        )
+
+        # Calls spread over channels; a full pool queues callers in order
+        pool = ChannelPool(["a", "b"], max_in_flight=1)
+        served = []
+        lock = threading.Lock()
+
+        def call(i):
+            with pool.acquire() as channel:
+                with lock:
+                    served.append(channel)
+                time.sleep(0.02)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.stats()
+
+        # A caller queued for a channel gives up at its budget and leaves the queue
+        full = ChannelPool(["only"], max_in_flight=1)
+        with full.acquire():
+            started = time.monotonic()
+            try:
+                with full.acquire(timeout=0.05):
+                    pass
+                timed_out = False
+            except ChannelWaitTimeout:
+                timed_out = time.monotonic() - started < 1
+        queue_left = full.stats()["waiting"]
+        with full.acquire(timeout=0.05) as entry:
+            reusable = entry == "only"
+
+        class StandInModel:
+            def generate_content(self, content, generation_config=None):
+                return "ok"
+
+        client = create_offline_client(None, "transport-model")
+        client.channels = ChannelPool([StandInModel()], max_in_flight=1)
+        with client.channels.acquire():
+            try:
+                await asyncio.to_thread(
+                    client._generate, ["prompt"], None, time.monotonic() + 0.05
+                )
+                deadline_raised = False
+            except DeadlineExceededError:
+                deadline_raised = True
+
+        with mock.patch.dict(os.environ, {"GEMINI_TRANSPORT": "carrier-pigeon"}):
+            try:
+                TransportConfig.from_env()
+                rejected = False
+            except ValueError:
+                rejected = True
+
+        # Clients are built without connecting
+        grpc_pool = build_channel_pool(
+            TransportConfig(kind="grpc", channels=3, endpoint="http://127.0.0.1:9"), "key", "m"
+        )
+        rest_pool = build_channel_pool(
+            TransportConfig(kind="rest", max_connections=16, endpoint="http://127.0.0.1:9"), "key", "m"
+        )
+        channels = {id(model._client.transport.grpc_channel) for model in grpc_pool.entries}
+        adapter = rest_pool.entries[0]._client.transport._session.get_adapter("http://127.0.0.1:9")
+
+        logger.info(f"  pool: {stats}, grpc channels: {len(channels)}")
+        if (
+            sum(stats["calls"]) == 6
+            and min(stats["calls"]) >= 2
+            and stats["in_flight"] == [0, 0]
+            and stats["waits"] == 4
+            and timed_out
+            and queue_left == 0
+            and reusable
+            and deadline_raised
+            and rejected
+            and len(channels) == 3
+            and grpc_pool.max_in_flight == 100
+            and rest_pool.max_in_flight == 0
+            and adapter._pool_maxsize == 16
+            and adapter._pool_block
+        ):
+            logger.info("✓ Transport settings applied and calls spread over channels")
+            return True
+
+        logger.error("✗ Transport configuration not applied as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Transport test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_logging_pipeline():
+    """Test 23: Queued, sampled and structured logging"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 23: Logging Pipeline")
+    logger.info("=" * 60)
+
+    try:
+        import json
+        import queue
+        import time
+        import logging
+        from utils.context import request_scope
+        from utils.logging_setup import JsonFormatter, LogWriter, SampledQueueHandler
+        from utils.metrics import get_metrics
+
+        def counter(name):
+            return get_metrics().snapshot()["counters"].get(name, 0)
+
+        def test_logger(name, handler):
+            log = logging.getLogger(name)
+            log.handlers = [handler]
+            log.propagate = False
+            log.setLevel(logging.DEBUG)
+            return log
+
+        # A full queue drops INFO records instead of blocking the caller
+        dropped_before = counter("logging.dropped")
+        full = SampledQueueHandler(queue.Queue(maxsize=2))
+        full_log = test_logger("test.logging.full", full)
+        for i in range(5):
+            full_log.info("record %s", i)
+        dropped = counter("logging.dropped") - dropped_before
+
+        # A slow writer does not slow down the logging call sites
+        class SlowWriter(logging.Handler):
+            def emit(self, record):
+                time.sleep(0.01)
+
+        slow = SampledQueueHandler(queue.Queue(maxsize=100))
+        listener = LogWriter(slow.queue, SlowWriter())
+        listener.start()
+        slow_log = test_logger("test.logging.slow", slow)
+        start = time.perf_counter()
+        for i in range(500):
+            slow_log.info("record %s", i)
+        elapsed = time.perf_counter() - start
+        listener.stop()
+
+        # Sampling applies per logger prefix, and only below WARNING
+        sampled = SampledQueueHandler(queue.Queue(), {"test.logging.sampled": 0.0})
+        test_logger("test.logging.sampled.child", sampled).info("sampled out")
+        test_logger("test.logging.sampled.child", sampled).warning("kept")
+        test_logger("test.logging.other", sampled).info("kept")
+
+        # JSON lines carry the request id of the calling tool
+        structured = SampledQueueHandler(queue.Queue())
+        structured_log = test_logger("test.logging.json", structured)
+        with request_scope("analyze_structure") as context:
+            structured_log.info("Decoded image: %sx%s", 640, 480)
+        line = json.loads(JsonFormatter().format(structured.queue.get_nowait()))
+
+        logger.info(f"  dropped {dropped}/5, 500 records with a slow writer in {elapsed * 1000:.1f} ms")
+        logger.info(f"  json: {line}")
+        if (
+            dropped == 3
+            and elapsed < 1.0
+            and sampled.queue.qsize() == 2
+            and line["message"] == "Decoded image: 640x480"
+            and line["request_id"] == context.request_id
+            and line["tool"] == "analyze_structure"
+        ):
+            logger.info("✓ Logging never blocks, samples and tags records with request ids")
+            return True
+
+        logger.error("✗ Logging pipeline did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Logging pipeline test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_session_quotas():
+    """Test 24: Per-session fair queueing and quotas"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 24: Session Quotas")
+    logger.info("=" * 60)
+
+    try:
+        from unittest.mock import patch
+        from handlers.tools import generate_yacht_style
+        from utils.batcher import MicroBatcher
+        from utils.context import request_scope
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.gemini_client import RejectedError
+        from types import SimpleNamespace
+        from mcp.server.fastmcp import Context
+        from mcp.shared.context import RequestContext
+        from utils.quotas import Caller, LOCAL_CALLER, QuotaManager, caller_identity, get_quotas
+        from utils.scheduler import PriorityScheduler, Priority
+
+        # Callers are identified from the FastMCP context of the tool call
+        http_request = SimpleNamespace(
+            headers={"mcp-session-id": "abc", "authorization": "Bearer secret"}
+        )
+        identified = caller_identity(Context(request_context=RequestContext(
+            request_id=1, meta=None, session=object(), lifespan_context=None, request=http_request,
+        )))
+        identified_ok = (
+            caller_identity(None) == LOCAL_CALLER
+            and caller_identity(Context()) == LOCAL_CALLER
+            and identified.session == "abc"
+            and identified.tenant.startswith("token-")
+            and "secret" not in identified.tenant
+        )
+
+        quotas = QuotaManager(
+            session_concurrency=0, tenant_concurrency=0,
+            session_tokens_per_min=0, tenant_tokens_per_min=0, max_queued=0, weights={},
+        )
+        scheduler = PriorityScheduler(max_concurrency=1, aging_s=60, quotas=quotas)
+        busy, quiet = Caller("session-busy"), Caller("session-quiet")
+        order = []
+
+        async def call(name, caller, hold):
+            async with scheduler.slot(Priority.INTERACTIVE, caller):
+                order.append(name)
+                await hold.wait()
+
+        # A busy session queues five calls, then a quiet one arrives with two
+        holds = []
+        tasks = []
+        for i in range(5):
+            holds.append(asyncio.Event())
+            tasks.append(asyncio.create_task(call(f"busy-{i}", busy, holds[-1])))
+            await asyncio.sleep(0)
+        for i in range(2):
+            holds.append(asyncio.Event())
+            tasks.append(asyncio.create_task(call(f"quiet-{i}", quiet, holds[-1])))
+            await asyncio.sleep(0)
+        while len(order) < 7:
+            await asyncio.sleep(0.01)
+            for hold in holds:
+                hold.set()
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        quiet_done = max(order.index("quiet-0"), order.index("quiet-1"))
+
+        # The session concurrency limit holds even with free slots
+        limited = QuotaManager(
+            session_concurrency=1, tenant_concurrency=0,
+            session_tokens_per_min=0, tenant_tokens_per_min=0, max_queued=0, weights={},
+        )
+        wide = PriorityScheduler(max_concurrency=4, aging_s=60, quotas=limited)
+        await wide.acquire(Priority.INTERACTIVE, busy)
+        second = asyncio.create_task(wide.acquire(Priority.INTERACTIVE, busy))
+        await wide.acquire(Priority.INTERACTIVE, quiet)
+        await asyncio.sleep(0.01)
+        blocked = not second.done()
+        wide.release(Priority.INTERACTIVE, busy)
+        await asyncio.wait_for(second, 1)
+        wide.release(Priority.INTERACTIVE, busy)
+        wide.release(Priority.INTERACTIVE, quiet)
+
+        # An exhausted token budget rejects with a retry-after hint
+        shared = get_quotas()
+        budget = shared.session_tokens_per_min
+        shared.session_tokens_per_min = 100
+        try:
+            spender = Caller("session-spender")
+            shared.charge(spender, 150)
+
+            class CountingModel:
+                calls = 0
+
+                def generate_content(self, content, generation_config=None):
+                    self.calls += 1
+                    return type("Response", (), {"text": "ok"})()
+
+            model = CountingModel()
+            client = create_offline_client(model, "quota-model")
+            rejection = None
+            try:
+                with request_scope("generate_style", caller=spender):
+                    await client.analyze_image(None, "prompt", operation="style")
+            except RejectedError as e:
+                rejection = e
+            with request_scope("generate_style", caller=Caller("session-other")):
+                other = await client.analyze_image(None, "prompt", operation="style")
+            stats = shared.stats()["sessions"]["session-spender"]
+
+            # Concurrent sessions share one micro-batch and split its
+            # tokens; the over-budget session is rejected on its own
+            fake = FakeGenerativeModel("quota-batch-model", latency_ms=0, ms_per_output_token=0)
+            batch_client = create_offline_client(fake, "quota-batch-model")
+            batcher = MicroBatcher(enabled=True, window_ms=50)
+
+            async def styled(caller):
+                with request_scope("generate_style", caller=caller):
+                    return await generate_yacht_style(create_test_image(), "Saloon", "futuristic")
+
+            with patch("handlers.tools.get_gemini_client", return_value=batch_client), \
+                    patch("handlers.tools.get_batcher", return_value=batcher):
+                batched = await asyncio.gather(
+                    styled(spender),
+                    styled(Caller("session-batched-a")),
+                    styled(Caller("session-batched-b")),
+                    return_exceptions=True,
+                )
+            sessions = shared.stats()["sessions"]
+            charged = [sessions[f"session-batched-{s}"]["tokens"] for s in "ab"]
+            spent = sessions["session-spender"]["tokens"]
+        finally:
+            shared.session_tokens_per_min = budget
+
+        logger.info(f"  grant order: {order}")
+        logger.info(f"  rejection: {rejection} (retry after {getattr(rejection, 'retry_after', None)})")
+        logger.info(f"  batched: {[type(r).__name__ for r in batched]}, charged {charged}")
+        if (
+            identified_ok
+            and quiet_done <= 4
+            and blocked
+            and rejection is not None
+            and 50 < rejection.retry_after <= 60
+            and model.calls == 1
+            and other == "ok"
+            and stats["rejected"] == 1
+            and isinstance(batched[0], RejectedError)
+            and all(isinstance(r, dict) and r["description"] for r in batched[1:])
+            and fake.calls == 1
+            and charged[0] > 0
+            and abs(charged[0] - charged[1]) <= 1
+            and spent == 150
+        ):
+            logger.info("✓ Sessions share slots fairly and quotas reject with retry-after")
+            return True
+
+        logger.error("✗ Session quotas did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Session quota test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_result_store_ingest():
+    """Test 25: Bulk ingest into the result store"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 25: Result Store and Bulk Ingest")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import shutil
+        import tempfile
+        from unittest.mock import patch
+        from handlers.tools import (
+            analyze_yacht_structure,
+            generate_all_styles,
+            generate_yacht_style,
+        )
+        from ingest import ingest_directory
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.result_store import ResultStore, get_result_store, set_result_store
+
+        model = FakeGenerativeModel("ingest-model", latency_ms=0, ms_per_output_token=0)
+        client = create_offline_client(model, "ingest-model")
+        previous = get_result_store()
+        workdir = tempfile.mkdtemp()
+        try:
+            photos = os.path.join(workdir, "photos")
+            os.makedirs(os.path.join(photos, "deck"))
+            image = base64.b64decode(create_test_image())
+            for name in ("saloon.png", os.path.join("deck", "saloon-copy.png")):
+                with open(os.path.join(photos, name), "wb") as f:
+                    f.write(image)
+            checkpoint = os.path.join(workdir, "checkpoint.jsonl")
+
+            set_result_store(ResultStore(mode="disk", root=os.path.join(workdir, "store")))
+            with patch("handlers.tools.get_gemini_client", return_value=client), patch.dict(
+                os.environ, {"STYLE_CACHE_VARIANTS": "2"}
+            ):
+                first = await ingest_directory(photos, checkpoint, concurrency=2)
+                ingest_calls = model.calls
+                resumed = await ingest_directory(photos, checkpoint, concurrency=2)
+
+                # A fresh server process sharing the directory gets cache hits,
+                # without decoding the image
+                set_result_store(ResultStore(mode="disk", root=os.path.join(workdir, "store")))
+                decodes = []
+                decode = client.decode_image_async
+
+                async def counting_decode(data):
+                    decodes.append(len(data))
+                    return await decode(data)
+
+                client.decode_image_async = counting_decode
+                analysis = await analyze_yacht_structure(create_test_image())
+                style = await generate_yacht_style(
+                    create_test_image(), analysis["description"], "futuristic"
+                )
+                everything = await generate_all_styles(create_test_image())
+                live_calls = model.calls - ingest_calls
+
+            # Concurrent variant writes to one key are not lost
+            shared = ResultStore(
+                mode="disk", root=os.path.join(workdir, "shared"), memory_entries=0
+            )
+            key = "ab" * 32
+            await asyncio.gather(
+                *(shared.add_variant_async(key, {"n": n}, 100) for n in range(20))
+            )
+            kept = shared.variant_count(key)
+        finally:
+            set_result_store(previous)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        # A misspelled mode is an error, not a silently disabled store
+        try:
+            ResultStore(mode="dsik")
+            bad_mode_refused = False
+        except ValueError as e:
+            bad_mode_refused = "memory" in str(e)
+
+        logger.info(f"  first run: {first}, resumed: {resumed}")
+        logger.info(f"  upstream calls: ingest {ingest_calls}, live {live_calls}")
+        logger.info(f"  live image decodes: {len(decodes)}, concurrent variants kept: {kept}")
+        if (
+            first["ingested"] == 1
+            and first["duplicates"] == 1
+            and resumed["skipped"] == 1
+            and resumed["ingested"] == 0
+            and ingest_calls == 11
+            and live_calls == 0
+            and not decodes
+            and kept == 20
+            and style["description"]
+            and len(everything["styles"]) == 5
+            and bad_mode_refused
+        ):
+            logger.info("✓ Ingested photos are deduplicated, resumable and served from the store")
+            return True
+
+        logger.error("✗ Result store ingest did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Result store ingest test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_similarity_search():
+    """Test 26: Similarity search over analyses"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 26: Similarity Search")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import random
+        import shutil
+        import tempfile
+        from unittest.mock import AsyncMock, MagicMock, patch
+        import numpy as np
+        from handlers.tools import analyze_yacht_structure, find_similar_interiors
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.vector_index import (
+            GeminiEmbedder,
+            HashingEmbedder,
+            VectorIndex,
+            VectorIndexError,
+        )
+
+        materials = ["teak", "walnut", "marble", "leather", "brass", "linen", "carbon fibre"]
+        spaces = ["saloon", "master cabin", "galley", "sky lounge", "guest cabin"]
+        lights = ["skylight", "hull windows", "indirect LED strips", "pendant lamps"]
+        rng = random.Random(7)
+
+        path = os.path.join(tempfile.mkdtemp(), "vectors.jsonl")
+        index = VectorIndex(embedder=HashingEmbedder(256), path=path, enabled=True)
+        for i in range(300):
+            space, material, light = rng.choice(spaces), rng.choice(materials), rng.choice(lights)
+            await index.add(
+                f"interior-{i}",
+                {
+                    "description": f"A {space} finished in {material} with {light}.",
+                    "key_features": [f"{material} panelling", light, space],
+                    "lighting_analysis": f"Daylight from the {light}.",
+                },
+            )
+
+        model = FakeGenerativeModel("similar-model", latency_ms=0, ms_per_output_token=0)
+        client = create_offline_client(model, "similar-model")
+        with patch("handlers.tools.get_vector_index_async", AsyncMock(return_value=index)), patch(
+            "handlers.tools.get_gemini_client", return_value=client
+        ):
+            # New analyses are indexed incrementally, in the background
+            await analyze_yacht_structure(create_test_image())
+            await index.drain()
+            indexed = len(index)
+
+            by_text = await find_similar_interiors(
+                description="saloon finished in teak with skylight", features=["teak"], top_k=5
+            )
+            by_image = await find_similar_interiors(image=create_test_image(), top_k=3)
+
+        reloaded = VectorIndex(embedder=HashingEmbedder(256), path=path)
+
+        # The file is compacted once it holds twice the capacity
+        small_path = os.path.join(os.path.dirname(path), "small.jsonl")
+        small = VectorIndex(embedder=HashingEmbedder(64), path=small_path, max_entries=10)
+        for n in range(30):
+            await small.add(f"entry-{n}", {"description": f"Cabin number {n}", "key_features": []})
+        with open(small_path, encoding="utf-8") as f:
+            small_lines = len(f.readlines())
+        small_reloaded = VectorIndex(embedder=HashingEmbedder(64), path=small_path, max_entries=10)
+
+        # Searches do not wait for a write to the file in progress
+        with small_reloaded._file_lock:
+            during_write = await asyncio.wait_for(
+                asyncio.to_thread(
+                    small_reloaded.search, small_reloaded.embedder.embed("Cabin number 25"), 1
+                ),
+                timeout=1,
+            )
+
+        # A file from another embedder is refused, not skipped or compacted
+        with open(path, "rb") as f:
+            before_mismatch = f.read()
+        try:
+            VectorIndex(embedder=HashingEmbedder(128), path=path, max_entries=10)
+            mismatch_refused = False
+        except VectorIndexError:
+            mismatch_refused = True
+        with open(path, "rb") as f:
+            mismatch_refused = mismatch_refused and f.read() == before_mismatch
+
+        # Gemini embeddings are scheduled client calls
+        embedding_client = MagicMock()
+        embedding_client.embed_text = AsyncMock(return_value=[3.0, 4.0])
+        with patch("utils.gemini_client.get_gemini_client", return_value=embedding_client):
+            gemini_vector = await GeminiEmbedder(dim=2).embed_async("teak saloon")
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        top = by_text["matches"][0]
+        logger.info(f"  indexed: {indexed}, top match: {top['description']} ({top['score']})")
+        logger.info(f"  search: {by_text['search_ms']} ms, reloaded: {len(reloaded)} entries")
+        logger.info(f"  file lines after 30 adds at capacity 10: {small_lines}")
+
+        if (
+            indexed == 301
+            and len(by_text["matches"]) == 5
+            and all(any("teak" in f for f in m["key_features"]) for m in by_text["matches"])
+            and "saloon" in top["description"] and "skylight" in top["description"]
+            and top["matched_features"] == ["teak panelling"]
+            and by_text["search_ms"] < 50
+            and len(by_image["matches"]) == 3
+            and all(m["id"].startswith("interior-") for m in by_image["matches"])
+            and len(reloaded) == 301
+            and small_lines <= 20
+            and len(small_reloaded) == 10
+            and "entry-29" in small_reloaded
+            and "entry-19" not in small_reloaded
+            and [m.id for m in during_write] == ["entry-25"]
+            and mismatch_refused
+            and np.allclose(gemini_vector, [0.6, 0.8])
+        ):
+            logger.info("✓ Analyses are indexed incrementally and searched in milliseconds")
+            return True
+
+        logger.error("✗ Similarity search did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Similarity search test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_speculative_prefetch():
+    """Test 27: Speculative style prefetch after analysis"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 27: Speculative Style Prefetch")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import time
+        from unittest.mock import patch
+        from PIL import Image
+        from handlers.tools import _style_key, analyze_yacht_structure, generate_yacht_style
+        from models.schemas import YachtStyle
+        from utils.context import request_scope
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.metrics import get_metrics
+        from utils.quotas import Caller
+        from utils.result_store import ResultStore, get_result_store, image_digest, set_result_store
+        from utils.scheduler import PriorityScheduler
+        from utils.speculation import StylePrefetcher
+
+        metrics = get_metrics()
+        model = FakeGenerativeModel("speculative-model", latency_ms=100, ms_per_output_token=0)
+        client = create_offline_client(model, "speculative-model")
+        prefetcher = StylePrefetcher(enabled=True, top_styles=2)
+        for style, requests in (("futuristic", 3), ("artdeco", 2), ("cyberpunk", 1)):
+            for _ in range(requests):
+                prefetcher.record(YachtStyle(style))
+        scheduler = PriorityScheduler(max_concurrency=4, aging_s=60)
+        store = ResultStore(mode="memory")
+        previous = get_result_store()
+        hits_before = metrics.counter("speculation.hits")
+        cancelled_before = metrics.counter("speculation.cancelled")
+
+        set_result_store(store)
+        try:
+            with patch("handlers.tools.get_gemini_client", return_value=client), patch(
+                "handlers.tools.get_prefetcher", return_value=prefetcher
+            ), patch("utils.gemini_client.get_scheduler", return_value=scheduler), patch(
+                "utils.speculation.get_scheduler", return_value=scheduler
+            ):
+                # Follow-up calls join or read the speculative outputs
+                analysis = await analyze_yacht_structure(create_test_image())
+                for style in ("futuristic", "artdeco"):
+                    await generate_yacht_style(create_test_image(), analysis["description"], style)
+                served_calls = model.calls
+
+                # A regular call waiting for a slot cancels the speculation
+                buffer = BytesIO()
+                Image.new("RGB", (100, 100), color="navy").save(buffer, format="PNG")
+                other = base64.b64encode(buffer.getvalue()).decode("utf-8")
+                other_analysis = await analyze_yacht_structure(other)
+                await asyncio.sleep(0.02)
+                in_flight = dict(scheduler.stats()["in_flight"])
+
+                async def interactive():
+                    with request_scope("generate_style"):
+                        await client.analyze_image(None, "prompt", operation="style")
+
+                await asyncio.gather(*(interactive() for _ in range(3)))
+                await asyncio.sleep(0.15)
+                other_digest = image_digest(buffer.getvalue())
+                stored = [
+                    store.contains(_style_key(client, other_digest, other_analysis["description"], s))
+                    for s in (YachtStyle.FUTURISTIC, YachtStyle.ARTDECO)
+                ]
+
+                # Speculation fills every variant of a key so it is served
+                buffer = BytesIO()
+                Image.new("RGB", (100, 100), color="teal").save(buffer, format="PNG")
+                third = base64.b64encode(buffer.getvalue()).decode("utf-8")
+                with patch.dict(os.environ, {"STYLE_CACHE_VARIANTS": "2"}):
+                    calls_before = model.calls
+                    third_analysis = await analyze_yacht_structure(third)
+                    await generate_yacht_style(third, third_analysis["description"], "futuristic")
+                    variant_calls = model.calls - calls_before
+
+                # Joining gives up when the request budget runs out
+                prefetcher.schedule({"slow": lambda: asyncio.sleep(0.5)}, Caller("join"), 0)
+                started = time.monotonic()
+                with request_scope("generate_style", deadline_s=0.1):
+                    await prefetcher.join("slow")
+                join_wait = time.monotonic() - started
+                still_running = "slow" in prefetcher._pending
+                await prefetcher.join("slow")
+                cancelled = metrics.counter("speculation.cancelled") - cancelled_before
+
+                # A stuck speculative generation only delays the follow-up
+                # call by about a direct generation, which then still fits
+                buffer = BytesIO()
+                Image.new("RGB", (100, 100), color="olive").save(buffer, format="PNG")
+                fourth = base64.b64encode(buffer.getvalue()).decode("utf-8")
+                fourth_analysis = await analyze_yacht_structure(fourth)
+                prefetcher.cancel_all()
+                await asyncio.gather(*prefetcher._pending.values(), return_exceptions=True)
+                stuck_key = _style_key(
+                    client,
+                    image_digest(buffer.getvalue()),
+                    fourth_analysis["description"],
+                    YachtStyle.BIOPHILIC,
+                )
+                stuck = prefetcher.schedule(
+                    {stuck_key: lambda: asyncio.sleep(30)}, Caller("stuck"), 0
+                )
+                started = time.monotonic()
+                with request_scope("generate_style", deadline_s=1.5):
+                    unstuck = await generate_yacht_style(
+                        fourth, fourth_analysis["description"], "biophilic"
+                    )
+                unstuck_s = time.monotonic() - started
+                prefetcher.cancel_all()
+        finally:
+            set_result_store(previous)
+
+        hits = metrics.counter("speculation.hits") - hits_before
+        logger.info(f"  upstream calls for analysis + 2 styles: {served_calls}, hits: {hits}")
+        logger.info(f"  upstream calls with 2 variants: {variant_calls}")
+        logger.info(f"  join waited {join_wait:.2f}s under a 0.1s budget")
+        logger.info(f"  generated past a stuck speculation in {unstuck_s:.2f}s of 1.5s")
+        logger.info(f"  speculative in flight: {in_flight['bulk']}, cancelled: {cancelled}")
+        if (
+            served_calls == 3
+            and hits == 3
+            and in_flight["bulk"] == 2
+            and cancelled == 2
+            and not any(stored)
+            and variant_calls == 5
+            and join_wait < 0.3
+            and still_running
+            and stuck == 1
+            and unstuck["style"] == "biophilic"
+            and unstuck_s < 1.2
+        ):
+            logger.info("✓ Popular styles are prefetched and speculation yields under load")
+            return True
+
+        logger.error("✗ Speculative prefetch did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Speculative prefetch test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_style_cache_variants():
+    """Test 28: Style output cache with variants and bypass"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 28: Style Cache Variants")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        import re
+        from unittest.mock import patch
+        from handlers.tools import generate_yacht_style
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.result_store import ResultStore, get_result_store, set_result_store
+
+        class NumberedModel(FakeGenerativeModel):
+            def _style_text(self) -> str:
+                return f"Variant {self.calls}. " + super()._style_text()
+
+        model = NumberedModel("variants-model", latency_ms=0, ms_per_output_token=0)
+        client = create_offline_client(model, "variants-model")
+        description = "Saloon with curved hull walls and a skylight."
+        image = create_test_image()
+        previous = get_result_store()
+
+        async def variant(structure_description=description, **kwargs):
+            result = await generate_yacht_style(image, structure_description, "biophilic", **kwargs)
+            return int(re.match(r"Variant (\d+)", result["description"]).group(1))
+
+        # Stored outputs are served without decoding the image
+        decodes = []
+        decode = client.decode_image_async
+
+        async def counting_decode(data):
+            decodes.append(len(data))
+            return await decode(data)
+
+        client.decode_image_async = counting_decode
+
+        set_result_store(ResultStore(mode="memory"))
+        try:
+            with patch("handlers.tools.get_gemini_client", return_value=client), patch.dict(
+                os.environ, {"STYLE_CACHE_VARIANTS": "2"}
+            ):
+                # The first two calls fill the variants, later ones rotate
+                served = [await variant() for _ in range(4)]
+                served.append(await variant("  Saloon with curved hull walls\n and a skylight. "))
+                regenerated = await variant(regenerate=True)
+                served.append(await variant())
+                calls = model.calls
+                with patch("handlers.tools.PROMPT_VERSION", 2):
+                    new_prompt = await variant()
+        finally:
+            set_result_store(previous)
+
+        logger.info(f"  served variants: {served}, regenerated: {regenerated}")
+        logger.info(f"  upstream calls: {calls}, after prompt change: {new_prompt}")
+        logger.info(f"  image decodes: {len(decodes)}")
+        if (
+            served == [1, 2, 1, 2, 1, 3]
+            and regenerated == 3
+            and calls == 3
+            and new_prompt == 4
+            and len(decodes) == 4
+        ):
+            logger.info("✓ Style outputs are cached per key, rotated and bypassable")
+            return True
+
+        logger.error("✗ Style cache did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Style cache test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_admission_control():
+    """Test 29: Admission control and load shedding"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 29: Admission Control")
+    logger.info("=" * 60)
+
+    try:
+        from utils.admission import AdmissionController
+        from utils.gemini_client import OverloadedError, RejectedError
+        from utils.quotas import QuotaManager
+        from utils.scheduler import Priority, PriorityScheduler
+
+        quotas = QuotaManager(
+            session_concurrency=0, tenant_concurrency=0,
+            session_tokens_per_min=0, tenant_tokens_per_min=0, max_queued=0, weights={},
+        )
+        scheduler = PriorityScheduler(max_concurrency=1, aging_s=60, quotas=quotas)
+        admission = AdmissionController(
+            max_requests=2, max_bytes=1000, delay_target_s=0.05, interval_s=0.1,
+            scheduler=scheduler,
+        )
+
+        def attempt(tool="generate_style", size=0):
+            try:
+                with admission.admit(tool, size=size):
+                    return "admitted"
+            except OverloadedError as e:
+                return e
+
+        # Bounded calls and image bytes in progress
+        with admission.admit("generate_style"), admission.admit("analyze_structure"):
+            full = attempt()
+        with admission.admit("generate_style", size=800):
+            too_big = attempt(size=300)
+            fits = attempt(size=100)
+        alone = attempt(size=5000)
+
+        # A background job keeps its bytes counted after the call returns
+        release = admission.reserve("submit_generate_all", size=900)
+        job_full = attempt(size=200)
+        job_fits = attempt(size=100)
+        release()
+        release()
+        reserved_after = (admission.reserved, admission.active_bytes)
+
+        # Standing queue delay: shed after a full interval above target
+        await scheduler.acquire(Priority.INTERACTIVE)
+        waiter = asyncio.create_task(scheduler.acquire(Priority.INTERACTIVE))
+        await asyncio.sleep(0.07)
+        first_above = attempt()
+        await asyncio.sleep(0.11)
+        shed = attempt()
+        spaced = attempt()
+        bulk = attempt("ingest")
+        await asyncio.sleep(0.11)
+        shed_again = attempt()
+        scheduler.release(Priority.INTERACTIVE)
+        await waiter
+        scheduler.release(Priority.INTERACTIVE)
+        recovered = attempt()
+
+        logger.info(f"  full: {full}, bytes: {too_big}")
+        logger.info(f"  delay: {shed} (retry after {getattr(shed, 'retry_after', None)})")
+        if (
+            isinstance(full, RejectedError)
+            and isinstance(too_big, OverloadedError)
+            and "300 bytes" in str(too_big) and "limit 1000 bytes" in str(too_big)
+            and full.retry_after >= 1
+            and fits == alone == first_above == spaced == bulk == recovered == "admitted"
+            and isinstance(job_full, OverloadedError)
+            and job_fits == "admitted"
+            and reserved_after == (0, 0)
+            and isinstance(shed, OverloadedError)
+            and "queue delay" in str(shed)
+            and isinstance(shed_again, OverloadedError)
+            and admission.active == 0
+            and admission.active_bytes == 0
+        ):
+            logger.info("✓ Calls are admitted within bounds and shed on standing queue delay")
+            return True
+
+        logger.error("✗ Admission control did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Admission control test failed: {e}")
+        logger.exception(e)
+        return False
+
+
+async def test_background_jobs():
+    """Test 30: Background generate_all jobs"""
+    logger.info("\n" + "=" * 60)
+    logger.info("TEST 30: Background Jobs")
+    logger.info("=" * 60)
+
+    try:
+        import os
+        from unittest.mock import patch
+        import main
+        from utils.admission import AdmissionController, payload_bytes
+        from utils.fake_backend import FakeGenerativeModel
+        from utils.jobs import JobManager
+
+        image = create_test_image()
+        fast = create_offline_client(
+            FakeGenerativeModel("jobs-fast", latency_ms=0, ms_per_output_token=0), "jobs-fast"
+        )
+        slow = create_offline_client(
+            FakeGenerativeModel("jobs-slow", latency_ms=300, ms_per_output_token=0), "jobs-slow"
+        )
+
+        async def finish(job_id, timeout=10.0):
+            for _ in range(int(timeout / 0.02)):
+                status = await main.get_job_status(job_id)
+                if status["status"] not in ("queued", "running"):
+                    return status
+                await asyncio.sleep(0.02)
+            return status
+
+        # Submit, poll status, fetch the result
+        manager = JobManager(workers=1, result_ttl=0.3, max_queued=1)
+        with patch("main.get_job_manager", return_value=manager), patch(
+            "handlers.tools.get_gemini_client", return_value=fast
+        ):
+            submitted = await main.submit_generate_all(image)
+            done = await finish(submitted["job_id"])
+            result = await main.get_job_result(submitted["job_id"])
+            dropped = manager.get(submitted["job_id"]).run is None
+            # Finished jobs expire after the result TTL
+            await asyncio.sleep(0.35)
+            expired = await main.get_job_result(submitted["job_id"])
+
+        progress = done["progress"]
+        completed = set(progress) == {"analysis", *result.get("styles", {})} and all(
+            state == "completed" for state in progress.values()
+        )
+        logger.info(f"  submitted: {submitted['status']}, finished: {done['status']}")
+        logger.info(f"  progress: {progress}")
+
+        # Cancel a running and a queued job; a full queue rejects; queued
+        # images count against the admission byte budget
+        manager = JobManager(workers=1, result_ttl=60, max_queued=1)
+        admission = AdmissionController(
+            max_requests=0, max_bytes=payload_bytes(image) * 2, delay_target_s=0
+        )
+        with patch("main.get_job_manager", return_value=manager), patch(
+            "main.get_admission", return_value=admission
+        ), patch("handlers.tools.get_gemini_client", return_value=slow):
+            running = await main.submit_generate_all(image)
+            await asyncio.sleep(0.05)
+            queued = await main.submit_generate_all(image)
+            overloaded = await main.submit_generate_all(image)
+            admission.max_bytes = 0
+            full = await main.submit_generate_all(image)
+            held = admission.reserved
+            # Invalid and oversized images are rejected before queueing
+            invalid = await main.submit_generate_all("!!!not base64!!!")
+            with patch.dict(os.environ, {"MAX_IMAGE_BYTES": "100"}):
+                oversized = await main.submit_generate_all(image)
+            rejected_held = admission.reserved
+            cancelled_queued = await main.cancel_job(queued["job_id"])
+            # A cancelled queued job frees its place in the queue
+            requeued = await main.submit_generate_all(image)
+            await main.cancel_job(requeued["job_id"])
+            await main.cancel_job(running["job_id"])
+            cancelled_running = await finish(running["job_id"])
+            await asyncio.sleep(0.05)
+            unstarted = manager.get(queued["job_id"])
+            released = (admission.reserved, admission.active_bytes)
+
+        logger.info(f"  overloaded: {overloaded}, queue full: {full}, requeued: {requeued}")
+        logger.info(
+            f"  cancelled: running={cancelled_running['status']}, "
+            f"queued={cancelled_queued['status']}"
+        )
+        if (
+            submitted["status"] == "queued"
+            and done["status"] == "succeeded"
+            and len(result.get("styles", {})) == 5
+            and completed
+            and dropped
+            and expired["status"] == "failed"
+            and "expired" in expired["error"]
+            and full["status"] == "failed"
+            and "full" in full["error"]
+            and requeued["status"] == "queued"
+            and overloaded["status"] == "overloaded"
+            and held == 2
+            and invalid["status"] == "failed"
+            and "Invalid base64" in invalid["error"]
+            and oversized["status"] == "failed"
+            and "too large" in oversized["error"]
+            and "job_id" not in invalid and "job_id" not in oversized
+            and rejected_held == 2
+            and released == (0, 0)
+            and cancelled_queued["status"] == "cancelled"
+            and unstarted.started_at is None
+            and unstarted.run is None
+            and cancelled_running["status"] == "cancelled"
+            and manager.get(running["job_id"]).run is None
+        ):
+            logger.info("✓ Jobs report progress, finish, cancel, expire and bound their queue")
+            return True
+
+        logger.error("✗ Background jobs did not behave as expected")
+        return False
+
+    except Exception as e:
+        logger.error(f"✗ Background jobs test failed: {e}")
+        logger.exception(e)
+        return False
+
+
 async def run_all_tests():
     """Run all tests and report results."""
     logger.info("\n")
@@ -263,6 +2499,30 @@ async def run_all_tests():
         ("Analyze Structure Tool", test_analyze_structure),
         ("Generate Style Tool", test_generate_style),
         ("Error Handling", test_error_handling),
+        ("Artifact Output Mode", test_artifact_output_mode),
+        ("Ingestion Peak Memory", test_ingestion_peak_memory),
+        ("Near-Duplicate Analysis Reuse", test_near_duplicate_reuse),
+        ("Priority Scheduler", test_priority_scheduler),
+        ("Deadlines and Cancellation", test_deadline_and_cancellation),
+        ("Hedged Requests", test_hedged_requests),
+        ("Adaptive Timeouts", test_adaptive_timeouts),
+        ("Image Process Pool", test_image_pool),
+        ("Tiled Analysis", test_tiled_analysis),
+        ("Room Analysis", test_room_analysis),
+        ("Single-Call Multi-Style", test_single_call_styles),
+        ("Micro-Batching", test_micro_batching),
+        ("Stdio Transport", test_stdio_transport),
+        ("On-Demand Profiling", test_profiling),
+        ("Startup Warm-Up", test_warmup),
+        ("Gemini Transport", test_transport),
+        ("Logging Pipeline", test_logging_pipeline),
+        ("Session Quotas", test_session_quotas),
+        ("Result Store and Bulk Ingest", test_result_store_ingest),
+        ("Similarity Search", test_similarity_search),
+        ("Speculative Style Prefetch", test_speculative_prefetch),
+        ("Style Cache Variants", test_style_cache_variants),
+        ("Admission Control", test_admission_control),
+        ("Background Jobs", test_background_jobs),
     ]
 
     results = {}
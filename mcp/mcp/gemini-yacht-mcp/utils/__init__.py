@@ -6,6 +6,8 @@ This module contains helper functions and the Gemini API client.
 
 from .gemini_client import GeminiClient, get_gemini_client
 from .prompts import ANALYSIS_PROMPT, STYLE_GENERATION_PROMPTS, STYLE_DESCRIPTIONS
+from .artifacts import ArtifactStore, get_artifact_store
+from .metrics import Metrics, get_metrics
 
 __all__ = [
     "GeminiClient",
@@ -13,4 +15,8 @@ __all__ = [
     "ANALYSIS_PROMPT",
     "STYLE_GENERATION_PROMPTS",
     "STYLE_DESCRIPTIONS",
+    "ArtifactStore",
+    "get_artifact_store",
+    "Metrics",
+    "get_metrics",
 ]
@@ -0,0 +1,278 @@
+"""
+Admission control and load shedding for tool calls.
+
+When upstream slows down, tool calls pile up (coroutines, decoded images,
+worker-thread jobs) until the process runs out of memory or clients time
+out. Every image tool call is admitted here first, and refused at once
+with an ``OverloadedError`` (status "overloaded" with a retry-after hint)
+when:
+
+- ADMISSION_MAX_REQUESTS calls are already in progress, or
+- admitting it would exceed ADMISSION_MAX_BYTES of image data held by the
+  calls in progress (a call alone is always admitted; MAX_IMAGE_BYTES
+  bounds single images), or
+- the scheduler queue of its priority class has a standing delay (CoDel,
+  "Controlling Queue Delay"): once the oldest waiter of the class has
+  been queued longer than ADMISSION_DELAY_TARGET_S for a whole
+  ADMISSION_DELAY_INTERVAL_S, new calls of that class are shed, the first
+  at once and then at intervals shrinking with the square root of the
+  number shed, until the queue delay falls below the target again.
+
+Queue delay is tracked per class so a backlog of bulk jobs, which may
+queue by design, does not shed interactive calls.
+
+Background jobs hold their image after the submitting call returns, so
+``reserve()`` admits them the same way and keeps their bytes counted
+until the job finishes.
+
+Settings (0 disables a limit):
+- ADMISSION_MAX_REQUESTS: Tool calls in progress (default: 64)
+- ADMISSION_MAX_BYTES: Image bytes held by calls in progress
+  (default: 268435456, 256 MiB)
+- ADMISSION_DELAY_TARGET_S: Acceptable standing queue delay (default: 5)
+- ADMISSION_DELAY_INTERVAL_S: How long the delay must stay above target
+  before shedding starts (default: 30)
+
+Rejections are counted in ``server_metrics`` as "admission.rejected.requests",
+"admission.rejected.bytes" and "admission.rejected.delay".
+"""
+
+import os
+import math
+import time
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from utils.gemini_client import OverloadedError
+from utils.metrics import get_metrics
+from utils.scheduler import Priority, PriorityScheduler, get_scheduler, tool_priority
+
+logger = logging.getLogger(__name__)
+
+
+def payload_bytes(*images: Optional[str]) -> int:
+    """Approximate decoded size of base64 image payloads."""
+    return sum(len(image) * 3 // 4 for image in images if image)
+
+
+@dataclass
+class _CoDelState:
+    """Shedding state of one priority class."""
+
+    first_above: Optional[float] = None
+    dropping: bool = False
+    drop_count: int = 0
+    drop_next: float = 0.0
+
+
+class AdmissionController:
+    """Bounds the calls and image bytes in progress and sheds on queue delay."""
+
+    def __init__(
+        self,
+        max_requests: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        delay_target_s: Optional[float] = None,
+        interval_s: Optional[float] = None,
+        scheduler: Optional[PriorityScheduler] = None,
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            max_requests: Calls in progress, 0 for unbounded
+                (default: ADMISSION_MAX_REQUESTS or 64)
+            max_bytes: Image bytes held by calls in progress, 0 for unbounded
+                (default: ADMISSION_MAX_BYTES or 256 MiB)
+            delay_target_s: Standing queue delay target, 0 disables shedding
+                on delay (default: ADMISSION_DELAY_TARGET_S or 5)
+            interval_s: Time above target before shedding starts
+                (default: ADMISSION_DELAY_INTERVAL_S or 30)
+            scheduler: Scheduler whose queues are watched (default: the
+                shared scheduler)
+        """
+        self.max_requests = (
+            max_requests
+            if max_requests is not None
+            else int(os.getenv("ADMISSION_MAX_REQUESTS", "64"))
+        )
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(os.getenv("ADMISSION_MAX_BYTES", str(256 * 1024 * 1024)))
+        )
+        self.delay_target_s = (
+            delay_target_s
+            if delay_target_s is not None
+            else float(os.getenv("ADMISSION_DELAY_TARGET_S", "5"))
+        )
+        self.interval_s = interval_s or float(os.getenv("ADMISSION_DELAY_INTERVAL_S", "30"))
+        self._scheduler = scheduler
+
+        self.active = 0
+        self.active_bytes = 0
+        self.reserved = 0
+        self._codel = {priority: _CoDelState() for priority in Priority}
+
+    @property
+    def scheduler(self) -> PriorityScheduler:
+        return self._scheduler or get_scheduler()
+
+    def _sheds_on_delay(self, priority: Priority, now: float) -> bool:
+        """CoDel decision for one new call of a class."""
+        if self.delay_target_s <= 0:
+            return False
+        state = self._codel[priority]
+        if self.scheduler.head_delay(priority) < self.delay_target_s:
+            state.first_above = None
+            state.dropping = False
+            return False
+        if state.first_above is None:
+            state.first_above = now + self.interval_s
+            return False
+        if not state.dropping:
+            if now < state.first_above:
+                return False
+            # Resume near the previous shedding rate if it ended recently
+            recent = now - state.drop_next < 16 * self.interval_s
+            state.drop_count = max(1, state.drop_count - 2) if recent else 1
+            state.dropping = True
+            logger.warning(
+                "Shedding %s calls: queue delay above %gs for %gs",
+                priority.value,
+                self.delay_target_s,
+                self.interval_s,
+            )
+        elif now < state.drop_next:
+            return False
+        else:
+            state.drop_count += 1
+        state.drop_next = now + self.interval_s / math.sqrt(state.drop_count)
+        return True
+
+    def _retry_after(self, priority: Priority) -> float:
+        """Time for the current backlog to drain, at least the target delay."""
+        return max(self.delay_target_s, self.scheduler.head_delay(priority), 1.0)
+
+    def _check(self, tool: str, priority: Optional[str], size: int) -> None:
+        """Refuse a new call or job if it does not fit."""
+        resolved = tool_priority(tool, priority)
+        reason = None
+        holders = self.active + self.reserved
+        if self.max_requests > 0 and self.active >= self.max_requests:
+            reason = "requests"
+            message = f"{self.active} requests in progress"
+        elif self.max_bytes > 0 and holders > 0 and self.active_bytes + size > self.max_bytes:
+            reason = "bytes"
+            message = (
+                f"{size} bytes of image data requested, {self.active_bytes} bytes "
+                f"in progress, limit {self.max_bytes} bytes"
+            )
+        elif self._sheds_on_delay(resolved, time.monotonic()):
+            reason = "delay"
+            message = (
+                f"{resolved.value} queue delay {self.scheduler.head_delay(resolved):.1f}s "
+                f"above target {self.delay_target_s:g}s"
+            )
+        if reason is not None:
+            get_metrics().increment(f"admission.rejected.{reason}")
+            raise OverloadedError(f"Server overloaded: {message}", self._retry_after(resolved))
+
+    @contextmanager
+    def admit(
+        self,
+        tool: str,
+        priority: Optional[str] = None,
+        size: int = 0,
+    ) -> Iterator[None]:
+        """
+        Hold an admission for the duration of a tool call.
+
+        Args:
+            tool: MCP tool name (selects the priority class)
+            priority: Per-request priority override
+            size: Image bytes the call holds (see payload_bytes())
+
+        Raises:
+            OverloadedError: If the call is shed
+            ValueError: If the priority name is not recognized
+        """
+        self._check(tool, priority, size)
+        self.active += 1
+        self.active_bytes += size
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.active_bytes -= size
+
+    def reserve(
+        self,
+        tool: str,
+        priority: Optional[str] = None,
+        size: int = 0,
+    ) -> Callable[[], None]:
+        """
+        Admit a background job and count its image bytes until it finishes.
+
+        Unlike admit(), the reservation outlives the submitting call and
+        does not count as a call in progress.
+
+        Args:
+            tool: MCP tool name (selects the priority class)
+            priority: Per-request priority override
+            size: Image bytes the job holds (see payload_bytes())
+
+        Returns:
+            Function releasing the reservation (safe to call more than once)
+
+        Raises:
+            OverloadedError: If the job is shed
+            ValueError: If the priority name is not recognized
+        """
+        self._check(tool, priority, size)
+        self.reserved += 1
+        self.active_bytes += size
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.reserved -= 1
+                self.active_bytes -= size
+
+        return release
+
+    def stats(self) -> Dict[str, Any]:
+        """Limits, calls, jobs and bytes in progress, and shedding state per class."""
+        return {
+            "max_requests": self.max_requests,
+            "max_bytes": self.max_bytes,
+            "delay_target_s": self.delay_target_s,
+            "interval_s": self.interval_s,
+            "active": self.active,
+            "active_bytes": self.active_bytes,
+            "reserved": self.reserved,
+            "shedding": {
+                priority.value: state.dropping for priority, state in self._codel.items()
+            },
+        }
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    """
+    Get the shared admission controller.
+
+    Returns:
+        AdmissionController configured from the environment
+    """
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
@@ -0,0 +1,322 @@
+"""
+Content-addressed artifact store for large tool outputs.
+
+Generated images and long descriptions can be written to a local output
+directory instead of being returned inline. Each artifact is stored under
+its SHA-256 digest and exposed to MCP clients as an ``artifact://<digest>``
+resource, so tool responses only carry small references with size and
+hash metadata.
+
+The directory is pruned as artifacts are added: artifacts not written or
+stored again for ARTIFACT_TTL_S are removed, then the least recently
+stored ones until the directory fits in ARTIFACT_MAX_BYTES.
+"""
+
+import os
+import re
+import time
+import base64
+import hashlib
+import logging
+import tempfile
+from typing import Optional
+
+from models.schemas import ArtifactRef
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_URI_SCHEME = "artifact://"
+
+# Output modes accepted by the generation tools
+OUTPUT_MODE_INLINE = "inline"
+OUTPUT_MODE_REFERENCE = "reference"
+OUTPUT_MODE_AUTO = "auto"
+OUTPUT_MODES = (OUTPUT_MODE_INLINE, OUTPUT_MODE_REFERENCE, OUTPUT_MODE_AUTO)
+
+# File extensions used on disk, keyed by MIME type
+_MIME_EXTENSIONS = {
+    "text/plain": ".txt",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "application/octet-stream": ".bin",
+}
+_EXTENSION_MIMES = {ext: mime for mime, ext in _MIME_EXTENSIONS.items()}
+# Artifact file names; anything else (e.g. a temp file being written) is
+# never counted or pruned
+_ARTIFACT_NAME = re.compile(
+    r"[0-9a-f]{64}(%s)" % "|".join(re.escape(ext) for ext in _EXTENSION_MIMES)
+)
+
+# Minimum time between two prunes of the directory
+_PRUNE_INTERVAL_S = 60.0
+
+
+class ArtifactStoreError(Exception):
+    """Raised when an artifact cannot be stored or read."""
+
+    pass
+
+
+class ArtifactStore:
+    """
+    Content-addressed artifact storage on the local filesystem.
+
+    Artifacts are written once to ``<root>/<digest[:2]>/<digest><ext>``.
+    Storing identical content twice only refreshes its modification time,
+    so repeated generations of the same output never duplicate data on
+    disk and keep it from being pruned.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        ttl_s: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            root: Output directory (default: ARTIFACT_DIR env or ./output)
+            ttl_s: Age after which an artifact is removed, 0 to keep them
+                (default: ARTIFACT_TTL_S or 7 days)
+            max_bytes: Directory size above which the oldest artifacts are
+                removed, 0 for no limit (default: ARTIFACT_MAX_BYTES or 1 GiB)
+        """
+        self.root = os.path.abspath(
+            root or os.getenv("ARTIFACT_DIR", os.path.join(os.getcwd(), "output"))
+        )
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("ARTIFACT_TTL_S", "604800"))
+        self.max_bytes = (
+            max_bytes if max_bytes is not None else int(os.getenv("ARTIFACT_MAX_BYTES", "1073741824"))
+        )
+        self._last_prune = 0.0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path_for(self, digest: str, mime_type: str) -> str:
+        """Build the on-disk path for an artifact."""
+        extension = _MIME_EXTENSIONS.get(mime_type, ".bin")
+        return os.path.join(self.root, digest[:2], f"{digest}{extension}")
+
+    def put(self, data: bytes, mime_type: str) -> ArtifactRef:
+        """
+        Store artifact content and return a reference to it.
+
+        Blocking (hashing and file I/O); call from a worker thread.
+
+        Args:
+            data: Raw artifact bytes
+            mime_type: MIME type of the content
+
+        Returns:
+            ArtifactRef with URI, digest and size
+
+        Raises:
+            ArtifactStoreError: If the artifact cannot be written
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path_for(digest, mime_type)
+
+        try:
+            if os.path.exists(path):
+                # Storing it again counts as a use for retention
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temp file first so readers never see partial data
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                logger.info("Stored artifact %s (%s bytes)", digest[:12], len(data))
+        except OSError as e:
+            raise ArtifactStoreError(f"Failed to store artifact: {str(e)}")
+
+        if 0 < self.max_bytes < len(data):
+            logger.warning(
+                "Artifact %s (%s bytes) alone exceeds ARTIFACT_MAX_BYTES (%s)",
+                digest[:12],
+                len(data),
+                self.max_bytes,
+            )
+        if time.monotonic() - self._last_prune >= _PRUNE_INTERVAL_S:
+            # Never the artifact being returned
+            self.prune(keep=path)
+
+        return ArtifactRef(
+            uri=f"{ARTIFACT_URI_SCHEME}{digest}",
+            sha256=digest,
+            size_bytes=len(data),
+            mime_type=mime_type,
+        )
+
+    def put_text(self, text: str) -> ArtifactRef:
+        """Store a UTF-8 text artifact."""
+        return self.put(text.encode("utf-8"), "text/plain")
+
+    def get(self, digest: str) -> tuple[bytes, str]:
+        """
+        Read an artifact by digest.
+
+        Args:
+            digest: SHA-256 hex digest (an ``artifact://`` URI is also accepted)
+
+        Returns:
+            Tuple of (content bytes, MIME type)
+
+        Raises:
+            ArtifactStoreError: If the artifact does not exist
+        """
+        if digest.startswith(ARTIFACT_URI_SCHEME):
+            digest = digest[len(ARTIFACT_URI_SCHEME):]
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ArtifactStoreError(f"Invalid artifact digest: {digest}")
+
+        directory = os.path.join(self.root, digest[:2])
+        for extension, mime_type in _EXTENSION_MIMES.items():
+            path = os.path.join(directory, f"{digest}{extension}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return f.read(), mime_type
+
+        raise ArtifactStoreError(f"Artifact not found: {digest}")
+
+    def prune(self, keep: Optional[str] = None) -> int:
+        """
+        Remove expired artifacts, then the oldest ones over the size limit.
+
+        Only files named ``<digest><ext>`` are counted and removed.
+        Blocking; called by put at most once a minute.
+
+        Args:
+            keep: Path of an artifact that is never removed (the one put
+                just wrote or refreshed); its size still counts
+
+        Returns:
+            Number of artifacts removed
+        """
+        self._last_prune = time.monotonic()
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if not _ARTIFACT_NAME.fullmatch(name):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        cutoff = time.time() - self.ttl_s if self.ttl_s > 0 else None
+        removed = 0
+        for mtime, size, path in files:
+            expired = cutoff is not None and mtime < cutoff
+            if not expired and (self.max_bytes <= 0 or total <= self.max_bytes):
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Failed to remove artifact %s: %s", path, e)
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            logger.info("Pruned %s artifact(s), %s bytes left", removed, total)
+        return removed
+
+
+def sniff_generated_image(generated_image: str) -> tuple[bytes, str]:
+    """
+    Convert a ``generated_image`` field into raw bytes and a MIME type.
+
+    Placeholder outputs (``[DESCRIPTION]...``) are stored as text; anything
+    else is treated as base64 image data.
+
+    Args:
+        generated_image: Value of GenerateStyleOutput.generated_image
+
+    Returns:
+        Tuple of (content bytes, MIME type)
+    """
+    if generated_image.startswith("["):
+        return generated_image.encode("utf-8"), "text/plain"
+
+    try:
+        data = base64.b64decode(generated_image, validate=True)
+    except Exception:
+        return generated_image.encode("utf-8"), "text/plain"
+
+    if data.startswith(b"\x89PNG"):
+        return data, "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return data, "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return data, "image/webp"
+    return data, "application/octet-stream"
+
+
+def resolve_output_mode(output_mode: Optional[str]) -> str:
+    """
+    Resolve the effective output mode for a tool call.
+
+    Args:
+        output_mode: Requested mode, or None to use ARTIFACT_OUTPUT_MODE
+
+    Returns:
+        One of "inline", "reference" or "auto"
+
+    Raises:
+        ValueError: If the mode is not recognized
+    """
+    mode = (output_mode or os.getenv("ARTIFACT_OUTPUT_MODE", OUTPUT_MODE_INLINE)).lower()
+    if mode not in OUTPUT_MODES:
+        raise ValueError(
+            f"Invalid output_mode '{mode}'. Expected one of: {', '.join(OUTPUT_MODES)}"
+        )
+    return mode
+
+
+def should_externalize(mode: str, size_bytes: int) -> bool:
+    """
+    Decide whether a payload of the given size is returned by reference.
+
+    In "auto" mode, payloads larger than ARTIFACT_INLINE_MAX_BYTES
+    (default: 64 KiB) are externalized.
+    """
+    if mode == OUTPUT_MODE_REFERENCE:
+        return True
+    if mode == OUTPUT_MODE_AUTO:
+        return size_bytes > int(os.getenv("ARTIFACT_INLINE_MAX_BYTES", "65536"))
+    return False
+
+
+def preview_text(text: str) -> str:
+    """Shorten text to ARTIFACT_PREVIEW_CHARS for use alongside a reference."""
+    limit = int(os.getenv("ARTIFACT_PREVIEW_CHARS", "200"))
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "…"
+
+
+_store: Optional[ArtifactStore] = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """
+    Get the shared artifact store instance.
+
+    Returns:
+        ArtifactStore rooted at ARTIFACT_DIR
+    """
+    global _store
+    if _store is None:
+        _store = ArtifactStore()
+    return _store
@@ -0,0 +1,258 @@
+"""
+Micro-batching of concurrent upstream requests.
+
+Independent requests that arrive within a short collection window and
+share a batch key (e.g. same model and style) are handed to one batch
+function together, which can serve them with a single upstream call and
+split the results back to each caller. A batch is flushed when its window
+expires, or early when adding another item would exceed the token budget
+or item limit.
+
+Items are only batched with items of the same priority class, but bursts
+from different callers (sessions and tenants) share batches. When a batch
+runs, items of callers over their token budget are rejected on their own,
+and the upstream call is attributed to the remaining callers by their
+items' estimated tokens: quotas are charged, concurrency limits held and
+fair-queueing tags advanced by each caller's share, so no caller rides for
+free on another's call. A batch runs (in the request context of its first
+item) under the loosest deadline of the items still waiting for it, so one
+caller's short deadline does not fail the others. Each caller stops
+waiting when its own deadline expires.
+
+Batching is opt-in (MICROBATCH_ENABLED). Time spent waiting for a batch
+to fill and batch sizes are recorded in metrics.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from utils.context import (
+    current_caller,
+    current_priority,
+    current_request,
+    deadline_override,
+    remaining_time,
+    shared_by,
+)
+from utils.gemini_client import DeadlineExceededError, RejectedError
+from utils.metrics import get_metrics
+from utils.quotas import Caller, LOCAL_CALLER, get_quotas
+from utils.scheduler import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Receives the items of one batch; returns one result (or exception) per item
+BatchFunction = Callable[[list], Awaitable[list]]
+
+
+@dataclass
+class _Pending:
+    """One caller waiting for its share of a batch."""
+
+    item: Any
+    tokens: int
+    future: asyncio.Future
+    caller: Caller = LOCAL_CALLER
+    deadline: Optional[float] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _Batch:
+    """Items collected for one key during one window."""
+
+    run: BatchFunction
+    context: contextvars.Context
+    items: list[_Pending] = field(default_factory=list)
+    tokens: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """Collects compatible requests into batches for a short window."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        window_ms: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        max_items: Optional[int] = None,
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            enabled: Whether callers should batch (default: MICROBATCH_ENABLED or false)
+            window_ms: Collection window (default: MICROBATCH_WINDOW_MS or 25)
+            max_tokens: Estimated token budget per batch (default:
+                MICROBATCH_MAX_TOKENS or 32768)
+            max_items: Maximum items per batch (default: MICROBATCH_MAX_ITEMS or 8)
+        """
+        self.enabled = (
+            enabled
+            if enabled is not None
+            else os.getenv("MICROBATCH_ENABLED", "false").lower() == "true"
+        )
+        self.window_s = (window_ms or float(os.getenv("MICROBATCH_WINDOW_MS", "25"))) / 1000
+        self.max_tokens = max_tokens or int(os.getenv("MICROBATCH_MAX_TOKENS", "32768"))
+        self.max_items = max_items or int(os.getenv("MICROBATCH_MAX_ITEMS", "8"))
+        self._open: Dict[Hashable, _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, item: Any, tokens: int, run: BatchFunction) -> Any:
+        """
+        Add an item to the open batch for its key and wait for its result.
+
+        The batch function runs in the context (request scope, priority)
+        of the batch's first item, under the loosest deadline of the items
+        it serves, with its upstream calls charged to the callers of those
+        items by token share. Items of different priority classes are never
+        batched together.
+
+        Args:
+            key: Batch compatibility key; only items with equal keys (and
+                priority classes) are batched
+            item: Item passed to the batch function
+            tokens: Estimated tokens the item adds to the upstream call
+            run: Batch function used if this item opens a new batch
+
+        Returns:
+            This item's result from the batch function
+
+        Raises:
+            DeadlineExceededError: If the caller's deadline expires first
+            RejectedError: If the caller is over its token budget when the
+                batch runs
+            Exception: The exception the batch function returned for this item
+        """
+        loop = asyncio.get_running_loop()
+        key = (key, current_priority())
+        batch = self._open.get(key)
+        if batch is not None and batch.items and batch.tokens + tokens > self.max_tokens:
+            self._flush(key, batch)
+            batch = None
+
+        if batch is None:
+            batch = _Batch(run=run, context=contextvars.copy_context())
+            batch.timer = loop.call_later(self.window_s, self._flush, key, batch)
+            self._open[key] = batch
+
+        request = current_request()
+        pending = _Pending(
+            item=item,
+            tokens=tokens,
+            future=loop.create_future(),
+            caller=current_caller(),
+            deadline=request.deadline if request else None,
+        )
+        batch.items.append(pending)
+        batch.tokens += tokens
+        if len(batch.items) >= self.max_items:
+            self._flush(key, batch)
+
+        try:
+            # Cancelling the future on timeout drops the item from its batch
+            return await asyncio.wait_for(pending.future, timeout=remaining_time())
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded while waiting for a batch")
+
+    def _flush(self, key: Hashable, batch: _Batch) -> None:
+        """Close a batch and start running it."""
+        if self._open.get(key) is not batch:
+            return
+        del self._open[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        loop = asyncio.get_running_loop()
+        task = batch.context.run(loop.create_task, self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        """Run the batch function and hand each caller its result."""
+        now = time.monotonic()
+        metrics = get_metrics()
+        for pending in batch.items:
+            metrics.observe("batch.wait_s", now - pending.enqueued_at)
+
+        # Callers that gave up while the batch was filling are dropped, and
+        # callers over budget are rejected without failing the others
+        quotas, scheduler = get_quotas(), get_scheduler()
+        live = []
+        for pending in batch.items:
+            if pending.future.done():
+                continue
+            rejection = quotas.check(pending.caller, scheduler.queued(pending.caller))
+            if rejection is not None:
+                pending.future.set_exception(
+                    RejectedError(rejection.reason, rejection.retry_after)
+                )
+                continue
+            live.append(pending)
+        if not live:
+            return
+        metrics.increment("batch.batches")
+        metrics.observe("batch.size", len(live))
+        logger.info("Running batch of %s item(s) (~%s tokens)", len(live), batch.tokens)
+
+        # Unbounded if any item is; otherwise the latest deadline
+        deadlines = [p.deadline for p in live]
+        deadline = None if None in deadlines else max(deadlines)
+        tokens: Dict[Caller, int] = {}
+        for pending in live:
+            tokens[pending.caller] = tokens.get(pending.caller, 0) + pending.tokens
+        total = sum(tokens.values())
+        shares = tuple(
+            (caller, count / total if total else 1 / len(tokens))
+            for caller, count in tokens.items()
+        )
+        try:
+            with deadline_override(deadline), shared_by(shares):
+                results = await batch.run([p.item for p in live])
+        except Exception as e:
+            results = [e] * len(live)
+
+        if len(results) != len(live):
+            error = RuntimeError(f"Batch returned {len(results)} results for {len(live)} items")
+            results = [error] * len(live)
+
+        for pending, result in zip(live, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, BaseException):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuration and currently open batches."""
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window_s * 1000,
+            "max_tokens": self.max_tokens,
+            "max_items": self.max_items,
+            "open_batches": len(self._open),
+            "running_batches": len(self._tasks),
+        }
+
+
+_batcher: Optional[MicroBatcher] = None
+
+
+def get_batcher() -> MicroBatcher:
+    """
+    Get the shared micro-batcher.
+
+    Returns:
+        MicroBatcher configured from the environment
+    """
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher()
+    return _batcher
@@ -0,0 +1,182 @@
+"""
+Per-request context for tool calls.
+
+Each MCP tool call runs inside a request scope that records its request
+id, tool name, caller (session and tenant), scheduling priority and
+deadline in a context variable.
+Handlers and the Gemini client read it with ``current_request()`` instead
+of threading these values through every function signature; asyncio tasks
+spawned within the scope (e.g. the parallel style generations) inherit it.
+"""
+
+import os
+import time
+import uuid
+import contextvars
+from dataclasses import dataclass, field, replace
+from contextlib import contextmanager
+from typing import Optional, Iterator
+
+from utils.quotas import Caller, LOCAL_CALLER, Shares
+from utils.scheduler import Priority, tool_priority
+from utils.profiling import get_profiler
+
+_current_request: contextvars.ContextVar[Optional["RequestContext"]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+@dataclass
+class RequestContext:
+    """State carried through one tool call."""
+
+    tool: str
+    priority: Priority = Priority.NORMAL
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    deadline: Optional[float] = None
+    caller: Caller = LOCAL_CALLER
+    # Callers upstream calls are charged to, when not just the caller
+    shares: Optional[Shares] = None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None if unbounded)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+
+def current_request() -> Optional[RequestContext]:
+    """Return the active request context, or None outside a tool call."""
+    return _current_request.get()
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left in the active request's budget (None if unbounded)."""
+    context = _current_request.get()
+    return context.remaining() if context else None
+
+
+def default_deadline_s(tool: str) -> Optional[float]:
+    """
+    Default time budget for a tool call.
+
+    Background jobs use JOB_DEADLINE_S (default: 600), everything else
+    REQUEST_DEADLINE_S (default: 120). A value of 0 disables the deadline.
+    """
+    if tool.startswith("submit_"):
+        value = float(os.getenv("JOB_DEADLINE_S", "600"))
+    else:
+        value = float(os.getenv("REQUEST_DEADLINE_S", "120"))
+    return value if value > 0 else None
+
+
+def current_priority() -> Priority:
+    """Priority of the active request (NORMAL outside a tool call)."""
+    context = _current_request.get()
+    return context.priority if context else Priority.NORMAL
+
+
+def current_caller() -> Caller:
+    """Caller of the active request (LOCAL_CALLER outside a tool call)."""
+    context = _current_request.get()
+    return context.caller if context else LOCAL_CALLER
+
+
+def current_shares() -> Shares:
+    """Callers upstream calls of the active request are charged to, with their shares."""
+    context = _current_request.get()
+    if context is None:
+        return ((LOCAL_CALLER, 1.0),)
+    return context.shares or ((context.caller, 1.0),)
+
+
+@contextmanager
+def request_scope(
+    tool: str,
+    priority: Optional[str] = None,
+    deadline_s: Optional[float] = None,
+    caller: Optional[Caller] = None,
+) -> Iterator[RequestContext]:
+    """
+    Run a block as one request of the given tool.
+
+    The deadline is fixed when the scope is entered; every stage of the
+    request (scheduler wait, analysis, each style) only gets what is left.
+    Calls selected for profiling (see utils.profiling) are profiled for the
+    duration of the scope.
+
+    Args:
+        tool: MCP tool name (selects the default priority and deadline)
+        priority: Optional per-request priority override
+        deadline_s: Optional per-request time budget in seconds
+        caller: Caller to attribute the request to, see
+            utils.quotas.caller_identity (default: LOCAL_CALLER)
+
+    Yields:
+        The new RequestContext
+
+    Raises:
+        ValueError: If the priority name is not recognized
+    """
+    budget = deadline_s if deadline_s is not None else default_deadline_s(tool)
+    context = RequestContext(
+        tool=tool,
+        priority=tool_priority(tool, priority),
+        deadline=time.monotonic() + budget if budget else None,
+        caller=caller or LOCAL_CALLER,
+    )
+    token = _current_request.set(context)
+    try:
+        profiler = get_profiler()
+        if profiler.enabled:
+            with profiler.session(tool, context.request_id):
+                yield context
+        else:
+            yield context
+    finally:
+        _current_request.reset(token)
+
+
+@contextmanager
+def deadline_override(deadline: Optional[float]) -> Iterator[None]:
+    """
+    Run a block with the active request's deadline replaced.
+
+    Used for work done on behalf of several requests (e.g. a micro-batch),
+    which must not be cut short by the deadline of just one of them.
+
+    Args:
+        deadline: Monotonic deadline, or None for unbounded
+    """
+    context = _current_request.get()
+    if context is None:
+        yield
+        return
+    token = _current_request.set(replace(context, deadline=deadline))
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+
+@contextmanager
+def shared_by(shares: Shares) -> Iterator[None]:
+    """
+    Run a block with its upstream calls charged to several callers.
+
+    Used for work done on behalf of several requests (e.g. a micro-batch):
+    quotas, concurrency limits and fair queueing see each caller's share
+    of the calls instead of the whole calls charged to the active caller.
+
+    Args:
+        shares: Callers and the fraction of the cost each bears
+    """
+    context = _current_request.get()
+    if context is None:
+        yield
+        return
+    token = _current_request.set(replace(context, shares=shares))
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
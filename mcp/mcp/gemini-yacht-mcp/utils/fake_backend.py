@@ -0,0 +1,123 @@
+"""
+Offline stand-in for the Gemini model.
+
+Selected with GEMINI_BACKEND=fake. The fake model answers every
+generate_content call with canned text shaped like real responses
+(structured analyses, style descriptions, or JSON objects when a
+response schema is requested) and reports estimated token usage. It
+sleeps FAKE_LATENCY_MS per call plus FAKE_MS_PER_OUTPUT_TOKEN per output
+token, which makes benchmarks and load tests reproducible without an API
+key or network access.
+"""
+
+import os
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Optional
+
+from PIL import Image
+
+# Gemini bills a small image as a fixed number of tokens
+_IMAGE_TOKENS = 258
+
+_ANALYSIS_TEXT = """Architectural Structure
+Main saloon with a 2.3 m ceiling, curved port and starboard walls following the hull, and a teak floor running fore and aft. A built-in L-shaped sofa sits against the aft bulkhead; large hull windows open both sides.
+
+Key Features
+- Curved hull windows on both sides
+- Built-in L-shaped sofa against the aft bulkhead
+- Central coffee table on a fixed pedestal
+- Recessed ceiling panel with cove LEDs
+- Sliding glass door to the aft deck
+
+Geometry & Layout
+Symmetric about the centreline, open plan from the aft door to the forward dining area, viewpoint from the forward port corner.
+
+Lighting Analysis
+Daylight through the hull windows, warm LED cove lighting in the ceiling recess and reading lights above the sofa."""
+
+_STYLE_TEXT = (
+    "The saloon keeps its curved hull walls, ceiling height, window positions "
+    "and the aft sofa layout. Surfaces, furniture and lighting are reworked in "
+    "the requested style: wall panels, upholstery, flooring, fixtures and "
+    "accessories follow its palette and materials, lighting is layered between "
+    "the ceiling recess and concealed strips, and every built-in element stays "
+    "where the original structure places it. "
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class FakeGenerativeModel:
+    """Drop-in replacement for ``genai.GenerativeModel`` used offline."""
+
+    def __init__(
+        self,
+        model_name: str = "fake",
+        latency_ms: Optional[float] = None,
+        ms_per_output_token: Optional[float] = None,
+        style_repeats: int = 4,
+    ):
+        """
+        Initialize the fake model.
+
+        Args:
+            model_name: Reported model name
+            latency_ms: Fixed latency per call (default: FAKE_LATENCY_MS or 200)
+            ms_per_output_token: Generation time per output token
+                (default: FAKE_MS_PER_OUTPUT_TOKEN or 2)
+            style_repeats: Length of canned style descriptions (in paragraphs)
+        """
+        self.model_name = model_name
+        self.latency_ms = (
+            latency_ms if latency_ms is not None else float(os.getenv("FAKE_LATENCY_MS", "200"))
+        )
+        self.ms_per_output_token = (
+            ms_per_output_token
+            if ms_per_output_token is not None
+            else float(os.getenv("FAKE_MS_PER_OUTPUT_TOKEN", "2"))
+        )
+        self.style_repeats = style_repeats
+        self.calls = 0
+
+    def _style_text(self) -> str:
+        return (_STYLE_TEXT * self.style_repeats).strip()
+
+    def _respond(self, prompt: str, generation_config: Any) -> str:
+        """Canned response matching the kind of request."""
+        schema = getattr(generation_config, "response_schema", None)
+        if isinstance(schema, dict) and "properties" in schema:
+            return json.dumps({key: self._style_text() for key in schema["properties"]})
+        if "STYLE GUIDELINES" in prompt:
+            return self._style_text()
+        return _ANALYSIS_TEXT
+
+    def count_tokens(self, content: Any, **kwargs) -> Any:
+        """Estimated token count of text content."""
+        parts = content if isinstance(content, list) else [content]
+        text = "\n".join(part for part in parts if isinstance(part, str))
+        return SimpleNamespace(total_tokens=estimate_tokens(text))
+
+    def generate_content(self, content: list, generation_config: Any = None, **kwargs) -> Any:
+        """Return a canned response after a simulated delay."""
+        self.calls += 1
+        prompt = "\n".join(part for part in content if isinstance(part, str))
+        images = sum(1 for part in content if isinstance(part, Image.Image))
+        text = self._respond(prompt, generation_config)
+
+        prompt_tokens = estimate_tokens(prompt) + images * _IMAGE_TOKENS
+        output_tokens = estimate_tokens(text)
+        time.sleep((self.latency_ms + self.ms_per_output_token * output_tokens) / 1000)
+
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens,
+            ),
+        )
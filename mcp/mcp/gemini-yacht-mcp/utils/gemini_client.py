@@ -6,16 +6,38 @@ error recovery, and image processing utilities.
 """
 
 import os
+import math
+import time
 import base64
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Iterator
 from io import BytesIO
 
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 from PIL import Image
 
+from models.schemas import decode_image_payload
+from utils.context import current_priority, current_shares, remaining_time
+from utils.fake_backend import FakeGenerativeModel
+from utils.imaging import ImageProcessingError, get_image_pool
+from utils.latency import get_latency_tracker
+from utils.metrics import get_metrics
+from utils.quotas import get_quotas
+from utils.scheduler import get_scheduler
+from utils.transport import (
+    TRANSPORT_GRPC,
+    ChannelPool,
+    ChannelWaitTimeout,
+    TransportConfig,
+    build_channel_pool,
+    generative_client,
+)
+
 # Configure stderr logging (critical for MCP stdio servers)
 logger = logging.getLogger(__name__)
 
@@ -26,6 +48,170 @@ class GeminiClientError(Exception):
     pass
 
 
+class RejectedError(GeminiClientError):
+    """A call refused by a quota or admission limit; may be retried later."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OverloadedError(RejectedError):
+    """A call shed by admission control because the server is overloaded."""
+
+    pass
+
+
+class DeadlineExceededError(GeminiClientError):
+    """Raised when a request's deadline leaves no time for an upstream call."""
+
+    pass
+
+
+class HedgePolicy:
+    """
+    Settings and accounting for hedged upstream requests.
+
+    A duplicate call is sent when a call has not returned by the
+    GEMINI_HEDGE_QUANTILE of recent latencies for the same model and
+    operation, as long as hedges stay within GEMINI_HEDGE_BUDGET (fraction
+    of extra calls) of all primary calls.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        quantile: Optional[float] = None,
+        budget: Optional[float] = None,
+        min_samples: Optional[int] = None,
+    ):
+        """Initialize from arguments or GEMINI_HEDGE_* environment variables."""
+        self.enabled = (
+            enabled
+            if enabled is not None
+            else os.getenv("GEMINI_HEDGING", "false").lower() == "true"
+        )
+        self.quantile = quantile or float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.95"))
+        self.budget = budget if budget is not None else float(os.getenv("GEMINI_HEDGE_BUDGET", "0.05"))
+        self.min_samples = min_samples or int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+        self.primary_calls = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def delay_for(self, key: tuple) -> Optional[float]:
+        """Hedge delay for a call key, or None if hedging does not apply."""
+        if not self.enabled:
+            return None
+        return get_latency_tracker().quantile(key, self.quantile, self.min_samples)
+
+    def allows_hedge(self) -> bool:
+        """Whether one more hedge stays within the budget."""
+        return self.hedges_sent + 1 <= self.budget * self.primary_calls
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedge rate (hedges per primary call) and win rate (hedges that won)."""
+        return {
+            "enabled": self.enabled,
+            "primary_calls": self.primary_calls,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "hedge_rate": self.hedges_sent / self.primary_calls if self.primary_calls else 0.0,
+            "win_rate": self.hedges_won / self.hedges_sent if self.hedges_sent else 0.0,
+        }
+
+
+class TimeoutPolicy:
+    """
+    Per-call timeouts learned from observed latency.
+
+    The timeout for a (model, operation, tier) key is the
+    GEMINI_TIMEOUT_QUANTILE of its recent latencies times
+    GEMINI_TIMEOUT_MULTIPLIER, clamped to [GEMINI_TIMEOUT_FLOOR,
+    GEMINI_TIMEOUT_CEILING]. Until GEMINI_TIMEOUT_MIN_SAMPLES calls have
+    been observed for a key, the static GEMINI_TIMEOUT applies.
+
+    A call is not started with less than GEMINI_MIN_CALL_TIMEOUT left of
+    the request deadline, or less than the key's median latency once it
+    is learned: it would almost certainly time out after using a slot
+    and upstream capacity.
+    """
+
+    def __init__(
+        self,
+        default: Optional[float] = None,
+        enabled: Optional[bool] = None,
+        quantile: Optional[float] = None,
+        multiplier: Optional[float] = None,
+        floor: Optional[float] = None,
+        ceiling: Optional[float] = None,
+        min_samples: Optional[int] = None,
+        min_call: Optional[float] = None,
+    ):
+        """Initialize from arguments or GEMINI_TIMEOUT*/GEMINI_MIN_CALL_TIMEOUT environment variables."""
+        self.default = default or float(os.getenv("GEMINI_TIMEOUT", "60"))
+        self.enabled = (
+            enabled
+            if enabled is not None
+            else os.getenv("GEMINI_ADAPTIVE_TIMEOUT", "true").lower() == "true"
+        )
+        self.quantile = quantile or float(os.getenv("GEMINI_TIMEOUT_QUANTILE", "0.99"))
+        self.multiplier = multiplier or float(os.getenv("GEMINI_TIMEOUT_MULTIPLIER", "3"))
+        self.floor = floor or float(os.getenv("GEMINI_TIMEOUT_FLOOR", "10"))
+        self.ceiling = ceiling or float(os.getenv("GEMINI_TIMEOUT_CEILING", "120"))
+        self.min_samples = min_samples or int(os.getenv("GEMINI_TIMEOUT_MIN_SAMPLES", "20"))
+        self.min_call = (
+            min_call if min_call is not None else float(os.getenv("GEMINI_MIN_CALL_TIMEOUT", "0.5"))
+        )
+
+    def timeout_for(self, key: tuple) -> float:
+        """Timeout in seconds for a call key (before the request deadline cap)."""
+        if not self.enabled:
+            return self.default
+        observed = get_latency_tracker().quantile(key, self.quantile, self.min_samples)
+        if observed is None:
+            return self.default
+        return min(self.ceiling, max(self.floor, observed * self.multiplier))
+
+    def min_useful(self, key: tuple) -> float:
+        """Shortest time left of a deadline worth starting a call with."""
+        if not self.enabled:
+            return self.min_call
+        median = get_latency_tracker().quantile(key, 0.5, self.min_samples)
+        return max(self.min_call, median or 0.0)
+
+
+def size_tier(image: Optional[Image.Image] | list[Image.Image]) -> str:
+    """
+    Bucket an image by pixel count: "small" (<1 MP), "medium" (<4 MP) or "large".
+
+    For a list of images the total pixel count is used.
+    """
+    images = image if isinstance(image, list) else [image]
+    return pixel_tier(sum(img.size[0] * img.size[1] for img in images if img is not None))
+
+
+def pixel_tier(pixels: int) -> str:
+    """Size tier (see size_tier()) of a pixel count."""
+    if pixels < 1_000_000:
+        return "small"
+    if pixels < 4_000_000:
+        return "medium"
+    return "large"
+
+
+def estimate_image_tokens(image: Image.Image) -> int:
+    """
+    Approximate input tokens Gemini charges for an image.
+
+    Images up to 384x384 cost 258 tokens; larger ones are tiled into
+    768x768 crops of 258 tokens each.
+    """
+    width, height = image.size
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
 class GeminiClient:
     """
     Singleton client for Google Gemini API interactions.
@@ -35,6 +221,12 @@ class GeminiClient:
     """
 
     _instance: Optional["GeminiClient"] = None
+    # Serializes first-time setup: concurrent first callers (e.g. warm-up
+    # steps) must not see a half-configured client or SDK
+    _init_lock = threading.Lock()
+    # Models bound to the configured connections (None: call self.model)
+    channels: Optional[ChannelPool] = None
+    transport: Optional[TransportConfig] = None
 
     def __new__(cls):
         """Singleton pattern implementation."""
@@ -47,36 +239,63 @@ class GeminiClient:
         """Initialize Gemini client (only once due to singleton)."""
         if self._initialized:
             return
+        with self._init_lock:
+            if not self._initialized:
+                self._setup()
 
+    def _setup(self) -> None:
+        """Configure the SDK and the models from the environment."""
         # Load configuration from environment
+        self.backend = os.getenv("GEMINI_BACKEND", "gemini").lower()
         self.api_key = os.getenv("GEMINI_API_KEY")
+        self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        self.timeout = int(os.getenv("GEMINI_TIMEOUT", "60"))
+        self.timeouts = TimeoutPolicy(default=self.timeout)
+        self.hedging = HedgePolicy()
+
+        if self.backend == "fake":
+            # Offline stand-in for benchmarks and load tests
+            self.model = FakeGenerativeModel(self.model_name)
+            logger.warning("Using fake Gemini backend for model: %s", self.model_name)
+            self._initialized = True
+            return
+
         if not self.api_key:
             raise GeminiClientError(
                 "GEMINI_API_KEY environment variable is required"
             )
 
-        self.model_name = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
-        self.timeout = int(os.getenv("GEMINI_TIMEOUT", "60"))
+        try:
+            self.transport = TransportConfig.from_env()
+        except ValueError as e:
+            raise GeminiClientError(str(e))
 
         # Configure the API
-        genai.configure(api_key=self.api_key)
+        genai.configure(api_key=self.api_key, transport=self.transport.kind)
 
-        # Initialize model
+        # Initialize one model per connection (see utils.transport)
         try:
-            self.model = genai.GenerativeModel(self.model_name)
-            logger.info(f"Initialized Gemini model: {self.model_name}")
+            self.channels = build_channel_pool(self.transport, self.api_key, self.model_name)
+            self.model = self.channels.entries[0]
+            logger.info(
+                f"Initialized Gemini model: {self.model_name} "
+                f"({self.transport.kind}, {len(self.channels.entries)} channel(s))"
+            )
         except Exception as e:
             raise GeminiClientError(f"Failed to initialize Gemini model: {str(e)}")
 
         self._initialized = True
 
     @staticmethod
-    def decode_base64_image(image_data: str) -> Image.Image:
+    def decode_image_bytes(image_bytes: bytes) -> Image.Image:
         """
-        Decode base64 image string to PIL Image.
+        Decode raw image bytes to a fully loaded PIL Image.
+
+        The pixel data is loaded eagerly so the caller can release the
+        encoded buffer as soon as this returns.
 
         Args:
-            image_data: Base64-encoded image (with or without data URL prefix)
+            image_bytes: Encoded image bytes (PNG, JPEG, WebP, ...)
 
         Returns:
             PIL Image object
@@ -85,27 +304,42 @@ class GeminiClient:
             GeminiClientError: If decoding fails
         """
         try:
-            # Remove data URL prefix if present
-            if "," in image_data:
-                image_data = image_data.split(",", 1)[1]
-
-            # Decode base64
-            image_bytes = base64.b64decode(image_data)
-
-            # Load as PIL Image
-            image = Image.open(BytesIO(image_bytes))
+            # Closing the buffer releases the encoded bytes held by PIL
+            with BytesIO(image_bytes) as buffer:
+                image = Image.open(buffer)
+                image.load()
 
             # Convert to RGB if necessary (handle RGBA, grayscale, etc.)
             if image.mode not in ("RGB", "L"):
-                image = image.convert("RGB")
+                converted = image.convert("RGB")
+                image.close()
+                image = converted
 
-            logger.info(
-                f"Decoded image: {image.size[0]}x{image.size[1]}, mode={image.mode}"
-            )
+            logger.info("Decoded image: %sx%s, mode=%s", image.size[0], image.size[1], image.mode)
             return image
 
         except Exception as e:
+            raise GeminiClientError(f"Failed to decode image: {str(e)}")
+
+    @staticmethod
+    def decode_base64_image(image_data: str) -> Image.Image:
+        """
+        Decode base64 image string to PIL Image.
+
+        Args:
+            image_data: Base64-encoded image (with or without data URL prefix)
+
+        Returns:
+            PIL Image object
+
+        Raises:
+            GeminiClientError: If decoding fails
+        """
+        try:
+            image_bytes = decode_image_payload(image_data)
+        except ValueError as e:
             raise GeminiClientError(f"Failed to decode base64 image: {str(e)}")
+        return GeminiClient.decode_image_bytes(image_bytes)
 
     @staticmethod
     def encode_image_to_base64(image: Image.Image, format: str = "PNG") -> str:
@@ -132,11 +366,189 @@ class GeminiClient:
         except Exception as e:
             raise GeminiClientError(f"Failed to encode image to base64: {str(e)}")
 
+    @staticmethod
+    async def decode_image_async(image_bytes: bytes) -> Image.Image:
+        """
+        Decode raw image bytes to a PIL Image off the event loop.
+
+        Decoding and RGB conversion run on the shared image pool
+        (IMAGE_POOL), so large photos do not stall other requests.
+
+        Args:
+            image_bytes: Encoded image bytes (PNG, JPEG, WebP, ...)
+
+        Returns:
+            PIL Image object
+
+        Raises:
+            GeminiClientError: If decoding fails
+        """
+        try:
+            image = await get_image_pool().decode(image_bytes)
+        except ImageProcessingError as e:
+            raise GeminiClientError(str(e))
+
+        logger.info("Decoded image: %sx%s, mode=%s", image.size[0], image.size[1], image.mode)
+        return image
+
+    @staticmethod
+    async def encode_image_to_base64_async(image: Image.Image, format: str = "PNG") -> str:
+        """
+        Encode PIL Image to base64 string off the event loop.
+
+        Args:
+            image: PIL Image object
+            format: Image format (PNG, JPEG, etc.)
+
+        Returns:
+            Base64-encoded image string
+
+        Raises:
+            GeminiClientError: If encoding fails
+        """
+        try:
+            image_bytes = await get_image_pool().encode(image, format)
+        except ImageProcessingError as e:
+            raise GeminiClientError(f"Failed to encode image to base64: {str(e)}")
+        return base64.b64encode(image_bytes).decode("utf-8")
+
+    def warm_up(self, ping: bool = False) -> None:
+        """
+        Prepare the upstream connection before the first request.
+
+        The SDK clients and their channels are created with the client;
+        channels connect on first use. With ping, a count_tokens request
+        (not billed) on every channel also opens the connections and
+        completes the TLS handshakes.
+
+        Args:
+            ping: Also make one lightweight API request per channel
+
+        Raises:
+            GeminiClientError: If the ping fails
+        """
+        if not ping:
+            return
+        models = self.channels.entries if self.channels else [self.model]
+        try:
+            for model in models:
+                model.count_tokens("ping", request_options={"timeout": self.timeout})
+        except Exception as e:
+            raise GeminiClientError(f"Warm-up ping failed: {str(e)}")
+
+    def _generate(
+        self, content: list, generation_config: GenerationConfig, deadline: Optional[float] = None
+    ):
+        """
+        Blocking SDK call on the least busy channel (runs in a worker thread).
+
+        Args:
+            content: Prompt and image parts
+            generation_config: Generation parameters
+            deadline: time.monotonic() by which the call must have started
+                (bounds the wait for a free channel)
+
+        Raises:
+            DeadlineExceededError: If no channel became free before the deadline
+        """
+        if self.channels is None:
+            return self.model.generate_content(content, generation_config=generation_config)
+        with self._channel(deadline) as model:
+            return model.generate_content(content, generation_config=generation_config)
+
+    def _embed(
+        self, text: str, model_name: str, dim: int, deadline: Optional[float] = None
+    ) -> list[float]:
+        """
+        Blocking embed_content call on the least busy channel (runs in a worker thread).
+
+        Args:
+            text: Text to embed
+            model_name: Embedding model
+            dim: Output dimensionality
+            deadline: time.monotonic() by which the call must have started
+
+        Raises:
+            DeadlineExceededError: If no channel became free before the deadline
+        """
+        if self.channels is None:
+            # Stand-in models: the SDK's default client
+            result = genai.embed_content(
+                model=model_name,
+                content=text,
+                task_type="semantic_similarity",
+                output_dimensionality=dim,
+            )
+            return result["embedding"]
+        with self._channel(deadline) as model:
+            result = genai.embed_content(
+                model=model_name,
+                content=text,
+                task_type="semantic_similarity",
+                output_dimensionality=dim,
+                client=generative_client(model),
+            )
+        return result["embedding"]
+
+    @contextmanager
+    def _channel(self, deadline: Optional[float]) -> Iterator[Any]:
+        """Least busy channel, waiting for one at most until the deadline."""
+        wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            with self.channels.acquire(timeout=wait) as model:
+                yield model
+        except ChannelWaitTimeout as e:
+            raise DeadlineExceededError(f"Call budget exceeded waiting for a Gemini channel: {e}")
+
+    async def embed_text(self, text: str, model_name: str, dim: int) -> list[float]:
+        """
+        Embed a text for semantic similarity.
+
+        The call takes the same path as generation calls: scheduler slot at
+        the request priority, caller quotas, request deadline and the
+        channel pool.
+
+        Args:
+            text: Text to embed
+            model_name: Embedding model (e.g. "models/text-embedding-004")
+            dim: Output dimensionality
+
+        Returns:
+            Embedding values
+
+        Raises:
+            GeminiClientError: If the call fails, is rejected or runs out of time
+        """
+        try:
+            return await self._call_model(
+                functools.partial(self._embed, text, model_name, dim), "embedding", "text"
+            )
+        except GeminiClientError:
+            raise
+        except Exception as e:
+            raise GeminiClientError(f"Gemini embedding call failed: {str(e)}")
+
+    def transport_stats(self) -> Dict[str, Any]:
+        """Transport settings and per-channel load."""
+        if self.transport is None or self.channels is None:
+            # Fake backend or a stand-in model
+            return {"transport": None}
+        return {
+            "transport": self.transport.kind,
+            "endpoint": self.transport.endpoint,
+            "keepalive_s": self.transport.keepalive_s,
+            "max_connections": (
+                None if self.transport.kind == TRANSPORT_GRPC else self.transport.max_connections
+            ),
+            "channels": self.channels.stats(),
+        }
+
     async def analyze_image(
         self,
         image: Image.Image,
         prompt: str,
         options: Optional[Dict[str, Any]] = None,
+        operation: str = "analysis",
     ) -> str:
         """
         Analyze an image using Gemini with text prompt.
@@ -145,6 +557,35 @@ class GeminiClient:
             image: PIL Image to analyze
             prompt: Analysis prompt/instructions
             options: Optional generation parameters
+            operation: Call type for latency statistics ("analysis", "style", ...)
+
+        Returns:
+            Generated text response
+
+        Raises:
+            GeminiClientError: If API call fails or times out
+        """
+        return await self.analyze_images([image], prompt, options, operation)
+
+    async def analyze_images(
+        self,
+        images: list[Image.Image],
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        operation: str = "analysis",
+    ) -> str:
+        """
+        Analyze one or more images in a single multimodal request.
+
+        With several images, each is preceded by a "Photo N:" label so the
+        response can refer to individual views.
+
+        Args:
+            images: PIL Images to analyze
+            prompt: Analysis prompt/instructions
+            options: Optional generation parameters (temperature, top_p, top_k,
+                max_tokens, response_mime_type, response_schema)
+            operation: Call type for latency statistics ("analysis", "style", ...)
 
         Returns:
             Generated text response
@@ -159,36 +600,267 @@ class GeminiClient:
                 top_p=options.get("top_p", 0.95) if options else 0.95,
                 top_k=options.get("top_k", 40) if options else 40,
                 max_output_tokens=options.get("max_tokens", 8192) if options else 8192,
+                # Structured output (e.g. a JSON object keyed by style)
+                response_mime_type=options.get("response_mime_type") if options else None,
+                response_schema=options.get("response_schema") if options else None,
             )
 
             # Create content list
-            content = [prompt, image]
-
-            # Execute with timeout
-            logger.info(f"Calling Gemini API for analysis (timeout: {self.timeout}s)")
-
-            response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    self.model.generate_content,
-                    content,
-                    generation_config=generation_config,
-                ),
-                timeout=self.timeout,
+            content = [prompt]
+            if len(images) == 1:
+                content.append(images[0])
+            else:
+                for index, image in enumerate(images, start=1):
+                    content.extend([f"Photo {index}:", image])
+
+            response = await self._call_model(
+                functools.partial(self._generate, content, generation_config),
+                operation,
+                size_tier(images),
             )
 
             # Extract text from response
             if not response or not response.text:
                 raise GeminiClientError("Empty response from Gemini API")
 
-            logger.info(f"Received analysis response ({len(response.text)} chars)")
+            logger.info("Received analysis response (%s chars)", len(response.text))
             return response.text
 
+        except GeminiClientError:
+            raise
+        except Exception as e:
+            raise GeminiClientError(f"Gemini API call failed: {str(e)}")
+
+    async def _call_model(
+        self,
+        request: Callable[[float], Any],
+        operation: str = "analysis",
+        tier: str = "small",
+    ) -> Any:
+        """
+        Run one upstream call within the request's budget.
+
+        Waits for a scheduler slot according to the request priority, then
+        runs the blocking SDK call in a worker thread. The timeout is learned
+        from recent latency of the same (model, operation, tier) and capped
+        by the remaining request deadline. If the caller is cancelled or times
+        out, the call is abandoned: control returns immediately, the slot is
+        held until the thread finishes (the upstream work is still running),
+        and the wasted time is recorded in metrics.
+
+        With hedging enabled, a duplicate call is sent when the first one is
+        slower than the configured latency quantile; the first response wins.
+
+        Args:
+            request: Blocking SDK call (e.g. a partial of _generate), given
+                the monotonic time by which it must have started
+            operation: Call type for latency statistics
+            tier: Image size tier for latency statistics
+
+        Returns:
+            Raw SDK response
+
+        Raises:
+            RejectedError: If the caller is over its token budget or queue limit
+            DeadlineExceededError: If the deadline expires before or during the
+                call, or leaves too little time to start it
+            GeminiClientError: If the call times out
+        """
+        scheduler = get_scheduler()
+        priority = current_priority()
+        # Usually the caller alone; a micro-batch's callers by token share
+        shares = current_shares()
+        key = (self.model_name, operation, tier)
+
+        minimum = self.timeouts.min_useful(key)
+        remaining = remaining_time()
+        if remaining is not None and remaining < minimum:
+            raise DeadlineExceededError(
+                f"Request deadline leaves {max(remaining, 0.0):.2f}s, "
+                f"under the {minimum:.2f}s an upstream call needs"
+            )
+        for caller, _ in shares:
+            rejection = get_quotas().check(caller, scheduler.queued(caller))
+            if rejection is not None:
+                raise RejectedError(rejection.reason, rejection.retry_after)
+        try:
+            # No point in getting a slot too late to use it
+            await asyncio.wait_for(
+                scheduler.acquire(priority, shares[0][0], shares),
+                timeout=None if remaining is None else remaining - minimum,
+            )
         except asyncio.TimeoutError:
+            raise DeadlineExceededError(
+                "Request deadline exceeded while waiting for an upstream slot"
+            )
+
+        remaining = remaining_time()
+        if remaining is not None and remaining < minimum:
+            scheduler.release(priority, shares[0][0], shares=shares)
+            raise DeadlineExceededError(
+                f"Request deadline leaves {max(remaining, 0.0):.2f}s after waiting for "
+                f"an upstream slot, under the {minimum:.2f}s a call needs"
+            )
+
+        timeout = self.timeouts.timeout_for(key)
+        deadline_bound = remaining is not None and remaining < timeout
+        if deadline_bound:
+            timeout = max(remaining, 0.0)
+
+        logger.info(
+            "Calling Gemini API for %s/%s (timeout: %.1fs, priority: %s)",
+            operation,
+            tier,
+            timeout,
+            priority.value,
+        )
+
+        # A call still waiting for a channel when the caller gives up is dropped
+        call_deadline = time.monotonic() + timeout
+        calls = [
+            self._start_call(request, call_deadline, key, priority, shares)
+        ]
+        self.hedging.primary_calls += 1
+
+        try:
+            response = await asyncio.wait_for(
+                self._await_first(calls, request, call_deadline, key, priority, shares),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            for call in calls:
+                self._abandon(call, "timeout")
+            if deadline_bound:
+                raise DeadlineExceededError(
+                    f"Request deadline exceeded during Gemini API call ({timeout:.1f}s left)"
+                )
             raise GeminiClientError(
-                f"Gemini API call timed out after {self.timeout} seconds"
+                f"Gemini API call timed out after {timeout:.1f} seconds"
             )
-        except Exception as e:
-            raise GeminiClientError(f"Gemini API call failed: {str(e)}")
+        except asyncio.CancelledError:
+            for call in calls:
+                self._abandon(call, "cancelled")
+            raise
+
+        return response
+
+    def _start_call(
+        self,
+        request: Callable[[float], Any],
+        deadline: float,
+        key: tuple,
+        priority,
+        shares,
+    ) -> asyncio.Future:
+        """
+        Start one SDK call in a worker thread on an already held slot.
+
+        The slot is released and the latency and tokens recorded (and
+        charged to the callers' quotas by share) when the thread finishes,
+        whether or not anyone is still waiting for the result.
+        """
+        started = time.monotonic()
+        call = asyncio.ensure_future(asyncio.to_thread(request, deadline))
+        call.started = started
+
+        def finished(done: asyncio.Future) -> None:
+            elapsed = time.monotonic() - started
+            get_scheduler().release(priority, shares[0][0], elapsed, shares)
+            if not done.cancelled() and done.exception() is None:
+                metrics = get_metrics()
+                get_latency_tracker().record(key, elapsed)
+                metrics.observe("upstream.latency_s", elapsed)
+                usage = getattr(done.result(), "usage_metadata", None)
+                if usage:
+                    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+                    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+                    metrics.increment("upstream.prompt_tokens", prompt_tokens)
+                    metrics.increment("upstream.output_tokens", output_tokens)
+                    tokens = prompt_tokens + output_tokens
+                    for caller, share in shares:
+                        get_quotas().charge(caller, round(tokens * share))
+
+        call.add_done_callback(finished)
+        return call
+
+    async def _await_first(
+        self,
+        calls: list,
+        request: Callable[[float], Any],
+        deadline: float,
+        key: tuple,
+        priority,
+        shares,
+    ) -> Any:
+        """
+        Wait for the primary call, hedging it if it runs slow.
+
+        ``calls`` is extended in place with the hedge so the caller can
+        abandon every outstanding call on timeout or cancellation.
+        """
+        primary = calls[0]
+        hedge_delay = self.hedging.delay_for(key)
+        if hedge_delay is None:
+            return await asyncio.shield(primary)
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        if not self.hedging.allows_hedge() or not get_scheduler().try_acquire(
+            priority, shares[0][0], shares
+        ):
+            return await asyncio.shield(primary)
+
+        logger.info("Hedging slow Gemini call after %.2fs", hedge_delay)
+        self.hedging.hedges_sent += 1
+        get_metrics().increment("hedge.sent")
+        hedge = self._start_call(request, deadline, key, priority, shares)
+        calls.append(hedge)
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer a successful response; fall back to the other call on error
+            winner = next((c for c in done if c.exception() is None), None)
+            if winner is None:
+                if pending:
+                    continue
+                return primary.result()
+
+            for loser in pending:
+                self._abandon(loser, "hedge_lost")
+            if winner is hedge:
+                self.hedging.hedges_won += 1
+                get_metrics().increment("hedge.won")
+            return winner.result()
+
+    @staticmethod
+    def _abandon(call: asyncio.Future, reason: str) -> None:
+        """
+        Stop waiting for an in-flight call and account for the wasted work.
+
+        The worker thread cannot be interrupted; once it finishes, its total
+        duration (and token usage, when reported) is recorded as waste.
+        """
+        if call.done():
+            return
+
+        metrics = get_metrics()
+        metrics.increment(f"upstream.abandoned.{reason}")
+        logger.warning("Abandoning in-flight Gemini call (%s)", reason)
+
+        def account(finished: asyncio.Future) -> None:
+            wasted_s = time.monotonic() - call.started
+            metrics.increment("upstream.wasted_seconds", wasted_s)
+            if finished.cancelled() or finished.exception() is not None:
+                return
+            usage = getattr(finished.result(), "usage_metadata", None)
+            tokens = getattr(usage, "total_token_count", 0) if usage else 0
+            if tokens:
+                metrics.increment("upstream.wasted_tokens", tokens)
+
+        call.add_done_callback(account)
 
     async def generate_image_edit(
         self,
@@ -0,0 +1,384 @@
+"""
+Off-loop image processing.
+
+Decoding, mode conversion and re-encoding are CPU-bound and, when run on
+the asyncio loop thread, stall every other session's I/O. This module
+dispatches that work to a configurable pool:
+
+- ``process`` (default): a ProcessPoolExecutor with IMAGE_WORKERS workers
+- ``thread``: the default asyncio thread pool
+- ``inline``: directly on the loop thread (previous behaviour, for comparison)
+
+PIL objects never cross the process boundary. To decode, the encoded
+image goes to the worker in a shared memory segment and the raw pixels
+come back in another, which the parent copies into the new image (on a
+thread, as it is tens of MB for a large photo) and removes. To encode,
+the parent exports the pixels into a segment on a thread and the worker
+returns the encoded bytes. Only segment names, sizes and the image mode
+are pickled. The thread and inline kinds work on the PIL image directly.
+
+A process pool whose worker died (killed, out of memory) is broken for
+good; it is then replaced and the call retried once on the new pool.
+"""
+
+import os
+import atexit
+import asyncio
+import logging
+from io import BytesIO
+from typing import Optional
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+IMAGE_POOL_PROCESS = "process"
+IMAGE_POOL_THREAD = "thread"
+IMAGE_POOL_INLINE = "inline"
+IMAGE_POOL_KINDS = (IMAGE_POOL_PROCESS, IMAGE_POOL_THREAD, IMAGE_POOL_INLINE)
+
+
+class ImageProcessingError(Exception):
+    """Raised when image decoding or encoding fails."""
+
+    pass
+
+
+# Worker functions (module level so they can run in another process)
+
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    """
+    Decode encoded image bytes to a loaded PIL Image.
+
+    Images not in RGB or L mode are converted to RGB.
+
+    Args:
+        image_bytes: Encoded image (PNG, JPEG, WebP, ...)
+
+    Returns:
+        PIL Image in RGB or L mode
+    """
+    with BytesIO(image_bytes) as buffer:
+        image = Image.open(buffer)
+        image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return image
+
+
+def _to_shared(data) -> SharedMemory:
+    """Copy bytes into a new shared memory segment (the caller removes it)."""
+    segment = SharedMemory(create=True, size=max(len(data), 1))
+    segment.buf[: len(data)] = data
+    return segment
+
+
+def _remove_shared(name: str) -> None:
+    """Remove a shared memory segment, if it still exists."""
+    try:
+        segment = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
+
+
+def decode_to_shared(name: str, size: int) -> tuple[str, tuple[int, int], str, int]:
+    """
+    Decode an encoded image from shared memory into a new segment of raw pixels.
+
+    Runs in a worker process; the parent owns and removes both segments.
+
+    Args:
+        name: Segment holding the encoded image
+        size: Encoded image size in bytes
+
+    Returns:
+        Tuple of (mode, size, name of the pixel segment, pixel bytes)
+    """
+    segment = SharedMemory(name=name)
+    try:
+        image_bytes = bytes(segment.buf[:size])
+    finally:
+        segment.close()
+    image = decode_image(image_bytes)
+    del image_bytes
+
+    raw = image.tobytes()
+    pixels = _to_shared(raw)
+    pixels.close()
+    return image.mode, image.size, pixels.name, len(raw)
+
+
+def _take_image(mode: str, size: tuple[int, int], name: str, nbytes: int) -> Image.Image:
+    """Copy raw pixels from a shared memory segment into a new image and remove it."""
+    segment = SharedMemory(name=name)
+    try:
+        with segment.buf[:nbytes] as view:
+            return Image.frombytes(mode, size, view)
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def _discard_result(future: Future) -> None:
+    """Remove the pixel segment of a decode nobody waits for anymore."""
+    if not future.cancelled() and future.exception() is None:
+        _remove_shared(future.result()[2])
+
+
+def encode_from_shared(
+    mode: str, size: tuple[int, int], name: str, nbytes: int, format: str
+) -> bytes:
+    """
+    Encode raw pixels from a shared memory segment to an image file format.
+
+    Runs in a worker process; the parent owns and removes the segment.
+
+    Args:
+        mode: PIL mode of the pixel data
+        size: (width, height)
+        name: Segment holding the raw pixels
+        nbytes: Pixel bytes in the segment
+        format: Target format (PNG, JPEG, ...)
+
+    Returns:
+        Encoded image bytes
+    """
+    segment = SharedMemory(name=name)
+    try:
+        with segment.buf[:nbytes] as view:
+            image = Image.frombytes(mode, size, view)
+    finally:
+        segment.close()
+    return encode_image(image, format)
+
+
+def _encodable(image: Image.Image) -> Image.Image:
+    """Convert modes the image formats cannot all store to RGB."""
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    return image
+
+
+def _share_pixels(image: Image.Image) -> tuple[str, tuple[int, int], SharedMemory, int]:
+    """Copy an image's pixels into a new shared memory segment (the caller removes it)."""
+    image = _encodable(image)
+    raw = image.tobytes()
+    return image.mode, image.size, _to_shared(raw), len(raw)
+
+
+def convert_and_encode(image: Image.Image, format: str) -> bytes:
+    """Convert an image to an encodable mode and encode it."""
+    return encode_image(_encodable(image), format)
+
+
+def encode_image(image: Image.Image, format: str) -> bytes:
+    """Encode a PIL Image to an image file format."""
+    buffer = BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def read_image_size(image_bytes: bytes) -> Optional[tuple[int, int]]:
+    """
+    Read the dimensions of an encoded image from its header, without
+    decoding the pixels.
+
+    Args:
+        image_bytes: Encoded image (PNG, JPEG, WebP, ...)
+
+    Returns:
+        (width, height), or None if the header is not readable
+    """
+    try:
+        with BytesIO(image_bytes) as buffer, Image.open(buffer) as image:
+            return image.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _warm_worker() -> bool:
+    """Load PIL codecs in a worker process."""
+    Image.init()
+    return True
+
+
+def _process_context() -> multiprocessing.context.BaseContext:
+    """
+    Start method for worker processes.
+
+    Forking a server that already runs threads (the stdio transport reads
+    stdin on a worker thread) can copy held locks into the child and hang
+    it, so workers are started from a fork server where the platform has
+    one and spawned otherwise.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class ImagePool:
+    """Dispatches image CPU work according to IMAGE_POOL."""
+
+    def __init__(self, kind: Optional[str] = None, workers: Optional[int] = None):
+        """
+        Initialize the pool (the executor itself is created lazily).
+
+        Args:
+            kind: "process", "thread" or "inline" (default: IMAGE_POOL or process)
+            workers: Process count (default: IMAGE_WORKERS or min(4, CPU count))
+        """
+        self.kind = (kind or os.getenv("IMAGE_POOL", IMAGE_POOL_PROCESS)).lower()
+        if self.kind not in IMAGE_POOL_KINDS:
+            logger.warning("Unknown IMAGE_POOL '%s', using thread pool", self.kind)
+            self.kind = IMAGE_POOL_THREAD
+        self.workers = workers or int(
+            os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))
+        )
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        """Process executor, or None for the default thread pool."""
+        if self.kind != IMAGE_POOL_PROCESS:
+            return None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=_process_context()
+            )
+            logger.info("Started image process pool (%s workers)", self.workers)
+        return self._executor
+
+    def _discard_executor(self, executor: Executor) -> None:
+        """Shut down a broken process pool; the next call starts a new one."""
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _submit(self, func, *args, on_cancel=None):
+        """
+        Run a worker function in the process pool.
+
+        Args:
+            func: Worker function
+            *args: Its arguments
+            on_cancel: Callback added to the future when the caller is
+                cancelled while the worker is still running
+
+        Raises:
+            BrokenProcessPool: If the pool breaks again after a restart
+        """
+        for retried in (False, True):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(func, *args)
+                try:
+                    return await asyncio.wrap_future(future)
+                except asyncio.CancelledError:
+                    if on_cancel is not None:
+                        future.add_done_callback(on_cancel)
+                    raise
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                if retried:
+                    raise
+                logger.warning("Image process pool broke, restarting it")
+
+    async def _run(self, func, *args):
+        """Run a worker function according to the pool kind."""
+        if self.kind == IMAGE_POOL_INLINE:
+            return func(*args)
+        if self.kind == IMAGE_POOL_PROCESS:
+            return await self._submit(func, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def decode(self, image_bytes: bytes) -> Image.Image:
+        """
+        Decode encoded image bytes to a PIL Image off the loop thread.
+
+        Raises:
+            ImageProcessingError: If decoding fails
+        """
+        try:
+            if self.kind != IMAGE_POOL_PROCESS:
+                return await self._run(decode_image, image_bytes)
+            return await self._decode_shared(image_bytes)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            raise ImageProcessingError(f"Failed to decode image: {str(e)}")
+
+    async def _decode_shared(self, image_bytes: bytes) -> Image.Image:
+        """Decode in a worker process, passing the data through shared memory."""
+        encoded = _to_shared(image_bytes)
+        try:
+            result = await self._submit(
+                decode_to_shared, encoded.name, len(image_bytes), on_cancel=_discard_result
+            )
+        finally:
+            # The worker has read it (or will fail to); free it before the pixels arrive
+            encoded.close()
+            encoded.unlink()
+        # Copying the pixels into the image is tens of MB for a large photo
+        return await asyncio.to_thread(_take_image, *result)
+
+    async def encode(self, image: Image.Image, format: str = "PNG") -> bytes:
+        """
+        Encode a PIL Image off the loop thread.
+
+        Raises:
+            ImageProcessingError: If encoding fails
+        """
+        try:
+            if self.kind != IMAGE_POOL_PROCESS:
+                return await self._run(convert_and_encode, image, format)
+            return await self._encode_shared(image, format)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            raise ImageProcessingError(f"Failed to encode image: {str(e)}")
+
+    async def _encode_shared(self, image: Image.Image, format: str) -> bytes:
+        """Encode in a worker process, passing the pixels through shared memory."""
+        mode, size, pixels, nbytes = await asyncio.to_thread(_share_pixels, image)
+        try:
+            return await self._submit(encode_from_shared, mode, size, pixels.name, nbytes, format)
+        finally:
+            pixels.close()
+            pixels.unlink()
+
+    async def warm_up(self) -> None:
+        """Start the workers and load codecs in each of them."""
+        if self.kind != IMAGE_POOL_PROCESS:
+            _warm_worker()
+            return
+        await asyncio.gather(*(self._submit(_warm_worker) for _ in range(self.workers)))
+
+    def shutdown(self) -> None:
+        """Stop the process pool, if one was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_pool: Optional[ImagePool] = None
+
+
+def get_image_pool() -> ImagePool:
+    """
+    Get the shared image pool.
+
+    Returns:
+        ImagePool configured from the environment
+    """
+    global _pool
+    if _pool is None:
+        _pool = ImagePool()
+        atexit.register(_pool.shutdown)
+    return _pool
@@ -0,0 +1,276 @@
+"""
+Background job manager for long-running tool calls.
+
+``generate_all`` can outlast MCP client request timeouts. Jobs let clients
+submit the work, get a job id back immediately, and poll for per-style
+progress and the final result. Jobs run on a bounded pool of asyncio
+workers, finished jobs are kept for a TTL, and queued or running jobs can
+be cancelled.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from enum import Enum
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """Base exception for job management errors."""
+
+    pass
+
+
+class JobNotFoundError(JobError):
+    """Raised when a job id is unknown or its result has expired."""
+
+    pass
+
+
+class JobQueueFullError(JobError):
+    """Raised when the job queue is at capacity."""
+
+    pass
+
+
+class JobStatus(str, Enum):
+    """Lifecycle states of a job."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+_FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
+@dataclass
+class Job:
+    """A submitted unit of background work."""
+
+    id: str
+    kind: str
+    # Dropped once the job finishes so the closure (and the image it
+    # captures) is not kept alive for the result TTL
+    run: Optional[Callable[["Job"], Awaitable[Dict[str, Any]]]]
+    status: JobStatus = JobStatus.QUEUED
+    progress: Dict[str, str] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    on_done: Optional[Callable[[], None]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINISHED
+
+    def release(self) -> None:
+        """Drop the work and run the on_done hook once the job finished."""
+        self.run = None
+        on_done, self.on_done = self.on_done, None
+        if on_done is not None:
+            on_done()
+
+    def report(self, step: str, state: str) -> None:
+        """Record progress of one step (e.g. a style) of the job."""
+        self.progress[step] = state
+
+    def to_status(self) -> Dict[str, Any]:
+        """Public status view of the job (without the result payload)."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status.value,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Bounded worker pool executing jobs from an in-memory queue.
+
+    Workers are started lazily on the first submission so the manager can
+    be created before the event loop is running.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        result_ttl: Optional[float] = None,
+        max_queued: Optional[int] = None,
+    ):
+        """
+        Initialize the manager.
+
+        Args:
+            workers: Concurrent jobs (default: JOB_WORKERS or 2)
+            result_ttl: Seconds finished jobs are kept (default: JOB_RESULT_TTL or 3600)
+            max_queued: Maximum queued jobs (default: JOB_QUEUE_MAX or 100)
+        """
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.result_ttl = result_ttl or float(os.getenv("JOB_RESULT_TTL", "3600"))
+        self.max_queued = max_queued or int(os.getenv("JOB_QUEUE_MAX", "100"))
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        # Jobs waiting to start; jobs cancelled while queued stay in the
+        # queue until a worker skips them but no longer count
+        self._queued = 0
+        self._worker_tasks: list[asyncio.Task] = []
+
+    def _ensure_workers(self) -> None:
+        """Start the worker tasks on the running loop if needed."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._worker_tasks = [t for t in self._worker_tasks if not t.done()]
+        while len(self._worker_tasks) < self.workers:
+            index = len(self._worker_tasks)
+            self._worker_tasks.append(
+                asyncio.create_task(self._worker(), name=f"job-worker-{index}")
+            )
+
+    async def _worker(self) -> None:
+        """Take jobs off the queue and run them one at a time."""
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status == JobStatus.QUEUED:
+                    self._queued -= 1
+                    await self._execute(job)
+            finally:
+                self._queue.task_done()
+
+    async def _execute(self, job: Job) -> None:
+        """Run a job to completion, recording its outcome."""
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        job.task = asyncio.create_task(job.run(job), name=f"job-{job.id}")
+        logger.info("Job %s (%s) started", job.id, job.kind)
+
+        try:
+            job.result = await job.task
+            job.status = JobStatus.SUCCEEDED
+            logger.info("Job %s succeeded", job.id)
+        except asyncio.CancelledError:
+            job.status = JobStatus.CANCELLED
+            logger.info("Job %s cancelled", job.id)
+            if not job.task.cancelled():
+                # The worker itself is being cancelled (shutdown)
+                raise
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+            logger.error("Job %s failed: %s", job.id, e)
+        finally:
+            job.finished_at = time.time()
+            job.task = None
+            job.release()
+
+    def _purge_expired(self) -> None:
+        """Drop finished jobs older than the result TTL."""
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[Job], Awaitable[Dict[str, Any]]],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """
+        Enqueue a job.
+
+        Args:
+            kind: Job type label (e.g. "generate_all")
+            run: Coroutine function receiving the Job (for progress reports)
+            on_done: Called once when the job finishes, fails or is cancelled
+                (not if the submission is refused)
+
+        Returns:
+            The queued Job
+
+        Raises:
+            JobQueueFullError: If the queue is at capacity
+        """
+        self._purge_expired()
+        self._ensure_workers()
+
+        if self._queued >= self.max_queued:
+            raise JobQueueFullError(
+                f"Job queue is full ({self.max_queued} jobs), retry later"
+            )
+        job = Job(id=uuid.uuid4().hex, kind=kind, run=run, on_done=on_done)
+        self._queue.put_nowait(job)
+        self._queued += 1
+
+        self._jobs[job.id] = job
+        logger.info("Job %s (%s) queued", job.id, kind)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """
+        Look up a job.
+
+        Raises:
+            JobNotFoundError: If the job is unknown or expired
+        """
+        self._purge_expired()
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(f"Unknown or expired job: {job_id}")
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        Cancel a queued or running job.
+
+        Finished jobs are returned unchanged.
+
+        Raises:
+            JobNotFoundError: If the job is unknown or expired
+        """
+        job = self.get(job_id)
+        if job.status == JobStatus.QUEUED:
+            job.status = JobStatus.CANCELLED
+            self._queued -= 1
+            job.finished_at = time.time()
+            job.release()
+            logger.info("Job %s cancelled before start", job.id)
+        elif job.status == JobStatus.RUNNING and job.task is not None:
+            job.task.cancel()
+        return job
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """
+    Get the shared job manager.
+
+    Returns:
+        JobManager configured from the environment
+    """
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
@@ -0,0 +1,86 @@
+"""
+Rolling latency statistics for upstream calls.
+
+Keeps a bounded window of recent successful call durations per key
+(model and operation) so the client can derive quantiles, e.g. for
+deciding when to hedge a slow request.
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Hashable, Optional, Dict, Any
+
+# Recent observations kept per key
+_WINDOW_SIZE = 512
+
+
+class LatencyTracker:
+    """Thread-safe per-key windows of recent latencies."""
+
+    def __init__(self, window_size: int = _WINDOW_SIZE):
+        """
+        Initialize the tracker.
+
+        Args:
+            window_size: Number of recent observations kept per key
+        """
+        self._lock = threading.Lock()
+        self._windows: Dict[Hashable, deque] = defaultdict(
+            lambda: deque(maxlen=window_size)
+        )
+
+    def record(self, key: Hashable, seconds: float) -> None:
+        """Record the duration of one successful call."""
+        with self._lock:
+            self._windows[key].append(seconds)
+
+    def count(self, key: Hashable) -> int:
+        """Number of observations currently in the window for a key."""
+        with self._lock:
+            return len(self._windows.get(key, ()))
+
+    def quantile(self, key: Hashable, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Nearest-rank quantile of recent latencies.
+
+        Args:
+            key: Latency key
+            q: Quantile in [0, 1]
+            min_samples: Minimum observations required
+
+        Returns:
+            Latency in seconds, or None if there are too few observations
+        """
+        with self._lock:
+            window = self._windows.get(key)
+            if not window or len(window) < min_samples:
+                return None
+            values = sorted(window)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Count and median per key, for diagnostics."""
+        with self._lock:
+            keys = list(self._windows)
+        result = {}
+        for key in keys:
+            name = "/".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+            result[name] = {
+                "count": self.count(key),
+                "p50": self.quantile(key, 0.5),
+                "p95": self.quantile(key, 0.95),
+            }
+        return result
+
+
+_tracker = LatencyTracker()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """
+    Get the process-wide latency tracker.
+
+    Returns:
+        Shared LatencyTracker
+    """
+    return _tracker
@@ -0,0 +1,198 @@
+"""
+Logging pipeline for the server.
+
+Log calls only create a record and put it on a bounded queue; a background
+thread formats the records and writes them to stderr. A slow or blocked
+stderr pipe to the MCP host therefore no longer stalls the event loop.
+Hot-path log calls use %-style arguments, so their messages are only
+formatted if they are written, by the writer thread.
+
+Settings:
+- LOG_LEVEL (default: INFO)
+- LOG_FORMAT: ``text`` or ``json`` (one object per line with the request
+  id and tool of the call that logged it) (default: text)
+- LOG_QUEUE_SIZE: records buffered for the writer; when the queue is full,
+  records below WARNING are dropped at once and WARNING and above wait up
+  to 100 ms before being dropped. 0 writes synchronously (default: 10000)
+- LOG_SAMPLE_RATES: share of DEBUG/INFO records kept per logger and its
+  children, e.g. ``handlers.tools=0.1,utils.gemini_client=0.5``
+  (default: keep all)
+
+Dropped and sampled-out records are counted in ``server_metrics``
+("logging.dropped", "logging.sampled_out").
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from utils.context import current_request
+from utils.metrics import get_metrics
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_FORMATS = ("text", "json")
+
+# How long WARNING and above wait for room in a full queue
+_BLOCK_TIMEOUT_S = 0.1
+
+_listener: Optional["LogWriter"] = None
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """
+    Parse "logger=rate,..." into a rate per logger name.
+
+    Raises:
+        ValueError: If a rate is not a number between 0 and 1
+    """
+    rates = {}
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, _, rate = part.partition("=")
+        rate_value = float(rate)
+        if not 0 <= rate_value <= 1:
+            raise ValueError(f"Log sample rate for '{name.strip()}' must be between 0 and 1")
+        rates[name.strip()] = rate_value
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the request id and tool if set."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+            entry["tool"] = record.tool
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampledQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that samples low-severity records and never blocks on them.
+
+    Unlike QueueHandler it does not format records before queueing them;
+    the queue stays in-process, so formatting is left to the writer thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue, sample_rates: Optional[Dict[str, float]] = None):
+        super().__init__(log_queue)
+        self.sample_rates = sample_rates or {}
+        # Rate per logger name, resolved once against the configured prefixes
+        self._rates: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            matches = [
+                prefix
+                for prefix in self.sample_rates
+                if name == prefix or name.startswith(prefix + ".")
+            ]
+            rate = self.sample_rates[max(matches, key=len)] if matches else 1.0
+            self._rates[name] = rate
+        return rate
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Attach the request id and tool of the calling task."""
+        context = current_request()
+        record.request_id = context.request_id if context else None
+        record.tool = context.tool if context else None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.put(record, timeout=_BLOCK_TIMEOUT_S)
+                return
+            except queue.Full:
+                pass
+        get_metrics().increment("logging.dropped")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if (
+            record.levelno < logging.WARNING
+            and self.sample_rates
+            and random.random() >= self._rate(record.name)
+        ):
+            get_metrics().increment("logging.sampled_out")
+            return
+        try:
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+class LogWriter(logging.handlers.QueueListener):
+    """Writer thread draining the queue into the real handlers."""
+
+    def enqueue_sentinel(self) -> None:
+        # QueueListener uses put_nowait, which fails while the queue is full
+        self.queue.put(self._sentinel)
+
+
+def _stop_listener() -> None:
+    """Write out the queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging() -> None:
+    """Install the logging pipeline on the root logger (stderr only)."""
+    global _listener
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    log_format = os.getenv("LOG_FORMAT", "text").lower()
+    queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # NEVER use stdout in MCP servers (it carries the protocol)
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _stop_listener()
+
+    problems = []
+    if log_format not in LOG_FORMATS:
+        problems.append(f"Unknown LOG_FORMAT '{log_format}', using text")
+    try:
+        sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))
+    except ValueError as e:
+        problems.append(f"Invalid LOG_SAMPLE_RATES ({str(e)}), keeping all records")
+        sample_rates = {}
+
+    if queue_size > 0:
+        handler: logging.Handler = SampledQueueHandler(queue.Queue(maxsize=queue_size), sample_rates)
+        _listener = LogWriter(handler.queue, writer)
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(_stop_listener)
+    else:
+        handler = writer
+
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+    for problem in problems:
+        logging.getLogger(__name__).warning(problem)
@@ -0,0 +1,161 @@
+"""
+In-process metrics for the Gemini Yacht MCP server.
+
+Provides thread-safe counters and latency summaries that handlers and the
+Gemini client record into, exposed through the ``server_metrics`` tool,
+plus process resource usage (resident memory, CPU time, threads).
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_STARTED_AT = time.monotonic()
+
+# Number of recent observations kept per summary for percentiles
+_WINDOW_SIZE = 1024
+
+
+class Metrics:
+    """
+    Registry of named counters and value summaries.
+
+    Counters are monotonically increasing floats. Summaries keep a count,
+    sum and maximum plus a bounded window of recent values for percentile
+    estimates.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Increment a counter.
+
+        Args:
+            name: Counter name (dotted, e.g. "phash.near_duplicate_hits")
+            value: Amount to add
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Record one observation in a summary.
+
+        Args:
+            name: Summary name (e.g. "gemini.latency_s")
+            value: Observed value
+        """
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "max": value,
+                    "window": deque(maxlen=_WINDOW_SIZE),
+                }
+                self._summaries[name] = summary
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+            summary["window"].append(value)
+
+    def counter(self, name: str) -> float:
+        """Return the current value of a counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return a JSON-serializable view of all metrics.
+
+        Returns:
+            Dictionary with "counters" and "summaries" (count, mean, max,
+            p50, p95, p99 over the recent window)
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {}
+            for name, summary in self._summaries.items():
+                window = sorted(summary["window"])
+                summaries[name] = {
+                    "count": summary["count"],
+                    "mean": summary["sum"] / summary["count"],
+                    "max": summary["max"],
+                    "p50": _percentile(window, 0.50),
+                    "p95": _percentile(window, 0.95),
+                    "p99": _percentile(window, 0.99),
+                }
+        return {"counters": counters, "summaries": summaries}
+
+    def reset(self) -> None:
+        """Clear all metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+def _percentile(sorted_values: list[float], quantile: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(quantile * len(sorted_values)))
+    return sorted_values[index]
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, where the platform exposes it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def process_stats() -> Dict[str, Any]:
+    """
+    Return resource usage of the server process.
+
+    Returns:
+        Dictionary with "rss_bytes" (current resident memory, None where
+        unavailable), "max_rss_bytes" (peak resident memory), "cpu_s",
+        "threads" and "uptime_s"
+    """
+    max_rss = None
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        max_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return {
+        "rss_bytes": _current_rss_bytes(),
+        "max_rss_bytes": max_rss,
+        "cpu_s": round(time.process_time(), 3),
+        "threads": threading.active_count(),
+        "uptime_s": round(time.monotonic() - _STARTED_AT, 3),
+    }
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """
+    Get the process-wide metrics registry.
+
+    Returns:
+        Shared Metrics instance
+    """
+    return _metrics
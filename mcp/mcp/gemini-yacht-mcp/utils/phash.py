@@ -0,0 +1,370 @@
+"""
+Perceptual-hash index over previously analyzed images.
+
+Brokers often upload the same interior shot recompressed, resized or
+slightly cropped. Exact content hashes miss those, so every analyzed image
+is also indexed by two 64-bit perceptual hashes (DCT pHash and gradient
+dHash). Lookups compute the Hamming distance to every stored hash with
+NumPy and return the closest prior analysis within a configurable
+threshold.
+"""
+
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, Dict, Any
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Analysis reuse modes
+PHASH_MODE_OFF = "off"
+PHASH_MODE_RETURN = "return"
+PHASH_MODE_SEED = "seed"
+PHASH_MODES = (PHASH_MODE_OFF, PHASH_MODE_RETURN, PHASH_MODE_SEED)
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis matrix of size n x n."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] = np.sqrt(1.0 / n)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    """Pack a flat boolean array (MSB first) into an integer."""
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(image: Image.Image) -> int:
+    """
+    Compute a 64-bit DCT perceptual hash.
+
+    The image is reduced to 32x32 grayscale, transformed with a 2D DCT, and
+    the 8x8 low-frequency block is thresholded at its median (DC excluded).
+
+    Args:
+        image: PIL image
+
+    Returns:
+        64-bit hash as int
+    """
+    small = image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+    dct = _DCT @ pixels @ _DCT.T
+    low = dct[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    median = np.median(low[1:])
+    return _bits_to_int(low > median)
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Compute a 64-bit horizontal gradient hash.
+
+    Args:
+        image: PIL image
+
+    Returns:
+        64-bit hash as int
+    """
+    small = image.convert("L").resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    return _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """
+    Hamming distance between every hash in an array and one value.
+
+    Args:
+        hashes: uint64 array of stored hashes
+        value: Hash to compare against
+
+    Returns:
+        Array of distances (0-64)
+    """
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+@dataclass
+class PerceptualMatch:
+    """A prior analysis matched by perceptual hash."""
+
+    analysis: Dict[str, Any]
+    distance: int
+
+
+class PerceptualIndex:
+    """
+    In-memory perceptual-hash index with optional JSON-lines persistence.
+
+    Entries are partitioned by a variant key (the analysis prompt options),
+    so an analysis is only reused for requests that asked for the same
+    thing. When full, the oldest entries are evicted first.
+
+    Hashes and variant ids live in preallocated NumPy arrays that grow by
+    doubling. Each added entry is appended to the file as one line; the
+    file is rewritten with the live entries once it holds more than twice
+    the capacity.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+    ):
+        """
+        Initialize the index.
+
+        Args:
+            path: JSON-lines file to load from and append to
+                (default: PHASH_INDEX_PATH)
+            max_entries: Capacity (default: PHASH_INDEX_MAX_ENTRIES or 10000)
+        """
+        self.path = path if path is not None else os.getenv("PHASH_INDEX_PATH")
+        self.max_entries = max_entries or int(os.getenv("PHASH_INDEX_MAX_ENTRIES", "10000"))
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._phashes = np.zeros(64, dtype=np.uint64)
+        self._dhashes = np.zeros(64, dtype=np.uint64)
+        self._variant_ids = np.zeros(64, dtype=np.int32)
+        self._variant_keys: Dict[str, int] = {}
+        self._variants: list[str] = []
+        self._analyses: list[Dict[str, Any]] = []
+        self._file_lines = 0
+
+        if self.path and os.path.exists(self.path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._analyses)
+
+    def add(self, image: Image.Image, analysis: Dict[str, Any], variant: str = "") -> None:
+        """
+        Index an analyzed image.
+
+        Args:
+            image: Decoded PIL image that was analyzed
+            analysis: AnalyzeYachtOutput as a dictionary
+            variant: Key of the analysis options used
+        """
+        self.add_hashes(phash(image), dhash(image), analysis, variant)
+
+    def add_hashes(
+        self,
+        p_hash: int,
+        d_hash: int,
+        analysis: Dict[str, Any],
+        variant: str = "",
+    ) -> None:
+        """Index precomputed hashes (see add; appends to the file, so call off the loop)."""
+        line = self._record(p_hash, d_hash, analysis, variant) if self.path else None
+        # Same lock order as compaction: file, then index. Entries reach
+        # the file in the order they were inserted
+        with self._file_lock:
+            with self._lock:
+                self._insert(p_hash, d_hash, analysis, variant)
+            if line is not None:
+                self._append(line)
+
+    def _insert(self, p_hash: int, d_hash: int, analysis: Dict[str, Any], variant: str) -> None:
+        """Add one entry (lock held)."""
+        if len(self._analyses) >= self.max_entries:
+            self._evict(max(1, self.max_entries // 10))
+        row = len(self._analyses)
+        if row == len(self._phashes):
+            self._phashes = self._grown(self._phashes)
+            self._dhashes = self._grown(self._dhashes)
+            self._variant_ids = self._grown(self._variant_ids)
+        variant_id = self._variant_keys.get(variant)
+        if variant_id is None:
+            variant_id = self._variant_keys[variant] = len(self._variants)
+            self._variants.append(variant)
+        self._phashes[row] = np.uint64(p_hash)
+        self._dhashes[row] = np.uint64(d_hash)
+        self._variant_ids[row] = variant_id
+        self._analyses.append(analysis)
+
+    @staticmethod
+    def _grown(array: np.ndarray) -> np.ndarray:
+        grown = np.zeros(2 * len(array), dtype=array.dtype)
+        grown[: len(array)] = array
+        return grown
+
+    def _evict(self, count: int) -> None:
+        """Drop the oldest entries (lock held)."""
+        count = min(count, len(self._analyses))
+        kept = len(self._analyses) - count
+        for array in (self._phashes, self._dhashes, self._variant_ids):
+            array[:kept] = array[count : count + kept]
+        del self._analyses[:count]
+
+    def find(
+        self,
+        image: Image.Image,
+        max_distance: int,
+        variant: str = "",
+    ) -> Optional[PerceptualMatch]:
+        """
+        Find the closest prior analysis of a near-duplicate image.
+
+        Both hashes must be within ``max_distance`` bits; the match with the
+        smallest combined distance wins.
+
+        Args:
+            image: Decoded PIL image to look up
+            max_distance: Maximum Hamming distance (0-64)
+            variant: Key of the requested analysis options
+
+        Returns:
+            PerceptualMatch, or None if nothing is close enough
+        """
+        return self.find_hashes(phash(image), dhash(image), max_distance, variant)
+
+    def find_hashes(
+        self,
+        p_hash: int,
+        d_hash: int,
+        max_distance: int,
+        variant: str = "",
+    ) -> Optional[PerceptualMatch]:
+        """Look up precomputed hashes (see find)."""
+        with self._lock:
+            count = len(self._analyses)
+            variant_id = self._variant_keys.get(variant)
+            if count == 0 or variant_id is None:
+                return None
+            p_dist = hamming_distances(self._phashes[:count], p_hash)
+            d_dist = hamming_distances(self._dhashes[:count], d_hash)
+
+            candidates = (
+                (p_dist <= max_distance)
+                & (d_dist <= max_distance)
+                & (self._variant_ids[:count] == variant_id)
+            )
+            if not candidates.any():
+                return None
+
+            combined = np.where(candidates, p_dist + d_dist, np.iinfo(np.int64).max)
+            best = int(np.argmin(combined))
+            return PerceptualMatch(
+                analysis=self._analyses[best],
+                distance=int(max(p_dist[best], d_dist[best])),
+            )
+
+    @staticmethod
+    def _record(p_hash: int, d_hash: int, analysis: Dict[str, Any], variant: str) -> str:
+        """One line of the index file."""
+        return json.dumps(
+            {
+                "phash": f"{int(p_hash):016x}",
+                "dhash": f"{int(d_hash):016x}",
+                "variant": variant,
+                "analysis": analysis,
+            }
+        )
+
+    def _append(self, line: str) -> None:
+        """Append one entry to the file, compacting it when it grew too long (file lock held)."""
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self._file_lines += 1
+            if self._file_lines > 2 * self.max_entries:
+                self._compact()
+        except OSError as e:
+            logger.warning("Failed to save perceptual-hash index: %s", e)
+
+    def _compact(self) -> None:
+        """Rewrite the file with the live entries (file lock held)."""
+        with self._lock:
+            count = len(self._analyses)
+            lines = [
+                self._record(p, d, analysis, self._variants[v])
+                for p, d, v, analysis in zip(
+                    self._phashes[:count],
+                    self._dhashes[:count],
+                    self._variant_ids[:count],
+                    self._analyses,
+                )
+            ]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in lines)
+        os.replace(tmp_path, self.path)
+        self._file_lines = len(lines)
+        logger.info("Compacted perceptual-hash index to %s entries", len(lines))
+
+    def _load(self) -> None:
+        """Replay the JSON-lines file."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f, self._lock:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._insert(
+                            int(entry["phash"], 16),
+                            int(entry["dhash"], 16),
+                            entry["analysis"],
+                            entry.get("variant", ""),
+                        )
+                    except (ValueError, KeyError, TypeError):
+                        continue
+            logger.info("Loaded %s perceptual-hash entries from %s", len(self), self.path)
+        except OSError as e:
+            logger.warning("Ignoring unreadable perceptual-hash index %s: %s", self.path, e)
+
+
+def get_phash_mode() -> str:
+    """
+    Analysis reuse mode from PHASH_MODE.
+
+    Returns:
+        "off" (default), "return" (reuse the prior analysis as-is) or
+        "seed" (send the prior analysis to Gemini for verification)
+    """
+    mode = os.getenv("PHASH_MODE", PHASH_MODE_OFF).lower()
+    if mode not in PHASH_MODES:
+        logger.warning("Unknown PHASH_MODE '%s', perceptual reuse disabled", mode)
+        return PHASH_MODE_OFF
+    return mode
+
+
+def get_phash_max_distance() -> int:
+    """Similarity threshold in bits from PHASH_MAX_DISTANCE (default: 8)."""
+    return int(os.getenv("PHASH_MAX_DISTANCE", "8"))
+
+
+_index: Optional[PerceptualIndex] = None
+
+
+def get_perceptual_index() -> PerceptualIndex:
+    """
+    Get the shared perceptual-hash index.
+
+    Returns:
+        PerceptualIndex configured from the environment
+    """
+    global _index
+    if _index is None:
+        _index = PerceptualIndex()
+    return _index
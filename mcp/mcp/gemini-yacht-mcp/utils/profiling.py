@@ -0,0 +1,416 @@
+"""
+On-demand profiling of tool calls.
+
+Selected tools (PROFILE_TOOLS) are profiled either every Nth call
+(PROFILE_EVERY_N) or whenever a call turns out slower than a latency
+threshold (PROFILE_SLOW_MS; every call of the selected tools is profiled
+and only the slow ones are kept). Two profilers are available
+(PROFILE_MODE):
+
+- ``cprofile`` (default): deterministic cProfile, written as a ``.prof``
+  file (for pstats / snakeviz) plus a ``.txt`` summary by cumulative time
+- ``sample``: a background thread samples the event-loop thread's stack
+  every PROFILE_SAMPLE_INTERVAL_MS and writes collapsed stacks
+  (``.folded``, flamegraph format); much cheaper than cProfile
+
+With PROFILE_TRACEMALLOC, the top allocations made during the call are
+written as well (``.mem.txt``). Files are named after the tool and the
+request id and rotated in PROFILE_DIR, keeping the newest
+PROFILE_MAX_FILES. Profiling can also be switched at runtime through the
+``configure_profiling`` tool.
+
+The server runs every call on one event loop, and both profilers watch the
+loop thread: a profile also contains the coroutines of whatever other
+requests ran while the profiled call was waiting (the summary header says
+how many other calls overlapped it). Profile an otherwise idle server,
+or read the profile through the profiled tool's own frames. Only one call
+is profiled at a time.
+
+The loop only stops the profiler and takes the tracemalloc snapshots; the
+statistics, allocation comparison, file writes and rotation run on a
+background writer thread. When no tool is selected the per-call cost is a
+single attribute check.
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODE_CPROFILE = "cprofile"
+PROFILE_MODE_SAMPLE = "sample"
+PROFILE_MODES = (PROFILE_MODE_CPROFILE, PROFILE_MODE_SAMPLE)
+
+# Rows of the cProfile text summary and of the tracemalloc report
+_TOP_N = 40
+# Frames kept per tracemalloc traceback
+_TRACEMALLOC_FRAMES = 5
+
+# Names of the files _write() produces: {timestamp}_{tool}_{request_id}.{suffix}
+_PROFILE_FILE = re.compile(r"^\d{8}-\d{6}_\w+_\w+\.(?:prof|txt|folded|mem\.txt)$")
+
+
+def _parse_tools(value: Optional[str]) -> frozenset[str]:
+    """Comma-separated tool names ("*" for all)."""
+    return frozenset(name.strip() for name in (value or "").split(",") if name.strip())
+
+
+class _StackSampler:
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                location = f"{os.path.basename(code.co_filename)}:{frame.f_lineno}"
+                stack.append(f"{code.co_name} ({location})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Collapsed stacks, one "frame;frame;... count" line per stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class Profiler:
+    """Decides which tool calls to profile and writes the results."""
+
+    def __init__(
+        self,
+        tools: Optional[str] = None,
+        every_n: Optional[int] = None,
+        slow_ms: Optional[float] = None,
+        mode: Optional[str] = None,
+        directory: Optional[str] = None,
+        max_files: Optional[int] = None,
+        trace_memory: Optional[bool] = None,
+        sample_interval_ms: Optional[float] = None,
+    ):
+        """
+        Initialize the profiler.
+
+        Args:
+            tools: Comma-separated tool names, "*" for all (default:
+                PROFILE_TOOLS or none, i.e. disabled)
+            every_n: Profile every Nth call of each tool, 0 for never
+                (default: PROFILE_EVERY_N or 0)
+            slow_ms: Keep profiles of calls slower than this, 0 for never
+                (default: PROFILE_SLOW_MS or 0)
+            mode: "cprofile" or "sample" (default: PROFILE_MODE or cprofile)
+            directory: Output directory (default: PROFILE_DIR or ./profiles)
+            max_files: Files kept in the directory (default: PROFILE_MAX_FILES or 50)
+            trace_memory: Record top allocations per profiled call
+                (default: PROFILE_TRACEMALLOC or false)
+            sample_interval_ms: Sampling interval of the sample mode
+                (default: PROFILE_SAMPLE_INTERVAL_MS or 5)
+        """
+        self.tools = _parse_tools(tools if tools is not None else os.getenv("PROFILE_TOOLS"))
+        self.every_n = every_n if every_n is not None else int(os.getenv("PROFILE_EVERY_N", "0"))
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("PROFILE_SLOW_MS", "0"))
+        self.mode = PROFILE_MODE_CPROFILE
+        self.set_mode(mode or os.getenv("PROFILE_MODE", PROFILE_MODE_CPROFILE))
+        self.directory = Path(directory or os.getenv("PROFILE_DIR", "./profiles"))
+        self.max_files = max_files or int(os.getenv("PROFILE_MAX_FILES", "50"))
+        self.sample_interval_s = (
+            sample_interval_ms or float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+        ) / 1000
+        self.trace_memory = False
+        self.set_trace_memory(
+            trace_memory
+            if trace_memory is not None
+            else os.getenv("PROFILE_TRACEMALLOC", "false").lower() == "true"
+        )
+
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._busy = False
+        # Other calls in progress, and those overlapping the profiled call
+        self._in_progress = 0
+        self._overlapping = 0
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Future] = None
+        self._update_enabled()
+
+    def _update_enabled(self) -> None:
+        # Checked on every tool call; kept as a plain attribute
+        self.enabled = bool(self.tools) and (self.every_n > 0 or self.slow_ms > 0)
+
+    def set_mode(self, mode: str) -> None:
+        """
+        Select the profiler.
+
+        Raises:
+            ValueError: If the mode is not recognized
+        """
+        mode = mode.lower()
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f"Invalid profile mode '{mode}'. Expected one of: {', '.join(PROFILE_MODES)}"
+            )
+        self.mode = mode
+
+    def set_trace_memory(self, enabled: bool) -> None:
+        """Start or stop tracemalloc (it slows every allocation while on)."""
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(_TRACEMALLOC_FRAMES)
+        elif not enabled and self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = enabled
+
+    def configure(
+        self,
+        tools: Optional[str] = None,
+        every_n: Optional[int] = None,
+        slow_ms: Optional[float] = None,
+        mode: Optional[str] = None,
+        trace_memory: Optional[bool] = None,
+    ) -> None:
+        """
+        Change settings at runtime; arguments left as None are unchanged.
+
+        Raises:
+            ValueError: If the mode is not recognized or a value is negative
+        """
+        if (every_n is not None and every_n < 0) or (slow_ms is not None and slow_ms < 0):
+            raise ValueError("every_n and slow_ms must not be negative")
+        if mode is not None:
+            self.set_mode(mode)
+        if tools is not None:
+            self.tools = _parse_tools(tools)
+        if every_n is not None:
+            self.every_n = every_n
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if trace_memory is not None:
+            self.set_trace_memory(trace_memory)
+        self._update_enabled()
+        logger.info("Profiling configured: %s", self.status()["config"])
+
+    def _should_profile(self, tool: str) -> tuple[bool, bool]:
+        """(profile this call, keep it regardless of latency)."""
+        if "*" not in self.tools and tool not in self.tools:
+            return False, False
+        with self._lock:
+            self._calls[tool] += 1
+            sampled = self.every_n > 0 and self._calls[tool] % self.every_n == 0
+            if not (sampled or self.slow_ms > 0):
+                return False, False
+            if self._busy:
+                get_metrics().increment("profiling.skipped_busy")
+                return False, False
+            self._busy = True
+        return True, sampled
+
+    @contextmanager
+    def session(self, tool: str, request_id: str) -> Iterator[None]:
+        """
+        Profile a block (one tool call) if it is selected.
+
+        Args:
+            tool: Tool name
+            request_id: Request id used in the output file names
+        """
+        if not self.enabled:
+            yield
+            return
+        profile_call, keep = self._should_profile(tool)
+        if not profile_call:
+            with self._lock:
+                self._in_progress += 1
+                if self._busy:
+                    self._overlapping += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._in_progress -= 1
+            return
+
+        memory_before = tracemalloc.take_snapshot() if self.trace_memory else None
+        profiler: Any
+        if self.mode == PROFILE_MODE_SAMPLE:
+            profiler = _StackSampler(threading.get_ident(), self.sample_interval_s)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Another profiler (e.g. a debugger) owns the profiling hook
+                logger.warning("Cannot profile %s (%s): %s", tool, request_id, e)
+                with self._lock:
+                    self._busy = False
+                yield
+                return
+        with self._lock:
+            self._overlapping = self._in_progress
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if isinstance(profiler, _StackSampler):
+                profiler.stop()
+            else:
+                profiler.disable()
+            with self._lock:
+                overlapping = self._overlapping
+            submitted = False
+            try:
+                if keep or (self.slow_ms > 0 and elapsed_ms >= self.slow_ms):
+                    memory_after = tracemalloc.take_snapshot() if memory_before else None
+                    self._pending = self._get_writer().submit(
+                        self._save,
+                        tool,
+                        request_id,
+                        elapsed_ms,
+                        overlapping,
+                        profiler,
+                        memory_before,
+                        memory_after,
+                    )
+                    submitted = True
+            except Exception as e:
+                logger.error("Failed to write profile for %s (%s): %s", tool, request_id, e)
+            finally:
+                if not submitted:
+                    with self._lock:
+                        self._busy = False
+
+    def _get_writer(self) -> ThreadPoolExecutor:
+        """Thread that writes profiles off the event loop."""
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-writer")
+        return self._writer
+
+    def _save(self, tool: str, request_id: str, *args: Any) -> None:
+        """Write a profile on the writer thread, then allow the next profiled call."""
+        try:
+            self._write(tool, request_id, *args)
+        except Exception as e:
+            logger.error("Failed to write profile for %s (%s): %s", tool, request_id, e)
+        finally:
+            with self._lock:
+                self._busy = False
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait until the last profile has been written (tests, shutdown)."""
+        if self._pending is not None:
+            wait([self._pending], timeout)
+
+    def _write(
+        self,
+        tool: str,
+        request_id: str,
+        elapsed_ms: float,
+        overlapping: int,
+        profiler: Any,
+        memory_before: Optional[tracemalloc.Snapshot],
+        memory_after: Optional[tracemalloc.Snapshot],
+    ) -> None:
+        """Write one call's profile files and rotate the directory."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}_{tool}_{request_id}"
+        header = f"# {tool} request {request_id}: {elapsed_ms:.1f} ms ({self.mode})\n"
+        if overlapping:
+            header += (
+                f"# {overlapping} other call(s) overlapped this one; their coroutines "
+                f"on the event loop are included\n"
+            )
+
+        if isinstance(profiler, _StackSampler):
+            (self.directory / f"{stem}.folded").write_text(profiler.folded())
+        else:
+            profiler.dump_stats(str(self.directory / f"{stem}.prof"))
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(_TOP_N)
+            (self.directory / f"{stem}.txt").write_text(header + summary.getvalue())
+
+        if memory_before is not None and memory_after is not None:
+            top = memory_after.compare_to(memory_before, "lineno")[:_TOP_N]
+            (self.directory / f"{stem}.mem.txt").write_text(
+                header + "".join(f"{stat}\n" for stat in top)
+            )
+
+        get_metrics().increment("profiling.captured")
+        logger.info("Wrote profile %s (%.1f ms)", stem, elapsed_ms)
+        self._rotate()
+
+    def _files(self) -> list[Path]:
+        """Profile files written by this profiler, oldest first (other files are ignored)."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (p for p in self.directory.iterdir() if _PROFILE_FILE.match(p.name) and p.is_file()),
+            key=lambda p: p.stat().st_mtime,
+        )
+
+    def _rotate(self) -> None:
+        """Delete the oldest profile files beyond max_files."""
+        files = self._files()
+        for path in files[: max(0, len(files) - self.max_files)]:
+            path.unlink(missing_ok=True)
+
+    def status(self) -> Dict[str, Any]:
+        """Current settings and the most recent profile files."""
+        return {
+            "enabled": self.enabled,
+            "config": {
+                "tools": sorted(self.tools),
+                "every_n": self.every_n,
+                "slow_ms": self.slow_ms,
+                "mode": self.mode,
+                "trace_memory": self.trace_memory,
+                "directory": str(self.directory.resolve()),
+                "max_files": self.max_files,
+            },
+            "recent_files": [p.name for p in self._files()[-10:]],
+        }
+
+
+_profiler: Optional[Profiler] = None
+
+
+def get_profiler() -> Profiler:
+    """
+    Get the shared profiler.
+
+    Returns:
+        Profiler configured from the environment
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
@@ -6,6 +6,10 @@ Contains all prompts used for yacht interior analysis and generation.
 
 from models.schemas import YachtStyle
 
+# Bump when a style prompt changes, so stored style outputs generated with
+# the old wording are no longer served
+PROMPT_VERSION = 1
+
 # Analysis prompt for structural understanding
 ANALYSIS_PROMPT = """You are an expert yacht interior architect and designer. Analyze this yacht interior image in extreme detail.
 
@@ -40,17 +44,38 @@ Provide a comprehensive analysis covering:
 Return your analysis in a structured format with clear sections. Be precise and technical - this will be used to guide image generation while preserving architectural integrity."""
 
 
-# Style-specific generation prompts
-STYLE_GENERATION_PROMPTS = {
-    YachtStyle.FUTURISTIC: """Transform this yacht interior into a FUTURISTIC design while preserving its exact architectural structure.
+# Appended to ANALYSIS_PROMPT when a near-duplicate photo was analyzed before
+ANALYSIS_SEED_PROMPT = """
+
+A previous analysis of a near-identical photo of this interior is provided below. The new photo may be recompressed, resized or slightly cropped. Use the previous analysis as a starting point: verify every statement against this image, correct anything that differs, and return a complete analysis in the same structured format.
+
+**PREVIOUS ANALYSIS**:
+{prior_analysis}"""
+
+
+# Prepended to ANALYSIS_PROMPT for each tile of a tiled analysis
+TILE_ANALYSIS_PROMPT = """This image is tile {index} of {count} (row {row}, column {column}) cut from a larger panoramic yacht interior photo. Neighbouring tiles overlap slightly. Describe only what is visible in this tile, and name elements cut off at its edges as partial.
+
+"""
+
+
+# Prepended to ANALYSIS_PROMPT when several photos of one room are analyzed together
+ROOM_ANALYSIS_PROMPT = """The {count} photos below all show the SAME yacht interior space from different viewpoints. Treat them as views of a single room: wherever the instructions refer to "this image", consider all photos together. Describe the room once, not once per photo. Use the overlapping views to establish the true layout, proportions and positions of elements, and resolve apparent contradictions between photos (perspective, cropping, lighting at different times) into one consistent description. Mention a specific photo only when an element is visible in that photo alone.
 
-**CRITICAL CONSTRAINTS**:
+"""
+
+
+# Constraints shared by every style prompt (formatted with the structure description)
+CRITICAL_CONSTRAINTS = """**CRITICAL CONSTRAINTS**:
 - Maintain ALL architectural elements: {structure_description}
 - Preserve room dimensions, wall angles, ceiling height, and floor layout
 - Keep window/door positions and sizes identical
-- Respect all structural constraints
+- Respect all structural constraints"""
+
 
-**FUTURISTIC STYLE GUIDELINES**:
+# Per-style design guidelines
+STYLE_GUIDELINES = {
+    YachtStyle.FUTURISTIC: """**FUTURISTIC STYLE GUIDELINES**:
 - **Materials**: Glossy white surfaces, brushed metal (chrome, titanium), transparent acrylic, carbon fiber accents
 - **Furniture**: Sleek, minimalist forms with LED integration, floating furniture, modular pieces
 - **Lighting**: Integrated LED strips (blue/white tones), backlit panels, fiber optic ceiling stars, smart ambient lighting
@@ -61,15 +86,7 @@ STYLE_GENERATION_PROMPTS = {
 
 Create a photorealistic rendering that feels like a luxury spaceship interior.""",
 
-    YachtStyle.ARTDECO: """Transform this yacht interior into an ART DECO design while preserving its exact architectural structure.
-
-**CRITICAL CONSTRAINTS**:
-- Maintain ALL architectural elements: {structure_description}
-- Preserve room dimensions, wall angles, ceiling height, and floor layout
-- Keep window/door positions and sizes identical
-- Respect all structural constraints
-
-**ART DECO STYLE GUIDELINES**:
+    YachtStyle.ARTDECO: """**ART DECO STYLE GUIDELINES**:
 - **Materials**: Exotic woods (ebony, zebrawood), polished marble, brass, lacquer, mirrored surfaces
 - **Furniture**: Geometric shapes, curved corners, luxurious upholstery in velvet/leather, stepped forms
 - **Patterns**: Chevrons, zigzags, sunburst motifs, geometric repeating patterns, Egyptian-inspired details
@@ -80,15 +97,7 @@ Create a photorealistic rendering that feels like a luxury spaceship interior.""
 
 Create a photorealistic rendering evoking 1920s-1930s luxury ocean liner elegance.""",
 
-    YachtStyle.BIOPHILIC: """Transform this yacht interior into a BIOPHILIC design while preserving its exact architectural structure.
-
-**CRITICAL CONSTRAINTS**:
-- Maintain ALL architectural elements: {structure_description}
-- Preserve room dimensions, wall angles, ceiling height, and floor layout
-- Keep window/door positions and sizes identical
-- Respect all structural constraints
-
-**BIOPHILIC STYLE GUIDELINES**:
+    YachtStyle.BIOPHILIC: """**BIOPHILIC STYLE GUIDELINES**:
 - **Natural Elements**: Living plant walls, potted trees, moss installations, water features (small fountains/aquariums)
 - **Materials**: Natural wood (teak, oak, bamboo), stone (granite, slate), cork, linen, cotton, rattan
 - **Furniture**: Organic shapes, woven textures, live-edge wood tables, natural fiber upholstery
@@ -99,15 +108,7 @@ Create a photorealistic rendering evoking 1920s-1930s luxury ocean liner eleganc
 
 Create a photorealistic rendering that brings the calming power of nature indoors.""",
 
-    YachtStyle.MEDITERRANEAN: """Transform this yacht interior into a MEDITERRANEAN design while preserving its exact architectural structure.
-
-**CRITICAL CONSTRAINTS**:
-- Maintain ALL architectural elements: {structure_description}
-- Preserve room dimensions, wall angles, ceiling height, and floor layout
-- Keep window/door positions and sizes identical
-- Respect all structural constraints
-
-**MEDITERRANEAN STYLE GUIDELINES**:
+    YachtStyle.MEDITERRANEAN: """**MEDITERRANEAN STYLE GUIDELINES**:
 - **Materials**: Terracotta tiles, natural stone, whitewashed wood, wrought iron, ceramic
 - **Furniture**: Rustic wooden pieces, wicker/rattan, cushioned seating with striped fabrics, distressed finishes
 - **Colors**: White/cream walls, azure blue accents, terracotta, sunny yellow, olive green, warm beige
@@ -118,15 +119,7 @@ Create a photorealistic rendering that brings the calming power of nature indoor
 
 Create a photorealistic rendering evoking the relaxed elegance of Greek islands and Italian coastal villas.""",
 
-    YachtStyle.CYBERPUNK: """Transform this yacht interior into a CYBERPUNK design while preserving its exact architectural structure.
-
-**CRITICAL CONSTRAINTS**:
-- Maintain ALL architectural elements: {structure_description}
-- Preserve room dimensions, wall angles, ceiling height, and floor layout
-- Keep window/door positions and sizes identical
-- Respect all structural constraints
-
-**CYBERPUNK STYLE GUIDELINES**:
+    YachtStyle.CYBERPUNK: """**CYBERPUNK STYLE GUIDELINES**:
 - **Materials**: Black metal grids, exposed cables/pipes, neon-lit acrylic, industrial plastics, carbon fiber
 - **Furniture**: Modular tech stations, gaming chairs, industrial stools, multi-monitor setups, futons with tech fabric
 - **Lighting**: Neon tubes (pink, cyan, purple), LED strips along edges, dramatic contrast lighting, holographic projections
@@ -139,6 +132,59 @@ Create a photorealistic rendering merging high-tech with gritty urban aesthetics
 }
 
 
+# How each style is named in prompts
+_STYLE_PROMPT_NAMES = {
+    YachtStyle.FUTURISTIC: "FUTURISTIC",
+    YachtStyle.ARTDECO: "ART DECO",
+    YachtStyle.BIOPHILIC: "BIOPHILIC",
+    YachtStyle.MEDITERRANEAN: "MEDITERRANEAN",
+    YachtStyle.CYBERPUNK: "CYBERPUNK",
+}
+
+
+def _with_article(name: str) -> str:
+    """Prefix a style name with "a" or "an"."""
+    return f"{'an' if name[0] in 'AEIOU' else 'a'} {name}"
+
+
+# Style-specific generation prompts
+STYLE_GENERATION_PROMPTS = {
+    style: (
+        f"Transform this yacht interior into {_with_article(_STYLE_PROMPT_NAMES[style])} design "
+        "while preserving its exact architectural structure."
+        f"\n\n{CRITICAL_CONSTRAINTS}\n\n{guidelines}"
+    )
+    for style, guidelines in STYLE_GUIDELINES.items()
+}
+
+
+# All requested styles in one call; the response is a JSON object keyed by style
+MULTI_STYLE_PROMPT = """Transform this yacht interior into each of the following designs while preserving its exact architectural structure: {style_names}.
+
+{constraints}
+
+{guidelines}
+
+For EACH style, describe in extreme detail what the transformed interior looks like, as completely as if it were the only style requested. Return a JSON object with exactly one key per style ({style_keys}); each value is that style's description."""
+
+
+# One style applied to several unrelated photos in one call (micro-batching)
+BATCH_STYLE_PROMPT = """Transform each of the {count} yacht interior photos below into {style_name} design while preserving each photo's exact architectural structure. The photos show different, unrelated interiors: treat every photo independently.
+
+**CRITICAL CONSTRAINTS** (for every photo):
+- Maintain ALL architectural elements listed for that photo below
+- Preserve room dimensions, wall angles, ceiling height, and floor layout
+- Keep window/door positions and sizes identical
+- Respect all structural constraints
+
+**ARCHITECTURAL ELEMENTS PER PHOTO**:
+{structures}
+
+{guidelines}
+
+Return a JSON object with exactly one key per photo ({item_keys}); each value is the detailed description of that photo's transformation."""
+
+
 # Style descriptions for the list_available_styles tool
 STYLE_DESCRIPTIONS = {
     YachtStyle.FUTURISTIC: {
@@ -220,3 +266,52 @@ def get_style_prompt(style: YachtStyle, structure_description: str) -> str:
         raise ValueError(f"No prompt template found for style: {style}")
 
     return template.format(structure_description=structure_description)
+
+
+def get_multi_style_prompt(styles: list[YachtStyle], structure_description: str) -> str:
+    """
+    Get the prompt generating several styles in one call.
+
+    The shared constraints (and the structure description) appear once,
+    followed by the guidelines of each requested style.
+
+    Args:
+        styles: Target yacht styles
+        structure_description: Structural analysis to preserve
+
+    Returns:
+        Formatted prompt string
+    """
+    return MULTI_STYLE_PROMPT.format(
+        style_names=", ".join(_STYLE_PROMPT_NAMES[s] for s in styles),
+        constraints=CRITICAL_CONSTRAINTS.format(structure_description=structure_description),
+        guidelines="\n\n".join(STYLE_GUIDELINES[s] for s in styles),
+        style_keys=", ".join(f'"{s.value}"' for s in styles),
+    )
+
+
+def get_batch_style_prompt(style: YachtStyle, structure_descriptions: list[str]) -> str:
+    """
+    Get the prompt applying one style to several photos in one call.
+
+    The response keys are "photo_1", "photo_2", ... in photo order.
+
+    Args:
+        style: The target yacht style
+        structure_descriptions: Structural analysis of each photo, in order
+
+    Returns:
+        Formatted prompt string
+    """
+    return BATCH_STYLE_PROMPT.format(
+        count=len(structure_descriptions),
+        style_name=_with_article(_STYLE_PROMPT_NAMES[style]),
+        structures="\n".join(
+            f"Photo {index}: {description}"
+            for index, description in enumerate(structure_descriptions, start=1)
+        ),
+        guidelines=STYLE_GUIDELINES[style],
+        item_keys=", ".join(
+            f'"photo_{index}"' for index in range(1, len(structure_descriptions) + 1)
+        ),
+    )
@@ -0,0 +1,370 @@
+"""
+Per-session and per-tenant quotas for upstream Gemini calls.
+
+Every tool call is attributed to a caller: its MCP session (the
+``mcp-session-id`` of the HTTP transports, the connection over stdio) and,
+when the client sends an ``Authorization`` header, a tenant identified by
+a hash of that token (the token itself is never stored). The priority
+scheduler queues each session as its own flow with weighted fair queueing
+(see utils.scheduler), so a client running ``generate_all`` in a loop
+cannot crowd out the others, and only starts a call while its session and
+tenant are under their concurrency limits.
+
+Token budgets are enforced before a call is queued: a caller whose
+prompt and output tokens over the last minute exceed its budget, or that
+already has too many calls waiting, is rejected with a retry-after hint.
+
+Settings (0 disables a limit):
+- QUOTA_SESSION_CONCURRENCY / QUOTA_TENANT_CONCURRENCY: upstream calls in
+  flight per session / tenant (default: 0)
+- QUOTA_SESSION_TOKENS_PER_MIN / QUOTA_TENANT_TOKENS_PER_MIN: tokens per
+  rolling minute (default: 0)
+- QUOTA_MAX_QUEUED: waiting calls per session (default: 32)
+- QUOTA_WEIGHTS: fair-share weight per tenant, client name or session,
+  e.g. ``claude-code=2,token-3f2a9c1b04de=0.5`` (default: 1)
+"""
+
+import os
+import time
+import hashlib
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+from utils.metrics import get_metrics
+
+if TYPE_CHECKING:
+    from mcp.server.fastmcp import Context
+
+logger = logging.getLogger(__name__)
+
+# Rolling window of the token budgets
+_WINDOW_S = 60.0
+# Usage of callers idle for longer than this is forgotten
+_IDLE_S = 600.0
+# Smoothing of the per-call duration used for retry-after estimates
+_DURATION_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class Caller:
+    """Who a tool call is attributed to."""
+
+    session: str
+    tenant: Optional[str] = None
+    client: Optional[str] = None
+
+
+LOCAL_CALLER = Caller(session="local")
+
+# Callers one upstream call is attributed to, with the fraction of its cost
+# each bears (a micro-batch serves several callers with one call)
+Shares = tuple[tuple[Caller, float], ...]
+
+
+def caller_identity(ctx: Optional["Context"] = None) -> Caller:
+    """
+    Identify the caller of an MCP request.
+
+    Args:
+        ctx: FastMCP context injected into the tool handling the request
+
+    Returns:
+        Caller for the request, or LOCAL_CALLER without one (tests,
+        background work started by the server itself)
+    """
+    if ctx is None:
+        return LOCAL_CALLER
+    try:
+        context = ctx.request_context
+    except ValueError:
+        return LOCAL_CALLER
+
+    # HTTP transports carry the starlette request; stdio has none
+    headers = getattr(context.request, "headers", None) or {}
+    session = headers.get("mcp-session-id") or f"conn-{id(context.session):x}"
+    authorization = headers.get("authorization")
+    tenant = (
+        f"token-{hashlib.sha256(authorization.encode()).hexdigest()[:12]}"
+        if authorization
+        else None
+    )
+    client_params = getattr(context.session, "client_params", None)
+    client = client_params.clientInfo.name if client_params else None
+    return Caller(session=session, tenant=tenant, client=client)
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    weights = {}
+    for item in raw.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            weights[key.strip()] = float(value)
+    return weights
+
+
+@dataclass
+class _Usage:
+    """Usage of one session or tenant."""
+
+    in_flight: int = 0
+    calls: int = 0
+    tokens: int = 0
+    rejected: int = 0
+    window: deque = field(default_factory=deque)
+    window_tokens: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+
+    def expire(self, now: float) -> None:
+        while self.window and self.window[0][0] <= now - _WINDOW_S:
+            self.window_tokens -= self.window.popleft()[1]
+
+    def retry_after(self, budget: int, now: float) -> float:
+        """Seconds until enough tokens leave the window to get under budget."""
+        excess = self.window_tokens - budget
+        for recorded_at, tokens in self.window:
+            excess -= tokens
+            if excess < 0:
+                return max(0.0, recorded_at + _WINDOW_S - now)
+        return 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "tokens": self.tokens,
+            "tokens_last_min": self.window_tokens,
+            "rejected": self.rejected,
+        }
+
+
+@dataclass
+class Rejection:
+    """Why a call was refused and when to retry."""
+
+    reason: str
+    retry_after: float
+
+
+class QuotaManager:
+    """Tracks usage per session and tenant and enforces their limits."""
+
+    def __init__(
+        self,
+        session_concurrency: Optional[int] = None,
+        tenant_concurrency: Optional[int] = None,
+        session_tokens_per_min: Optional[int] = None,
+        tenant_tokens_per_min: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Initialize the quotas.
+
+        Args:
+            session_concurrency: Calls in flight per session, 0 for unbounded
+                (default: QUOTA_SESSION_CONCURRENCY or 0)
+            tenant_concurrency: Calls in flight per tenant, 0 for unbounded
+                (default: QUOTA_TENANT_CONCURRENCY or 0)
+            session_tokens_per_min: Token budget per session, 0 for unbounded
+                (default: QUOTA_SESSION_TOKENS_PER_MIN or 0)
+            tenant_tokens_per_min: Token budget per tenant, 0 for unbounded
+                (default: QUOTA_TENANT_TOKENS_PER_MIN or 0)
+            max_queued: Waiting calls per session, 0 for unbounded
+                (default: QUOTA_MAX_QUEUED or 32)
+            weights: Fair-share weight per tenant, client name or session
+                (default: QUOTA_WEIGHTS, otherwise 1)
+        """
+
+        def setting(value: Optional[int], name: str, default: str) -> int:
+            return value if value is not None else int(os.getenv(name, default))
+
+        self.session_concurrency = setting(session_concurrency, "QUOTA_SESSION_CONCURRENCY", "0")
+        self.tenant_concurrency = setting(tenant_concurrency, "QUOTA_TENANT_CONCURRENCY", "0")
+        self.session_tokens_per_min = setting(
+            session_tokens_per_min, "QUOTA_SESSION_TOKENS_PER_MIN", "0"
+        )
+        self.tenant_tokens_per_min = setting(
+            tenant_tokens_per_min, "QUOTA_TENANT_TOKENS_PER_MIN", "0"
+        )
+        self.max_queued = setting(max_queued, "QUOTA_MAX_QUEUED", "32")
+        self.weights = (
+            weights if weights is not None else _parse_weights(os.getenv("QUOTA_WEIGHTS", ""))
+        )
+
+        self._sessions: Dict[str, _Usage] = {}
+        self._tenants: Dict[str, _Usage] = {}
+        self._call_duration_s = 1.0
+
+    def _usage(self, caller: Caller) -> tuple[_Usage, Optional[_Usage]]:
+        now = time.monotonic()
+        session = self._sessions.get(caller.session)
+        if session is None:
+            self._forget_idle(now)
+            session = self._sessions[caller.session] = _Usage()
+        session.last_seen = now
+        tenant = None
+        if caller.tenant is not None:
+            tenant = self._tenants.setdefault(caller.tenant, _Usage())
+            tenant.last_seen = now
+        return session, tenant
+
+    def _forget_idle(self, now: float) -> None:
+        for registry in (self._sessions, self._tenants):
+            for key in [
+                key
+                for key, usage in registry.items()
+                if usage.in_flight == 0 and now - usage.last_seen > _IDLE_S
+            ]:
+                del registry[key]
+
+    def weight(self, caller: Caller) -> float:
+        """Fair-share weight of a caller (tenant, then client, then session)."""
+        for key in (caller.tenant, caller.client, caller.session):
+            if key is not None and key in self.weights:
+                return max(self.weights[key], 1e-3)
+        return 1.0
+
+    def check(self, caller: Caller, queued: int = 0) -> Optional[Rejection]:
+        """
+        Decide whether a new call may be queued.
+
+        Args:
+            caller: Caller of the request
+            queued: Calls of this session already waiting for a slot
+
+        Returns:
+            None if admitted, else the Rejection (also counted in metrics)
+        """
+        now = time.monotonic()
+        session, tenant = self._usage(caller)
+        rejection = None
+
+        for usage, budget, scope in (
+            (session, self.session_tokens_per_min, "session"),
+            (tenant, self.tenant_tokens_per_min, "tenant"),
+        ):
+            if usage is None or budget <= 0:
+                continue
+            usage.expire(now)
+            if usage.window_tokens >= budget:
+                rejection = Rejection(
+                    f"{scope.capitalize()} token budget of {budget} tokens per minute exhausted",
+                    usage.retry_after(budget, now),
+                )
+                break
+
+        if rejection is None and self.max_queued > 0 and queued >= self.max_queued:
+            limit = self.session_concurrency or 1
+            rejection = Rejection(
+                f"Too many queued calls for this session ({queued})",
+                (queued / limit) * self._call_duration_s,
+            )
+
+        if rejection is not None:
+            session.rejected += 1
+            if tenant is not None:
+                tenant.rejected += 1
+            get_metrics().increment("quota.rejected")
+        return rejection
+
+    def can_start(self, caller: Caller) -> bool:
+        """Whether the caller's session and tenant are under their concurrency limits."""
+        session = self._sessions.get(caller.session)
+        if self.session_concurrency > 0 and session and session.in_flight >= self.session_concurrency:
+            return False
+        tenant = self._tenants.get(caller.tenant) if caller.tenant else None
+        if self.tenant_concurrency > 0 and tenant and tenant.in_flight >= self.tenant_concurrency:
+            return False
+        return True
+
+    def has_headroom(self, caller: Caller, tokens: int = 0) -> bool:
+        """
+        Whether optional work fits within the caller's limits.
+
+        Stricter than check(): the caller must be able to start another call
+        while keeping one concurrency slot free for its own requests, and
+        the estimated tokens must fit in what is left of its budgets.
+        Nothing is counted as rejected.
+
+        Args:
+            caller: Caller the work would be charged to
+            tokens: Estimated tokens of the work
+        """
+        now = time.monotonic()
+        session, tenant = self._usage(caller)
+        for usage, concurrency, budget in (
+            (session, self.session_concurrency, self.session_tokens_per_min),
+            (tenant, self.tenant_concurrency, self.tenant_tokens_per_min),
+        ):
+            if usage is None:
+                continue
+            if concurrency > 0 and usage.in_flight + 1 >= concurrency:
+                return False
+            if budget > 0:
+                usage.expire(now)
+                if usage.window_tokens + tokens > budget:
+                    return False
+        return True
+
+    def started(self, caller: Caller) -> None:
+        """Record an upstream call starting."""
+        for usage in self._usage(caller):
+            if usage is not None:
+                usage.in_flight += 1
+                usage.calls += 1
+
+    def finished(self, caller: Caller, duration_s: Optional[float] = None) -> None:
+        """Record an upstream call ending (successfully or not)."""
+        for usage in self._usage(caller):
+            if usage is not None:
+                usage.in_flight -= 1
+        if duration_s is not None:
+            self._call_duration_s += _DURATION_ALPHA * (duration_s - self._call_duration_s)
+
+    def charge(self, caller: Caller, tokens: int) -> None:
+        """Count a finished call's prompt and output tokens against the budgets."""
+        if tokens <= 0:
+            return
+        now = time.monotonic()
+        for usage in self._usage(caller):
+            if usage is not None:
+                usage.tokens += tokens
+                usage.window.append((now, tokens))
+                usage.window_tokens += tokens
+                usage.expire(now)
+
+    def stats(self) -> Dict[str, Any]:
+        """Limits and usage per session and tenant."""
+        now = time.monotonic()
+        for registry in (self._sessions, self._tenants):
+            for usage in registry.values():
+                usage.expire(now)
+        return {
+            "limits": {
+                "session_concurrency": self.session_concurrency,
+                "tenant_concurrency": self.tenant_concurrency,
+                "session_tokens_per_min": self.session_tokens_per_min,
+                "tenant_tokens_per_min": self.tenant_tokens_per_min,
+                "max_queued": self.max_queued,
+            },
+            "sessions": {key: usage.to_dict() for key, usage in self._sessions.items()},
+            "tenants": {key: usage.to_dict() for key, usage in self._tenants.items()},
+        }
+
+
+_quotas: Optional[QuotaManager] = None
+
+
+def get_quotas() -> QuotaManager:
+    """
+    Get the shared quota manager.
+
+    Returns:
+        QuotaManager configured from the environment
+    """
+    global _quotas
+    if _quotas is None:
+        _quotas = QuotaManager()
+    return _quotas
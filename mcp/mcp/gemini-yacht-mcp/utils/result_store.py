@@ -0,0 +1,309 @@
+"""
+Result store for analyses and style outputs, keyed by image content.
+
+Results are stored under a digest of the image bytes (SHA-256 of the
+decoded payload) and the parameters that determine them: the model, the
+analysis options, or the style, normalized structure description,
+temperature and prompt version. Identical requests are then served without
+an upstream call, whether the result was computed by an earlier live
+request or precomputed by ``ingest.py``. A result may hold several
+variants (e.g. style outputs sampled at temperature 0.7), served in turn.
+
+The handlers use the ``*_async`` methods, which run disk reads and writes
+in a worker thread. Updates of one key (``add_variant``) are serialized
+within the process, so concurrent writers do not drop each other's
+variants.
+
+Settings:
+- RESULT_STORE: ``off``, ``memory`` (in-process LRU) or ``disk`` (LRU in
+  front of RESULT_STORE_DIR, shared with other processes such as the
+  ingest CLI) (default: off)
+- RESULT_STORE_DIR: Directory of the disk store (default: ./results)
+- RESULT_STORE_MEMORY_ENTRIES: Results kept in memory (default: 1000)
+
+Hits, misses and writes are counted in ``server_metrics``
+("result_store.hits", "result_store.misses", "result_store.writes").
+"""
+
+import os
+import json
+import asyncio
+import unicodedata
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_OFF = "off"
+RESULT_STORE_MEMORY = "memory"
+RESULT_STORE_DISK = "disk"
+RESULT_STORE_MODES = (RESULT_STORE_OFF, RESULT_STORE_MEMORY, RESULT_STORE_DISK)
+
+# Result kinds
+KIND_ANALYSIS = "analysis"
+KIND_STYLE = "style"
+
+# Locks serializing updates of one key (keys are striped across them)
+_KEY_LOCKS = 64
+
+
+def image_digest(data: bytes) -> str:
+    """SHA-256 hex digest of decoded image bytes (the store's image key)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def text_digest(text: str) -> str:
+    """SHA-256 hex digest of a text parameter (e.g. a structure description)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Unicode (NFC) and whitespace normalization of a text parameter before hashing."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def result_key(kind: str, image: str, **params: Any) -> str:
+    """
+    Key of one result.
+
+    Args:
+        kind: "analysis" or "style"
+        image: Image digest
+        **params: Everything else that determines the result (JSON-serializable)
+
+    Returns:
+        SHA-256 hex digest of the kind, image and parameters
+    """
+    material = json.dumps({"kind": kind, "image": image, **params}, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    """
+    LRU of results in memory, optionally backed by one JSON file per key.
+
+    Disk entries are written atomically, so several processes (the server
+    and an ingest run) can share a directory.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        root: Optional[str] = None,
+        memory_entries: Optional[int] = None,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            mode: "off", "memory" or "disk" (default: RESULT_STORE or off)
+            root: Directory of the disk store (default: RESULT_STORE_DIR or
+                ./results)
+            memory_entries: Results kept in memory
+                (default: RESULT_STORE_MEMORY_ENTRIES or 1000)
+
+        Raises:
+            ValueError: If the mode is not recognized
+        """
+        self.mode = (mode or os.getenv("RESULT_STORE", RESULT_STORE_OFF)).lower()
+        if self.mode not in RESULT_STORE_MODES:
+            raise ValueError(
+                f"Invalid RESULT_STORE '{self.mode}'. "
+                f"Expected one of: {', '.join(RESULT_STORE_MODES)}"
+            )
+        self.root = os.path.abspath(
+            root or os.getenv("RESULT_STORE_DIR", os.path.join(os.getcwd(), "results"))
+        )
+        self.memory_entries = (
+            memory_entries
+            if memory_entries is not None
+            else int(os.getenv("RESULT_STORE_MEMORY_ENTRIES", "1000"))
+        )
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cursors: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(_KEY_LOCKS)]
+
+        if self.mode == RESULT_STORE_DISK:
+            os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether results are stored at all."""
+        return self.mode != RESULT_STORE_OFF
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def contains(self, key: str) -> bool:
+        """Whether a result is stored (not counted as a hit or miss)."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if key in self._memory:
+                return True
+        return self.mode == RESULT_STORE_DISK and os.path.exists(self._path_for(key))
+
+    def variant_count(self, key: str) -> int:
+        """Variants stored for a key (not counted as a hit or miss)."""
+        if not self.enabled:
+            return 0
+        return len((self._read(key) or {}).get("variants", []))
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+        if value is None and self.mode == RESULT_STORE_DISK:
+            try:
+                with open(self._path_for(key), "r", encoding="utf-8") as f:
+                    value = json.load(f)
+                self._remember(key, value)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable result %s: %s", key[:12], e)
+        return value
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a result.
+
+        Args:
+            key: Key from result_key()
+
+        Returns:
+            The stored result, or None
+        """
+        if not self.enabled:
+            return None
+        value = self._read(key)
+        get_metrics().increment("result_store.hits" if value is not None else "result_store.misses")
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store a result (failures to write to disk are logged, not raised).
+
+        Args:
+            key: Key from result_key()
+            value: JSON-serializable result
+        """
+        if not self.enabled:
+            return
+        self._remember(key, value)
+        if self.mode == RESULT_STORE_DISK:
+            path = self._path_for(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temp file first so readers never see partial data
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning("Failed to store result %s: %s", key[:12], e)
+                return
+        get_metrics().increment("result_store.writes")
+
+    def add_variant(self, key: str, value: Dict[str, Any], limit: int) -> None:
+        """
+        Append one variant to a result holding several (``{"variants": [...]}``).
+
+        Args:
+            key: Key from result_key()
+            value: JSON-serializable variant
+            limit: Variants kept; the oldest are dropped beyond it
+        """
+        if not self.enabled:
+            return
+        with self._key_locks[hash(key) % _KEY_LOCKS]:
+            variants = (self._read(key) or {}).get("variants", [])
+            self.put(key, {"variants": (variants + [value])[-max(1, limit):]})
+
+    def next_variant(self, key: str, count: int) -> int:
+        """
+        Index of the variant to serve next for a key (round-robin).
+
+        Args:
+            key: Key of a result holding several variants
+            count: Number of variants stored
+
+        Returns:
+            Index in [0, count)
+        """
+        with self._lock:
+            cursor = self._cursors.pop(key, -1) + 1
+            self._cursors[key] = cursor
+            while len(self._cursors) > max(1, self.memory_entries):
+                self._cursors.popitem(last=False)
+        return cursor % count
+
+    async def _off_loop(self, func, *args):
+        """Run a store operation in a worker thread when it may touch the disk."""
+        if self.mode == RESULT_STORE_DISK:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """get() without blocking the event loop on disk reads."""
+        return await self._off_loop(self.get, key)
+
+    async def put_async(self, key: str, value: Dict[str, Any]) -> None:
+        """put() without blocking the event loop on disk writes."""
+        await self._off_loop(self.put, key, value)
+
+    async def add_variant_async(self, key: str, value: Dict[str, Any], limit: int) -> None:
+        """add_variant() without blocking the event loop on disk I/O."""
+        await self._off_loop(self.add_variant, key, value, limit)
+
+    async def variant_count_async(self, key: str) -> int:
+        """variant_count() without blocking the event loop on disk reads."""
+        return await self._off_loop(self.variant_count, key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Mode, location and entries held in memory."""
+        return {
+            "mode": self.mode,
+            "root": self.root if self.mode == RESULT_STORE_DISK else None,
+            "memory_entries": len(self._memory),
+            "memory_capacity": self.memory_entries,
+        }
+
+
+_store: Optional[ResultStore] = None
+
+
+def get_result_store() -> ResultStore:
+    """
+    Get the shared result store.
+
+    Returns:
+        ResultStore configured from the environment
+    """
+    global _store
+    if _store is None:
+        _store = ResultStore()
+    return _store
+
+
+def set_result_store(store: ResultStore) -> None:
+    """Replace the shared result store (used by the ingest CLI and tests)."""
+    global _store
+    _store = store
@@ -0,0 +1,418 @@
+"""
+Priority-aware scheduler in front of the Gemini client.
+
+Every upstream call takes a slot from this scheduler. Waiting calls are
+ordered by priority class (interactive, normal, bulk) so a live
+``generate_style`` does not queue behind a batch of bulk work. Each class
+may only occupy its configured share of the slots, and waiting calls are
+promoted one class for every SCHEDULER_AGING_S seconds they wait, so bulk
+work is never starved.
+
+Within a class, calls are ordered by weighted fair queueing across caller
+sessions (start-time fair queueing: each call is tagged with its session's
+virtual start time, advancing by 1/weight per call), so a session with a
+long backlog does not delay a session that just arrived. A session or
+tenant at its concurrency limit (see utils.quotas) is skipped until one of
+its calls finishes. A call serving several callers (a micro-batch) is
+tagged by the weighted start of their sessions and advances each by its
+share only; it counts against the concurrency limits of all of them.
+
+Optional work (e.g. speculative prefetch) can register a pressure
+listener, called whenever a call has to wait for a slot, to back off.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+import itertools
+from enum import Enum
+from dataclasses import dataclass, field
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, Callable, Literal
+
+from utils.metrics import get_metrics
+from utils.quotas import Caller, LOCAL_CALLER, QuotaManager, Shares, get_quotas
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(str, Enum):
+    """Scheduling classes, highest priority first."""
+
+    INTERACTIVE = "interactive"
+    NORMAL = "normal"
+    BULK = "bulk"
+
+
+# Priority names accepted by the MCP tools
+PriorityName = Literal["interactive", "normal", "bulk"]
+
+_BASE_RANK = {
+    Priority.INTERACTIVE: 0,
+    Priority.NORMAL: 1,
+    Priority.BULK: 2,
+}
+
+# Fraction of the total slots each class may occupy
+_DEFAULT_SHARES = {
+    Priority.INTERACTIVE: 1.0,
+    Priority.NORMAL: 0.75,
+    Priority.BULK: 0.5,
+}
+
+
+def parse_priority(value: Optional[str], default: Priority = Priority.NORMAL) -> Priority:
+    """
+    Parse a priority name.
+
+    Args:
+        value: "interactive", "normal", "bulk" or None
+        default: Priority used when value is None
+
+    Returns:
+        Priority
+
+    Raises:
+        ValueError: If the name is not recognized
+    """
+    if value is None:
+        return default
+    try:
+        return Priority(value.lower())
+    except ValueError:
+        raise ValueError(
+            f"Invalid priority '{value}'. Expected one of: "
+            f"{', '.join(p.value for p in Priority)}"
+        )
+
+
+def _parse_mapping(raw: str) -> Dict[str, str]:
+    """Parse "key=value,key=value" configuration strings."""
+    mapping = {}
+    for item in raw.split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            mapping[key.strip()] = value.strip()
+    return mapping
+
+
+@dataclass
+class _Waiter:
+    """A call waiting for a slot."""
+
+    priority: Priority
+    seq: int
+    caller: Caller = LOCAL_CALLER
+    shares: Shares = ((LOCAL_CALLER, 1.0),)
+    start_tag: float = 0.0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+    def effective_rank(self, now: float, aging_s: float) -> float:
+        """Base rank lowered by one class per aging interval waited."""
+        return _BASE_RANK[self.priority] - (now - self.enqueued_at) / aging_s
+
+    def order(self, now: float, aging_s: float) -> tuple:
+        """Dispatch order: promoted class, then fair-share tag, then arrival."""
+        return (math.ceil(self.effective_rank(now, aging_s)), self.start_tag, self.seq)
+
+
+class PriorityScheduler:
+    """
+    Slot-based scheduler with priority classes, shares and aging.
+
+    Slots are granted in order of effective rank (then arrival), skipping
+    classes that have reached their share of the slots.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        shares: Optional[Dict[Priority, float]] = None,
+        aging_s: Optional[float] = None,
+        quotas: Optional[QuotaManager] = None,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_concurrency: Total slots (default: GEMINI_MAX_CONCURRENCY or 8)
+            shares: Max fraction of slots per class (default: SCHEDULER_SHARES
+                or interactive=1.0, normal=0.75, bulk=0.5)
+            aging_s: Seconds of waiting per one-class promotion
+                (default: SCHEDULER_AGING_S or 10)
+            quotas: Per-caller limits and weights (default: the shared
+                QuotaManager)
+        """
+        self.quotas = quotas or get_quotas()
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self.aging_s = aging_s or float(os.getenv("SCHEDULER_AGING_S", "10"))
+
+        if shares is None:
+            shares = dict(_DEFAULT_SHARES)
+            for name, value in _parse_mapping(os.getenv("SCHEDULER_SHARES", "")).items():
+                shares[parse_priority(name)] = float(value)
+        self.limits = {
+            priority: max(1, int(shares.get(priority, 1.0) * self.max_concurrency))
+            for priority in Priority
+        }
+
+        self._waiters: list[_Waiter] = []
+        self._in_flight = {priority: 0 for priority in Priority}
+        self._seq = itertools.count()
+        # Fair queueing: virtual time and each session's last finish tag
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._pressure_listeners: list[Callable[[Priority], None]] = []
+
+    @property
+    def in_flight(self) -> int:
+        """Total slots currently held."""
+        return sum(self._in_flight.values())
+
+    def _start_tag(self, shares: Shares) -> float:
+        """Tag a new call with its sessions' virtual start time, weighted by share."""
+        tag = 0.0
+        for caller, share in shares:
+            start = max(self._virtual_time, self._finish_tags.get(caller.session, 0.0))
+            self._finish_tags[caller.session] = start + share / self.quotas.weight(caller)
+            tag += share * start
+        return tag
+
+    def _can_start(self, shares: Shares) -> bool:
+        return all(self.quotas.can_start(caller) for caller, _ in shares)
+
+    def _grant(self, priority: Priority, shares: Shares) -> None:
+        self._in_flight[priority] += 1
+        for caller, _ in shares:
+            self.quotas.started(caller)
+
+    def _dispatch(self) -> None:
+        """Grant free slots to the best eligible waiters."""
+        while self._waiters and self.in_flight < self.max_concurrency:
+            now = time.monotonic()
+            eligible = [
+                w for w in self._waiters
+                if self._in_flight[w.priority] < self.limits[w.priority]
+                and self._can_start(w.shares)
+            ]
+            if not eligible:
+                return
+            best = min(eligible, key=lambda w: w.order(now, self.aging_s))
+            self._waiters.remove(best)
+            self._virtual_time = max(self._virtual_time, best.start_tag)
+            self._grant(best.priority, best.shares)
+            best.future.set_result(None)
+
+        if not self._waiters and len(self._finish_tags) > 1024:
+            # Sessions behind the virtual time would start from it anyway
+            self._finish_tags = {
+                session: tag
+                for session, tag in self._finish_tags.items()
+                if tag > self._virtual_time
+            }
+
+    def add_pressure_listener(self, listener: Callable[[Priority], None]) -> None:
+        """
+        Register a callback run whenever a call has to wait for a slot.
+
+        The callback gets the waiting call's priority and runs in its
+        context (so ``current_request()`` identifies the waiting request).
+        """
+        self._pressure_listeners.append(listener)
+
+    def head_delay(self, priority: Optional[Priority] = None) -> float:
+        """
+        Seconds the longest-waiting call has been queued.
+
+        Args:
+            priority: Only consider waiters of this class (default: all)
+
+        Returns:
+            Queue delay of the oldest waiter, 0 when none waits
+        """
+        enqueued = [
+            w.enqueued_at for w in self._waiters if priority is None or w.priority == priority
+        ]
+        return time.monotonic() - min(enqueued) if enqueued else 0.0
+
+    def queued(self, caller: Caller) -> int:
+        """Calls of the caller's session waiting for a slot."""
+        return sum(
+            1
+            for w in self._waiters
+            if any(c.session == caller.session for c, _ in w.shares)
+        )
+
+    async def acquire(
+        self,
+        priority: Priority,
+        caller: Caller = LOCAL_CALLER,
+        shares: Optional[Shares] = None,
+    ) -> None:
+        """
+        Wait for a slot in the given class.
+
+        Cancellation while waiting removes the call from the queue.
+
+        Args:
+            priority: Priority class of the call
+            caller: Caller of the call
+            shares: Callers the call serves and their shares of it
+                (default: the caller alone)
+        """
+        shares = shares or ((caller, 1.0),)
+        waiter = _Waiter(
+            priority=priority,
+            seq=next(self._seq),
+            caller=caller,
+            shares=shares,
+            start_tag=self._start_tag(shares),
+        )
+        self._waiters.append(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            for listener in self._pressure_listeners:
+                listener(priority)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                get_metrics().increment("scheduler.cancelled_waiters")
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just as we were cancelled
+                self.release(priority, caller, shares=shares)
+            raise
+
+        wait_s = time.monotonic() - waiter.enqueued_at
+        get_metrics().observe(f"scheduler.wait_s.{priority.value}", wait_s)
+
+    def try_acquire(
+        self,
+        priority: Priority,
+        caller: Caller = LOCAL_CALLER,
+        shares: Optional[Shares] = None,
+    ) -> bool:
+        """
+        Take a slot only if one is idle right now.
+
+        Used for optional extra work (e.g. hedged requests) that must never
+        queue ahead of, or delay, regular calls.
+
+        Returns:
+            True if a slot was granted
+        """
+        shares = shares or ((caller, 1.0),)
+        if (
+            self._waiters
+            or self.in_flight >= self.max_concurrency
+            or self._in_flight[priority] >= self.limits[priority]
+            or not self._can_start(shares)
+        ):
+            return False
+        self._grant(priority, shares)
+        return True
+
+    def release(
+        self,
+        priority: Priority,
+        caller: Caller = LOCAL_CALLER,
+        duration_s: Optional[float] = None,
+        shares: Optional[Shares] = None,
+    ) -> None:
+        """Return a slot (acquired with the same caller or shares) and wake the next waiter."""
+        self._in_flight[priority] -= 1
+        for index, (sharer, _) in enumerate(shares or ((caller, 1.0),)):
+            self.quotas.finished(sharer, duration_s if index == 0 else None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, caller: Caller = LOCAL_CALLER) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block."""
+        await self.acquire(priority, caller)
+        try:
+            yield
+        finally:
+            self.release(priority, caller)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current slot usage and queue lengths per class."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": {p.value: n for p, n in self._in_flight.items()},
+            "queued": {
+                p.value: sum(1 for w in self._waiters if w.priority == p)
+                for p in Priority
+            },
+            "limits": {p.value: n for p, n in self.limits.items()},
+        }
+
+
+# Default priority per MCP tool, overridable with TOOL_PRIORITIES
+_TOOL_PRIORITIES = {
+    "analyze_structure": Priority.INTERACTIVE,
+    "analyze_room": Priority.INTERACTIVE,
+    "generate_style": Priority.INTERACTIVE,
+    "generate_all": Priority.NORMAL,
+    "submit_generate_all": Priority.BULK,
+    "ingest": Priority.BULK,
+    "find_similar_interiors": Priority.INTERACTIVE,
+    "speculative_prefetch": Priority.BULK,
+    "index_analysis": Priority.BULK,
+}
+# TOOL_PRIORITIES, parsed on first use
+_configured_priorities: Optional[Dict[str, Priority]] = None
+
+
+def _tool_priority_overrides() -> Dict[str, Priority]:
+    """Per-tool priorities from TOOL_PRIORITIES (parsed once)."""
+    global _configured_priorities
+    if _configured_priorities is None:
+        _configured_priorities = {
+            tool: parse_priority(name)
+            for tool, name in _parse_mapping(os.getenv("TOOL_PRIORITIES", "")).items()
+        }
+    return _configured_priorities
+
+
+def tool_priority(tool: str, requested: Optional[str] = None) -> Priority:
+    """
+    Resolve the priority for a tool call.
+
+    Args:
+        tool: MCP tool name
+        requested: Per-request override ("interactive", "normal", "bulk")
+
+    Returns:
+        The requested priority, else the TOOL_PRIORITIES entry, else the
+        built-in default for the tool
+
+    Raises:
+        ValueError: If a priority name is not recognized
+    """
+    if requested is not None:
+        return parse_priority(requested)
+    configured = _tool_priority_overrides()
+    if tool in configured:
+        return configured[tool]
+    return _TOOL_PRIORITIES.get(tool, Priority.NORMAL)
+
+
+_scheduler: Optional[PriorityScheduler] = None
+
+
+def get_scheduler() -> PriorityScheduler:
+    """
+    Get the shared scheduler.
+
+    Returns:
+        PriorityScheduler configured from the environment
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PriorityScheduler()
+    return _scheduler
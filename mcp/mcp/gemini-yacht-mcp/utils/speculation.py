@@ -0,0 +1,292 @@
+"""
+Speculative style prefetch after a structure analysis.
+
+Clients usually call ``analyze_structure`` and then, seconds later,
+``generate_style`` for the same image with the returned description. With
+speculation enabled, an analysis is followed in the background by the
+generation of the styles most requested recently (decayed counts of
+``generate_style`` calls), at bulk priority. The outputs go to the result
+store under the key ``generate_style`` looks up, so the follow-up call is
+served from the store, or joins the speculative generation still running
+for as long as it can and still generate the style itself in time.
+
+Speculation only uses spare capacity:
+- it starts only while no call is waiting for a scheduler slot, the bulk
+  class has free slots and the caller's quotas leave room for it (the
+  speculative calls are charged to the caller of the analysis);
+- at most SPECULATIVE_MAX_IN_FLIGHT styles are generated at once;
+- all speculative generations are cancelled as soon as a regular call has
+  to wait for a slot.
+
+It needs the result store (RESULT_STORE=memory or disk); with the store
+off nothing is speculated.
+
+Settings:
+- SPECULATIVE_PREFETCH: Enable speculation (default: false)
+- SPECULATIVE_TOP_STYLES: Styles generated per analysis (default: 2)
+- SPECULATIVE_MAX_IN_FLIGHT: Speculative generations at once (default: 2)
+- SPECULATIVE_HALF_LIFE_S: Half-life of the style popularity counts
+  (default: 3600)
+
+Counters in ``server_metrics``: "speculation.started", "speculation.hits"
+(generate_style served by a speculative output), "speculation.skipped"
+(no headroom), "speculation.cancelled" and "speculation.failed".
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from utils.context import current_request, remaining_time, request_scope
+from utils.latency import get_latency_tracker
+from utils.metrics import get_metrics
+from utils.quotas import Caller, get_quotas
+from utils.scheduler import Priority, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Request scope (and default priority) of speculative generations
+SPECULATIVE_TOOL = "speculative_prefetch"
+
+# Speculated keys remembered for hit accounting
+_SPECULATED_KEYS = 4096
+
+# Share of the remaining request budget a caller may spend joining a
+# speculative generation, the latency quantile of direct generations it
+# must leave time for, and (without a deadline) the multiple of that
+# latency after which a speculative generation is considered starved
+_JOIN_BUDGET_SHARE = 0.5
+_JOIN_LATENCY_QUANTILE = 0.95
+_JOIN_LATENCY_SLACK = 2.0
+
+
+class StylePrefetcher:
+    """Learns style popularity and generates likely styles ahead of time."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        top_styles: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        half_life_s: Optional[float] = None,
+    ):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            enabled: Whether to speculate (default: SPECULATIVE_PREFETCH or false)
+            top_styles: Styles generated per analysis
+                (default: SPECULATIVE_TOP_STYLES or 2)
+            max_in_flight: Speculative generations at once
+                (default: SPECULATIVE_MAX_IN_FLIGHT or 2)
+            half_life_s: Half-life of the popularity counts
+                (default: SPECULATIVE_HALF_LIFE_S or 3600)
+        """
+        self.enabled = (
+            enabled
+            if enabled is not None
+            else os.getenv("SPECULATIVE_PREFETCH", "false").lower() == "true"
+        )
+        self.top_styles = (
+            top_styles
+            if top_styles is not None
+            else int(os.getenv("SPECULATIVE_TOP_STYLES", "2"))
+        )
+        self.max_in_flight = max_in_flight or int(os.getenv("SPECULATIVE_MAX_IN_FLIGHT", "2"))
+        self.half_life_s = half_life_s or float(os.getenv("SPECULATIVE_HALF_LIFE_S", "3600"))
+
+        self._counts: Dict[Any, float] = {}
+        self._counted_at = time.monotonic()
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        self._speculated: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._listening = False
+
+    def record(self, style: Any) -> None:
+        """Count a request for a style (older requests decay with the half-life)."""
+        now = time.monotonic()
+        decay = 0.5 ** ((now - self._counted_at) / self.half_life_s)
+        self._counted_at = now
+        for key in self._counts:
+            self._counts[key] *= decay
+        self._counts[style] = self._counts.get(style, 0.0) + 1.0
+
+    def popular(self) -> list:
+        """Most requested styles, most popular first (only styles seen so far)."""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return [style for style, _ in ranked[: self.top_styles]]
+
+    def _has_headroom(self, caller: Caller, tokens: int) -> bool:
+        scheduler = get_scheduler()
+        stats = scheduler.stats()
+        if any(stats["queued"].values()):
+            return False
+        if stats["in_flight"][Priority.BULK.value] >= scheduler.limits[Priority.BULK]:
+            return False
+        if scheduler.in_flight >= scheduler.max_concurrency:
+            return False
+        return get_quotas().has_headroom(caller, tokens)
+
+    def schedule(
+        self,
+        jobs: Dict[Hashable, Callable[[], Awaitable[None]]],
+        caller: Caller,
+        tokens: int,
+    ) -> int:
+        """
+        Start speculative generations while there is headroom.
+
+        Args:
+            jobs: Coroutine factory per result key, most wanted first; each
+                generates one output and stores it under its key
+            caller: Caller the generations are charged to
+            tokens: Estimated tokens of one generation (checked against the
+                caller's budgets)
+
+        Returns:
+            Number of generations started
+        """
+        if not self.enabled:
+            return 0
+        if not self._listening:
+            get_scheduler().add_pressure_listener(self._on_pressure)
+            self._listening = True
+
+        metrics = get_metrics()
+        started = 0
+        for key, job in jobs.items():
+            if key in self._pending:
+                continue
+            if len(self._pending) >= self.max_in_flight or not self._has_headroom(caller, tokens):
+                metrics.increment("speculation.skipped")
+                continue
+            task = asyncio.create_task(self._run(job, caller))
+            self._pending[key] = task
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+            metrics.increment("speculation.started")
+            started += 1
+        if started:
+            logger.debug("Started %s speculative generation(s)", started)
+        return started
+
+    async def _run(self, job: Callable[[], Awaitable[None]], caller: Caller) -> None:
+        with request_scope(SPECULATIVE_TOOL, caller=caller):
+            await job()
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            get_metrics().increment("speculation.failed")
+            logger.debug("Speculative generation failed: %s", task.exception())
+            return
+        self._speculated[key] = None
+        while len(self._speculated) > _SPECULATED_KEYS:
+            self._speculated.popitem(last=False)
+
+    def _on_pressure(self, priority: Priority) -> None:
+        """Scheduler hook: a call had to wait for a slot."""
+        request = current_request()
+        if request is not None and request.tool == SPECULATIVE_TOOL:
+            return
+        self.cancel_all()
+
+    def cancel_all(self) -> int:
+        """Cancel every speculative generation in progress."""
+        tasks = [task for task in self._pending.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            get_metrics().increment("speculation.cancelled", len(tasks))
+            logger.info("Cancelled %s speculative generation(s) under load", len(tasks))
+        return len(tasks)
+
+    def running(self, key: Hashable) -> bool:
+        """Whether a speculative generation of a key is in progress."""
+        return key in self._pending
+
+    def _join_timeout(self, latency_key: Optional[Hashable]) -> Optional[float]:
+        """Longest wait for a speculative generation that leaves time to generate directly."""
+        expected = (
+            get_latency_tracker().quantile(latency_key, _JOIN_LATENCY_QUANTILE)
+            if latency_key is not None
+            else None
+        )
+        remaining = remaining_time()
+        if remaining is not None:
+            timeout = remaining * _JOIN_BUDGET_SHARE
+            return timeout if expected is None else min(timeout, remaining - expected)
+        return expected * _JOIN_LATENCY_SLACK if expected is not None else None
+
+    async def join(self, key: Hashable, latency_key: Optional[Hashable] = None) -> None:
+        """
+        Wait for the speculative generation of a key, if one is running.
+
+        Speculative generations run at bulk priority and may be slow or
+        starved, so the wait is bounded by half of the active request's
+        remaining budget and, when direct generations have been observed
+        under ``latency_key``, by the budget less their p95 latency; the
+        caller then still has time to generate the output itself. Without
+        a deadline, the wait is bounded by twice that latency. Neither
+        cancelling the caller nor giving up cancels the speculative
+        generation.
+
+        Args:
+            key: Result key of the generation
+            latency_key: Latency key (model, operation, tier) of a direct
+                generation of the same output
+        """
+        task = self._pending.get(key)
+        if task is None:
+            return
+        timeout = self._join_timeout(latency_key)
+        if timeout is not None and timeout <= 0:
+            logger.debug("No time left to wait for a speculative generation")
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.debug("Stopped waiting for a speculative generation after %.2fs", timeout)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+        except Exception:
+            pass
+
+    def served(self, key: Hashable) -> None:
+        """Count a stored output served to a client if speculation produced it."""
+        if key in self._speculated:
+            del self._speculated[key]
+            get_metrics().increment("speculation.hits")
+
+    def stats(self) -> Dict[str, Any]:
+        """Settings, in-flight generations and current style popularity."""
+        return {
+            "enabled": self.enabled,
+            "top_styles": self.top_styles,
+            "in_flight": len(self._pending),
+            "popularity": {
+                getattr(style, "value", str(style)): round(count, 2)
+                for style, count in self._counts.items()
+            },
+        }
+
+
+_prefetcher: Optional[StylePrefetcher] = None
+
+
+def get_prefetcher() -> StylePrefetcher:
+    """
+    Get the shared prefetcher.
+
+    Returns:
+        StylePrefetcher configured from the environment
+    """
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = StylePrefetcher()
+    return _prefetcher
@@ -0,0 +1,229 @@
+"""
+Tiled analysis of panoramas and very large interiors.
+
+A large image is split into overlapping tiles that are analyzed
+concurrently (each tile is one scheduled upstream call), and the
+per-tile sections are merged into a single analysis. Tiles keep detail
+that downscaling would lose while the latency of the whole analysis stays
+close to that of a single tile.
+"""
+
+import os
+import re
+import math
+from typing import Optional, Iterable
+
+from models.schemas import AnalyzeYachtOutput
+
+TILING_OFF = "off"
+TILING_ON = "on"
+TILING_AUTO = "auto"
+TILING_MODES = (TILING_OFF, TILING_ON, TILING_AUTO)
+
+# Token overlap above which two features are considered the same
+_FEATURE_SIMILARITY = 0.8
+
+# Defaults filled in by the response parser when a section is missing
+_PLACEHOLDER_FEATURES = (
+    "Analysis completed - see description",
+    "No specific features extracted",
+)
+_PLACEHOLDER_TEXT_PREFIX = "See full description for"
+
+
+def resolve_tiling(requested: Optional[str] = None) -> str:
+    """
+    Resolve the tiling mode for an analysis.
+
+    Args:
+        requested: "off", "on", "auto" or None for ANALYSIS_TILING (default: off)
+
+    Returns:
+        Tiling mode
+
+    Raises:
+        ValueError: If the mode is not recognized
+    """
+    mode = (requested or os.getenv("ANALYSIS_TILING", TILING_OFF)).lower()
+    if mode not in TILING_MODES:
+        raise ValueError(
+            f"Invalid tiling mode '{mode}'. Expected one of: {', '.join(TILING_MODES)}"
+        )
+    return mode
+
+
+def _int_setting(name: str, default: str, minimum: int) -> int:
+    """Integer setting from the environment, refused below `minimum`."""
+    value = int(os.getenv(name, default))
+    if value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}, got {value}")
+    return value
+
+
+def get_tile_size() -> int:
+    """Tile edge length in pixels (TILE_SIZE, default: 1536)."""
+    return _int_setting("TILE_SIZE", "1536", 1)
+
+
+def get_tile_overlap() -> int:
+    """Overlap between neighbouring tiles in pixels (TILE_OVERLAP, default: 192)."""
+    return _int_setting("TILE_OVERLAP", "192", 0)
+
+
+def get_max_tiles() -> int:
+    """Maximum tiles per image (TILE_MAX_COUNT, default: 8)."""
+    return _int_setting("TILE_MAX_COUNT", "8", 1)
+
+
+def get_auto_threshold() -> int:
+    """Long-edge length above which auto mode tiles (TILE_AUTO_THRESHOLD, default: 3072)."""
+    return int(os.getenv("TILE_AUTO_THRESHOLD", "3072"))
+
+
+def should_tile(mode: str, size: tuple[int, int]) -> bool:
+    """
+    Decide whether an image of the given size is analyzed in tiles.
+
+    Args:
+        mode: Resolved tiling mode
+        size: (width, height) of the image
+
+    Returns:
+        True if the image should be tiled
+    """
+    if mode == TILING_ON:
+        return max(size) > get_tile_size()
+    if mode == TILING_AUTO:
+        return max(size) > get_auto_threshold()
+    return False
+
+
+def _axis_starts(length: int, tile: int, overlap: int) -> list[int]:
+    """Evenly spaced tile offsets covering one axis with at least `overlap`."""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def tile_boxes(
+    size: tuple[int, int],
+    tile_size: Optional[int] = None,
+    overlap: Optional[int] = None,
+    max_tiles: Optional[int] = None,
+) -> list[tuple[int, int, int, int]]:
+    """
+    Compute overlapping tile boxes covering an image.
+
+    Tiles are square where the image allows; if the grid would exceed
+    max_tiles, the tile size grows until it fits.
+
+    Args:
+        size: (width, height) of the image
+        tile_size: Tile edge in pixels (default: TILE_SIZE)
+        overlap: Minimum overlap in pixels (default: TILE_OVERLAP)
+        max_tiles: Maximum number of tiles (default: TILE_MAX_COUNT)
+
+    Returns:
+        List of (left, top, right, bottom) boxes in row-major order
+
+    Raises:
+        ValueError: If the tile size or tile count is below 1, or the
+            overlap is negative
+    """
+    width, height = size
+    tile = tile_size if tile_size is not None else get_tile_size()
+    overlap = overlap if overlap is not None else get_tile_overlap()
+    limit = max_tiles if max_tiles is not None else get_max_tiles()
+    if tile < 1 or limit < 1 or overlap < 0:
+        raise ValueError(
+            f"Invalid tiling: tile size {tile} and tile count {limit} must be at least 1, "
+            f"overlap {overlap} at least 0"
+        )
+
+    while True:
+        tile_w, tile_h = min(tile, width), min(tile, height)
+        xs = _axis_starts(width, tile_w, min(overlap, tile_w // 2))
+        ys = _axis_starts(height, tile_h, min(overlap, tile_h // 2))
+        if len(xs) * len(ys) <= limit:
+            break
+        tile = max(tile + 1, int(tile * 1.25))
+
+    return [(x, y, x + tile_w, y + tile_h) for y in ys for x in xs]
+
+
+def _normalize(text: str) -> str:
+    """Lowercase text without punctuation or repeated whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _similar(a: str, b: str) -> bool:
+    """Token-set overlap of two normalized strings."""
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    if not tokens_a or not tokens_b:
+        return a == b
+    overlap = len(tokens_a & tokens_b) / min(len(tokens_a), len(tokens_b))
+    return overlap >= _FEATURE_SIMILARITY
+
+
+def dedupe_items(items: Iterable[str]) -> list[str]:
+    """
+    Remove duplicate and near-duplicate items, keeping first occurrences.
+
+    Two items are near-duplicates when one's words are (almost) all
+    contained in the other, e.g. "Curved sofa" and "curved sofa."; the
+    longer, more specific wording is kept.
+    """
+    kept: list[tuple[str, str]] = []
+    for item in items:
+        normalized = _normalize(item)
+        if not normalized:
+            continue
+        for index, (existing, existing_norm) in enumerate(kept):
+            if _similar(normalized, existing_norm):
+                if len(normalized) > len(existing_norm):
+                    kept[index] = (item, normalized)
+                break
+        else:
+            kept.append((item, normalized))
+    return [item for item, _ in kept]
+
+
+def _merge_text(sections: list[str]) -> str:
+    """Merge section texts paragraph by paragraph, dropping repeats."""
+    paragraphs = [
+        paragraph.strip()
+        for section in sections
+        for paragraph in section.split("\n\n")
+        if paragraph.strip()
+    ]
+    informative = [p for p in paragraphs if not p.startswith(_PLACEHOLDER_TEXT_PREFIX)]
+    return "\n\n".join(dedupe_items(informative or paragraphs))
+
+
+def merge_analyses(analyses: list[AnalyzeYachtOutput]) -> AnalyzeYachtOutput:
+    """
+    Merge several partial analyses of one space into a single analysis.
+
+    Args:
+        analyses: Per-tile (or per-group) analyses, in spatial order
+
+    Returns:
+        Merged AnalyzeYachtOutput with deduplicated key features
+    """
+    if len(analyses) == 1:
+        return analyses[0]
+
+    features = dedupe_items(
+        feature
+        for analysis in analyses
+        for feature in analysis.key_features
+        if feature not in _PLACEHOLDER_FEATURES
+    )
+    return AnalyzeYachtOutput(
+        description=_merge_text([a.description for a in analyses]),
+        key_features=features or [_PLACEHOLDER_FEATURES[0]],
+        geometry_notes=_merge_text([a.geometry_notes for a in analyses]),
+        lighting_analysis=_merge_text([a.lighting_analysis for a in analyses]),
+    )
@@ -0,0 +1,345 @@
+"""
+Transport and connection management for the Gemini SDK.
+
+``genai.configure()`` only selects a transport by name; pool sizes,
+keep-alive and how concurrent calls share connections are left at the
+SDK defaults. This module builds the SDK's GenerativeService clients
+itself so they can be configured:
+
+- ``grpc`` (GEMINI_TRANSPORT, default): GEMINI_CHANNELS independent
+  HTTP/2 channels (each its own TCP connection), with calls going to the
+  channel with the fewest in flight and at most
+  GEMINI_MAX_STREAMS_PER_CHANNEL concurrent calls per channel; keep-alive
+  pings every GEMINI_KEEPALIVE_S
+- ``rest``: one HTTP/1.1 session whose connection pool holds
+  GEMINI_MAX_CONNECTIONS persistent connections (one call per connection;
+  callers wait for a free connection instead of opening throwaway ones),
+  with TCP keep-alive probes after GEMINI_KEEPALIVE_S idle
+
+GEMINI_ENDPOINT overrides the API endpoint (e.g. a proxy, or
+``http://127.0.0.1:8080`` for a local stand-in; ``http://`` endpoints are
+reached without TLS).
+
+Neither the REST transport's HTTP session nor the client a GenerativeModel
+calls can be passed to the SDK, so both are set on private attributes;
+google-generativeai and google-ai-generativelanguage are pinned to the
+tested versions in requirements.txt, and a missing attribute fails client
+creation instead of silently using the SDK defaults.
+"""
+
+import os
+import socket
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import grpc
+import google.generativeai as genai
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from google.ai.generativelanguage_v1beta import GenerativeServiceClient
+from google.ai.generativelanguage_v1beta.services.generative_service.transports import (
+    GenerativeServiceGrpcTransport,
+    GenerativeServiceRestTransport,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelWaitTimeout(TimeoutError):
+    """Raised when no pooled connection becomes free within the caller's budget."""
+
+    pass
+
+
+def _sdk_attribute(obj: Any, name: str) -> Any:
+    """
+    Read a private SDK attribute this module depends on.
+
+    Raises:
+        RuntimeError: If the installed SDK version no longer has it
+    """
+    if not hasattr(obj, name):
+        raise RuntimeError(
+            f"{type(obj).__name__}.{name} not found; install the google-generativeai "
+            f"and google-ai-generativelanguage versions pinned in requirements.txt"
+        )
+    return getattr(obj, name)
+
+TRANSPORT_GRPC = "grpc"
+TRANSPORT_REST = "rest"
+TRANSPORTS = (TRANSPORT_GRPC, TRANSPORT_REST)
+
+
+@dataclass
+class TransportConfig:
+    """Connection settings for the Gemini API."""
+
+    kind: str = TRANSPORT_GRPC
+    endpoint: Optional[str] = None
+    channels: int = 1
+    max_streams_per_channel: int = 100
+    max_connections: int = 10
+    keepalive_s: float = 30.0
+    keepalive_timeout_s: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        """
+        Read the settings from the environment.
+
+        Raises:
+            ValueError: If GEMINI_TRANSPORT is not recognized
+        """
+        kind = os.getenv("GEMINI_TRANSPORT", TRANSPORT_GRPC).lower()
+        if kind not in TRANSPORTS:
+            raise ValueError(
+                f"Invalid GEMINI_TRANSPORT '{kind}'. Expected one of: {', '.join(TRANSPORTS)}"
+            )
+        return cls(
+            kind=kind,
+            endpoint=os.getenv("GEMINI_ENDPOINT") or None,
+            channels=max(1, int(os.getenv("GEMINI_CHANNELS", "1"))),
+            max_streams_per_channel=int(os.getenv("GEMINI_MAX_STREAMS_PER_CHANNEL", "100")),
+            max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", "10")),
+            keepalive_s=float(os.getenv("GEMINI_KEEPALIVE_S", "30")),
+            keepalive_timeout_s=float(os.getenv("GEMINI_KEEPALIVE_TIMEOUT_S", "10")),
+        )
+
+    @property
+    def insecure(self) -> bool:
+        """Whether the endpoint is plain HTTP (local stand-ins)."""
+        return bool(self.endpoint) and self.endpoint.startswith("http://")
+
+    @property
+    def host(self) -> Optional[str]:
+        """Endpoint without its scheme."""
+        if not self.endpoint:
+            return None
+        return self.endpoint.split("://", 1)[-1].rstrip("/")
+
+    def grpc_options(self) -> list[tuple[str, Any]]:
+        """Channel arguments for each gRPC channel."""
+        options: list[tuple[str, Any]] = [
+            # Channels with equal arguments otherwise share one connection
+            ("grpc.use_local_subchannel_pool", 1),
+        ]
+        if self.keepalive_s > 0:
+            options += [
+                ("grpc.keepalive_time_ms", int(self.keepalive_s * 1000)),
+                ("grpc.keepalive_timeout_ms", int(self.keepalive_timeout_s * 1000)),
+            ]
+        return options
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """requests adapter whose connections enable TCP keep-alive probes."""
+
+    def __init__(self, keepalive_s: float, **kwargs):
+        self.keepalive_s = keepalive_s
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        options = list(HTTPConnection.default_socket_options)
+        if self.keepalive_s > 0:
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            # Probe timing is only adjustable on some platforms
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, int(self.keepalive_s)))
+            if hasattr(socket, "TCP_KEEPINTVL"):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(self.keepalive_s) // 3)))
+        kwargs["socket_options"] = options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _grpc_transport(config: TransportConfig, **kwargs) -> GenerativeServiceGrpcTransport:
+    """gRPC transport whose channel carries the configured options."""
+
+    def create_channel(host: str, options: Optional[list] = None, **channel_kwargs) -> grpc.Channel:
+        options = list(options or []) + config.grpc_options()
+        if config.insecure:
+            return grpc.insecure_channel(host, options=options)
+        return GenerativeServiceGrpcTransport.create_channel(host, options=options, **channel_kwargs)
+
+    return GenerativeServiceGrpcTransport(channel=create_channel, **kwargs)
+
+
+def _rest_transport(config: TransportConfig, **kwargs) -> GenerativeServiceRestTransport:
+    """REST transport with a bounded, blocking keep-alive connection pool."""
+    transport = GenerativeServiceRestTransport(
+        url_scheme="http" if config.insecure else "https", **kwargs
+    )
+    if config.max_connections > 0:
+        adapter = _KeepAliveAdapter(
+            config.keepalive_s,
+            pool_connections=1,
+            pool_maxsize=config.max_connections,
+            pool_block=True,
+        )
+        # The transport's AuthorizedSession is a requests.Session
+        session = _sdk_attribute(transport, "_session")
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    return transport
+
+
+def build_generative_clients(config: TransportConfig, api_key: Optional[str]) -> list:
+    """
+    Create the GenerativeService clients for a transport configuration.
+
+    Args:
+        config: Transport settings
+        api_key: Gemini API key
+
+    Returns:
+        One client per gRPC channel, or a single REST client
+    """
+    client_options: Dict[str, Any] = {"api_key": api_key}
+    if config.host:
+        client_options["api_endpoint"] = config.host
+
+    if config.kind == TRANSPORT_REST:
+        factory = lambda **kwargs: _rest_transport(config, **kwargs)  # noqa: E731
+        count = 1
+    else:
+        factory = lambda **kwargs: _grpc_transport(config, **kwargs)  # noqa: E731
+        count = config.channels
+
+    return [
+        GenerativeServiceClient(transport=factory, client_options=client_options)
+        for _ in range(count)
+    ]
+
+
+class _Waiter:
+    """A caller waiting for a free entry of a ChannelPool."""
+
+    __slots__ = ("event", "index")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.index = -1
+
+
+class ChannelPool:
+    """
+    Hands out one of several connections (any objects) to calling threads.
+
+    Each call goes to the entry with the fewest calls in flight. When every
+    entry has ``max_in_flight`` calls, callers queue and each finishing call
+    hands its entry to the longest waiting caller, so a thread that keeps
+    calling cannot starve the others.
+    """
+
+    def __init__(self, entries: list, max_in_flight: int = 0):
+        """
+        Initialize the pool.
+
+        Args:
+            entries: Connections (e.g. SDK models bound to one channel each)
+            max_in_flight: Concurrent calls per entry, 0 for unbounded
+        """
+        self.entries = entries
+        self.max_in_flight = max_in_flight
+        self._in_flight = [0] * len(entries)
+        self._calls = [0] * len(entries)
+        self._waits = 0
+        self._waiters: deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+
+    def _take(self) -> Optional[int]:
+        index = min(range(len(self.entries)), key=self._in_flight.__getitem__)
+        if self.max_in_flight > 0 and self._in_flight[index] >= self.max_in_flight:
+            return None
+        self._in_flight[index] += 1
+        self._calls[index] += 1
+        return index
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Use the least busy entry for one call (blocks while all are full).
+
+        Args:
+            timeout: Longest wait for a free entry in seconds (None: no limit)
+
+        Raises:
+            ChannelWaitTimeout: If no entry was handed over within the timeout
+        """
+        waiter = None
+        with self._lock:
+            index = None if self._waiters else self._take()
+            if index is None:
+                self._waits += 1
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+        if waiter is not None:
+            if not waiter.event.wait(timeout):
+                with self._lock:
+                    # An entry handed over just as the wait timed out is used
+                    if waiter.index < 0:
+                        self._waiters.remove(waiter)
+                        raise ChannelWaitTimeout(
+                            f"No free connection within {timeout:.2f}s "
+                            f"({len(self._waiters)} other caller(s) waiting)"
+                        )
+            index = waiter.index
+        try:
+            yield self.entries[index]
+        finally:
+            with self._lock:
+                if self._waiters:
+                    # Still in flight; now for the next caller
+                    next_waiter = self._waiters.popleft()
+                    next_waiter.index = index
+                    self._calls[index] += 1
+                    next_waiter.event.set()
+                else:
+                    self._in_flight[index] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls in flight and served per entry, and waits for a free entry."""
+        with self._lock:
+            return {
+                "size": len(self.entries),
+                "max_in_flight": self.max_in_flight,
+                "in_flight": list(self._in_flight),
+                "calls": list(self._calls),
+                "waits": self._waits,
+                "waiting": len(self._waiters),
+            }
+
+
+def generative_client(model: Any) -> GenerativeServiceClient:
+    """GenerativeService client a pooled model calls (for other RPCs on its channel)."""
+    return _sdk_attribute(model, "_client")
+
+
+def build_channel_pool(config: TransportConfig, api_key: Optional[str], model_name: str) -> ChannelPool:
+    """
+    Create one SDK model per connection and pool them.
+
+    Args:
+        config: Transport settings
+        api_key: Gemini API key
+        model_name: Gemini model name
+
+    Returns:
+        ChannelPool of GenerativeModel objects; gRPC channels are limited to
+        max_streams_per_channel concurrent calls, the REST connection pool
+        limits itself
+    """
+    models = []
+    for api_client in build_generative_clients(config, api_key):
+        model = genai.GenerativeModel(model_name)
+        # GenerativeModel otherwise creates the default client lazily
+        _sdk_attribute(model, "_client")
+        model._client = api_client
+        models.append(model)
+    return ChannelPool(
+        models,
+        config.max_streams_per_channel if config.kind == TRANSPORT_GRPC else 0,
+    )
@@ -0,0 +1,541 @@
+"""
+Similarity index over structure analyses.
+
+Every analysis (description, key features and lighting) is embedded and
+added to an in-memory NumPy matrix as it is produced, so
+``find_similar_interiors`` ranks all stored interiors by cosine similarity
+with one matrix-vector product instead of re-analyzing anything. An
+inverted index from key-feature words to entries restricts a search to
+interiors that have the requested features (e.g. "teak", "skylight").
+
+Embedders:
+- ``hashing`` (default): offline feature hashing of words and word pairs;
+  no API calls, stable across processes
+- ``gemini``: Gemini text embeddings (EMBEDDING_MODEL); one API call per
+  indexed analysis and per text query, made through the Gemini client like
+  any other call (scheduler slot, caller quotas, deadline, channel pool);
+  background indexing runs at bulk priority
+
+An index file written by a different embedder (name or dimensions) is
+refused with VectorIndexError rather than skipped: set EMBEDDER and
+EMBEDDING_DIM to match it, or point VECTOR_INDEX_PATH at a new file.
+
+Settings:
+- VECTOR_INDEX_ENABLED: index analyses as they arrive (default: true)
+- EMBEDDER: ``hashing`` or ``gemini`` (default: hashing)
+- EMBEDDING_DIM: embedding dimensions (default: 512 for hashing, 768 for
+  gemini)
+- EMBEDDING_MODEL: Gemini embedding model (default: models/text-embedding-004)
+- VECTOR_INDEX_PATH: JSON-lines file the entries are appended to and
+  reloaded from at startup (in-memory only if unset); rewritten with the
+  live entries once it holds more than twice the capacity
+- VECTOR_INDEX_MAX_ENTRIES: capacity; the oldest entries are evicted first
+  (default: 50000)
+"""
+
+import os
+import re
+import asyncio
+import json
+import math
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Protocol
+
+import numpy as np
+
+from utils.context import current_caller, request_scope
+from utils.quotas import Caller
+
+logger = logging.getLogger(__name__)
+
+EMBEDDER_HASHING = "hashing"
+EMBEDDER_GEMINI = "gemini"
+EMBEDDERS = (EMBEDDER_HASHING, EMBEDDER_GEMINI)
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Words that say nothing about an interior
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to with which while there their these those into over under".split()
+)
+# Length of the text kept per entry for results
+_PREVIEW_CHARS = 300
+# Request the background indexing runs as (see utils.scheduler)
+INDEX_TOOL = "index_analysis"
+
+
+class VectorIndexError(Exception):
+    """Raised when the index file cannot be used with the configured embedder."""
+
+    pass
+
+
+def words(text: str) -> list[str]:
+    """Lowercase content words of a text."""
+    return [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def analysis_text(analysis: Dict[str, Any]) -> str:
+    """Text embedded for an analysis: description, key features and lighting."""
+    return "\n".join(
+        [
+            analysis.get("description", ""),
+            " ".join(analysis.get("key_features", [])),
+            analysis.get("lighting_analysis", ""),
+        ]
+    )
+
+
+class Embedder(Protocol):
+    """Turns text into a fixed-size vector."""
+
+    name: str
+    dim: int
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        ...
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: signed feature hashing of words and adjacent word pairs.
+
+    Term counts are damped (1 + log tf) and the vector is L2-normalized, so
+    the dot product of two embeddings is their cosine similarity.
+    """
+
+    name = EMBEDDER_HASHING
+
+    def __init__(self, dim: Optional[int] = None):
+        self.dim = dim or int(os.getenv("EMBEDDING_DIM", "512"))
+
+    def embed(self, text: str) -> np.ndarray:
+        tokens = words(text)
+        terms = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for term, count in counts.items():
+            # blake2b rather than hash(): the same across processes
+            digest = int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "big")
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dim] += sign * (1.0 + math.log(count))
+        return _normalize(vector)
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        return await asyncio.to_thread(self.embed, text)
+
+
+class GeminiEmbedder:
+    """
+    Gemini text embeddings through the shared Gemini client.
+
+    The client is created (and the API configured) before anything else,
+    and every embedding is a scheduled client call, so it is subject to
+    the request's priority, quotas and deadline like a generation call.
+    """
+
+    name = EMBEDDER_GEMINI
+
+    def __init__(self, model: Optional[str] = None, dim: Optional[int] = None):
+        from utils.gemini_client import get_gemini_client
+
+        self._client = get_gemini_client()
+        self.model = model or os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+        self.dim = dim or int(os.getenv("EMBEDDING_DIM", "768"))
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        values = await self._client.embed_text(text, self.model, self.dim)
+        vector = np.asarray(values, dtype=np.float32)
+        if len(vector) != self.dim:
+            raise ValueError(f"{self.model} returned {len(vector)} dimensions, expected {self.dim}")
+        return _normalize(vector)
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def create_embedder(kind: Optional[str] = None) -> Embedder:
+    """
+    Create the configured embedder.
+
+    The fake Gemini backend has no embeddings, so it uses the hashing
+    embedder.
+
+    Args:
+        kind: "hashing" or "gemini" (default: EMBEDDER or hashing)
+
+    Returns:
+        Embedder
+
+    Raises:
+        VectorIndexError: If the embedder is unknown or the Gemini client
+            cannot be created
+    """
+    kind = (kind or os.getenv("EMBEDDER", EMBEDDER_HASHING)).lower()
+    if kind not in EMBEDDERS:
+        raise VectorIndexError(
+            f"Unknown EMBEDDER '{kind}'. Expected one of: {', '.join(EMBEDDERS)}"
+        )
+    if kind == EMBEDDER_GEMINI and os.getenv("GEMINI_BACKEND", "gemini").lower() != "fake":
+        try:
+            return GeminiEmbedder()
+        except Exception as e:
+            raise VectorIndexError(f"Gemini embedder unavailable: {e}")
+    return HashingEmbedder()
+
+
+@dataclass
+class SimilarInterior:
+    """One search result."""
+
+    id: str
+    score: float
+    description: str
+    key_features: list[str]
+    lighting_analysis: str
+    matched_features: list[str]
+
+
+class VectorIndex:
+    """
+    NumPy vector index of analyses with an inverted index on key features.
+
+    Entries are keyed by id (the image digest, or a digest of the
+    description); adding an id again replaces its entry.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Initialize the index.
+
+        Args:
+            embedder: Text embedder (default: create_embedder())
+            path: JSON-lines file to load from and append to
+                (default: VECTOR_INDEX_PATH)
+            max_entries: Capacity (default: VECTOR_INDEX_MAX_ENTRIES or 50000)
+            enabled: Whether analyses are indexed as they arrive
+                (default: VECTOR_INDEX_ENABLED or true)
+
+        Raises:
+            VectorIndexError: If the embedder cannot be created or the file
+                was written by a different embedder
+        """
+        self.enabled = (
+            enabled
+            if enabled is not None
+            else os.getenv("VECTOR_INDEX_ENABLED", "true").lower() == "true"
+        )
+        self.embedder = embedder or create_embedder()
+        self.path = path if path is not None else os.getenv("VECTOR_INDEX_PATH")
+        self.max_entries = max_entries or int(os.getenv("VECTOR_INDEX_MAX_ENTRIES", "50000"))
+        # _lock guards the in-memory index, _file_lock the order of writes
+        # to the file; file I/O never holds _lock, so searches do not wait
+        # for appends or compaction
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._vectors = np.zeros((64, self.embedder.dim), dtype=np.float32)
+        self._ids: list[str] = []
+        self._entries: list[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._postings: Dict[str, set[int]] = {}
+        self._pending: set[asyncio.Task] = set()
+        self._file_lines = 0
+
+        if self.path and os.path.exists(self.path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, entry_id: str) -> bool:
+        return entry_id in self._rows
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed a query with the index's embedder."""
+        return await self.embedder.embed_async(text)
+
+    async def add(self, entry_id: str, analysis: Dict[str, Any]) -> None:
+        """
+        Embed and index an analysis.
+
+        Args:
+            entry_id: Key of the analyzed image
+            analysis: AnalyzeYachtOutput as a dictionary
+        """
+        entry = {
+            "id": entry_id,
+            "description": analysis["description"][:_PREVIEW_CHARS],
+            "key_features": list(analysis.get("key_features", [])),
+            "lighting_analysis": analysis.get("lighting_analysis", "")[:_PREVIEW_CHARS],
+        }
+        vector = await self.embed(analysis_text(analysis))
+        await asyncio.to_thread(self._store, entry, vector)
+
+    def _store(self, entry: Dict[str, Any], vector: np.ndarray) -> None:
+        self._insert(entry, vector)
+        if self.path:
+            self._append(entry, vector)
+
+    def add_in_background(self, entry_id: str, analysis: Dict[str, Any]) -> None:
+        """
+        Index an analysis without waiting for it.
+
+        The embedding runs as a bulk request of the current caller, so it
+        never holds up interactive calls. Does nothing when indexing is
+        disabled or the id is already indexed.
+        """
+        if not self.enabled or entry_id in self._rows:
+            return
+        task = asyncio.create_task(self._add_in_scope(entry_id, analysis, current_caller()))
+        self._pending.add(task)
+        task.add_done_callback(self._added)
+
+    async def _add_in_scope(self, entry_id: str, analysis: Dict[str, Any], caller: Caller) -> None:
+        with request_scope(INDEX_TOOL, caller=caller):
+            await self.add(entry_id, analysis)
+
+    def _added(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Failed to index analysis: %s", task.exception())
+
+    async def drain(self) -> None:
+        """Wait for the analyses being indexed in the background."""
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    def _insert(self, entry: Dict[str, Any], vector: np.ndarray) -> None:
+        with self._lock:
+            row = self._rows.get(entry["id"])
+            if row is None:
+                if len(self._ids) >= self.max_entries:
+                    self._evict(max(1, self.max_entries // 10))
+                row = len(self._ids)
+                if row == len(self._vectors):
+                    grown = np.zeros((2 * row, self._vectors.shape[1]), dtype=np.float32)
+                    grown[:row] = self._vectors
+                    self._vectors = grown
+                self._ids.append(entry["id"])
+                self._entries.append(entry)
+                self._rows[entry["id"]] = row
+            else:
+                self._unpost(row)
+                self._entries[row] = entry
+            self._vectors[row] = vector
+            for word in self._feature_words(entry):
+                self._postings.setdefault(word, set()).add(row)
+
+    @staticmethod
+    def _feature_words(entry: Dict[str, Any]) -> set[str]:
+        return {word for feature in entry["key_features"] for word in words(feature)}
+
+    def _unpost(self, row: int) -> None:
+        for word in self._feature_words(self._entries[row]):
+            rows = self._postings.get(word)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._postings[word]
+
+    def _evict(self, count: int) -> None:
+        """Drop the oldest entries and renumber the rest (lock held)."""
+        count = min(count, len(self._ids))
+        kept = len(self._ids) - count
+        self._vectors[:kept] = self._vectors[count : count + kept]
+        del self._ids[:count]
+        del self._entries[:count]
+        self._rows = {entry_id: row for row, entry_id in enumerate(self._ids)}
+        self._postings = {}
+        for row, entry in enumerate(self._entries):
+            for word in self._feature_words(entry):
+                self._postings.setdefault(word, set()).add(row)
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 5,
+        features: Optional[list[str]] = None,
+        exclude: Optional[str] = None,
+    ) -> list[SimilarInterior]:
+        """
+        Rank the indexed interiors by similarity to a query vector.
+
+        Args:
+            query: Embedding of the query (from the same embedder)
+            top_k: Number of results
+            features: Only interiors whose key features contain all words
+                of every given feature
+            exclude: Id left out of the results (the query image itself)
+
+        Returns:
+            Best matches first
+        """
+        required = {word for feature in features or [] for word in words(feature)}
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return []
+            scores = self._vectors[:count] @ query
+            if required:
+                rows = set.intersection(*(self._postings.get(w, set()) for w in required))
+                mask = np.zeros(count, dtype=bool)
+                mask[list(rows)] = True
+                scores = np.where(mask, scores, -np.inf)
+            if exclude is not None and exclude in self._rows:
+                scores[self._rows[exclude]] = -np.inf
+
+            k = min(top_k, count)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            results = []
+            for row in best:
+                if not np.isfinite(scores[row]):
+                    break
+                entry = self._entries[row]
+                matched = [
+                    feature for feature in entry["key_features"] if required & set(words(feature))
+                ]
+                results.append(
+                    SimilarInterior(
+                        id=entry["id"],
+                        score=round(float(scores[row]), 4),
+                        description=entry["description"],
+                        key_features=entry["key_features"],
+                        lighting_analysis=entry["lighting_analysis"],
+                        matched_features=matched,
+                    )
+                )
+            return results
+
+    def _record(self, entry: Dict[str, Any], vector: np.ndarray) -> str:
+        """One line of the index file."""
+        record = {**entry, "embedder": self.embedder.name, "vector": vector.round(5).tolist()}
+        return json.dumps(record)
+
+    def _append(self, entry: Dict[str, Any], vector: np.ndarray) -> None:
+        line = self._record(entry, vector) + "\n"
+        try:
+            with self._file_lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self._file_lines += 1
+                # Replaced and evicted entries stay in the file until compacted
+                if self._file_lines > 2 * self.max_entries:
+                    self._compact()
+        except OSError as e:
+            logger.warning("Failed to append to vector index: %s", e)
+
+    def _snapshot(self) -> list[tuple[Dict[str, Any], np.ndarray]]:
+        """Live entries with a copy of their vectors."""
+        with self._lock:
+            count = len(self._entries)
+            return list(zip(list(self._entries), self._vectors[:count].copy()))
+
+    def _compact(self) -> None:
+        """Rewrite the file with a snapshot of the live entries (file lock held)."""
+        snapshot = self._snapshot()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry, vector in snapshot:
+                f.write(self._record(entry, vector) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file_lines = len(snapshot)
+        logger.info("Compacted vector index file to %s entries", self._file_lines)
+
+    def _load(self) -> None:
+        """
+        Replay the JSON-lines file (later lines replace earlier ones).
+
+        Raises:
+            VectorIndexError: If an entry was written by a different
+                embedder (the file is left untouched)
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        record = json.loads(line)
+                        vector = np.asarray(record.pop("vector"), dtype=np.float32)
+                    except (ValueError, KeyError):
+                        continue
+                    embedder = record.pop("embedder", None)
+                    if embedder != self.embedder.name or len(vector) != self.embedder.dim:
+                        raise VectorIndexError(
+                            f"{self.path} was written by the {embedder} embedder "
+                            f"({len(vector)} dimensions), but {self.embedder.name} "
+                            f"({self.embedder.dim} dimensions) is configured; set EMBEDDER "
+                            "and EMBEDDING_DIM to match or use a new VECTOR_INDEX_PATH"
+                        )
+                    self._insert(record, vector)
+        except OSError as e:
+            logger.warning("Ignoring unreadable vector index %s: %s", self.path, e)
+            return
+        logger.info("Loaded %s vector index entries from %s", len(self), self.path)
+        if self._file_lines > 2 * self.max_entries:
+            try:
+                with self._file_lock:
+                    self._compact()
+            except OSError as e:
+                logger.warning("Failed to compact vector index: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, capacity and embedder of the index."""
+        return {
+            "enabled": self.enabled,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "embedder": self.embedder.name,
+            "dim": self.embedder.dim,
+            "feature_words": len(self._postings),
+            "pending": len(self._pending),
+            "path": self.path,
+        }
+
+
+_index: Optional[VectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """
+    Get the shared vector index.
+
+    The first call loads VECTOR_INDEX_PATH and sets up the embedder
+    (creating the Gemini client for the Gemini embedder); from the event
+    loop, use get_vector_index_async().
+
+    Returns:
+        VectorIndex configured from the environment
+
+    Raises:
+        VectorIndexError: If the embedder cannot be created or does not
+            match the file
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = VectorIndex()
+    return _index
+
+
+async def get_vector_index_async() -> VectorIndex:
+    """Get the shared vector index, building it in a worker thread on first use."""
+    if _index is None:
+        return await asyncio.to_thread(get_vector_index)
+    return _index
@@ -0,0 +1,239 @@
+"""
+Startup warm-up of the lazily initialized request paths.
+
+The first request after a spawn otherwise pays for image codec loading,
+process and thread pool start-up, Gemini SDK client creation (and, on the
+first API call, connection and TLS setup) and loading the on-disk
+perceptual-hash cache. The warm-up runs these once in the background as
+soon as the server starts, without delaying the MCP handshake, and the
+``readiness`` tool reports its progress so a host can route traffic only
+to warm servers.
+
+Settings:
+- WARMUP_ENABLED (default: true)
+- WARMUP_PING: also make a count_tokens API call per channel (default: false)
+- WARMUP_PRELOAD_CACHE: load the perceptual-hash and similarity indexes and
+  open the result store (default: true)
+- WARMUP_TIMEOUT_S: limit for the whole warm-up (default: 30)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from io import BytesIO
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from PIL import Image
+
+from utils.gemini_client import GeminiClient, get_gemini_client
+from utils.imaging import get_image_pool
+from utils.metrics import get_metrics
+from utils.phash import dhash, phash, get_perceptual_index
+from utils.result_store import get_result_store
+from utils.vector_index import get_vector_index
+
+logger = logging.getLogger(__name__)
+
+WARMUP_PENDING = "pending"
+WARMUP_RUNNING = "warming"
+WARMUP_READY = "ready"
+WARMUP_DEGRADED = "degraded"
+WARMUP_DISABLED = "disabled"
+
+# Steps every tool depends on: the server is not ready if one failed
+_REQUIRED_STEPS = ("client",)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+
+@dataclass
+class WarmupStep:
+    """Outcome of one warm-up step."""
+
+    name: str
+    duration_s: Optional[float] = None
+    error: Optional[str] = None
+    finished: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "duration_s": self.duration_s, "error": self.error}
+
+
+async def _warm_image_pool() -> None:
+    """Start the image workers and round-trip a tiny image through them."""
+    await get_image_pool().warm_up()
+    image = await GeminiClient.decode_image_async(_tiny_png())
+    await GeminiClient.encode_image_to_base64_async(image, "JPEG")
+
+
+async def _warm_hashing() -> None:
+    """Create the default thread pool and prime the perceptual-hash path."""
+    image = Image.new("RGB", (64, 64), (128, 128, 128))
+    await asyncio.to_thread(lambda: (phash(image), dhash(image)))
+
+
+async def _warm_client(ping: bool) -> None:
+    """Create the Gemini client and its SDK channel (optionally ping the API)."""
+    client = await asyncio.to_thread(get_gemini_client)
+    await asyncio.to_thread(client.warm_up, ping)
+
+
+async def _preload_cache() -> None:
+    """Load the perceptual-hash and similarity indexes and open the result store."""
+    index = await asyncio.to_thread(get_perceptual_index)
+    logger.info("Perceptual-hash index ready (%s entries)", len(index))
+    store = await asyncio.to_thread(get_result_store)
+    logger.info("Result store ready (mode: %s)", store.mode)
+    vectors = await asyncio.to_thread(get_vector_index)
+    logger.info("Similarity index ready (%s entries)", len(vectors))
+
+
+def _tiny_png() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (8, 8), (200, 180, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Warmup:
+    """Runs the warm-up steps once and records their outcome."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        ping: Optional[bool] = None,
+        preload_cache: Optional[bool] = None,
+        timeout_s: Optional[float] = None,
+    ):
+        """
+        Initialize the warm-up.
+
+        Args:
+            enabled: Run the warm-up (default: WARMUP_ENABLED or true)
+            ping: Make a count_tokens API call per channel (default: WARMUP_PING or false)
+            preload_cache: Load the perceptual-hash and similarity indexes and
+                open the result store
+                (default: WARMUP_PRELOAD_CACHE or true)
+            timeout_s: Limit for the whole warm-up (default: WARMUP_TIMEOUT_S or 30)
+        """
+        self.enabled = enabled if enabled is not None else _env_flag("WARMUP_ENABLED", "true")
+        self.ping = ping if ping is not None else _env_flag("WARMUP_PING", "false")
+        self.preload_cache = (
+            preload_cache
+            if preload_cache is not None
+            else _env_flag("WARMUP_PRELOAD_CACHE", "true")
+        )
+        self.timeout_s = timeout_s or float(os.getenv("WARMUP_TIMEOUT_S", "30"))
+
+        self.state = WARMUP_PENDING if self.enabled else WARMUP_DISABLED
+        self.duration_s: Optional[float] = None
+        self.steps: list[WarmupStep] = []
+        self._started_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def _step_functions(self) -> Dict[str, Callable[[], Awaitable[None]]]:
+        steps = {
+            "image_pool": _warm_image_pool,
+            "hashing": _warm_hashing,
+            "client": lambda: _warm_client(self.ping),
+        }
+        if self.preload_cache:
+            steps["cache"] = _preload_cache
+        return steps
+
+    async def _run_step(self, step: WarmupStep, func: Callable[[], Awaitable[None]]) -> None:
+        start = time.perf_counter()
+        try:
+            await func()
+        except Exception as e:
+            step.error = f"{type(e).__name__}: {str(e)}"
+            logger.warning("Warm-up step %s failed: %s", step.name, step.error)
+        else:
+            step.finished = True
+        finally:
+            step.duration_s = round(time.perf_counter() - start, 3)
+
+    async def run(self) -> None:
+        """Run all steps concurrently; failures are recorded, not raised."""
+        if not self.enabled or self.state != WARMUP_PENDING:
+            return
+        self.state = WARMUP_RUNNING
+        start = time.perf_counter()
+        functions = self._step_functions()
+        self.steps = [WarmupStep(name) for name in functions]
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    *(self._run_step(step, functions[step.name]) for step in self.steps)
+                ),
+                timeout=self.timeout_s,
+            )
+        except asyncio.TimeoutError:
+            for step in self.steps:
+                if not step.finished and step.error is None:
+                    step.error = f"Timed out after {self.timeout_s}s"
+
+        self.duration_s = round(time.perf_counter() - start, 3)
+        failed = [step.name for step in self.steps if step.error]
+        self.state = WARMUP_DEGRADED if failed else WARMUP_READY
+        get_metrics().observe("warmup.duration_s", self.duration_s)
+        if failed:
+            logger.info(
+                "Warm-up %s in %.2fs (failed: %s)", self.state, self.duration_s, ", ".join(failed)
+            )
+        else:
+            logger.info("Warm-up %s in %.2fs", self.state, self.duration_s)
+
+    def start(self) -> Optional[asyncio.Task]:
+        """
+        Start the warm-up in the background (once per process).
+
+        Returns:
+            The warm-up task, or None if it already ran or is disabled
+        """
+        if self.state != WARMUP_PENDING or self._task is not None:
+            return None
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the server should receive traffic.
+
+        A degraded warm-up is ready unless a required step (the Gemini
+        client) failed or timed out.
+        """
+        if self.state == WARMUP_DEGRADED:
+            return not any(step.error for step in self.steps if step.name in _REQUIRED_STEPS)
+        return self.state in (WARMUP_READY, WARMUP_DISABLED)
+
+    def status(self) -> Dict[str, Any]:
+        """Warm state, duration and per-step outcome."""
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "warmup_duration_s": self.duration_s,
+            "steps": [step.to_dict() for step in self.steps],
+            "uptime_s": round(time.monotonic() - self._started_at, 3),
+        }
+
+
+_warmup: Optional[Warmup] = None
+
+
+def get_warmup() -> Warmup:
+    """
+    Get the shared warm-up state.
+
+    Returns:
+        Warmup configured from the environment
+    """
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup